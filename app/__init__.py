@@ -101,6 +101,17 @@ def create_app(config_name='default'):
     from app.sqlite_cross_process_lock import register_sqlite_cross_process_lock
 
     register_sqlite_cross_process_lock(app, db)
+    from app.services.fifo_checkpoint_service import register_fifo_checkpoint_invalidation
+    from app.services.transaction_frame import register_transaction_frame_versioning
+    from app.services.json_cache_lru import register_json_cache_tracking
+    from app.services.monthly_rollup_service import register_monthly_rollup_invalidation
+    from app.services.cache_invalidation_bus import register_cache_invalidation_bus
+
+    register_fifo_checkpoint_invalidation(db)
+    register_transaction_frame_versioning(db)
+    register_json_cache_tracking(db)
+    register_monthly_rollup_invalidation(db)
+    register_cache_invalidation_bus(db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     bcrypt.init_app(app)
@@ -130,6 +141,10 @@ def create_app(config_name='default'):
     # Registrar filtros personalizados para templates
     from app.utils.template_filters import register_filters
     register_filters(app)
+
+    # Presupuesto de sentencias SQL por petición (detector de N+1; ver app/utils/query_budget.py)
+    from app.utils.query_budget import register_query_budget
+    register_query_budget(app)
     
     # Context processor para CSRF token global
     # Flask-WTF ya proporciona csrf_token() automáticamente, pero lo aseguramos aquí
@@ -214,6 +229,18 @@ def create_app(config_name='default'):
             return
         return redirect(url_for('admin.index'))
 
+    # Latido de sesión abierta: el worker de rebuild atiende antes a estos usuarios
+    @app.before_request
+    def cache_rebuild_heartbeat():
+        from flask import request
+        from flask_login import current_user
+        if request.blueprint == 'static' or request.endpoint == 'static':
+            return
+        if not current_user.is_authenticated:
+            return
+        from app.services.cache_rebuild_state_service import CacheRebuildStateService
+        CacheRebuildStateService.touch_seen(current_user.id)
+
     # Para rutas API: devolver JSON en 404/500 (evita "is not valid JSON" en frontend)
     @app.errorhandler(404)
     def not_found_handler(e):
@@ -259,16 +286,18 @@ def create_app(config_name='default'):
 
     # CLI: Job de polling de precios (ejecutar vía cron cada minuto)
     @app.cli.command('price-poll-one')
-    def price_poll_one():
-        """Actualiza 1 activo por rotación (Chart API solo). Ejecutar cada minuto vía cron."""
+    @click.option('--batch-size', type=int, default=None, help='Tickers por tick (por defecto PRICE_POLL_BATCH_SIZE)')
+    @click.option('--rotate', is_flag=True, help='Modo clásico: 1 elemento por rotación')
+    def price_poll_one(batch_size, rotate):
+        """Actualiza los precios más atrasados en lote (Chart API solo). Ejecutar cada minuto vía cron."""
         import time
 
-        from app.services.price_polling_service import run_poll_one
+        from app.services.price_polling_service import run_poll_batch, run_poll_one
 
         t0 = time.perf_counter()
-        # Sin exclusive_db_lock global: envolver run_poll_one bloqueaba todo el sitio web
+        # Sin exclusive_db_lock global: envolver el polling bloqueaba todo el sitio web
         # durante la petición HTTP a Yahoo (flock EX compartido con Gunicorn).
-        result = run_poll_one()
+        result = run_poll_one() if rotate else run_poll_batch(batch_size)
         elapsed = time.perf_counter() - t0
         if result and result.get("kind") == "asset":
             print(f"OK: actualizado asset_id={result.get('asset_id')} [cron price-poll-one {elapsed:.2f}s]")
@@ -277,6 +306,11 @@ def create_app(config_name='default'):
                 f"OK: actualizado benchmark {result.get('name')} ({result.get('ticker')}) "
                 f"[cron price-poll-one {elapsed:.2f}s]"
             )
+        elif result and "assets" in result:
+            print(
+                f"OK: {len(result['assets'])} activos, {len(result['benchmarks'])} benchmarks, "
+                f"{result['failed']} fallidos [cron price-poll-one {elapsed:.2f}s]"
+            )
         else:
             print(f"OK: sin cola o sin actualización [cron price-poll-one {elapsed:.2f}s]")
 
@@ -351,36 +385,59 @@ def create_app(config_name='default'):
         else:
             print(f"OK: benchmark global daily sin cambios [{elapsed:.2f}s]")
 
-    @app.cli.command('cache-rebuild-worker-once')
-    def cache_rebuild_worker_once():
+    @app.cli.command('fx-rates-backfill')
+    @click.option('--start', default=None, help='Fecha inicio YYYY-MM-DD (por defecto: tras el último día guardado)')
+    @click.option('--export', 'export_file', is_flag=True, help='Volcar después la tabla al CSV de fallback')
+    def fx_rates_backfill(start, export_file):
         """
-        Procesa como máximo 1 usuario pendiente por ejecución (FULL domina NOW).
-        Diseñado para cron cada ~30s con lock global para evitar solapes.
+        Rellena la serie diaria de tipos de cambio a EUR (BCE) usada para convertir a fecha.
+        Sin red, carga FX_RATES_FALLBACK_FILE. Ejecutar 1×/día vía cron.
         """
-        import os
+        import time
         from datetime import datetime
 
-        from flask import current_app
+        from app.services.fx_rate_service import FxRateService
 
-        from app.services.cache_rebuild_state_service import CacheRebuildStateService
-        from app.services.dashboard_summary_cache import DashboardSummaryCacheService
-        from app.services.metrics.cache import MetricsCacheService
-        from app.services.net_worth_service import get_dashboard_summary
-        from app.services.portfolio_benchmarks_cache import PortfolioBenchmarksCacheService
-        from app.services.portfolio_evolution_cache import PortfolioEvolutionCacheService
+        t0 = time.perf_counter()
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        written = FxRateService.backfill(start=start_date)
+        msg = f"OK: fx-rates-backfill {written} filas"
+        if export_file:
+            msg += f", exportadas {FxRateService.export_fallback_file()} al CSV de fallback"
+        print(f"{msg} [{time.perf_counter() - t0:.2f}s]")
+
+    @app.cli.command('api-log-compact')
+    def api_log_compact():
+        """
+        Retención del log de APIs: borra filas crudas de más de API_LOG_RAW_RETENTION_DAYS días
+        (sus totales ya están en api_call_daily) y rollups de más de 6 meses. Ejecutar 1×/día.
+        """
+        from app.services.api_log_service import compact_api_logs, flush_api_log_buffer
 
-        import time
+        flush_api_log_buffer()
+        deleted = compact_api_logs()
+        print(f"OK: api-log-compact {deleted['raw']} filas crudas, {deleted['daily']} filas de rollup borradas")
 
-        t0 = time.perf_counter()
+    @app.cli.command('watchlist-recompute')
+    @click.option('--user-id', type=int, default=None, help='Solo este usuario (por defecto, todos)')
+    def watchlist_recompute(user_id):
+        """Recalcula valoración, tier y operativa de la watchlist en lote (tras cambiar fórmulas o configs)."""
+        from app.services.watchlist_batch_valuation import recompute_watchlist_metrics
 
-        def _elapsed_s() -> float:
-            return time.perf_counter() - t0
+        updated = recompute_watchlist_metrics(user_id)
+        db.session.commit()
+        print(f"OK: watchlist-recompute {updated} filas actualizadas")
+
+    def _acquire_cache_rebuild_lock():
+        """flock no bloqueante compartido por los workers de rebuild (None si no disponible u ocupado)."""
+        import os
+
+        from flask import current_app
 
         try:
             import fcntl
         except ImportError:
-            click.echo(f'SKIP: fcntl no disponible para lock del worker. [cron cache-rebuild {_elapsed_s():.2f}s]')
-            return
+            return None, 'fcntl no disponible para lock del worker'
 
         os.makedirs(current_app.instance_path, exist_ok=True)
         lock_path = os.path.join(current_app.instance_path, 'cache_rebuild_worker.lock')
@@ -388,51 +445,86 @@ def create_app(config_name='default'):
         try:
             fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
         except OSError:
-            click.echo(f'SKIP: worker ya en ejecución. [cron cache-rebuild {_elapsed_s():.2f}s]')
             fp.close()
-            return
+            return None, 'worker ya en ejecución'
+        return fp, None
+
+    def _release_cache_rebuild_lock(fp):
+        import fcntl
 
         try:
-            row = CacheRebuildStateService.pick_next_pending()
-            if not row:
-                click.echo(f'OK: sin rebuild pendiente. [cron cache-rebuild {_elapsed_s():.2f}s]')
-                return
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+        except Exception:
+            pass
+        try:
+            fp.close()
+        except Exception:
+            pass
 
-            user_id = row.user_id
-            action = 'full' if row.pending_full_history else 'now'
-            started = datetime.utcnow()
-
-            if action == 'full':
-                # FULL: invalidar métricas y reconstruir snapshots completos.
-                MetricsCacheService.invalidate(user_id)
-                DashboardSummaryCacheService.set(user_id, get_dashboard_summary(user_id))
-                # Fuerza snapshot mensual completo para performance/index comparison.
-                PortfolioEvolutionCacheService.get_state(user_id, frequency='monthly')
-                PortfolioBenchmarksCacheService.get_comparison_state(user_id)
+    @app.cli.command('cache-rebuild-worker-once')
+    def cache_rebuild_worker_once():
+        """
+        Procesa como máximo 1 usuario pendiente por ejecución (FULL domina NOW), en orden de
+        prioridad de la cola. Diseñado para cron cada ~30s con lock global para evitar solapes.
+        """
+        import time
+
+        from app.services.cache_rebuild_worker import run_worker
+
+        t0 = time.perf_counter()
+        fp, reason = _acquire_cache_rebuild_lock()
+        if fp is None:
+            click.echo(f'SKIP: {reason}. [cron cache-rebuild {time.perf_counter() - t0:.2f}s]')
+            return
+
+        try:
+            processed = run_worker(workers=1, max_jobs=1, log=click.echo)
+            if not processed:
+                click.echo(f'OK: sin rebuild pendiente. [cron cache-rebuild {time.perf_counter() - t0:.2f}s]')
             else:
-                # NOW: conservar histórico, recalcular tramo actual.
-                MetricsCacheService.invalidate(user_id)
-                updated = DashboardSummaryCacheService.recompute_current_from_cache(user_id)
-                if updated is None:
-                    DashboardSummaryCacheService.set(user_id, get_dashboard_summary(user_id))
-                PortfolioEvolutionCacheService.get_state(user_id, frequency='monthly')
-                PortfolioBenchmarksCacheService.get_comparison_state(user_id)
-
-            CacheRebuildStateService.clear_after_success(user_id, action=action)
-            elapsed_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
-            total_s = _elapsed_s()
-            click.echo(
-                f'OK: rebuild {action} user_id={user_id} (trabajo {elapsed_ms} ms, total cron {total_s:.2f}s)'
+                click.echo(f'OK: total cron {time.perf_counter() - t0:.2f}s')
+        finally:
+            _release_cache_rebuild_lock(fp)
+
+    @app.cli.command('cache-rebuild-worker')
+    @click.option('--workers', type=int, default=None, help='Procesos del pool (por defecto CACHE_REBUILD_WORKERS; <=1 = en línea)')
+    @click.option('--idle', 'idle_seconds', type=float, default=None, help='Espera con la cola vacía (por defecto CACHE_REBUILD_IDLE_SECONDS)')
+    @click.option('--max-jobs', type=int, default=None, help='Salir tras N rebuilds o con la cola vacía')
+    @click.option('--metrics-every', type=float, default=60.0, help='Segundos entre líneas METRICS')
+    def cache_rebuild_worker(workers, idle_seconds, max_jobs, metrics_every):
+        """
+        Worker de larga duración: reparte la cola de rebuild en un pool de procesos por prioridad
+        (sesión abierta, NOW antes que FULL, antigüedad). Usa el mismo lock que cache-rebuild-worker-once.
+        """
+        fp, reason = _acquire_cache_rebuild_lock()
+        if fp is None:
+            click.echo(f'SKIP: {reason}.')
+            return
+
+        from app.services.cache_rebuild_worker import run_worker
+
+        try:
+            processed = run_worker(
+                workers=workers,
+                max_jobs=max_jobs,
+                idle_seconds=idle_seconds,
+                metrics_every=metrics_every,
+                log=click.echo,
             )
+            click.echo(f'OK: {processed} rebuilds procesados')
+        except KeyboardInterrupt:
+            click.echo('OK: worker detenido')
         finally:
-            try:
-                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
-            except Exception:
-                pass
-            try:
-                fp.close()
-            except Exception:
-                pass
+            _release_cache_rebuild_lock(fp)
+
+    @app.cli.command('cache-rebuild-stats')
+    def cache_rebuild_stats():
+        """Métricas de la cola de rebuild (profundidad, espera y duración p50/p95 de la última hora) en JSON."""
+        import json
+
+        from app.services.cache_rebuild_state_service import CacheRebuildStateService
+
+        click.echo(json.dumps(CacheRebuildStateService.queue_stats(), sort_keys=True))
 
     @app.cli.command('reconciliation-debug')
     @click.option('--email', required=True, help='Email del usuario (ej. amieva91@gmail.com)')
@@ -707,6 +799,8 @@ def create_app(config_name='default'):
             if st:
                 st.last_asset_index = -1
                 st.last_updated_asset_id = None
+                st.queue = None
+                st.queue_built_at = None
             else:
                 db.session.add(
                     PricePollingState(id=1, last_asset_index=-1, last_updated_asset_id=None)
@@ -7,6 +7,7 @@ from app.models.income import IncomeCategory, Income
 from app.models.broker import Broker, BrokerAccount
 from app.models.asset import Asset, PriceHistory
 from app.models.asset_registry import AssetRegistry
+from app.models.openfigi_negative_cache import OpenFIGINegativeCache
 from app.models.asset_delisting import AssetDelisting, DELISTING_TYPES
 from app.models.mapping_registry import MappingRegistry
 from app.models.portfolio import PortfolioHolding
@@ -24,15 +25,19 @@ from app.models.bank import Bank, BankBalance
 from app.models.dashboard_config import UserDashboardConfig, DEFAULT_WIDGETS
 from app.models.dashboard_layout import UserDashboardLayout
 from app.models.dashboard_onboarding_state import DashboardOnboardingState
-from app.models.api_call_log import ApiCallLog
+from app.models.api_call_log import ApiCallDaily, ApiCallLog
 from app.models.user_login_log import UserLoginLog
 from app.models.price_polling_state import PricePollingState
 from app.models.cache_rebuild_state import CacheRebuildState
 from app.models.benchmark_global_quote import BenchmarkGlobalQuote
-from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalState
+from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalDailyPoint, BenchmarkGlobalState
 from app.models.spending_plan import SpendingPlanSettings, SpendingPlanFixedCategory, SpendingPlanGoal
 from app.models.reconciliation_adjustment_metric_pref import ReconciliationAdjustmentMetricPreference
 from app.models.interest_rate_context import InterestRateContextSnapshot
+from app.models.fifo_checkpoint import FifoCheckpoint
+from app.models.fx_rate import FxRateDaily
+from app.models.user_ledger_version import UserLedgerVersion
+from app.models.monthly_rollup import MonthlyRollup
 
 __all__ = [
     'User', 'MODULES', 'AVATARS', 
@@ -41,6 +46,7 @@ __all__ = [
     'Broker', 'BrokerAccount',
     'Asset', 'PriceHistory',
     'AssetRegistry',
+    'OpenFIGINegativeCache',
     'AssetDelisting',
     'DELISTING_TYPES',
     'MappingRegistry',
@@ -66,16 +72,22 @@ __all__ = [
     'UserDashboardLayout',
     'DashboardOnboardingState',
     'ApiCallLog',
+    'ApiCallDaily',
     'UserLoginLog',
     'PricePollingState',
     'CacheRebuildState',
     'BenchmarkGlobalQuote',
     'BenchmarkGlobalDaily',
+    'BenchmarkGlobalDailyPoint',
     'BenchmarkGlobalState',
     'SpendingPlanSettings',
     'SpendingPlanFixedCategory',
     'SpendingPlanGoal',
     'ReconciliationAdjustmentMetricPreference',
     'InterestRateContextSnapshot',
+    'FifoCheckpoint',
+    'FxRateDaily',
+    'UserLedgerVersion',
+    'MonthlyRollup',
 ]
 
@@ -19,3 +19,21 @@ class ApiCallLog(db.Model):
 
     def __repr__(self):
         return f'<ApiCallLog {self.api_name} @ {self.called_at}>'
+
+
+class ApiCallDaily(db.Model):
+    """
+    Rollup diario de api_call_log por API y clase de status ('2xx', '4xx', 'none'...).
+    Lo mantiene el flush del buffer de log (api_log_service) en la misma transacción que
+    las filas crudas; el panel de administración lee de aquí.
+    """
+    __tablename__ = 'api_call_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    api_name = db.Column(db.String(50), primary_key=True)
+    status_class = db.Column(db.String(8), primary_key=True)
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)  # status distinto de 200 o sin status
+
+    def __repr__(self):
+        return f'<ApiCallDaily {self.day} {self.api_name} {self.status_class}: {self.calls}>'
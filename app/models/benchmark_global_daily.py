@@ -1,6 +1,10 @@
 """
 Serie diaria global por benchmark (misma para todos los usuarios).
 El job `benchmark-global-daily-once` mantiene filas y sube `BenchmarkGlobalState.daily_data_version`.
+
+Los cierres viven en `benchmark_global_daily_point` (una fila por benchmark y día, clave
+(benchmark, ordinal de fecha)): añadir un día es un INSERT y recortar desde una fecha es un
+rango sobre la clave. `benchmark_global_daily` queda como cabecera (ticker, último día).
 """
 from datetime import datetime
 
@@ -12,11 +16,21 @@ class BenchmarkGlobalDaily(db.Model):
 
     benchmark_name = db.Column(db.String(128), primary_key=True)
     yahoo_ticker = db.Column(db.String(64), nullable=False)
-    data_points = db.Column(db.JSON, nullable=False, default=list)
     hist_end_date = db.Column(db.String(16), nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
 
+class BenchmarkGlobalDailyPoint(db.Model):
+    """Cierre diario de un benchmark."""
+
+    __tablename__ = "benchmark_global_daily_point"
+
+    benchmark_name = db.Column(db.String(128), primary_key=True)
+    # date.toordinal(): entero ordenable, sin parsear cadenas ISO
+    day = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    close = db.Column(db.Float, nullable=False)
+
+
 class BenchmarkGlobalState(db.Model):
     """Fila singleton (id=1): versión monotónica para invalidar lecturas en cachés por usuario."""
 
@@ -2,7 +2,8 @@
 Estado persistido de rebuild de cachés por usuario (HIST/NOW).
 
 Se usa por el worker periódico para ejecutar recomputes en segundo plano
-sin bloquear la request del usuario.
+sin bloquear la request del usuario. Cada fila es la entrada de cola del usuario:
+marcas repetidas no la duplican y el worker la reclama (claimed_at) mientras la procesa.
 """
 from datetime import datetime
 
@@ -19,6 +20,21 @@ class CacheRebuildState(db.Model):
     pending_full_history = db.Column(db.Boolean, nullable=False, default=False)
     pending_now = db.Column(db.Boolean, nullable=False, default=False)
 
+    # Primera marca aún sin procesar (orden de cola y latencia de espera)
+    requested_at = db.Column(db.DateTime, nullable=True)
+    # Última petición del usuario (sesión abierta => prioridad)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+    # Reclamada por un worker: acción en curso ('full' | 'now')
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    claimed_action = db.Column(db.String(8), nullable=True)
+    # Reintento tras un fallo: no reclamar antes de esta hora
+    not_before = db.Column(db.DateTime, nullable=True)
+
+    # Último rebuild completado: espera en cola y duración (métricas)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_wait_ms = db.Column(db.Integer, nullable=True)
+    last_run_ms = db.Column(db.Integer, nullable=True)
+
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
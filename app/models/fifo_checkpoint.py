@@ -0,0 +1,34 @@
+"""
+Checkpoints persistidos del estado FIFO a fin de mes.
+
+Cada fila guarda, para un usuario y una cuenta (account_id NULL = ledger completo
+del usuario), las colas de lotes, posiciones cortas, caja por divisa y acumulados
+de P&L realizado tras aplicar todas las transacciones con fecha <= as_of (23:59:59).
+
+Las valoraciones reanudan desde el checkpoint más cercano y solo replayan la cola.
+Editar/insertar/borrar una transacción con fecha D invalida los checkpoints con as_of >= D.
+"""
+from datetime import datetime
+
+from app import db
+
+
+class FifoCheckpoint(db.Model):
+    __tablename__ = 'fifo_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('broker_accounts.id'), nullable=True)
+
+    as_of = db.Column(db.Date, nullable=False)  # Último día del mes cubierto
+    state = db.Column(db.JSON, nullable=False)  # LedgerState.to_dict()
+    txn_count = db.Column(db.Integer, nullable=False, default=0)  # Transacciones aplicadas
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_fifo_checkpoints_scope_as_of', 'user_id', 'account_id', 'as_of'),
+    )
+
+    def __repr__(self):
+        return f"<FifoCheckpoint user_id={self.user_id} account_id={self.account_id} as_of={self.as_of}>"
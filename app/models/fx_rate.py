@@ -0,0 +1,21 @@
+"""
+Serie diaria global de tipos de cambio a EUR (misma para todos los usuarios).
+El job `fx-rates-backfill` rellena filas desde el proveedor (BCE vía Frankfurter) o,
+sin red, desde el fichero de fallback (FX_RATES_FALLBACK_FILE).
+"""
+from datetime import datetime
+
+from app import db
+
+
+class FxRateDaily(db.Model):
+    __tablename__ = "fx_rates_daily"
+
+    currency = db.Column(db.String(8), primary_key=True)  # ISO 4217 (USD, GBP...)
+    rate_date = db.Column(db.Date, primary_key=True)
+    rate_to_eur = db.Column(db.Float, nullable=False)  # 1 unidad de currency = rate_to_eur EUR
+    source = db.Column(db.String(16), nullable=False, default="ecb")  # ecb | file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<FxRateDaily {self.currency} {self.rate_date} {self.rate_to_eur}>"
@@ -26,6 +26,8 @@ class MetricsCache(db.Model):
     # Metadata
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
+    # Contador de escrituras (lo incrementa la BD en cada UPDATE): invalida la caché en memoria
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', onupdate=db.text('revision + 1'))
     
     # Relación con User
     user = db.relationship('User', backref=db.backref('metrics_cache', uselist=False))
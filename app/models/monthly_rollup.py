@@ -0,0 +1,39 @@
+"""
+Agregados mensuales materializados por usuario (ingresos, gastos, saldos bancarios y broker).
+
+Una fila por (user_id, year, month), solo para meses ya cerrados: el mes en curso se
+calcula al vuelo (las cuotas de deuda futuras dependen de la fecha de hoy).
+
+Los importes del broker se guardan en su divisa original por cuenta y se convierten a EUR
+al leer, igual que los checkpoints FIFO: un cambio de tipo de cambio no invalida filas.
+Escribir ingresos/gastos/saldos/DEPOSIT/WITHDRAWAL del mes borra la fila de ese mes.
+"""
+from datetime import datetime
+
+from app import db
+
+
+class MonthlyRollup(db.Model):
+    __tablename__ = 'monthly_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+
+    income_by_category = db.Column(db.JSON, nullable=False, default=dict)  # {category_id: total}
+    expense_by_category = db.Column(db.JSON, nullable=False, default=dict)  # {category_id: total}
+    bank_cash = db.Column(db.Float, nullable=False, default=0.0)  # Suma de BankBalance del mes
+    has_bank_balance = db.Column(db.Boolean, nullable=False, default=False)
+    broker_withdrawals = db.Column(db.JSON, nullable=False, default=dict)  # {account_id: {divisa: importe}}
+    broker_deposits = db.Column(db.JSON, nullable=False, default=dict)  # {account_id: {divisa: importe}}
+    include_adjustment = db.Column(db.Boolean, nullable=False, default=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', name='uq_monthly_rollup_user_ym'),
+    )
+
+    def __repr__(self):
+        return f"<MonthlyRollup user_id={self.user_id} {self.year}-{self.month:02d}>"
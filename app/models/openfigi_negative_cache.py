@@ -0,0 +1,21 @@
+"""
+Cache negativa global de OpenFIGI: ISINs que la API no reconoce.
+Evita volver a consultarlos en cada importación hasta que caduque la entrada
+(OPENFIGI_NEGATIVE_CACHE_TTL); un enriquecimiento correcto la elimina.
+"""
+from datetime import datetime
+
+from app import db
+
+
+class OpenFIGINegativeCache(db.Model):
+    __tablename__ = "openfigi_negative_cache"
+
+    isin = db.Column(db.String(12), primary_key=True)
+    reason = db.Column(db.String(200))
+    attempts = db.Column(db.Integer, nullable=False, default=1)  # Veces que OpenFIGI no lo encontró
+    failed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<OpenFIGINegativeCache {self.isin} hasta {self.expires_at}>"
@@ -22,6 +22,8 @@ class PortfolioBenchmarksCache(db.Model):
     cached_data = db.Column(db.JSON, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
+    # Contador de escrituras (lo incrementa la BD en cada UPDATE): invalida la caché en memoria
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', onupdate=db.text('revision + 1'))
 
     @property
     def is_valid(self) -> bool:
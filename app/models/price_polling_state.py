@@ -13,5 +13,8 @@ class PricePollingState(db.Model):
     last_asset_index = db.Column(db.Integer, default=0, nullable=False)
     last_run_at = db.Column(db.DateTime, nullable=True)
     last_updated_asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=True)
+    # Cola de polling cacheada entre ticks del cron: [{kind, asset_id|name, ticker, held}, ...]
+    queue = db.Column(db.JSON, nullable=True)
+    queue_built_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -51,6 +51,11 @@ class Transaction(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Recálculo de holdings por activo: solo las operaciones de los activos tocados
+    __table_args__ = (
+        db.Index('ix_transactions_account_asset_date', 'account_id', 'asset_id', 'transaction_date'),
+    )
+    
     # Relaciones
     user = db.relationship('User', backref=db.backref('transactions', lazy=True))
     
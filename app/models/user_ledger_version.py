@@ -0,0 +1,21 @@
+"""
+Contador de escrituras del ledger de transacciones por usuario.
+
+Cada flush que inserta/modifica/borra transacciones de un usuario incrementa `version`.
+Las vistas columnares cacheadas (TransactionFrame) se invalidan al cambiar el contador,
+también entre procesos (web, cron, worker).
+"""
+from datetime import datetime
+
+from app import db
+
+
+class UserLedgerVersion(db.Model):
+    __tablename__ = "user_ledger_versions"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserLedgerVersion user_id={self.user_id} version={self.version}>"
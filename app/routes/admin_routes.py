@@ -185,18 +185,20 @@ def user_delete(user_id):
 @login_required
 @admin_required
 def api_monitor():
-    """Listado de llamadas a APIs con filtros (fecha, status, api, endpoint, usuario) y retención 6 meses."""
+    """Listado de llamadas a APIs con filtros (fecha, status, api, endpoint, usuario); métricas del rollup diario."""
     from app.services.api_log_service import (
         get_api_metrics,
         get_api_logs_filtered,
         get_api_names_distinct,
-        delete_logs_older_than_retention,
+        compact_api_logs,
+        flush_api_log_buffer,
         get_api_calls_chart_data,
     )
     from datetime import datetime as dt
     from app.models import ApiCallLog
 
-    delete_logs_older_than_retention(months=6)
+    flush_api_log_buffer()
+    compact_api_logs()
 
     days = request.args.get("days", type=int, default=30)
     if days < 1 or days > 365:
@@ -250,6 +252,7 @@ def api_monitor():
         users_for_filter=users_for_filter,
         user_names=user_names,
         chart_data=chart_data,
+        raw_retention_days=current_app.config.get("API_LOG_RAW_RETENTION_DAYS", 31),
     )
 
 
@@ -300,7 +303,9 @@ def cache():
             flash("Cache invalidado para todos los usuarios.", "success")
         return redirect(url_for("admin.cache"))
     users = User.query.order_by(User.username).all()
-    return render_template("admin/cache.html", users=users)
+    from app.services.cache_rebuild_state_service import CacheRebuildStateService
+
+    return render_template("admin/cache.html", users=users, queue=CacheRebuildStateService.queue_stats())
 
 
 # ---------- Sistema ----------
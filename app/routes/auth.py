@@ -6,7 +6,7 @@ from flask_login import login_user, logout_user, current_user, login_required
 from app import db
 from app.models import (
     User, MODULES, AVATARS,
-    CashFlow, Transaction, PortfolioHolding, PortfolioMetrics, BrokerAccount,
+    CashFlow, Transaction, FifoCheckpoint, UserLedgerVersion, MonthlyRollup, PortfolioHolding, PortfolioMetrics, BrokerAccount,
     Expense, ExpenseCategory, Income, IncomeCategory, DebtPlan,
     Bank, BankBalance, Watchlist, WatchlistConfig,
     UserDashboardConfig, MetricsCache,
@@ -16,6 +16,7 @@ from app.models import (
 )
 from app.forms import LoginForm, RegisterForm, RequestResetForm, ResetPasswordForm
 from app.forms.profile_forms import ProfileForm, ChangePasswordForm, DeleteAccountForm, FirstLoginPasswordForm
+from app.services import transaction_frame
 from app.utils.email import send_reset_email
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
@@ -217,6 +218,10 @@ def _delete_user_data(user_id):
     """Elimina todos los datos asociados al usuario (orden correcto por FKs)."""
     CashFlow.query.filter_by(user_id=user_id).delete()
     Transaction.query.filter_by(user_id=user_id).delete()
+    FifoCheckpoint.query.filter_by(user_id=user_id).delete()
+    MonthlyRollup.query.filter_by(user_id=user_id).delete()
+    UserLedgerVersion.query.filter_by(user_id=user_id).delete()
+    transaction_frame.forget([user_id])
     for acc in BrokerAccount.query.filter_by(user_id=user_id).all():
         PortfolioHolding.query.filter_by(account_id=acc.id).delete()
         PortfolioMetrics.query.filter_by(account_id=acc.id).delete()
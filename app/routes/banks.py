@@ -113,23 +113,9 @@ def save_balances():
             except ValueError:
                 pass
 
+    # El commit marca el worker (mes pasado => FULL, actual => NOW) y el dashboard
+    # (cache_invalidation_bus)
     BankService.save_balances(current_user.id, year, month, balances)
-    # Nuevo flujo: encolar trabajo para worker (cron). Se mantiene el criterio actual:
-    # - mes pasado => FULL
-    # - mes actual/futuro => NOW
-    from app.services.cache_rebuild_state_service import CacheRebuildStateService
-    from app.services.dashboard_summary_cache import DashboardSummaryCacheService
-
-    today = date.today()
-    if (year, month) < (today.year, today.month):
-        CacheRebuildStateService.mark_full_history(current_user.id)
-    else:
-        CacheRebuildStateService.mark_now(current_user.id)
-    # Refresco inmediato del snapshot para evitar tarjetas con datos sintéticos obsoletos.
-    DashboardSummaryCacheService.touch_for_dates(
-        current_user.id,
-        month_refs=[(year, month)],
-    )
     flash('Saldos guardados', 'success')
     return redirect(url_for('banks.dashboard', year=year, month=month))
 
@@ -1,7 +1,7 @@
 """
 Rutas para el módulo Cryptomonedas
 """
-from datetime import date, datetime
+from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 
@@ -90,7 +90,7 @@ def transaction_new():
         from app.services.portfolio_holding_service import recalculate_holdings
         from app.services.metrics.cache import MetricsCacheService
 
-        recalculate_holdings(current_user.id, account_id)
+        recalculate_holdings(current_user.id, account_id, [txn.asset_id])
         db.session.commit()
         from app.services.dashboard_summary_cache import DashboardSummaryCacheService
         MetricsCacheService.invalidate(current_user.id)
@@ -176,7 +176,6 @@ def transaction_edit(id):
     """Editar operación de crypto (mismo formulario que /nueva)."""
     from app.forms.crypto_forms import CryptoTransactionForm
     from app.services.importer_v2 import CSVImporterV2
-    from app.services.cache_rebuild_state_service import CacheRebuildStateService
     from app.services.metrics.cache import MetricsCacheService
     from app.services.dashboard_summary_cache import DashboardSummaryCacheService
 
@@ -232,11 +231,7 @@ def transaction_edit(id):
         commission = form.commission.data or 0
 
         old_account_id = transaction.account_id
-        old_txn_date = (
-            transaction.transaction_date.date()
-            if isinstance(transaction.transaction_date, datetime)
-            else transaction.transaction_date
-        )
+        old_asset_id = transaction.asset_id
 
         transaction.account_id = account_id
         transaction.asset_id = target_asset.id
@@ -255,20 +250,15 @@ def transaction_edit(id):
 
         db.session.commit()
 
+        # Solo cambian las posiciones del activo editado (y del anterior si se cambió)
+        touched_assets = {old_asset_id, transaction.asset_id}
         if old_account_id != transaction.account_id:
             importer_old = CSVImporterV2(current_user.id, old_account_id)
-            importer_old._recalculate_holdings()
+            importer_old._recalculate_holdings(touched_assets)
         importer = CSVImporterV2(current_user.id, transaction.account_id)
-        importer._recalculate_holdings()
+        importer._recalculate_holdings(touched_assets)
         db.session.commit()
 
-        d_new = form.transaction_date.data
-        to_mark: list[date] = list(
-            {d for d in (old_txn_date, d_new) if isinstance(d, date)}
-        )
-        if to_mark:
-            CacheRebuildStateService.mark_for_dates(current_user.id, dates=to_mark)
-
         MetricsCacheService.invalidate(current_user.id)
         DashboardSummaryCacheService.invalidate(current_user.id)
 
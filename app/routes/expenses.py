@@ -23,7 +23,7 @@ from app.services.income_expense_aggregator import (
     flatten_expense_category_chips_sorted,
 )
 from app.services.summary_metrics_service import get_expense_summary_metrics
-from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+from app.services import cache_invalidation_bus
 
 expenses_bp = Blueprint('expenses', __name__, url_prefix='/expenses')
 
@@ -68,12 +68,6 @@ def _apply_expense_series_field_updates(series_expenses, form, new_end_date):
     return deleted_count
 
 
-def _touch_dashboard_for_expense_dates(user_id, dates):
-    """Sincroniza caché del dashboard (barras, histórico) tras cambiar gastos."""
-    if dates:
-        DashboardSummaryCacheService.touch_for_dates(user_id, dates=dates)
-
-
 # ==================== CATEGORÍAS ====================
 
 @expenses_bp.route('/categories')
@@ -412,10 +406,6 @@ def new():
             db.session.add(expense)
         
         db.session.commit()
-        _touch_dashboard_for_expense_dates(
-            current_user.id,
-            [e.date for e in expense_instances if e.date],
-        )
         
         # Mensaje según cantidad de instancias generadas
         if len(expense_instances) > 1:
@@ -470,7 +460,6 @@ def edit(id):
     is_part_of_series = expense.is_recurring and expense.recurrence_group_id
 
     if form.validate_on_submit():
-        old_date = expense.date
         was_not_recurring = not expense.is_recurring
         will_be_recurring = form.is_recurring.data
 
@@ -508,10 +497,6 @@ def edit(id):
                 db.session.add(new_expense)
 
             db.session.commit()
-            _touch_dashboard_for_expense_dates(
-                current_user.id,
-                [old_date] + [e.date for e in expense_instances if e.date],
-            )
             flash(
                 f'✅ Gasto convertido a recurrente: {len(expense_instances)} entradas generadas',
                 'success',
@@ -524,10 +509,6 @@ def edit(id):
             expense.date = form.date.data
             expense.notes = form.notes.data
             db.session.commit()
-            _touch_dashboard_for_expense_dates(
-                current_user.id,
-                [d for d in (old_date, expense.date) if d],
-            )
             flash('✅ Entrada actualizada (resto de la serie sin cambios)', 'success')
 
         elif needs_scope and recurrence_edit_scope == 'future':
@@ -540,13 +521,11 @@ def edit(id):
                 .order_by(Expense.date)
                 .all()
             )
-            series_dates_for_cache = [e.date for e in series_expenses if e.date]
             new_end_date = form.recurrence_end_date.data if form.is_recurring.data else None
             deleted_count = _apply_expense_series_field_updates(
                 series_expenses, form, new_end_date
             )
             db.session.commit()
-            _touch_dashboard_for_expense_dates(current_user.id, series_dates_for_cache)
             if deleted_count > 0:
                 flash(
                     f'✅ Entradas futuras actualizadas: {len(series_expenses)} gastos, '
@@ -564,13 +543,11 @@ def edit(id):
                 user_id=current_user.id,
                 recurrence_group_id=expense.recurrence_group_id,
             ).all()
-            series_dates_for_cache = [e.date for e in series_expenses if e.date]
             new_end_date = form.recurrence_end_date.data if form.is_recurring.data else None
             deleted_count = _apply_expense_series_field_updates(
                 series_expenses, form, new_end_date
             )
             db.session.commit()
-            _touch_dashboard_for_expense_dates(current_user.id, series_dates_for_cache)
             if deleted_count > 0:
                 flash(
                     f'✅ Serie actualizada: {len(series_expenses)} gastos, '
@@ -595,10 +572,6 @@ def edit(id):
             )
 
             db.session.commit()
-            _touch_dashboard_for_expense_dates(
-                current_user.id,
-                [d for d in (old_date, expense.date) if d],
-            )
             flash('Gasto actualizado', 'success')
 
         return redirect(url_for('expenses.list'))
@@ -651,7 +624,6 @@ def terminate_recurrence(id):
         Expense.date > pivot,
     ).all()
 
-    dates_touch = [e.date for e in future_rows if e.date]
     for row in future_rows:
         db.session.delete(row)
 
@@ -663,8 +635,6 @@ def terminate_recurrence(id):
         r.recurrence_end_date = pivot
 
     db.session.commit()
-    dates_touch.extend([r.date for r in remaining if r.date])
-    _touch_dashboard_for_expense_dates(current_user.id, dates_touch)
     flash(
         'Contrato terminado: se eliminaron las cuotas futuras de esta serie.',
         'success',
@@ -699,16 +669,14 @@ def delete(id):
             user_id=current_user.id,
             recurrence_group_id=expense.recurrence_group_id
         ).delete()
-        
+        # Borrado masivo sin eventos ORM: las fechas se publican para el commit
+        cache_invalidation_bus.publish(current_user.id, cache_invalidation_bus.CASHFLOW, dates=series_dates)
         db.session.commit()
-        _touch_dashboard_for_expense_dates(current_user.id, series_dates)
         flash(f'✅ Serie completa eliminada ({count} gastos)', 'info')
     else:
         # Eliminar solo esta entrada
-        del_date = expense.date
         db.session.delete(expense)
         db.session.commit()
-        _touch_dashboard_for_expense_dates(current_user.id, [del_date] if del_date else [])
         flash('Gasto eliminado', 'info')
     
     return redirect(url_for('expenses.list'))
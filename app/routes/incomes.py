@@ -20,7 +20,7 @@ from app.services.income_expense_aggregator import (
     get_synthetic_income_entries_by_month,
 )
 from app.services.summary_metrics_service import get_income_summary_metrics
-from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+from app.services import cache_invalidation_bus
 
 incomes_bp = Blueprint('incomes', __name__, url_prefix='/incomes')
 
@@ -59,11 +59,6 @@ def _apply_income_series_field_updates(series_incomes, form, new_end_date):
     return deleted_count
 
 
-def _touch_dashboard_for_income_dates(user_id, dates):
-    if dates:
-        DashboardSummaryCacheService.touch_for_dates(user_id, dates=dates)
-
-
 # ==================== CATEGORÍAS ====================
 
 @incomes_bp.route('/categories')
@@ -383,10 +378,6 @@ def new():
             db.session.add(income)
         
         db.session.commit()
-        _touch_dashboard_for_income_dates(
-            current_user.id,
-            [i.date for i in income_instances if i.date],
-        )
         
         # Mensaje según cantidad de instancias generadas
         if len(income_instances) > 1:
@@ -440,7 +431,6 @@ def edit(id):
     is_part_of_series = income.is_recurring and income.recurrence_group_id
 
     if form.validate_on_submit():
-        old_date = income.date
         was_not_recurring = not income.is_recurring
         will_be_recurring = form.is_recurring.data
 
@@ -478,10 +468,6 @@ def edit(id):
                 db.session.add(new_income)
 
             db.session.commit()
-            _touch_dashboard_for_income_dates(
-                current_user.id,
-                [old_date] + [i.date for i in income_instances if i.date],
-            )
             flash(
                 f'✅ Ingreso convertido a recurrente: {len(income_instances)} entradas generadas',
                 'success',
@@ -494,10 +480,6 @@ def edit(id):
             income.date = form.date.data
             income.notes = form.notes.data
             db.session.commit()
-            _touch_dashboard_for_income_dates(
-                current_user.id,
-                [d for d in (old_date, income.date) if d],
-            )
             flash('✅ Entrada actualizada (resto de la serie sin cambios)', 'success')
 
         elif needs_scope and recurrence_edit_scope == 'future':
@@ -510,13 +492,11 @@ def edit(id):
                 .order_by(Income.date)
                 .all()
             )
-            series_dates_for_cache = [i.date for i in series_incomes if i.date]
             new_end_date = form.recurrence_end_date.data if form.is_recurring.data else None
             deleted_count = _apply_income_series_field_updates(
                 series_incomes, form, new_end_date
             )
             db.session.commit()
-            _touch_dashboard_for_income_dates(current_user.id, series_dates_for_cache)
             if deleted_count > 0:
                 flash(
                     f'✅ Entradas futuras actualizadas: {len(series_incomes)} ingresos, '
@@ -534,13 +514,11 @@ def edit(id):
                 user_id=current_user.id,
                 recurrence_group_id=income.recurrence_group_id,
             ).all()
-            series_dates_for_cache = [i.date for i in series_incomes if i.date]
             new_end_date = form.recurrence_end_date.data if form.is_recurring.data else None
             deleted_count = _apply_income_series_field_updates(
                 series_incomes, form, new_end_date
             )
             db.session.commit()
-            _touch_dashboard_for_income_dates(current_user.id, series_dates_for_cache)
             if deleted_count > 0:
                 flash(
                     f'✅ Serie actualizada: {len(series_incomes)} ingresos, '
@@ -565,10 +543,6 @@ def edit(id):
             )
 
             db.session.commit()
-            _touch_dashboard_for_income_dates(
-                current_user.id,
-                [d for d in (old_date, income.date) if d],
-            )
             flash('Ingreso actualizado', 'success')
 
         return redirect(url_for('incomes.list'))
@@ -621,7 +595,6 @@ def terminate_recurrence(id):
         Income.date > pivot,
     ).all()
 
-    dates_touch = [i.date for i in future_rows if i.date]
     for row in future_rows:
         db.session.delete(row)
 
@@ -633,8 +606,6 @@ def terminate_recurrence(id):
         r.recurrence_end_date = pivot
 
     db.session.commit()
-    dates_touch.extend([r.date for r in remaining if r.date])
-    _touch_dashboard_for_income_dates(current_user.id, dates_touch)
     flash(
         'Contrato terminado: se eliminaron las cuotas futuras de esta serie.',
         'success',
@@ -669,16 +640,14 @@ def delete(id):
             user_id=current_user.id,
             recurrence_group_id=income.recurrence_group_id
         ).delete()
-        
+        # Borrado masivo sin eventos ORM: las fechas se publican para el commit
+        cache_invalidation_bus.publish(current_user.id, cache_invalidation_bus.CASHFLOW, dates=series_dates)
         db.session.commit()
-        _touch_dashboard_for_income_dates(current_user.id, series_dates)
         flash(f'✅ Serie completa eliminada ({count} ingresos)', 'info')
     else:
         # Eliminar solo esta entrada
-        del_date = income.date
         db.session.delete(income)
         db.session.commit()
-        _touch_dashboard_for_income_dates(current_user.id, [del_date] if del_date else [])
         flash('Ingreso eliminado', 'info')
     
     return redirect(url_for('incomes.list'))
@@ -3,7 +3,7 @@ Rutas principales de la aplicación
 """
 import json
 
-from flask import render_template, redirect, url_for, request, jsonify, flash
+from flask import render_template, redirect, url_for, request, jsonify, flash, make_response
 from flask_login import login_required, current_user
 from datetime import datetime, date
 from sqlalchemy import func, extract
@@ -14,6 +14,7 @@ from app.services.dashboard_onboarding_service import DashboardOnboardingService
 from app.services.net_worth_service import get_dashboard_summary
 from app.services.price_polling_service import get_updated_asset_ids_for_user
 from app.utils.perf_timing import new_tick, perf_mark
+from app.utils.query_budget import query_budget
 
 
 @main_bp.route('/')
@@ -114,6 +115,7 @@ def dashboard_onboarding_modules():
 
 @main_bp.route('/api/price-updates')
 @login_required
+@query_budget(15)
 def api_price_updates():
     """
     Polling ligero: activos del usuario actualizados desde `since` (ISO).
@@ -139,6 +141,7 @@ def api_price_updates():
         from app.models.asset import Asset
         assets = Asset.query.filter(Asset.id.in_(updated_asset_ids)).all()
         asset_by_id = {a.id: a for a in assets}
+        updated_set = set(updated_asset_ids)
 
         if view in ('portfolio', 'holdings'):
             # Calcular value/pnl en EUR desde holdings + Asset.current_price
@@ -197,7 +200,7 @@ def api_price_updates():
             m = compute_crypto_metrics(current_user.id)
             for p in (m.get('posiciones') or []):
                 aid = p.get('asset_id')
-                if aid in set(updated_asset_ids):
+                if aid in updated_set:
                     updates[str(aid)] = {
                         'price_eur': p.get('price'),
                         'value_eur': round(float(p.get('value') or 0), 2),
@@ -209,7 +212,7 @@ def api_price_updates():
             m = compute_metales_metrics(current_user.id)
             for p in (m.get('posiciones') or []):
                 aid = p.get('asset_id')
-                if aid in set(updated_asset_ids):
+                if aid in updated_set:
                     # Table muestra €/oz: price es EUR/g
                     price_eur_g = float(p.get('price') or 0)
                     updates[str(aid)] = {
@@ -231,7 +234,9 @@ def dashboard_state():
     """
     Snapshot del dashboard para polling (~30s).
     Recalcula solo NOW (patrimonio actual, último punto, widgets) sobre el HIST
-    cacheado — no reconstruye la serie histórica completa.
+    cacheado, y solo si cambiaron precios/FX/índices o el día (refresh_for_poll).
+    Versionado: ETag = meta.version. Con If-None-Match igual a la versión actual → 304;
+    con una versión anterior → solo las secciones que cambiaron desde ella (delta=True).
     Incluye updated_asset_ids si el cliente envía ?since= (ISO timestamp).
     """
     tick = new_tick()
@@ -239,17 +244,18 @@ def dashboard_state():
     perf_mark("GET /dashboard/state", uid, tick, "enter", since=request.args.get("since"))
 
     from datetime import timedelta
-    from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+    from app.services.dashboard_summary_cache import DashboardSummaryCacheService, sections_since
     from app.models.dashboard_summary_cache import DashboardSummaryCache
+    from app.services import json_cache_lru
 
-    c = DashboardSummaryCache.query.filter_by(user_id=current_user.id).first()
+    c = json_cache_lru.read(DashboardSummaryCache, current_user.id)
     perf_mark("GET /dashboard/state", uid, tick, "cache_row_query", has_row=c is not None)
     if not c or not c.is_valid:
         perf_mark("GET /dashboard/state", uid, tick, "exit_no_cache")
         return jsonify({'has_cache': False}), 200
 
-    updated = DashboardSummaryCacheService.recompute_current_from_cache(current_user.id)
-    perf_mark("GET /dashboard/state", uid, tick, "recompute_current_from_cache", ok=updated is not None)
+    updated = DashboardSummaryCacheService.refresh_for_poll(current_user.id)
+    perf_mark("GET /dashboard/state", uid, tick, "refresh_for_poll", ok=updated is not None)
 
     if updated is None:
         perf_mark("GET /dashboard/state", uid, tick, "exit_recompute_none")
@@ -262,9 +268,30 @@ def dashboard_state():
         return jsonify({'has_cache': False}), 200
 
     meta = (cache.get('meta') or {}).copy()
+    meta.pop('section_versions', None)
     meta['_from_cache'] = cache.get('_from_cache', False)
     meta['_cached_at'] = cache.get('_cached_at')
 
+    version = str(meta.get('version') or '')
+    client_version = (request.headers.get('If-None-Match') or '').strip()
+    client_version = client_version.removeprefix('W/').strip('"')
+    if version and client_version == version:
+        perf_mark("GET /dashboard/state", uid, tick, "exit_not_modified")
+        resp = make_response('', 304)
+        resp.set_etag(version)
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+
+    sections = sections_since(cache, client_version) if client_version else None
+    if sections is None:
+        summary = dict(cache)
+        summary['meta'] = meta
+    else:
+        summary = {k: cache[k] for k in sections}
+        summary['_from_cache'] = cache.get('_from_cache', False)
+        summary['_cached_at'] = cache.get('_cached_at')
+        summary['meta'] = meta
+
     updated_asset_ids = []
     since_param = request.args.get('since')
     if since_param:
@@ -286,13 +313,19 @@ def dashboard_state():
         n_ids=len(updated_asset_ids),
     )
 
-    perf_mark("GET /dashboard/state", uid, tick, "jsonify_response")
-    return jsonify({
+    perf_mark("GET /dashboard/state", uid, tick, "jsonify_response", n_sections=len(sections) if sections is not None else -1)
+    resp = jsonify({
         'has_cache': True,
         'meta': meta,
-        'summary': cache,
+        'summary': summary,
+        'delta': sections is not None,
+        'sections': sections,
         'updated_asset_ids': updated_asset_ids,
-    }), 200
+    })
+    if version:
+        resp.set_etag(version)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp, 200
 
 @main_bp.route('/reconciliation/adjustment-metrics', methods=['POST'])
 @login_required
@@ -369,7 +402,6 @@ def reconciliation_integrate_adjustment():
         if err:
             flash(err, 'error')
             return redirect(next_url)
-        DashboardSummaryCacheService.touch_for_dates(current_user.id, dates=[obj.date])
     elif side == 'income':
         obj, err, merged, applied = integrate_reconciliation_adjustment_as_income(
             current_user.id, year, month, category_id
@@ -377,7 +409,6 @@ def reconciliation_integrate_adjustment():
         if err:
             flash(err, 'error')
             return redirect(next_url)
-        DashboardSummaryCacheService.touch_for_dates(current_user.id, dates=[obj.date])
     else:
         flash('Tipo de movimiento no válido.', 'error')
         return redirect(next_url)
@@ -140,6 +140,9 @@ def account_clear(id):
 
     from app.models.metrics import PortfolioMetrics
     from app.models.transaction import CashFlow
+    from app.services.fifo_checkpoint_service import FifoCheckpointService
+    from app.services.monthly_rollup_service import MonthlyRollupService
+    from app.services.transaction_frame import bump_ledger_version
 
     num_holdings = PortfolioHolding.query.filter_by(account_id=id).count()
     num_transactions = Transaction.query.filter_by(account_id=id).count()
@@ -149,6 +152,10 @@ def account_clear(id):
     CashFlow.query.filter_by(account_id=id).delete()
     Transaction.query.filter_by(account_id=id).delete()
     PortfolioHolding.query.filter_by(account_id=id).delete()
+    # El borrado masivo no dispara eventos ORM: invalidar checkpoints FIFO, agregados y frames a mano
+    FifoCheckpointService.invalidate(current_user.id, account_id=id)
+    MonthlyRollupService.invalidate(current_user.id)
+    bump_ledger_version([current_user.id])
 
     account.current_cash = 0.0
     account.margin_used = 0.0
@@ -170,6 +177,8 @@ def account_delete(id):
 
     from app.models.metrics import PortfolioMetrics
     from app.models.transaction import CashFlow
+    from app.services.fifo_checkpoint_service import FifoCheckpointService
+    from app.services.transaction_frame import bump_ledger_version
 
     num_holdings = PortfolioHolding.query.filter_by(account_id=id).count()
     num_transactions = Transaction.query.filter_by(account_id=id).count()
@@ -179,6 +188,9 @@ def account_delete(id):
     CashFlow.query.filter_by(account_id=id).delete()
     Transaction.query.filter_by(account_id=id).delete()
     PortfolioHolding.query.filter_by(account_id=id).delete()
+    # El borrado masivo no dispara eventos ORM: invalidar checkpoints FIFO y frames a mano
+    FifoCheckpointService.invalidate(current_user.id, account_id=id)
+    bump_ledger_version([current_user.id])
     db.session.delete(account)
     db.session.commit()
 
@@ -10,10 +10,12 @@ from app.routes import portfolio_bp
 from app.models import BrokerAccount, Asset, PortfolioHolding
 from app.services.currency_service import convert_to_eur
 from app.services.delisting_reconciliation_service import get_delisted_asset_ids
+from app.utils.query_budget import query_budget
 
 
 @portfolio_bp.route('/holdings')
 @login_required
+@query_budget(20)
 def holdings_list():
     """Lista de posiciones actuales con precios en tiempo real"""
     delisted_asset_ids = get_delisted_asset_ids()
@@ -2,6 +2,7 @@
 Rutas de importación CSV
 """
 import os
+import tempfile
 import time
 import traceback
 from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
@@ -17,7 +18,8 @@ from app.routes.portfolio._shared import (
     UPLOAD_FOLDER,
 )
 from app import db
-from app.services.csv_detector import detect_and_parse
+from app.services.batch_import_service import BatchImportService
+from app.services.csv_detector import detect_parser
 from app.services.importer_v2 import CSVImporterV2
 
 
@@ -149,70 +151,56 @@ def import_csv_process():
         'pending_files': [secure_filename(f.filename) for f in files],
     })
 
-    for file_idx, file in enumerate(files):
-        filepath = None
-        try:
-            file_number = file_idx + 1
-            filename = secure_filename(file.filename)
-            debug_log.info(f"--- Archivo {file_number}/{total_files}: {filename} ---")
+    if total_files > 1:
+        _import_files_in_batch(
+            files, total_stats, failed_files, completed_files,
+            failed_enrichment_cache, csv_asset_ids_touched, debug_log
+        )
+    else:
+        for file_idx, file in enumerate(files):
+            filepath = None
+            try:
+                file_number = file_idx + 1
+                filename = secure_filename(file.filename)
+                debug_log.info(f"--- Archivo {file_number}/{total_files}: {filename} ---")
+
+                filepath = os.path.join(UPLOAD_FOLDER, f"temp_{current_user.id}_{filename}")
+                file.save(filepath)
+                debug_log.debug(f"Archivo guardado en {filepath}")
 
-            filepath = os.path.join(UPLOAD_FOLDER, f"temp_{current_user.id}_{filename}")
-            file.save(filepath)
-            debug_log.debug(f"Archivo guardado en {filepath}")
-
-            remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
-            set_import_progress(current_user.id, {
-                'current': 0,
-                'total': 1,
-                'message': f'Analizando {filename}…',
-                'percentage': 0,
-                'current_file': filename,
-                'file_number': file_number,
-                'total_files': total_files,
-                'completed_files': completed_files.copy(),
-                'pending_files': remaining.copy(),
-            })
-
-            parsed_data = detect_and_parse(filepath)
-            broker_format = parsed_data.get('format', 'unknown')
-            debug_log.info(f"Formato detectado: {broker_format}")
-            debug_log.debug(f"Claves en parsed_data: {list(parsed_data.keys())}")
-            for k in ['trades', 'dividends', 'deposits', 'withdrawals', 'fees', 'holdings']:
-                cnt = len(parsed_data.get(k, []))
-                if cnt > 0:
-                    debug_log.info(f"  {k}: {cnt} registros")
-
-            account = get_or_create_broker_account(current_user.id, broker_format)
-            debug_log.info(f"Cuenta broker: id={account.id}")
+                remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
+                set_import_progress(current_user.id, {
+                    'current': 0,
+                    'total': 1,
+                    'message': f'Analizando {filename}…',
+                    'percentage': 0,
+                    'current_file': filename,
+                    'file_number': file_number,
+                    'total_files': total_files,
+                    'completed_files': completed_files.copy(),
+                    'pending_files': remaining.copy(),
+                })
 
-            importer = CSVImporterV2(
-                user_id=current_user.id,
-                broker_account_id=account.id,
-                enable_enrichment=True,
-                failed_enrichment_cache=failed_enrichment_cache
-            )
+                broker_format, parser = detect_parser(filepath)
+                debug_log.info(f"Formato detectado: {broker_format}")
+
+                account = get_or_create_broker_account(current_user.id, broker_format)
+                debug_log.info(f"Cuenta broker: id={account.id}")
 
-            # Estado inicial para que el polling muestre progreso desde el primer archivo
-            remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
-            set_import_progress(current_user.id, {
-                'current': 0,
-                'total': 1,
-                'message': f'Procesando {filename}...',
-                'percentage': 0,
-                'current_file': filename,
-                'file_number': file_number,
-                'total_files': total_files,
-                'completed_files': completed_files.copy(),
-                'pending_files': remaining.copy()
-            })
-
-            def progress_callback(current, total, message):
+                importer = CSVImporterV2(
+                    user_id=current_user.id,
+                    broker_account_id=account.id,
+                    enable_enrichment=True,
+                    failed_enrichment_cache=failed_enrichment_cache
+                )
+
+                # Estado inicial para que el polling muestre progreso desde el primer archivo
                 remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
                 set_import_progress(current_user.id, {
-                    'current': current,
-                    'total': total,
-                    'message': message,
-                    'percentage': int((current / total) * 100) if total > 0 else 0,
+                    'current': 0,
+                    'total': 1,
+                    'message': f'Procesando {filename}...',
+                    'percentage': 0,
                     'current_file': filename,
                     'file_number': file_number,
                     'total_files': total_files,
@@ -220,61 +208,58 @@ def import_csv_process():
                     'pending_files': remaining.copy()
                 })
 
-            stats = importer.import_data(parsed_data, progress_callback=progress_callback)
-
-            debug_log.info(f"Stats archivo {filename}: {stats}")
-            completed_files.append(filename)
-
-            remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
-            set_import_progress(current_user.id, {
-                'phase': 'file_completed',
-                'current_file': filename,
-                'file_number': file_number,
-                'total_files': total_files,
-                'completed_files': completed_files.copy(),
-                'pending_files': remaining,
-                'message': f'✅ {filename} importado correctamente'
-            })
-
-            time.sleep(0.3)
-
-            total_stats['files_processed'] += 1
-            total_stats['transactions_created'] += stats['transactions_created']
-            total_stats['holdings_created'] += stats['holdings_created']
-            total_stats['dividends_created'] += stats['dividends_created']
-            total_stats['assets_created'] += stats['assets_created']
-            total_stats['fees_created'] += stats.get('fees_created', 0)
-            total_stats['deposits_created'] += stats.get('deposits_created', 0)
-            total_stats['withdrawals_created'] += stats.get('withdrawals_created', 0)
-            total_stats['deposits_skipped'].extend(stats.get('deposits_skipped', []))
-
-            if 'enrichment_needed' not in total_stats:
-                total_stats['enrichment_needed'] = 0
-                total_stats['enrichment_success'] = 0
-                total_stats['enrichment_failed'] = 0
-
-            total_stats['enrichment_needed'] += stats.get('enrichment_needed', 0)
-            total_stats['enrichment_success'] += stats.get('enrichment_success', 0)
-            total_stats['enrichment_failed'] += stats.get('enrichment_failed', 0)
-
-            for aid in stats.get('asset_ids_touched') or []:
-                try:
-                    csv_asset_ids_touched.add(int(aid))
-                except (TypeError, ValueError):
-                    pass
+                def progress_callback(current, total, message):
+                    remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
+                    set_import_progress(current_user.id, {
+                        'current': current,
+                        'total': total,
+                        'message': message,
+                        'percentage': int((current / total) * 100) if total > 0 else 0,
+                        'current_file': filename,
+                        'file_number': file_number,
+                        'total_files': total_files,
+                        'completed_files': completed_files.copy(),
+                        'pending_files': remaining.copy()
+                    })
+
+                stats = importer.import_events(
+                    parser.iter_events(filepath),
+                    broker=parser.BROKER,
+                    progress_callback=progress_callback
+                )
+
+                debug_log.info(f"Parser {broker_format}: {parser.throughput.as_dict()}")
+                debug_log.info(f"Stats archivo {filename}: {stats}")
+                completed_files.append(filename)
 
-            if os.path.exists(filepath):
-                os.remove(filepath)
+                remaining = [secure_filename(files[i].filename) for i in range(file_idx + 1, len(files))]
+                set_import_progress(current_user.id, {
+                    'phase': 'file_completed',
+                    'current_file': filename,
+                    'file_number': file_number,
+                    'total_files': total_files,
+                    'completed_files': completed_files.copy(),
+                    'pending_files': remaining,
+                    'message': f'✅ {filename} importado correctamente'
+                })
 
-        except Exception as e:
-            db.session.rollback()
-            total_stats['files_failed'] += 1
-            failed_files.append((file.filename, str(e)))
-            debug_log.error(f"ERROR en archivo {getattr(file, 'filename', '?')}: {e}")
-            debug_log.error(traceback.format_exc())
+                time.sleep(0.3)
 
-            if filepath and os.path.exists(filepath):
-                os.remove(filepath)
+                total_stats['files_processed'] += 1
+                _accumulate_import_stats(total_stats, stats, csv_asset_ids_touched)
+
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+            except Exception as e:
+                db.session.rollback()
+                total_stats['files_failed'] += 1
+                failed_files.append((file.filename, str(e)))
+                debug_log.error(f"ERROR en archivo {getattr(file, 'filename', '?')}: {e}")
+                debug_log.error(traceback.format_exc())
+
+                if filepath and os.path.exists(filepath):
+                    os.remove(filepath)
 
     debug_log.info(f"{'='*60}")
     debug_log.info(f"RESUMEN FINAL: processed={total_stats['files_processed']}, failed={total_stats['files_failed']}")
@@ -288,12 +273,7 @@ def import_csv_process():
         debug_log.warning(f"Archivos fallidos: {failed_files}")
 
     if total_stats['files_processed'] > 0:
-        # Nuevo flujo: encolar rebuild FULL (worker en cron).
-        # FULL domina NOW y reemplaza los invalidates/recompute en la request.
-        from app.services.cache_rebuild_state_service import CacheRebuildStateService
-
-        CacheRebuildStateService.mark_full_history(current_user.id)
-
+        # El rebuild del worker lo encola el commit de las inserciones (cache_invalidation_bus).
         # Mismo criterio que el cron de consenso, solo sobre activos tocados por los CSV;
         # hilo en segundo plano para no alargar el POST.
         if csv_asset_ids_touched:
@@ -352,3 +332,126 @@ def import_csv_process():
 
     flash('❌ No se pudo importar ningún archivo', 'error')
     return redirect(url_for('portfolio.import_csv'))
+
+
+def _accumulate_import_stats(total_stats, stats, csv_asset_ids_touched):
+    """Suma las estadísticas de una importación (archivo o cuenta) al total de la petición"""
+    total_stats['transactions_created'] += stats['transactions_created']
+    total_stats['holdings_created'] += stats['holdings_created']
+    total_stats['dividends_created'] += stats['dividends_created']
+    total_stats['assets_created'] += stats['assets_created']
+    total_stats['fees_created'] += stats.get('fees_created', 0)
+    total_stats['deposits_created'] += stats.get('deposits_created', 0)
+    total_stats['withdrawals_created'] += stats.get('withdrawals_created', 0)
+    total_stats['deposits_skipped'].extend(stats.get('deposits_skipped', []))
+
+    if 'enrichment_needed' not in total_stats:
+        total_stats['enrichment_needed'] = 0
+        total_stats['enrichment_success'] = 0
+        total_stats['enrichment_failed'] = 0
+
+    total_stats['enrichment_needed'] += stats.get('enrichment_needed', 0)
+    total_stats['enrichment_success'] += stats.get('enrichment_success', 0)
+    total_stats['enrichment_failed'] += stats.get('enrichment_failed', 0)
+
+    for aid in stats.get('asset_ids_touched') or []:
+        try:
+            csv_asset_ids_touched.add(int(aid))
+        except (TypeError, ValueError):
+            pass
+
+
+def _import_files_in_batch(files, total_stats, failed_files, completed_files,
+                           failed_enrichment_cache, csv_asset_ids_touched, debug_log):
+    """
+    Modo por lotes (varios archivos): parseo en paralelo en procesos y, por cada cuenta de
+    broker, una importación con los archivos en orden y un único recálculo de holdings.
+    """
+    user_id = current_user.id
+    total_files = len(files)
+
+    def set_progress(message, current=0, total=1, current_file=None, pending=()):
+        set_import_progress(user_id, {
+            'current': current,
+            'total': total,
+            'message': message,
+            'percentage': int((current / total) * 100) if total > 0 else 0,
+            'current_file': current_file,
+            'file_number': len(completed_files) + len(failed_files),
+            'total_files': total_files,
+            'completed_files': completed_files.copy(),
+            'pending_files': list(pending),
+        })
+
+    def mark_failed(filename, error):
+        total_stats['files_failed'] += 1
+        failed_files.append((filename, error))
+        debug_log.error(f"ERROR en archivo {filename}: {error}")
+
+    saved = []
+    try:
+        for file in files:
+            filename = secure_filename(file.filename)
+            # Ruta única: dos exports con el mismo nombre (p. ej. Account.csv) no se pisan
+            fd, filepath = tempfile.mkstemp(prefix=f"temp_{user_id}_", suffix=f"_{filename}", dir=UPLOAD_FOLDER)
+            os.close(fd)
+            saved.append((filename, filepath))
+            file.save(filepath)
+
+        set_progress(f'Analizando {total_files} archivos en paralelo…', pending=[f for f, _ in saved])
+        parsed_files = BatchImportService.parse_files(saved)
+    finally:
+        for _, filepath in saved:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    # Agrupar por cuenta (DeGiro Transacciones y Estado de Cuenta van a la misma cuenta)
+    by_account = {}
+    for parsed in parsed_files:
+        if parsed.error:
+            mark_failed(parsed.filename, parsed.error)
+            continue
+        debug_log.info(f"{parsed.filename}: formato {parsed.format}, parser {parsed.throughput}")
+        try:
+            account = get_or_create_broker_account(user_id, parsed.format)
+        except Exception as e:
+            db.session.rollback()
+            mark_failed(parsed.filename, str(e))
+            continue
+        by_account.setdefault(account.id, []).append(parsed)
+
+    pending = [p.filename for group in by_account.values() for p in group]
+    for account_id, account_files in by_account.items():
+        names = [p.filename for p in account_files]
+        pending = [f for f in pending if f not in names]
+        current_file = ', '.join(names)
+        debug_log.info(f"--- Cuenta {account_id}: {current_file} ---")
+        set_progress(f'Procesando {current_file}...', current_file=current_file, pending=pending)
+
+        def progress_callback(current, total, message):
+            set_progress(message, current, total, current_file=current_file, pending=pending)
+
+        try:
+            importer = CSVImporterV2(
+                user_id=user_id,
+                broker_account_id=account_id,
+                enable_enrichment=True,
+                failed_enrichment_cache=failed_enrichment_cache
+            )
+            stats = importer.import_batch([p.data for p in account_files], progress_callback=progress_callback)
+        except Exception as e:
+            db.session.rollback()
+            debug_log.error(traceback.format_exc())
+            for name in names:
+                mark_failed(name, str(e))
+            continue
+
+        debug_log.info(f"Stats cuenta {account_id}: {stats}")
+        file_errors = stats.get('file_errors', {})
+        for idx, name in enumerate(names):
+            if idx in file_errors:
+                mark_failed(name, file_errors[idx])
+            else:
+                completed_files.append(name)
+                total_stats['files_processed'] += 1
+        _accumulate_import_stats(total_stats, stats, csv_asset_ids_touched)
@@ -4,19 +4,25 @@ Rutas de transacciones
 from datetime import datetime
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 
 from app.routes import portfolio_bp
 from app import db
 from app.models import BrokerAccount, Asset, Transaction, PortfolioHolding
 from app.forms import ManualTransactionForm
+from app.utils.query_budget import query_budget
 
 @portfolio_bp.route('/transactions')
 @login_required
+@query_budget(20)
 def transactions_list():
     """Lista de transacciones con filtros"""
     
-    # Query base
-    query = Transaction.query.filter_by(user_id=current_user.id)
+    # Query base (activo y cuenta → broker en la misma consulta: la tabla los pinta por fila)
+    query = Transaction.query.options(
+        joinedload(Transaction.asset),
+        joinedload(Transaction.account).joinedload(BrokerAccount.broker),
+    ).filter_by(user_id=current_user.id)
     
     # Aplicar filtros
     filtered = False
@@ -152,7 +158,7 @@ def transactions_list():
     transactions = pagination.items
     
     # Obtener todas las cuentas para el selector
-    accounts = BrokerAccount.query.filter_by(
+    accounts = BrokerAccount.query.options(joinedload(BrokerAccount.broker)).filter_by(
         user_id=current_user.id,
         is_active=True
     ).order_by(BrokerAccount.broker_id, BrokerAccount.account_name).all()
@@ -234,18 +240,14 @@ def transaction_edit(id):
         # Recalcular cuenta antigua si cambió
         if old_account_id != transaction.account_id:
             importer_old = CSVImporterV2(current_user.id, old_account_id)
-            importer_old._recalculate_holdings()
+            importer_old._recalculate_holdings([transaction.asset_id])
         
-        # Recalcular cuenta actual
+        # Recalcular cuenta actual (solo el activo de la transacción)
         importer = CSVImporterV2(current_user.id, transaction.account_id)
-        importer._recalculate_holdings()
+        importer._recalculate_holdings([transaction.asset_id])
         
         db.session.commit()
-        
-        # Encolar rebuild para worker (criterio unificado por fecha)
-        from app.services.cache_rebuild_state_service import CacheRebuildStateService
-        txn_date = transaction.transaction_date.date() if isinstance(transaction.transaction_date, datetime) else transaction.transaction_date
-        CacheRebuildStateService.mark_for_dates(current_user.id, dates=[txn_date])
+        # Rebuild del worker y marcas de evolución/benchmarks: cache_invalidation_bus en el commit
         
         flash('✅ Transacción actualizada correctamente. Holdings recalculados.', 'success')
         return redirect(url_for('portfolio.transactions_list'))
@@ -290,9 +292,9 @@ def transaction_delete(id):
         user_id=current_user.id
     ).first_or_404()
     
-    # Guardar cuenta para recalcular holdings después + fecha para cachés HIST/NOW
+    # Guardar cuenta para recalcular holdings después
     account_id = transaction.account_id
-    txn_date = transaction.transaction_date.date() if isinstance(transaction.transaction_date, datetime) else transaction.transaction_date
+    asset_id = transaction.asset_id
     asset_symbol = transaction.asset.symbol if transaction.asset else transaction.transaction_type
     
     # Eliminar transacción
@@ -302,12 +304,9 @@ def transaction_delete(id):
     # Recalcular holdings de la cuenta afectada
     from app.services.importer_v2 import CSVImporterV2
     importer = CSVImporterV2(current_user.id, account_id)
-    importer._recalculate_holdings()
+    importer._recalculate_holdings([asset_id] if asset_id else [])
     db.session.commit()
-    
-    # Encolar rebuild para worker (criterio unificado por fecha)
-    from app.services.cache_rebuild_state_service import CacheRebuildStateService
-    CacheRebuildStateService.mark_for_dates(current_user.id, dates=[txn_date])
+    # Rebuild del worker y marcas de evolución/benchmarks: cache_invalidation_bus en el commit
     
     flash(f'✅ Transacción de {asset_symbol} eliminada correctamente. Holdings recalculados.', 'success')
     next_url = (request.form.get('next') or '').strip()
@@ -484,11 +483,7 @@ def transaction_new():
                 transaction.realized_pl_pct = (realized_pl / float(cost_basis_of_sale)) * 100
         
         db.session.commit()
-        
-        # Encolar rebuild para worker (criterio unificado por fecha)
-        from app.services.cache_rebuild_state_service import CacheRebuildStateService
-        d = form.transaction_date.data
-        CacheRebuildStateService.mark_for_dates(current_user.id, dates=[d])
+        # Rebuild del worker y marcas de evolución/benchmarks: cache_invalidation_bus en el commit
         
         action_text = 'compra' if form.transaction_type.data == 'BUY' else 'venta'
         flash(f'✅ {form.transaction_type.data} de {form.symbol.data} registrada correctamente', 'success')
@@ -5,6 +5,7 @@ from collections import defaultdict
 from datetime import date, datetime, timedelta
 from flask import render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import contains_eager, joinedload
 
 from app.routes import portfolio_bp
 from app import db, csrf
@@ -12,6 +13,7 @@ from app.models import BrokerAccount, Asset, PortfolioHolding, Watchlist, Watchl
 
 WATCHLIST_COMMENT_MAX_LEN = 16000
 from app.services.currency_service import convert_to_eur
+from app.utils.query_budget import query_budget
 
 
 def _schedule_market_data_after_watchlist_add(asset: Asset) -> None:
@@ -31,6 +33,7 @@ def _schedule_market_data_after_watchlist_add(asset: Asset) -> None:
 
 @portfolio_bp.route('/watchlist')
 @login_required
+@query_budget(40)
 def watchlist():
     """
     Página principal de watchlist con tabla combinada (portfolio holdings + watchlist items)
@@ -38,7 +41,7 @@ def watchlist():
     from collections import defaultdict
     from app.models import Asset
     from app.services.watchlist_service import WatchlistService
-    from app.services.watchlist_metrics_service import WatchlistMetricsService
+    from app.services.watchlist_batch_valuation import recompute_watchlist_metrics
     
     # Obtener configuración de watchlist
     config = WatchlistService.get_or_create_config(current_user.id)
@@ -46,9 +49,14 @@ def watchlist():
     
     # ========== PARTE 1: HOLDINGS EN CARTERA ==========
     # Obtener todos los holdings individuales (igual que dashboard), solo Stock y ETF
+    # Cuenta, broker y activo en la misma consulta (sin lazy-load por fila)
     all_holdings = (
         PortfolioHolding.query
         .join(Asset, PortfolioHolding.asset_id == Asset.id)
+        .options(
+            contains_eager(PortfolioHolding.asset),
+            joinedload(PortfolioHolding.account).joinedload(BrokerAccount.broker),
+        )
         .filter(
             PortfolioHolding.user_id == current_user.id,
             PortfolioHolding.quantity > 0,
@@ -122,6 +130,7 @@ def watchlist():
     
     # ========== PARTE 2: WATCHLIST ITEMS ==========
     watchlist_items = WatchlistService.get_user_watchlist(current_user.id)
+    watchlist_by_asset_id = {w.asset_id: w for w in watchlist_items}
     
     # Obtener asset_ids de holdings para identificar qué assets están en cartera
     holdings_asset_ids = set([h['asset_id'] for h in holdings_unified])
@@ -132,45 +141,35 @@ def watchlist():
     # ========== PARTE 3: COMBINAR Y CALCULAR MÉTRICAS ==========
     # Preparar datos para la tabla combinada
     table_data = []
+    metrics_asset_ids = set()
+    current_values = {}
     
     # Primero: Assets en cartera
     for holding in holdings_unified:
         asset = holding['asset']
         asset_id = asset.id
         
-        # Buscar si tiene item en watchlist
-        watchlist_item = next((w for w in watchlist_items if w.asset_id == asset_id), None)
+        # Buscar si tiene item en watchlist (la lista ya trae todos los del usuario)
+        watchlist_item = watchlist_by_asset_id.get(asset_id)
         
         # Si está en cartera pero no tiene watchlist_item, crear uno automáticamente
         # para que pueda editar métricas
         if not watchlist_item:
-            # Usar get_watchlist_item para verificar si existe (por si acaso)
-            watchlist_item = WatchlistService.get_watchlist_item(current_user.id, asset_id)
-            if not watchlist_item:
-                # Crear nuevo watchlist_item
-                watchlist_item = Watchlist(
-                    user_id=current_user.id,
-                    asset_id=asset_id,
-                    operativa_indicator='-'
-                )
-                db.session.add(watchlist_item)
-                db.session.flush()
-                # Añadir a la lista para evitar duplicados en la siguiente iteración
-                watchlist_items.append(watchlist_item)
+            watchlist_item = Watchlist(
+                user_id=current_user.id,
+                asset_id=asset_id,
+                operativa_indicator='-'
+            )
+            watchlist_item.asset = asset
+            db.session.add(watchlist_item)
+            # Añadir a la lista para evitar duplicados en la siguiente iteración
+            watchlist_items.append(watchlist_item)
+            watchlist_by_asset_id[asset_id] = watchlist_item
         
-        # Actualizar métricas del watchlist item
+        # Métricas con cantidad invertida actual (se recalculan en lote tras el bucle)
         if watchlist_item:
-            # Actualizar precio_actual desde asset si está disponible
-            if asset.current_price is not None:
-                watchlist_item.precio_actual = asset.current_price
-            
-            # Calcular métricas con cantidad invertida actual
-            current_value_eur = holding.get('current_value_eur', 0)
-            WatchlistMetricsService.update_all_metrics(
-                watchlist_item, config, current_value_eur=current_value_eur, asset=asset
-            )
-            
-            db.session.flush()  # Flush para tener datos actualizados
+            metrics_asset_ids.add(asset_id)
+            current_values[asset_id] = holding.get('current_value_eur', 0)
         
         vm = (
             resolve_valuation_mode(asset, config)
@@ -195,15 +194,8 @@ def watchlist():
             if not asset or asset.asset_type not in ('Stock', 'ETF'):
                 continue
             
-            # Actualizar precio_actual desde asset si está disponible
-            if asset.current_price is not None:
-                watchlist_item.precio_actual = asset.current_price
-            
-            # Actualizar métricas (sin cantidad invertida)
-            WatchlistMetricsService.update_all_metrics(
-                watchlist_item, config, current_value_eur=None, asset=asset
-            )
-            db.session.flush()
+            # Métricas sin cantidad invertida
+            metrics_asset_ids.add(asset.id)
             
             vm = resolve_valuation_mode(asset, config)
             table_data.append({
@@ -217,8 +209,16 @@ def watchlist():
                 'valuation_mode': vm,
             })
     
+    # Recalcular métricas de todas las filas en una pasada y un único UPDATE
+    # (los objetos cargados en la sesión quedan sincronizados)
+    recompute_watchlist_metrics(
+        current_user.id, current_values=current_values, asset_ids=metrics_asset_ids
+    )
+    
     # Guardar cambios en BD
     db.session.commit()
+    # El commit expira los objetos: recargar filas y activos en bloque (no uno a uno al renderizar)
+    WatchlistService.get_user_watchlist(current_user.id)
     
     # Fecha actual para comparaciones en el template
     today = date.today()
@@ -329,6 +329,11 @@ def watchlist_update_config():
             color_thresholds=color_thresholds
         )
         
+        # Tier / cantidades / reglas cambian las métricas de todas las filas
+        from app.services.watchlist_batch_valuation import recompute_watchlist_metrics
+        recompute_watchlist_metrics(current_user.id)
+        db.session.commit()
+        
         return jsonify({
             'success': True,
             'message': 'Configuración actualizada correctamente',
@@ -739,12 +744,8 @@ def watchlist_update_prices():
         
         result = WatchlistPriceUpdateService.update_prices_batch(current_user.id)
         
-        # Actualizar métricas calculadas para todos los items
-        from app.services.watchlist_service import WatchlistService
-        from app.services.watchlist_metrics_service import WatchlistMetricsService
-        
-        watchlist_items = WatchlistService.get_user_watchlist(current_user.id)
-        config = WatchlistService.get_or_create_config(current_user.id)
+        # Actualizar métricas calculadas para todos los items (en lote)
+        from app.services.watchlist_batch_valuation import recompute_watchlist_metrics
         
         # Obtener holdings para calcular current_value_eur
         from collections import defaultdict
@@ -763,12 +764,7 @@ def watchlist_update_prices():
                     current_value_eur = cost_eur
                 holdings_by_asset_id[holding.asset_id] = current_value_eur
         
-        for item in watchlist_items:
-            current_value_eur = holdings_by_asset_id.get(item.asset_id)
-            WatchlistMetricsService.update_all_metrics(
-                item, config, current_value_eur=current_value_eur, asset=item.asset
-            )
-        
+        recompute_watchlist_metrics(current_user.id, current_values=holdings_by_asset_id)
         db.session.commit()
         
         return jsonify({
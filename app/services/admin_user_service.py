@@ -15,6 +15,9 @@ from app.models import (
     BankBalance,
     PortfolioHolding,
     Transaction,
+    FifoCheckpoint,
+    MonthlyRollup,
+    UserLedgerVersion,
     CashFlow,
     BrokerAccount,
     Watchlist,
@@ -31,6 +34,7 @@ from app.models import (
     UserDashboardConfig,
     UserLoginLog,
 )
+from app.services import transaction_frame
 from app.models.api_call_log import ApiCallLog
 
 
@@ -70,6 +74,10 @@ def delete_user_and_data(user_id: int) -> tuple[bool, str]:
         for acc in accounts:
             CashFlow.query.filter_by(account_id=acc.id).delete()
             Transaction.query.filter_by(account_id=acc.id).delete()
+        FifoCheckpoint.query.filter_by(user_id=user_id).delete()
+        MonthlyRollup.query.filter_by(user_id=user_id).delete()
+        UserLedgerVersion.query.filter_by(user_id=user_id).delete()
+        transaction_frame.forget([user_id])
         # 9. Cuentas broker
         BrokerAccount.query.filter_by(user_id=user_id).delete()
         # 10. Watchlist y config
@@ -1,23 +1,181 @@
 """
 Registro de llamadas a APIs externas para el panel de administración.
-Retención máxima: 6 meses.
+Retención: filas crudas API_LOG_RAW_RETENTION_DAYS días; rollup diario (api_call_daily) 6 meses.
+
+log_api_call / log_api_calls no escriben en la petición: dejan la entrada en un buffer en
+memoria (acotado a API_LOG_BUFFER_SIZE; lleno, se descartan las más antiguas) y un hilo
+del proceso las inserta en lote cada API_LOG_BATCH_SIZE entradas o API_LOG_FLUSH_SECONDS
+segundos, con su propia conexión: ni commit de la sesión del llamador ni escritura SQLite
+por llamada. Al salir del proceso (cron, CLI) se vacía lo pendiente.
+
+Cada flush suma sus entradas al rollup diario en la misma transacción; las métricas del
+panel agregan sobre el rollup (filas por día y API, no por llamada).
 """
+import atexit
+import logging
+import os
+import threading
+from collections import deque
 from datetime import datetime, date, timedelta
-from typing import Any, Dict, List, Optional
-from sqlalchemy import or_
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import func, or_
 from app import db
-from app.models import ApiCallLog
+from app.models import ApiCallDaily, ApiCallLog
 
 
 RETENTION_MONTHS = 6
 
+logger = logging.getLogger(__name__)
 
-def delete_logs_older_than_retention(months: int = RETENTION_MONTHS) -> int:
-    """Elimina registros más antiguos que el período de retención. Devuelve número de filas borradas."""
-    since = datetime.utcnow() - timedelta(days=months * 31)
-    deleted = ApiCallLog.query.filter(ApiCallLog.called_at < since).delete()
+# Buffer por proceso: (engine, fila) en orden de llegada
+_buffer: deque = deque()
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_dropped = 0
+_flusher_pid: Optional[int] = None
+_settings = {"capacity": 10000, "batch_size": 200, "interval": 5.0}
+
+
+def compact_api_logs(raw_days: Optional[int] = None, months: int = RETENTION_MONTHS) -> Dict[str, int]:
+    """
+    Retención: borra filas crudas de más de `raw_days` días (ya sumadas al rollup al
+    escribirlas) y rollups de más de `months` meses. Devuelve filas borradas de cada tabla.
+    """
+    if raw_days is None:
+        raw_days = current_app.config.get("API_LOG_RAW_RETENTION_DAYS", 31)
+    now = datetime.utcnow()
+    raw_deleted = ApiCallLog.query.filter(ApiCallLog.called_at < now - timedelta(days=raw_days)).delete()
+    daily_deleted = ApiCallDaily.query.filter(
+        ApiCallDaily.day < (now - timedelta(days=months * 31)).date()
+    ).delete()
     db.session.commit()
-    return deleted
+    return {"raw": raw_deleted, "daily": daily_deleted}
+
+
+def status_class(response_status: Optional[int]) -> str:
+    """'2xx', '4xx', '5xx'... o 'none' si no hubo respuesta."""
+    return f"{int(response_status) // 100}xx" if response_status is not None else "none"
+
+
+def _rollup_counts(rows: List[Dict[str, Any]]) -> Dict[Tuple[date, str, str], List[int]]:
+    """{(día, api, clase de status): [llamadas, errores]} de un lote de filas."""
+    counts: Dict[Tuple[date, str, str], List[int]] = {}
+    for row in rows:
+        status = row["response_status"]
+        key = (row["called_at"].date(), row["api_name"], status_class(status))
+        entry = counts.setdefault(key, [0, 0])
+        entry[0] += 1
+        if status != 200:
+            entry[1] += 1
+    return counts
+
+
+def _apply_rollup(conn, rows: List[Dict[str, Any]]) -> None:
+    table = ApiCallDaily.__table__
+    for (day, api_name, cls), (calls, errors) in _rollup_counts(rows).items():
+        result = conn.execute(
+            table.update()
+            .where(table.c.day == day, table.c.api_name == api_name, table.c.status_class == cls)
+            .values(calls=table.c.calls + calls, errors=table.c.errors + errors)
+        )
+        if not result.rowcount:
+            conn.execute(
+                table.insert().values(day=day, api_name=api_name, status_class=cls, calls=calls, errors=errors)
+            )
+
+
+def _start_flusher() -> None:
+    """Arranca el hilo de escritura (uno por proceso; tras fork se arranca otro)."""
+    global _buffer_lock, _flush_lock, _wake, _flusher_pid, _dropped
+    pid = os.getpid()
+    if _flusher_pid is not None:
+        # Proceso hijo: las entradas heredadas las escribe el padre
+        _buffer.clear()
+        _dropped = 0
+        _buffer_lock, _flush_lock, _wake = threading.Lock(), threading.Lock(), threading.Event()
+    config = current_app.config
+    _settings["capacity"] = max(1, int(config.get("API_LOG_BUFFER_SIZE", 10000)))
+    _settings["batch_size"] = max(1, int(config.get("API_LOG_BATCH_SIZE", 200)))
+    _settings["interval"] = float(config.get("API_LOG_FLUSH_SECONDS", 5))
+    _flusher_pid = pid
+    threading.Thread(target=_flusher_loop, name="api-log-flusher", daemon=True).start()
+
+
+def _flusher_loop() -> None:
+    pid = os.getpid()
+    while _flusher_pid == pid:
+        _wake.wait(_settings["interval"])
+        _wake.clear()
+        flush_api_log_buffer()
+
+
+def _enqueue(rows: List[Dict[str, Any]]) -> None:
+    global _dropped
+    if _flusher_pid != os.getpid():
+        _start_flusher()
+    engine = db.engine
+    capacity = _settings["capacity"]
+    with _buffer_lock:
+        for row in rows:
+            if len(_buffer) >= capacity:
+                _buffer.popleft()
+                _dropped += 1
+            _buffer.append((engine, row))
+        full = len(_buffer) >= _settings["batch_size"]
+    if full:
+        _wake.set()
+
+
+def flush_api_log_buffer() -> int:
+    """Inserta en lote lo pendiente del buffer. Devuelve número de filas escritas."""
+    global _dropped
+    with _flush_lock:
+        with _buffer_lock:
+            batch = list(_buffer)
+            _buffer.clear()
+            dropped, _dropped = _dropped, 0
+        if dropped:
+            logger.warning("api_log: buffer lleno, %d entradas descartadas", dropped)
+
+        by_engine: Dict[Any, List[Dict[str, Any]]] = {}
+        for engine, row in batch:
+            by_engine.setdefault(engine, []).append(row)
+        written = 0
+        for engine, rows in by_engine.items():
+            try:
+                with engine.begin() as conn:
+                    conn.execute(ApiCallLog.__table__.insert(), rows)
+                    _apply_rollup(conn, rows)
+                written += len(rows)
+            except Exception as e:
+                # No reintentar: el log no debe acumular presión sobre una BD ocupada
+                logger.warning("api_log: %d entradas descartadas al escribir: %s", len(rows), e)
+        return written
+
+
+atexit.register(flush_api_log_buffer)
+
+
+def _row(
+    api_name: str,
+    endpoint_or_operation: Optional[str],
+    response_status: Optional[int],
+    value_reported: Optional[Dict[str, Any]],
+    user_id: Optional[int],
+    extra: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return {
+        "api_name": api_name,
+        "endpoint_or_operation": endpoint_or_operation,
+        "called_at": datetime.utcnow(),
+        "response_status": response_status,
+        "value_reported": value_reported,
+        "user_id": user_id,
+        "extra": extra,
+    }
 
 
 def log_api_call(
@@ -28,46 +186,52 @@ def log_api_call(
     user_id: Optional[int] = None,
     extra: Optional[Dict[str, Any]] = None,
 ) -> None:
-    """Registra una llamada a una API externa (Yahoo, exchangerate, etc.)."""
+    """Registra una llamada a una API externa (Yahoo, exchangerate, etc.) en el buffer."""
     try:
-        entry = ApiCallLog(
-            api_name=api_name,
-            endpoint_or_operation=endpoint_or_operation,
-            response_status=response_status,
-            value_reported=value_reported,
-            user_id=user_id,
-            extra=extra,
-        )
-        db.session.add(entry)
-        db.session.commit()
+        _enqueue([_row(api_name, endpoint_or_operation, response_status, value_reported, user_id, extra)])
     except Exception:
-        db.session.rollback()
         # No fallar la petición principal si el log falla
         pass
 
 
+def log_api_calls(
+    calls: Iterable[Tuple[str, Optional[str], Optional[Dict[str, Any]]]],
+    user_id: Optional[int] = None,
+    response_status: int = 200,
+) -> None:
+    """Registra varias llamadas (api_name, endpoint, value_reported) en el buffer."""
+    rows = [
+        _row(api_name, endpoint, response_status, value_reported, user_id)
+        for api_name, endpoint, value_reported in calls
+    ]
+    if not rows:
+        return
+    try:
+        _enqueue(rows)
+    except Exception:
+        pass
+
+
 def get_api_metrics(days: int = 30) -> Dict[str, Any]:
     """
     Métricas de llamadas a API: por día, media diaria, por mes, media mensual.
-    days: número de días hacia atrás a considerar.
+    days: número de días hacia atrás a considerar (agregado en SQL sobre api_call_daily).
     """
-    since = datetime.utcnow() - timedelta(days=days)
-    logs = (
-        ApiCallLog.query.filter(ApiCallLog.called_at >= since)
-        .order_by(ApiCallLog.called_at.desc())
-        .all()
-    )
-
-    by_day: Dict[date, int] = {}
-    by_month: Dict[str, int] = {}  # key "YYYY-MM"
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    window = ApiCallDaily.day >= since
 
-    for log in logs:
-        d = log.called_at.date()
-        by_day[d] = by_day.get(d, 0) + 1
+    by_day: Dict[date, int] = {
+        d: int(n)
+        for d, n in db.session.query(ApiCallDaily.day, func.sum(ApiCallDaily.calls))
+        .filter(window)
+        .group_by(ApiCallDaily.day)
+    }
+    by_month: Dict[str, int] = {}  # key "YYYY-MM"
+    for d, n in by_day.items():
         month_key = d.strftime("%Y-%m")
-        by_month[month_key] = by_month.get(month_key, 0) + 1
+        by_month[month_key] = by_month.get(month_key, 0) + n
 
-    total = len(logs)
+    total = sum(by_day.values())
     num_days = len(by_day) or 1
     num_months = len(by_month) or 1
     avg_per_day = round(total / num_days, 1)
@@ -75,8 +239,14 @@ def get_api_metrics(days: int = 30) -> Dict[str, Any]:
 
     # Por API
     by_api: Dict[str, int] = {}
-    for log in logs:
-        by_api[log.api_name] = by_api.get(log.api_name, 0) + 1
+    errors_by_api: Dict[str, int] = {}
+    for api_name, n, errors in (
+        db.session.query(ApiCallDaily.api_name, func.sum(ApiCallDaily.calls), func.sum(ApiCallDaily.errors))
+        .filter(window)
+        .group_by(ApiCallDaily.api_name)
+    ):
+        by_api[api_name] = int(n)
+        errors_by_api[api_name] = int(errors or 0)
 
     return {
         "total_calls": total,
@@ -86,6 +256,7 @@ def get_api_metrics(days: int = 30) -> Dict[str, Any]:
         "calls_per_month": dict(sorted(by_month.items(), reverse=True)),
         "avg_per_day": avg_per_day,
         "by_api": by_api,
+        "errors_by_api": errors_by_api,
     }
 
 
@@ -110,7 +281,7 @@ def get_api_calls_chart_data(days: int = 30) -> Dict[str, List]:
 
 def get_api_names_distinct() -> List[str]:
     """Lista de nombres de API únicos para filtros."""
-    rows = db.session.query(ApiCallLog.api_name).distinct().order_by(ApiCallLog.api_name).all()
+    rows = db.session.query(ApiCallDaily.api_name).distinct().order_by(ApiCallDaily.api_name).all()
     return [r[0] for r in rows if r[0]]
 
 
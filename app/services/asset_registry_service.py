@@ -2,10 +2,12 @@
 Servicio de AssetRegistry - Gestión de cache global de assets
 """
 import requests
-from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
 from app import db
-from app.models import Asset, AssetRegistry
+from app.models import Asset, AssetRegistry, OpenFIGINegativeCache
 from app.services.market_data import AssetEnricher
+from app.services.market_data.config import OPENFIGI_NEGATIVE_CACHE_TTL
 from app.services.market_data.mappers import ExchangeMapper, YahooSuffixMapper
 
 # Timeout para verificación contra Yahoo
@@ -76,18 +78,26 @@ class AssetRegistryService:
         exchange: str = None,
         mic: str = None,
         degiro_exchange: str = None,
-        asset_type: str = 'Stock'
+        asset_type: str = 'Stock',
+        cache: Optional[Dict[str, AssetRegistry]] = None
     ) -> AssetRegistry:
         """
         Obtiene o crea un registro en AssetRegistry desde ISIN
         Si existe, incrementa usage_count
         Si no existe, lo crea con los datos disponibles
         
+        Args:
+            cache: {isin: AssetRegistry} precargado (importación en lote). Si se pasa, no se
+                   consulta la BD por ISIN y los registros nuevos se añaden al dict.
+        
         Returns:
             AssetRegistry instance
         """
         # Buscar en cache
-        registry = AssetRegistry.query.filter_by(isin=isin).first()
+        if cache is not None:
+            registry = cache.get(isin)
+        else:
+            registry = AssetRegistry.query.filter_by(isin=isin).first()
         
         if registry:
             # Existe - actualizar campos si vienen nuevos datos más completos
@@ -147,7 +157,11 @@ class AssetRegistryService:
             self._set_yahoo_suffix(registry, mic, exchange)
         
         db.session.add(registry)
-        db.session.flush()
+        if cache is not None:
+            # Importación en lote: los INSERT se agrupan en el siguiente flush
+            cache[isin] = registry
+        else:
+            db.session.flush()
         
         return registry
     
@@ -175,11 +189,13 @@ class AssetRegistryService:
             if suffix is not None:
                 registry.yahoo_suffix = suffix
     
-    def create_asset_from_registry(self, registry: AssetRegistry, user_id: int = None) -> Asset:
+    def create_asset_from_registry(self, registry: AssetRegistry, user_id: int = None, flush: bool = True) -> Asset:
         """
         Crea un Asset local desde AssetRegistry
         Los Assets son específicos por usuario (por si quieren personalizar nombres)
         pero apuntan al registro global
+        
+        flush=False deja el INSERT para un único flush posterior (creación en lote).
         """
         asset = Asset(
             symbol=registry.symbol,
@@ -194,7 +210,8 @@ class AssetRegistryService:
         )
         
         db.session.add(asset)
-        db.session.flush()
+        if flush:
+            db.session.flush()
         
         return asset
     
@@ -241,48 +258,146 @@ class AssetRegistryService:
                 degiro_mic=registry.mic
             )
             
-            if not enriched_data or not enriched_data.get('symbol'):
-                return False, "OpenFIGI no devolvió symbol"
-            
-            # Actualizar symbol si viene
-            if enriched_data.get('symbol'):
-                registry.symbol = enriched_data['symbol']
-            
-            # Actualizar name si viene y es mejor que el actual
-            if enriched_data.get('name'):
-                if not registry.name or len(enriched_data['name']) > len(registry.name or ''):
-                    registry.name = enriched_data['name']
-            
-            # Actualizar asset_type
-            registry.asset_type = enriched_data.get('asset_type', registry.asset_type)
-            
-            # MIC: Actualizar si OpenFIGI lo proporciona y es válido
-            openfigi_mic = enriched_data.get('mic')
-            if openfigi_mic and openfigi_mic != 'N/A' and openfigi_mic.strip():
-                registry.mic = openfigi_mic
-                print(f"   ✅ MIC obtenido: {openfigi_mic}")
-            
-            # ibkr_exchange: Actualizar si OpenFIGI lo proporciona
-            if enriched_data.get('exchange'):
-                registry.ibkr_exchange = enriched_data['exchange']
-            elif not registry.ibkr_exchange and registry.degiro_exchange:
-                registry.ibkr_exchange = ExchangeMapper.degiro_to_unified(registry.degiro_exchange)
-            
-            # yahoo_suffix: Recalcular con prioridad MIC > exchange
-            self._set_yahoo_suffix(registry, registry.mic, registry.ibkr_exchange)
-            
-            # Marcar como enriquecido si ahora tiene symbol
-            if registry.symbol:
-                registry.mark_as_enriched('OPENFIGI')
+            result = self._apply_openfigi_data(registry, enriched_data)
+            if result[0]:
+                self.clear_negative_cache([registry.isin])
             
             if update_db:
                 db.session.commit()
             
-            return True, f"✅ {registry.symbol}"
+            return result
         
         except Exception as e:
             return False, f"❌ Error: {str(e)[:50]}"
     
+    def enrich_many_from_openfigi(
+        self,
+        registries: List[AssetRegistry],
+        update_db: bool = True
+    ) -> Dict[str, Tuple[bool, str]]:
+        """
+        Enriquece varios AssetRegistry con OpenFIGI en lote (pocas requests)
+        
+        Los ISINs que OpenFIGI no reconoce se guardan en la cache negativa; los que fallan
+        por red o rate limit no (se reintentarán en la siguiente importación).
+        
+        Args:
+            registries: Registros a enriquecer
+            update_db: Si True, guarda cambios en BD
+            
+        Returns:
+            Dict {isin: (success, message)}
+        """
+        enriched = self.enricher.enrich_many_from_isin([
+            {
+                'isin': registry.isin,
+                'currency': registry.currency,
+                'degiro_exchange': registry.degiro_exchange,
+                'degiro_mic': registry.mic,
+            }
+            for registry in registries
+        ])
+        
+        results = {}
+        not_found = []
+        for registry in registries:
+            enriched_data = enriched.get(registry.isin)
+            try:
+                results[registry.isin] = self._apply_openfigi_data(registry, enriched_data)
+            except Exception as e:
+                results[registry.isin] = (False, f"❌ Error: {str(e)[:50]}")
+            if enriched_data and enriched_data.get('source') == 'Manual':
+                not_found.append(registry.isin)
+        
+        self.clear_negative_cache([isin for isin, (success, _) in results.items() if success])
+        self.record_negative_cache(not_found, "OpenFIGI: No identifier found")
+        
+        if update_db:
+            db.session.commit()
+        
+        return results
+    
+    def _apply_openfigi_data(self, registry: AssetRegistry, enriched_data: Optional[Dict]) -> Tuple[bool, str]:
+        """Vuelca en el registro los datos de AssetEnricher.enrich_from_isin (sin commit)"""
+        if not enriched_data or not enriched_data.get('symbol'):
+            return False, "OpenFIGI no devolvió symbol"
+        
+        # Actualizar symbol si viene
+        if enriched_data.get('symbol'):
+            registry.symbol = enriched_data['symbol']
+        
+        # Actualizar name si viene y es mejor que el actual
+        if enriched_data.get('name'):
+            if not registry.name or len(enriched_data['name']) > len(registry.name or ''):
+                registry.name = enriched_data['name']
+        
+        # Actualizar asset_type
+        registry.asset_type = enriched_data.get('asset_type', registry.asset_type)
+        
+        # MIC: Actualizar si OpenFIGI lo proporciona y es válido
+        openfigi_mic = enriched_data.get('mic')
+        if openfigi_mic and openfigi_mic != 'N/A' and openfigi_mic.strip():
+            registry.mic = openfigi_mic
+            print(f"   ✅ MIC obtenido: {openfigi_mic}")
+        
+        # ibkr_exchange: Actualizar si OpenFIGI lo proporciona
+        if enriched_data.get('exchange'):
+            registry.ibkr_exchange = enriched_data['exchange']
+        elif not registry.ibkr_exchange and registry.degiro_exchange:
+            registry.ibkr_exchange = ExchangeMapper.degiro_to_unified(registry.degiro_exchange)
+        
+        # yahoo_suffix: Recalcular con prioridad MIC > exchange
+        self._set_yahoo_suffix(registry, registry.mic, registry.ibkr_exchange)
+        
+        # Marcar como enriquecido si ahora tiene symbol
+        if registry.symbol:
+            registry.mark_as_enriched('OPENFIGI')
+        
+        return True, f"✅ {registry.symbol}"
+    
+    @staticmethod
+    def negative_cached_isins(isins: List[str]) -> Set[str]:
+        """ISINs con entrada vigente en la cache negativa de OpenFIGI"""
+        if not isins:
+            return set()
+        rows = db.session.query(OpenFIGINegativeCache.isin).filter(
+            OpenFIGINegativeCache.isin.in_(set(isins)),
+            OpenFIGINegativeCache.expires_at > datetime.utcnow(),
+        )
+        return {isin for (isin,) in rows}
+    
+    @staticmethod
+    def record_negative_cache(isins: List[str], reason: str, ttl_seconds: int = OPENFIGI_NEGATIVE_CACHE_TTL) -> None:
+        """Añade (o renueva) ISINs en la cache negativa durante `ttl_seconds` (sin commit)"""
+        if not isins:
+            return
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        existing = {
+            row.isin: row
+            for row in OpenFIGINegativeCache.query.filter(OpenFIGINegativeCache.isin.in_(set(isins)))
+        }
+        for isin in dict.fromkeys(isins):
+            row = existing.get(isin)
+            if row is None:
+                db.session.add(OpenFIGINegativeCache(
+                    isin=isin, reason=reason[:200], attempts=1, failed_at=now, expires_at=expires_at
+                ))
+            else:
+                row.reason = reason[:200]
+                row.attempts = (row.attempts or 0) + 1
+                row.failed_at = now
+                row.expires_at = expires_at
+    
+    @staticmethod
+    def clear_negative_cache(isins: List[str]) -> None:
+        """Elimina ISINs de la cache negativa (p. ej. tras enriquecerlos con éxito; sin commit)"""
+        if not isins:
+            return
+        OpenFIGINegativeCache.query.filter(
+            OpenFIGINegativeCache.isin.in_(set(isins))
+        ).delete(synchronize_session=False)
+    
     def enrich_from_yahoo_url(
         self,
         registry: AssetRegistry,
@@ -0,0 +1,70 @@
+"""
+Importación por lotes de varios CSV de broker.
+
+El parseo de cada archivo (csv + Decimal, solo CPU) se ejecuta en un proceso del pool. La
+fusión, el filtrado de duplicados y la escritura en BD se hacen después en el proceso
+principal, en serie por cuenta de broker (SQLite admite un único escritor) y con un solo
+recálculo de holdings por cuenta: CSVImporterV2.import_batch().
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from app.services.csv_detector import detect_parser
+
+
+@dataclass
+class ParsedFile:
+    """Resultado de parsear un archivo (viaja del proceso del pool al principal)"""
+    filename: str
+    format: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+    throughput: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def parse_file(filename: str, file_path: str) -> ParsedFile:
+    """Detecta el formato y parsea un archivo. Corre en el pool: sin BD ni app context."""
+    try:
+        format_type, parser = detect_parser(file_path)
+        data = parser.parse(file_path)
+        data['format'] = format_type
+        return ParsedFile(filename, format_type, data, parser.throughput.as_dict())
+    except Exception as e:
+        return ParsedFile(filename, error=str(e))
+
+
+class BatchImportService:
+    """Parseo en paralelo de varios CSV para importarlos por cuenta de broker"""
+
+    @staticmethod
+    def parse_workers(file_count: int) -> int:
+        """Procesos a usar: IMPORT_PARSE_WORKERS (0 = núcleos), nunca más que archivos"""
+        configured = current_app.config.get('IMPORT_PARSE_WORKERS', 0)
+        workers = configured or os.cpu_count() or 1
+        return max(1, min(workers, file_count))
+
+    @staticmethod
+    def parse_files(files: List[Tuple[str, str]], max_workers: Optional[int] = None) -> List[ParsedFile]:
+        """
+        Parsea [(filename, ruta)] en paralelo y devuelve los resultados en el mismo orden.
+
+        Un archivo que falla no interrumpe el resto: su ParsedFile lleva `error`.
+        Con un solo archivo o un solo proceso se parsea en el propio proceso.
+        """
+        if max_workers is None:
+            max_workers = BatchImportService.parse_workers(len(files))
+        if max_workers <= 1 or len(files) <= 1:
+            return [parse_file(filename, path) for filename, path in files]
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            # spawn: los procesos no heredan conexiones SQLite ni locks del hilo de la petición
+            mp_context=multiprocessing.get_context('spawn'),
+        ) as pool:
+            futures = [pool.submit(parse_file, filename, path) for filename, path in files]
+            return [future.result() for future in futures]
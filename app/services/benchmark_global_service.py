@@ -1,18 +1,66 @@
 """
 Mantenimiento global de series diarias de benchmarks (Yahoo una vez para todos los usuarios).
 NOW intradía sigue en `benchmark_global_quote` + price-poll-one.
+
+Los cierres se guardan por día en `benchmark_global_daily_point` y se leen como arrays
+(ordinales int32 + cierres float64) cacheados por proceso y por `daily_data_version`: cada
+benchmark se carga una vez por versión, y recortar la serie por la fecha de inicio de un
+usuario es una búsqueda binaria (np.searchsorted) sobre ese array.
 """
 from __future__ import annotations
 
 from datetime import date, datetime, timedelta
-from typing import Any
+from threading import Lock
+from typing import Any, NamedTuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert
 
 from app import db
-from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalState
+from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalDailyPoint, BenchmarkGlobalState
 from app.models.user import User
 from app.services.metrics.benchmark_comparison import BENCHMARKS, BenchmarkComparisonService
 
 
+class DailySeries(NamedTuple):
+    """Serie de cierres ordenada por día."""
+    days: np.ndarray  # date.toordinal(), int32 ascendente
+    closes: np.ndarray  # float64
+    iso: list[str]  # fechas ISO de `days`, para la salida JSON
+
+    @staticmethod
+    def from_rows(rows) -> "DailySeries":
+        rows = list(rows)
+        days = np.fromiter((r[0] for r in rows), dtype=np.int32, count=len(rows))
+        closes = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        iso = [date.fromordinal(int(d)).strftime("%Y-%m-%d") for d in days.tolist()]
+        return DailySeries(days, closes, iso)
+
+    def points_from(self, start: date) -> list[dict[str, Any]]:
+        """Puntos {'date', 'price'} desde `start` (incluido)."""
+        i = int(np.searchsorted(self.days, start.toordinal(), side="left"))
+        return [{"date": d, "price": p} for d, p in zip(self.iso[i:], self.closes[i:].tolist())]
+
+
+# Series por proceso: {benchmark_name: DailySeries} válidas para `_series_version`
+_series_cache: dict[str, DailySeries] = {}
+_series_version: int | None = None
+_series_lock = Lock()
+
+
+def _points_by_day(points: list[dict[str, Any]] | None) -> dict[int, float]:
+    """Puntos de Yahoo ({'date': 'YYYY-MM-DD', 'price'}) a {ordinal: cierre}; el último gana."""
+    out: dict[int, float] = {}
+    for p in points or []:
+        d, price = p.get("date"), p.get("price")
+        if not d or price is None:
+            continue
+        if not isinstance(d, date):
+            d = datetime.strptime(str(d)[:10], "%Y-%m-%d").date()
+        out[d.toordinal()] = float(price)
+    return out
+
+
 class BenchmarkGlobalService:
     """Serie diaria HIST compartida; cada usuario recorta por su fecha de inicio."""
 
@@ -26,20 +74,53 @@ class BenchmarkGlobalService:
         return BenchmarkComparisonService(row[0])
 
     @staticmethod
-    def _merge_point_maps(
-        existing_points: list[dict[str, Any]],
-        new_points: list[dict[str, Any]],
-    ) -> list[dict[str, Any]]:
-        by_date: dict[str, dict[str, Any]] = {}
-        for p in existing_points or []:
-            d = p.get("date")
-            if d:
-                by_date[str(d)] = dict(p)
-        for p in new_points or []:
-            d = p.get("date")
-            if d:
-                by_date[str(d)] = dict(p)
-        return [by_date[k] for k in sorted(by_date.keys())]
+    def _last_day(name: str) -> int | None:
+        return db.session.query(func.max(BenchmarkGlobalDailyPoint.day)).filter_by(benchmark_name=name).scalar()
+
+    @staticmethod
+    def _write_points(name: str, by_day: dict[int, float], replace: bool = False) -> None:
+        """Inserta cierres (sin commit). Los días ya guardados se sustituyen; replace=True borra la serie."""
+        stmt = delete(BenchmarkGlobalDailyPoint).where(BenchmarkGlobalDailyPoint.benchmark_name == name)
+        if not replace:
+            stmt = stmt.where(BenchmarkGlobalDailyPoint.day.in_(list(by_day)))
+        db.session.execute(stmt)
+        db.session.execute(
+            insert(BenchmarkGlobalDailyPoint),
+            [{"benchmark_name": name, "day": day, "close": close} for day, close in sorted(by_day.items())],
+        )
+
+    @staticmethod
+    def get_series(name: str, version: int | None = None) -> DailySeries | None:
+        """Serie completa del benchmark (cacheada en el proceso mientras no cambie la versión)."""
+        global _series_version
+        if version is None:
+            version = BenchmarkGlobalService.get_daily_data_version()
+        with _series_lock:
+            if _series_version != version:
+                _series_cache.clear()
+                _series_version = version
+            series = _series_cache.get(name)
+        if series is not None:
+            return series
+
+        rows = (
+            db.session.query(BenchmarkGlobalDailyPoint.day, BenchmarkGlobalDailyPoint.close)
+            .filter(BenchmarkGlobalDailyPoint.benchmark_name == name)
+            .order_by(BenchmarkGlobalDailyPoint.day)
+        )
+        series = DailySeries.from_rows(rows)
+        if not len(series.days):
+            return None
+        with _series_lock:
+            if _series_version == version:
+                _series_cache[name] = series
+        return series
+
+    @staticmethod
+    def last_closes(name: str, count: int = 2) -> list[float]:
+        """Últimos `count` cierres del benchmark (más antiguo primero)."""
+        series = BenchmarkGlobalService.get_series(name)
+        return series.closes[-count:].tolist() if series is not None else []
 
     @staticmethod
     def get_daily_data_version() -> int:
@@ -77,46 +158,46 @@ class BenchmarkGlobalService:
             if not need:
                 continue
 
-            points = list(row.data_points) if row and row.data_points else []
+            last_day = BenchmarkGlobalService._last_day(name)
 
-            if force or not points:
+            if force or last_day is None:
                 new_data = bc.get_benchmark_historical_data(
                     ticker, BenchmarkGlobalService.FIXED_GLOBAL_START, end_date=today
                 )
-                if not new_data or not new_data.get("data_points"):
+                by_day = _points_by_day(new_data.get("data_points") if new_data else None)
+                if not by_day:
                     continue
-                merged = new_data["data_points"]
+                BenchmarkGlobalService._write_points(name, by_day, replace=True)
             else:
-                last_d: str | None = None
-                for p in reversed(points):
-                    if p.get("date"):
-                        last_d = str(p["date"])
-                        break
-                if last_d and last_d >= today_str:
-                    if row.hist_end_date != last_d:
-                        row.hist_end_date = last_d
+                last_d = date.fromordinal(last_day)
+                last_str = last_d.strftime("%Y-%m-%d")
+                if last_str >= today_str:
+                    if row is not None and row.hist_end_date != last_str:
+                        row.hist_end_date = last_str
                         row.updated_at = datetime.utcnow()
                         meta_fix = True
                     continue
-                start_fetch = datetime.strptime(last_d, "%Y-%m-%d").date() + timedelta(days=1)
+                start_fetch = last_d + timedelta(days=1)
                 if start_fetch > today:
                     continue
                 new_data = bc.get_benchmark_historical_data(ticker, start_fetch, end_date=today)
-                if not new_data or not new_data.get("data_points"):
+                by_day = _points_by_day(new_data.get("data_points") if new_data else None)
+                if not by_day:
                     continue
-                merged = BenchmarkGlobalService._merge_point_maps(points, new_data["data_points"])
+                # Días nuevos al final de la serie: solo INSERT de esos días
+                BenchmarkGlobalService._write_points(name, by_day)
 
+            end_day = max(by_day) if last_day is None or force else max(last_day, max(by_day))
+            hist_end_date = date.fromordinal(end_day).strftime("%Y-%m-%d")
             if row:
                 row.yahoo_ticker = ticker
-                row.data_points = merged
-                row.hist_end_date = merged[-1]["date"] if merged else today_str
+                row.hist_end_date = hist_end_date
                 row.updated_at = datetime.utcnow()
             else:
                 row = BenchmarkGlobalDaily(
                     benchmark_name=name,
                     yahoo_ticker=ticker,
-                    data_points=merged,
-                    hist_end_date=merged[-1]["date"] if merged else today_str,
+                    hist_end_date=hist_end_date,
                     updated_at=datetime.utcnow(),
                 )
                 db.session.add(row)
@@ -131,18 +212,21 @@ class BenchmarkGlobalService:
 
     @staticmethod
     def get_sliced_daily_for_user(user_id: int) -> dict[str, Any]:
-        """Recorte de la serie global desde la fecha de inicio del portfolio del usuario."""
+        """
+        Recorte de la serie global desde la fecha de inicio del portfolio del usuario.
+        Las listas devueltas son nuevas en cada llamada (el llamador puede modificarlas).
+        """
         svc = BenchmarkComparisonService(user_id)
         start = svc.start_date
         if not start:
             return {}
-        start_str = start.strftime("%Y-%m-%d")
+        version = BenchmarkGlobalService.get_daily_data_version()
         out: dict[str, Any] = {}
         for name, ticker in BENCHMARKS.items():
-            row = BenchmarkGlobalDaily.query.filter_by(benchmark_name=name).first()
-            if not row or not row.data_points:
+            series = BenchmarkGlobalService.get_series(name, version)
+            if series is None:
                 continue
-            pts = [p for p in row.data_points if p.get("date") and str(p["date"]) >= start_str]
+            pts = series.points_from(start)
             if pts:
                 out[name] = {"ticker": ticker, "data_points": pts}
         return out
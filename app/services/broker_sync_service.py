@@ -21,6 +21,20 @@ def _broker_account_ids(user_id):
     ).all()
 
 
+def broker_account_names(user_id):
+    """Dict {account_id: broker_name} de las cuentas IBKR/DeGiro del usuario."""
+    rows = db.session.query(BrokerAccount.id, Broker.name).join(
+        Broker, BrokerAccount.broker_id == Broker.id
+    ).filter(
+        BrokerAccount.user_id == user_id,
+        db.or_(
+            db.func.upper(Broker.name) == 'IBKR',
+            db.func.lower(Broker.name).like('%degiro%')
+        )
+    ).all()
+    return {r[0]: r[1] for r in rows}
+
+
 def get_broker_withdrawals_by_month(user_id, year, month):
     """Suma de WITHDRAWAL (broker→banco) en EUR para el mes. Es ingreso."""
     account_ids = [r[0] for r in _broker_account_ids(user_id)]
@@ -49,20 +63,10 @@ def get_broker_withdrawals_by_month(user_id, year, month):
 
 def get_broker_deposits_by_month(user_id, year, month):
     """Dict {broker_name: amount_eur} para DEPOSIT en el mes. Son gastos."""
-    account_ids = db.session.query(BrokerAccount.id, Broker.name).join(
-        Broker, BrokerAccount.broker_id == Broker.id
-    ).filter(
-        BrokerAccount.user_id == user_id,
-        db.or_(
-            db.func.upper(Broker.name) == 'IBKR',
-            db.func.lower(Broker.name).like('%degiro%')
-        )
-    ).all()
-    if not account_ids:
+    acc_to_broker = broker_account_names(user_id)
+    if not acc_to_broker:
         return {}
 
-    acc_to_broker = {r[0]: r[1] for r in account_ids}
-
     txns = Transaction.query.filter(
         Transaction.user_id == user_id,
         Transaction.account_id.in_(acc_to_broker.keys()),
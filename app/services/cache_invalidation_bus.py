@@ -0,0 +1,228 @@
+"""
+Cache Invalidation Bus - Marcas de las cachés derivadas, una sola vez por commit
+
+Las cachés JSON por usuario (dashboard, evolución, benchmarks) y los flags del worker
+(cache_rebuild_state) se marcaban desde cada ruta después de su commit: un commit y una
+reescritura del JSON por llamada, y alguna caché se quedaba sin marcar (editar una
+transacción no marcaba evolución ni benchmarks, así que el worker servía el snapshot viejo).
+
+Aquí los cambios se recogen con eventos de sesión:
+- before_flush: Transaction, Income, Expense y BankBalance nuevos, borrados o modificados
+  (fecha/mes actual y previo) y Asset con current_price cambiado.
+- do_orm_execute: UPDATE masivos de Asset por clave primaria con current_price
+  (session.execute(update(Asset), filas) de los actualizadores de precios).
+
+Se acumulan por usuario durante la transacción y en before_commit cada caché afectada recibe
+una única marca, sin commit propio: viaja en el mismo commit que los datos. Un rollback
+descarta lo pendiente.
+
+Qué marca cada cambio (mismo criterio que los antiguos touch_for_dates / mark_for_dates:
+alguna fecha o mes pasado => HIST completo; solo hoy / mes actual => NOW):
+- LEDGER (Transaction): flags del worker, evolución y benchmarks
+- CASHFLOW (Income, Expense): dashboard
+- BANK (BankBalance): flags del worker y dashboard
+- Precios (Asset.current_price): NOW de evolución y benchmarks de quien tenga el activo
+
+Las escrituras que no pasan por la sesión ORM (INSERT Core del importador, query.delete)
+publican con `publish()` antes del commit.
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app import db
+from app.models import Asset, BankBalance, Expense, Income, PortfolioHolding, Transaction
+
+LEDGER = 'ledger'
+CASHFLOW = 'cashflow'
+BANK = 'bank'
+
+_SESSION_KEY = '_cache_invalidation_pending'
+_registered = False
+
+# Columnas de Transaction que cambian posiciones, cash o flujos (realized_pl, notas... no)
+_LEDGER_COLUMNS = (
+    'user_id', 'account_id', 'asset_id', 'transaction_type', 'transaction_date',
+    'quantity', 'price', 'amount', 'currency', 'commission', 'fees', 'tax',
+)
+
+
+class PendingChanges:
+    """Cambios de una transacción: fechas y meses por (usuario, tipo) y activos con precio nuevo."""
+
+    def __init__(self):
+        self.dates: Dict[Tuple[int, str], Set[date]] = {}
+        self.month_refs: Dict[Tuple[int, str], Set[Tuple[int, int]]] = {}
+        self.asset_ids: Set[int] = set()
+
+    def add(self, user_id: int, kind: str, dates: Iterable = (), month_refs: Iterable = ()) -> None:
+        key = (user_id, kind)
+        bucket = self.dates.setdefault(key, set())
+        for d in dates:
+            if isinstance(d, datetime):
+                d = d.date()
+            if isinstance(d, date):
+                bucket.add(d)
+        self.month_refs.setdefault(key, set()).update(
+            (int(y), int(m)) for y, m in month_refs if y is not None and m is not None
+        )
+
+    def user_ids(self) -> Set[int]:
+        return {user_id for user_id, _ in self.dates}
+
+    def dates_for(self, user_id: int, *kinds: str) -> Set[date]:
+        return set().union(*(self.dates.get((user_id, k), ()) for k in kinds))
+
+    def month_refs_for(self, user_id: int, *kinds: str) -> Set[Tuple[int, int]]:
+        return set().union(*(self.month_refs.get((user_id, k), ()) for k in kinds))
+
+    def __bool__(self) -> bool:
+        return bool(self.dates or self.asset_ids)
+
+
+def _pending(session) -> PendingChanges:
+    pending = session.info.get(_SESSION_KEY)
+    if pending is None:
+        pending = session.info[_SESSION_KEY] = PendingChanges()
+    return pending
+
+
+def publish(
+    user_id: int,
+    kind: str,
+    dates: Optional[Iterable] = None,
+    month_refs: Optional[Iterable] = None,
+) -> None:
+    """Registra un cambio hecho fuera de la sesión ORM; se aplica en el próximo commit."""
+    _pending(db.session).add(user_id, kind, dates or (), month_refs or ())
+
+
+def publish_prices(asset_ids: Iterable[int]) -> None:
+    """Registra activos con precio nuevo escritos fuera de la sesión ORM."""
+    _pending(db.session).asset_ids.update(a for a in asset_ids if a is not None)
+
+
+# ----------------------------------------------------------------------
+# Recogida en flush / execute
+# ----------------------------------------------------------------------
+
+def _versions(state, columns) -> Tuple[dict, dict]:
+    """Valores actuales y previos (antes del flush) de las columnas indicadas."""
+    current = {c: getattr(state.obj(), c) for c in columns}
+    previous = {}
+    for c in columns:
+        history = state.attrs[c].history
+        previous[c] = history.deleted[0] if history.deleted else current[c]
+    return current, previous
+
+
+def _record(pending: PendingChanges, obj, state, changed_only: bool) -> None:
+    if isinstance(obj, Transaction):
+        if changed_only and not any(state.attrs[c].history.has_changes() for c in _LEDGER_COLUMNS):
+            return
+        for values in _versions(state, ('user_id', 'transaction_date')):
+            if values['user_id'] is not None:
+                pending.add(values['user_id'], LEDGER, dates=[values['transaction_date']])
+    elif isinstance(obj, (Income, Expense)):
+        for values in _versions(state, ('user_id', 'date')):
+            if values['user_id'] is not None:
+                pending.add(values['user_id'], CASHFLOW, dates=[values['date']])
+    elif isinstance(obj, BankBalance):
+        for values in _versions(state, ('user_id', 'year', 'month')):
+            if values['user_id'] is not None:
+                pending.add(values['user_id'], BANK, month_refs=[(values['year'], values['month'])])
+    elif isinstance(obj, Asset):
+        if not changed_only or state.attrs['current_price'].history.has_changes():
+            pending.asset_ids.add(obj.id)
+
+
+def _collect_changes(session, flush_context, instances) -> None:
+    watched = (Transaction, Income, Expense, BankBalance)
+    pending = _pending(session)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, watched):
+            _record(pending, obj, db.inspect(obj), changed_only=False)
+    for obj in session.dirty:
+        if isinstance(obj, watched + (Asset,)) and session.is_modified(obj, include_collections=False):
+            _record(pending, obj, db.inspect(obj), changed_only=True)
+
+
+def _collect_bulk_prices(orm_execute_state) -> None:
+    if not orm_execute_state.is_update:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Asset:
+        return
+    params = orm_execute_state.parameters
+    rows = [params] if isinstance(params, dict) else (params or ())
+    asset_ids = [row.get('id') for row in rows if 'current_price' in row]
+    if asset_ids:
+        _pending(orm_execute_state.session).asset_ids.update(a for a in asset_ids if a is not None)
+
+
+# ----------------------------------------------------------------------
+# Aplicación en before_commit
+# ----------------------------------------------------------------------
+
+def _holders(asset_ids: Set[int]) -> Set[int]:
+    rows = (
+        db.session.query(PortfolioHolding.user_id)
+        .filter(PortfolioHolding.asset_id.in_(asset_ids), PortfolioHolding.quantity > 0)
+        .distinct()
+    )
+    return {row[0] for row in rows}
+
+
+def apply_changes(pending: PendingChanges) -> None:
+    """Una marca por caché y usuario (sin commit)."""
+    from app.services.cache_rebuild_state_service import CacheRebuildStateService, classify_dates
+    from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+    from app.services.portfolio_benchmarks_cache import PortfolioBenchmarksCacheService
+    from app.services.portfolio_evolution_cache import PortfolioEvolutionCacheService
+
+    price_users = _holders(pending.asset_ids) if pending.asset_ids else set()
+    local_today = datetime.now().date()  # Evolución/benchmarks usan la fecha local
+
+    for user_id in sorted(pending.user_ids() | price_users):
+        CacheRebuildStateService.mark_for_dates(
+            user_id,
+            dates=pending.dates_for(user_id, LEDGER),
+            month_refs=pending.month_refs_for(user_id, BANK),
+            commit=False,
+        )
+
+        past, current = classify_dates(pending.dates_for(user_id, LEDGER), today=local_today)
+        if past or current or user_id in price_users:
+            PortfolioEvolutionCacheService.mark_dirty(user_id, full_rebuild=past)
+            PortfolioBenchmarksCacheService.mark_dirty(user_id, full_rebuild=past)
+
+        past, current = classify_dates(
+            pending.dates_for(user_id, CASHFLOW), pending.month_refs_for(user_id, BANK)
+        )
+        if past or current:
+            DashboardSummaryCacheService.mark_dirty(user_id, full_rebuild=past)
+
+
+def _before_commit(session) -> None:
+    # Lo que siga en memoria se recoge ahora; las marcas las escribe el flush del commit
+    session.flush()
+    pending = session.info.pop(_SESSION_KEY, None)
+    if pending:
+        apply_changes(pending)
+
+
+def _after_rollback(session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+def register_cache_invalidation_bus(db) -> None:
+    """Registra los hooks que recogen cambios y marcan las cachés derivadas al hacer commit."""
+    global _registered
+    if _registered:
+        return
+    from sqlalchemy import event
+
+    event.listen(db.session, 'before_flush', _collect_changes)
+    event.listen(db.session, 'do_orm_execute', _collect_bulk_prices)
+    event.listen(db.session, 'before_commit', _before_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+    _registered = True
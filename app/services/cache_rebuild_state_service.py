@@ -1,17 +1,82 @@
 """
 Orquestación de flags pendientes de rebuild de cachés (HIST/NOW).
 
-Regla:
+Reglas:
 - FULL domina NOW
-- El worker procesa como máximo 1 usuario por ciclo
+- Una fila por usuario: marcas repetidas sobre una entrada pendiente no escriben nada
+- Orden de la cola: usuarios con sesión abierta, luego NOW antes que FULL, luego antigüedad
+- Un worker reclama la fila (claimed_at) y limpia sus flags; las marcas que llegan mientras
+  procesa vuelven a dejarla pendiente para la siguiente pasada
 """
 from __future__ import annotations
 
-from datetime import date, datetime
+import time
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import NamedTuple
+
+from flask import current_app
+from sqlalchemy import case, func
+from sqlalchemy.exc import SQLAlchemyError
 
 from app import db
 from app.models.cache_rebuild_state import CacheRebuildState
 
+# Segundos mínimos entre dos escrituras de last_seen_at del mismo usuario (por proceso)
+_SEEN_THROTTLE_SECONDS = 60
+_seen_at: dict[int, float] = {}
+_seen_lock = Lock()
+
+
+class RebuildJob(NamedTuple):
+    """Entrada reclamada por un worker."""
+    user_id: int
+    action: str  # "full" | "now"
+    requested_at: datetime
+    claimed_at: datetime
+
+
+def classify_dates(dates=None, month_refs=None, today: date | None = None) -> tuple[bool, bool]:
+    """
+    (alguna fecha/mes pasado, alguna fecha hoy / mes actual). Fechas futuras no cuentan;
+    meses distintos del actual cuentan como pasados.
+    """
+    today = today or datetime.utcnow().date()
+    any_past = False
+    any_today_or_current = False
+
+    if dates:
+        for d in dates:
+            if isinstance(d, datetime):
+                d = d.date()
+            if not isinstance(d, date):
+                continue
+            if d < today:
+                any_past = True
+            elif d == today:
+                any_today_or_current = True
+
+    if month_refs:
+        for year, month in month_refs:
+            try:
+                year = int(year)
+                month = int(month)
+            except (TypeError, ValueError):
+                continue
+            if year == today.year and month == today.month:
+                any_today_or_current = True
+            else:
+                any_past = True
+
+    return any_past, any_today_or_current
+
+
+def _percentile(values: list[int], pct: float) -> int | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct * (len(values) - 1))))]
+
 
 class CacheRebuildStateService:
     @staticmethod
@@ -29,82 +94,224 @@ class CacheRebuildStateService:
         return row
 
     @staticmethod
-    def mark_full_history(user_id: int) -> None:
+    def mark_full_history(user_id: int, commit: bool = True) -> None:
         row = CacheRebuildStateService._get_or_create(user_id)
-        row.pending_full_history = True
-        row.pending_now = False
-        row.updated_at = datetime.utcnow()
-        db.session.commit()
+        if not row.pending_full_history:
+            now = datetime.utcnow()
+            if not row.pending_now:
+                row.requested_at = now
+            row.pending_full_history = True
+            row.pending_now = False
+            row.updated_at = now
+        if commit:
+            db.session.commit()
 
     @staticmethod
-    def mark_now(user_id: int) -> None:
+    def mark_now(user_id: int, commit: bool = True) -> None:
         row = CacheRebuildStateService._get_or_create(user_id)
-        if not row.pending_full_history:
+        if not row.pending_full_history and not row.pending_now:
+            now = datetime.utcnow()
             row.pending_now = True
-        row.updated_at = datetime.utcnow()
-        db.session.commit()
+            row.requested_at = now
+            row.updated_at = now
+        if commit:
+            db.session.commit()
 
     @staticmethod
-    def mark_for_dates(user_id: int, dates: list[date] | None = None, month_refs=None) -> None:
+    def mark_for_dates(
+        user_id: int, dates: list[date] | None = None, month_refs=None, commit: bool = True
+    ) -> None:
         """
         Replica el criterio actual:
         - cualquier fecha/mes pasado => FULL
         - solo hoy/mes actual => NOW
         """
-        today = datetime.utcnow().date()
-        any_past = False
-        any_today_or_current = False
-
-        if dates:
-            for d in dates:
-                if isinstance(d, datetime):
-                    d = d.date()
-                if not isinstance(d, date):
-                    continue
-                if d < today:
-                    any_past = True
-                elif d == today:
-                    any_today_or_current = True
-
-        if month_refs:
-            for year, month in month_refs:
-                try:
-                    year = int(year)
-                    month = int(month)
-                except (TypeError, ValueError):
-                    continue
-                if year == today.year and month == today.month:
-                    any_today_or_current = True
-                else:
-                    any_past = True
-
+        any_past, any_today_or_current = classify_dates(dates, month_refs)
         if any_past:
-            CacheRebuildStateService.mark_full_history(user_id)
+            CacheRebuildStateService.mark_full_history(user_id, commit=commit)
         elif any_today_or_current:
-            CacheRebuildStateService.mark_now(user_id)
+            CacheRebuildStateService.mark_now(user_id, commit=commit)
+
+    @staticmethod
+    def touch_seen(user_id: int) -> None:
+        """Latido de sesión abierta (como mucho una escritura por minuto y proceso)."""
+        now_mono = time.monotonic()
+        with _seen_lock:
+            last = _seen_at.get(user_id)
+            if last is not None and now_mono - last < _SEEN_THROTTLE_SECONDS:
+                return
+            _seen_at[user_id] = now_mono
+
+        table = CacheRebuildState.__table__
+        now = datetime.utcnow()
+        try:
+            result = db.session.execute(
+                table.update().where(table.c.user_id == user_id).values(last_seen_at=now)
+            )
+            if not result.rowcount:
+                db.session.add(CacheRebuildState(
+                    user_id=user_id, pending_full_history=False, pending_now=False, last_seen_at=now,
+                ))
+            db.session.commit()
+        except SQLAlchemyError:
+            # BD ocupada o alta concurrente de la fila: el siguiente latido lo reintenta
+            db.session.rollback()
+            with _seen_lock:
+                _seen_at.pop(user_id, None)
+
+    @staticmethod
+    def _pending_filter():
+        return (
+            (CacheRebuildState.pending_full_history.is_(True))
+            | (CacheRebuildState.pending_now.is_(True))
+        )
 
     @staticmethod
     def pick_next_pending() -> CacheRebuildState | None:
+        """Siguiente entrada según la prioridad de la cola (sin reclamarla)."""
+        now = datetime.utcnow()
+        active_since = now - timedelta(seconds=current_app.config.get("CACHE_REBUILD_ACTIVE_SECONDS", 300))
         return (
             CacheRebuildState.query
             .filter(
-                (CacheRebuildState.pending_full_history.is_(True))
-                | (CacheRebuildState.pending_now.is_(True))
+                CacheRebuildStateService._pending_filter(),
+                CacheRebuildState.claimed_at.is_(None),
+                (CacheRebuildState.not_before.is_(None)) | (CacheRebuildState.not_before <= now),
+            )
+            .order_by(
+                case((CacheRebuildState.last_seen_at >= active_since, 0), else_=1),
+                CacheRebuildState.pending_full_history.asc(),
+                func.coalesce(CacheRebuildState.requested_at, CacheRebuildState.updated_at).asc(),
+                CacheRebuildState.id.asc(),
             )
-            .order_by(CacheRebuildState.updated_at.asc())
             .first()
         )
 
     @staticmethod
-    def clear_after_success(user_id: int, action: str) -> None:
-        row = CacheRebuildState.query.filter_by(user_id=user_id).first()
-        if not row:
+    def _release_stale_claims(now: datetime) -> None:
+        """Claims de workers caídos (más viejos que CACHE_REBUILD_CLAIM_TIMEOUT): vuelven a la cola."""
+        timeout = current_app.config.get("CACHE_REBUILD_CLAIM_TIMEOUT", 900)
+        stale = CacheRebuildState.query.filter(
+            CacheRebuildState.claimed_at < now - timedelta(seconds=timeout)
+        ).all()
+        for row in stale:
+            if row.claimed_action == "full":
+                row.pending_full_history = True
+                row.pending_now = False
+            elif not row.pending_full_history:
+                row.pending_now = True
+            row.requested_at = min(filter(None, (row.requested_at, row.claimed_at)))
+            row.claimed_at = None
+            row.claimed_action = None
+        if stale:
+            db.session.commit()
+
+    @staticmethod
+    def claim_next() -> RebuildJob | None:
+        """
+        Reclama la siguiente entrada: limpia sus flags y guarda la acción en curso.
+        Devuelve None si no hay trabajo (o si otro proceso se la llevó antes).
+        """
+        now = datetime.utcnow()
+        CacheRebuildStateService._release_stale_claims(now)
+        row = CacheRebuildStateService.pick_next_pending()
+        if row is None:
+            db.session.rollback()
+            return None
+
+        action = "full" if row.pending_full_history else "now"
+        requested_at = row.requested_at or row.updated_at
+        table = CacheRebuildState.__table__
+        # Condición sobre los flags leídos: si entretanto llegó un FULL, no se pierde
+        result = db.session.execute(
+            table.update()
+            .where(
+                table.c.id == row.id,
+                table.c.claimed_at.is_(None),
+                table.c.pending_full_history == row.pending_full_history,
+            )
+            .values(
+                pending_full_history=False,
+                pending_now=False,
+                requested_at=None,
+                claimed_at=now,
+                claimed_action=action,
+            )
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return None
+        user_id = row.user_id
+        db.session.commit()
+        return RebuildJob(user_id, action, requested_at, now)
+
+    @staticmethod
+    def finish(job: RebuildJob, ok: bool, run_ms: int | None = None) -> None:
+        """
+        Libera el claim. Éxito: guarda las métricas del job. Fallo: la acción vuelve a la cola
+        con su antigüedad original y no se reintenta hasta CACHE_REBUILD_RETRY_SECONDS.
+        """
+        row = CacheRebuildState.query.filter_by(user_id=job.user_id).first()
+        if row is None or row.claimed_at != job.claimed_at:
+            db.session.rollback()
             return
-        if action == "full":
-            row.pending_full_history = False
-            row.pending_now = False
-        elif action == "now":
-            row.pending_now = False
-        row.updated_at = datetime.utcnow()
+        now = datetime.utcnow()
+        row.claimed_at = None
+        row.claimed_action = None
+        if ok:
+            row.not_before = None
+            row.last_finished_at = now
+            row.last_wait_ms = int((job.claimed_at - job.requested_at).total_seconds() * 1000)
+            row.last_run_ms = run_ms
+        else:
+            if job.action == "full":
+                row.pending_full_history = True
+                row.pending_now = False
+            elif not row.pending_full_history:
+                row.pending_now = True
+            row.requested_at = job.requested_at
+            retry = current_app.config.get("CACHE_REBUILD_RETRY_SECONDS", 30)
+            row.not_before = now + timedelta(seconds=retry)
+        row.updated_at = now
         db.session.commit()
 
+    @staticmethod
+    def queue_stats(window_seconds: int = 3600) -> dict:
+        """
+        Métricas de la cola: profundidad (total, FULL, NOW, sesión abierta, en curso), espera de
+        la entrada más antigua y percentiles de espera/duración de los rebuilds de la ventana.
+        """
+        now = datetime.utcnow()
+        active_since = now - timedelta(seconds=current_app.config.get("CACHE_REBUILD_ACTIVE_SECONDS", 300))
+        rows = db.session.query(
+            CacheRebuildState.pending_full_history,
+            CacheRebuildState.pending_now,
+            CacheRebuildState.requested_at,
+            CacheRebuildState.last_seen_at,
+            CacheRebuildState.claimed_at,
+            CacheRebuildState.last_finished_at,
+            CacheRebuildState.last_wait_ms,
+            CacheRebuildState.last_run_ms,
+        ).all()
+
+        pending = [r for r in rows if r.pending_full_history or r.pending_now]
+        requested = [r.requested_at for r in pending if r.requested_at]
+        recent = [
+            r for r in rows
+            if r.last_finished_at and r.last_finished_at >= now - timedelta(seconds=window_seconds)
+        ]
+        waits = [r.last_wait_ms for r in recent if r.last_wait_ms is not None]
+        runs = [r.last_run_ms for r in recent if r.last_run_ms is not None]
+        return {
+            "depth": len(pending),
+            "depth_full": sum(1 for r in pending if r.pending_full_history),
+            "depth_now": sum(1 for r in pending if not r.pending_full_history),
+            "depth_active": sum(1 for r in pending if r.last_seen_at and r.last_seen_at >= active_since),
+            "in_progress": sum(1 for r in rows if r.claimed_at),
+            "oldest_wait_s": round((now - min(requested)).total_seconds(), 1) if requested else 0.0,
+            "done_window": len(recent),
+            "wait_ms_p50": _percentile(waits, 0.5),
+            "wait_ms_p95": _percentile(waits, 0.95),
+            "run_ms_p50": _percentile(runs, 0.5),
+            "run_ms_p95": _percentile(runs, 0.95),
+        }
@@ -0,0 +1,159 @@
+"""
+Worker de rebuild de cachés (dashboard, evolución, benchmarks) sobre la cola cache_rebuild_state.
+
+`run_worker()` es un bucle de larga duración: el proceso principal reclama entradas por
+prioridad (CacheRebuildStateService.claim_next) y las reparte en un pool de procesos; cada
+proceso del pool crea su propia app (conexiones de BD propias) y ejecuta `rebuild_user()`.
+Con workers <= 1 los rebuilds se ejecutan en el propio proceso, uno tras otro.
+
+Cada `metrics_every` segundos se emite una línea con las métricas de la cola (profundidad y
+latencias) vía `log`.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Optional
+
+from flask import current_app
+
+from app import db
+from app.services.cache_rebuild_state_service import CacheRebuildStateService, RebuildJob
+
+_pool_app = None
+
+
+def rebuild_user(user_id: int, action: str) -> None:
+    """FULL: checkpoints FIFO + snapshots completos. NOW: conservar histórico, tramo actual."""
+    from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+    from app.services.fifo_checkpoint_service import FifoCheckpointService
+    from app.services.metrics.cache import MetricsCacheService
+    from app.services.net_worth_service import get_dashboard_summary
+    from app.services.portfolio_benchmarks_cache import PortfolioBenchmarksCacheService
+    from app.services.portfolio_evolution_cache import PortfolioEvolutionCacheService
+
+    if action == 'full':
+        # FULL: completar checkpoints FIFO de fin de mes, invalidar métricas y
+        # reconstruir snapshots completos.
+        FifoCheckpointService.refresh(user_id)
+        MetricsCacheService.invalidate(user_id)
+        DashboardSummaryCacheService.set(user_id, get_dashboard_summary(user_id))
+        # Fuerza snapshot mensual completo para performance/index comparison.
+        PortfolioEvolutionCacheService.get_state(user_id, frequency='monthly')
+        PortfolioBenchmarksCacheService.get_comparison_state(user_id)
+    else:
+        # NOW: conservar histórico, recalcular tramo actual.
+        MetricsCacheService.invalidate(user_id)
+        updated = DashboardSummaryCacheService.recompute_current_from_cache(user_id)
+        if updated is None:
+            DashboardSummaryCacheService.set(user_id, get_dashboard_summary(user_id))
+        PortfolioEvolutionCacheService.get_state(user_id, frequency='monthly')
+        PortfolioBenchmarksCacheService.get_comparison_state(user_id)
+
+
+def run_job(job: RebuildJob) -> int:
+    """Ejecuta el rebuild en la app actual y devuelve su duración en ms."""
+    started = time.perf_counter()
+    try:
+        rebuild_user(job.user_id, job.action)
+    finally:
+        db.session.remove()
+    return int((time.perf_counter() - started) * 1000)
+
+
+def _init_pool_process(config_name: str) -> None:
+    global _pool_app
+    from app import create_app
+
+    _pool_app = create_app(config_name)
+
+
+def _run_in_pool(job: RebuildJob) -> int:
+    with _pool_app.app_context():
+        return run_job(job)
+
+
+def _finish(job: RebuildJob, run_ms: Optional[int], error: Optional[BaseException], log: Callable) -> None:
+    CacheRebuildStateService.finish(job, ok=error is None, run_ms=run_ms)
+    if error is None:
+        log(f'OK: rebuild {job.action} user_id={job.user_id} ({run_ms} ms)')
+    else:
+        log(f'ERROR: rebuild {job.action} user_id={job.user_id}: {error}')
+
+
+def run_worker(
+    workers: Optional[int] = None,
+    max_jobs: Optional[int] = None,
+    idle_seconds: Optional[float] = None,
+    metrics_every: float = 60.0,
+    config_name: Optional[str] = None,
+    log: Callable[[str], None] = print,
+) -> int:
+    """
+    Procesa la cola hasta `max_jobs` rebuilds (None = sin fin). Con la cola vacía espera
+    `idle_seconds`; con max_jobs indicado, sale en cuanto no queda trabajo.
+
+    Returns:
+        Número de rebuilds ejecutados (correctos o fallidos)
+    """
+    config = current_app.config
+    if workers is None:
+        workers = config.get('CACHE_REBUILD_WORKERS', 2) or os.cpu_count() or 1
+    if idle_seconds is None:
+        idle_seconds = config.get('CACHE_REBUILD_IDLE_SECONDS', 2)
+    config_name = config_name or os.environ.get('FLASK_ENV', 'development')
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            # spawn: los procesos no heredan conexiones SQLite abiertas del principal
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_pool_process,
+            initargs=(config_name,),
+        )
+    slots = max(1, workers)
+    in_flight = {}
+    processed = 0
+    next_metrics = time.monotonic() + metrics_every
+
+    def _budget_left() -> bool:
+        return max_jobs is None or processed + len(in_flight) < max_jobs
+
+    try:
+        while True:
+            while len(in_flight) < slots and _budget_left():
+                job = CacheRebuildStateService.claim_next()
+                if job is None:
+                    break
+                if pool is None:
+                    try:
+                        _finish(job, run_job(job), None, log)
+                    except Exception as e:
+                        db.session.rollback()
+                        _finish(job, None, e, log)
+                    processed += 1
+                else:
+                    in_flight[pool.submit(_run_in_pool, job)] = job
+
+            if in_flight:
+                done, _ = wait(in_flight, timeout=idle_seconds, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    error = future.exception()
+                    _finish(job, None if error else future.result(), error, log)
+                    processed += 1
+            elif max_jobs is not None:
+                # Cola vacía o presupuesto agotado
+                break
+            else:
+                db.session.remove()
+                time.sleep(idle_seconds)
+
+            if time.monotonic() >= next_metrics:
+                log(f'METRICS: cache-rebuild {CacheRebuildStateService.queue_stats()}')
+                next_metrics = time.monotonic() + metrics_every
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    return processed
@@ -113,6 +113,30 @@ class CSVDetector:
             raise ValueError(f"Formato no soportado: {format_type}")
 
 
+def detect_parser(file_path: str):
+    """
+    Detecta el formato y devuelve el parser correspondiente sin leer aún los datos
+
+    Args:
+        file_path: Ruta al archivo CSV
+
+    Returns:
+        (format_type, parser): el parser expone iter_events(file_path) para importar
+        en streaming y parse(file_path) para obtener todo en memoria
+    """
+    _import_debug.debug(f"csv_detector: detectando formato de {file_path}")
+    format_type = CSVDetector.detect_format_from_file(file_path)
+    _import_debug.info(f"csv_detector: formato detectado = {format_type}")
+
+    if format_type == 'UNKNOWN':
+        _import_debug.error("csv_detector: formato UNKNOWN - no se pudo detectar")
+        raise ValueError("No se pudo detectar el formato del CSV")
+
+    parser_class = CSVDetector.get_parser_class(format_type)
+    _import_debug.debug(f"csv_detector: usando parser {parser_class.__name__}")
+    return format_type, parser_class()
+
+
 def detect_and_parse(file_path: str):
     """
     Función de conveniencia para detectar formato y parsear automáticamente
@@ -124,18 +148,7 @@ def detect_and_parse(file_path: str):
         Datos parseados en formato normalizado
     """
     try:
-        _import_debug.debug(f"csv_detector: detectando formato de {file_path}")
-        format_type = CSVDetector.detect_format_from_file(file_path)
-        _import_debug.info(f"csv_detector: formato detectado = {format_type}")
-
-        if format_type == 'UNKNOWN':
-            _import_debug.error("csv_detector: formato UNKNOWN - no se pudo detectar")
-            raise ValueError("No se pudo detectar el formato del CSV")
-
-        parser_class = CSVDetector.get_parser_class(format_type)
-        parser = parser_class()
-        _import_debug.debug(f"csv_detector: usando parser {parser_class.__name__}")
-
+        format_type, parser = detect_parser(file_path)
         parsed_data = parser.parse(file_path)
         parsed_data['format'] = format_type
         _import_debug.debug(f"csv_detector: parse OK, claves={list(parsed_data.keys())}")
@@ -143,4 +156,3 @@ def detect_and_parse(file_path: str):
     except Exception as e:
         _import_debug.error(f"csv_detector: excepción en detect_and_parse: {e}")
         raise
-
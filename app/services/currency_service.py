@@ -1,13 +1,18 @@
 """
 Currency Conversion Service - Real-time exchange rates
 Uses European Central Bank (ECB) API with 24h cache
+
+Conversión a fecha (on_date / dates): usa la serie diaria de fx_rate_service y, si no hay
+histórico para la divisa o la fecha es hoy o posterior, la tasa actual.
 """
 import requests
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from threading import Lock
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 # Cache global (thread-safe)
@@ -68,8 +73,12 @@ def get_exchange_rates(force_refresh=False):
     Returns:
         Dict con tasas de cambio a EUR. Ejemplo: {'USD': 0.92, 'GBP': 1.17, ...}
     """
+    # Camino rápido sin lock: en bucles calientes el cache casi siempre es válido
+    if not force_refresh and _is_cache_valid():
+        return _exchange_rates_cache['rates']
+    
     with _cache_lock:
-        # Verificar si el cache es válido
+        # Verificar si el cache es válido (otro hilo pudo refrescarlo mientras esperábamos)
         if not force_refresh and _is_cache_valid():
             # Cache hit - no logging para evitar saturar logs
             return _exchange_rates_cache['rates']
@@ -179,13 +188,40 @@ def _normalize_currency(currency: str) -> str:
     return CURRENCY_ALIASES.get(cu, cu)
 
 
-def convert_to_eur(amount, currency):
+def get_rate_to_eur(currency, on_date=None):
+    """
+    Tasa de 1 unidad de currency a EUR.
+    
+    Args:
+        currency: Código de moneda
+        on_date: date/datetime para usar el tipo de ese día (None o >= hoy = tasa actual)
+    """
+    currency_upper = _normalize_currency(currency)
+    
+    if on_date is not None and on_date.toordinal() < date.today().toordinal():
+        from app.services.fx_rate_service import FxRateService
+        historical = FxRateService.rates_on(currency_upper, np.array([on_date.toordinal()], dtype=np.int64))
+        if historical is not None:
+            return float(historical[0])
+    
+    # Obtener tasas (usa cache si está disponible)
+    rate = get_exchange_rates().get(currency_upper)
+    
+    if rate is None:
+        logger.warning(f"⚠️ Moneda no encontrada: {currency_upper}, usando tasa 1.0")
+        rate = 1.0
+    
+    return rate
+
+
+def convert_to_eur(amount, currency, on_date=None):
     """
     Convierte una cantidad en cualquier moneda a EUR.
     
     Args:
         amount: Cantidad a convertir
         currency: Código de moneda (ej: 'USD', 'GBP', 'BGN', etc.)
+        on_date: Fecha del tipo de cambio (None = tasa actual)
         
     Returns:
         Cantidad equivalente en EUR
@@ -197,18 +233,58 @@ def convert_to_eur(amount, currency):
     if not amount or not currency:
         return 0.0
     
-    # Obtener tasas (usa cache si está disponible)
-    rates = get_exchange_rates()
+    return amount * get_rate_to_eur(currency, on_date)
+
+
+def convert_many(amounts, currencies, dates=None):
+    """
+    Convierte arrays completos a EUR en una pasada NumPy (agrupando por divisa).
     
-    # Resolver alias (BG -> BGN, etc.)
-    currency_upper = _normalize_currency(currency)
-    rate = rates.get(currency_upper)
+    Args:
+        amounts: Secuencia de importes (None = 0)
+        currencies: Secuencia de códigos de moneda, alineada con amounts
+        dates: Secuencia de date/datetime alineada (None o elementos None = tasa actual)
+        
+    Returns:
+        np.ndarray float64 con los importes en EUR (0 si falta importe o moneda)
+    """
+    amounts = np.fromiter((a or 0.0 for a in amounts), dtype=np.float64)
+    n = len(amounts)
+    rates_arr = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return rates_arr
     
-    if rate is None:
-        logger.warning(f"⚠️ Moneda no encontrada: {currency_upper}, usando tasa 1.0")
-        rate = 1.0
+    groups = {}
+    for i, currency in enumerate(currencies):
+        if currency:
+            groups.setdefault(_normalize_currency(currency), []).append(i)
+    
+    today_ordinal = date.today().toordinal()
+    ordinals = None
+    if dates is not None:
+        ordinals = np.fromiter(
+            (d.toordinal() if d else today_ordinal for d in dates), dtype=np.int64, count=n
+        )
+    
+    current_rates = get_exchange_rates()
+    from app.services.fx_rate_service import FxRateService
+    
+    for currency, idx_list in groups.items():
+        idx = np.asarray(idx_list, dtype=np.int64)
+        current = current_rates.get(currency)
+        if current is None:
+            logger.warning(f"⚠️ Moneda no encontrada: {currency}, usando tasa 1.0")
+            current = 1.0
+        historical = None
+        if ordinals is not None:
+            group_ordinals = ordinals[idx]
+            historical = FxRateService.rates_on(currency, group_ordinals)
+        if historical is None:
+            rates_arr[idx] = current
+        else:
+            rates_arr[idx] = np.where(group_ordinals >= today_ordinal, current, historical)
     
-    return amount * rate
+    return amounts * rates_arr
 
 
 def get_cache_info():
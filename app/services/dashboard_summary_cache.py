@@ -1,12 +1,18 @@
 """
 Cache del resumen del dashboard principal (/dashboard).
 TTL 15 min; se invalida al cambiar transacciones, gastos, ingresos, bancos, inmuebles, deudas.
+
+Polling (/dashboard/state): meta.section_versions guarda la versión en la que cambió por
+última vez cada sección, para responder 304 o solo las secciones nuevas para el cliente.
 """
 import copy
 import json
 from datetime import date, datetime, timezone
+from flask import current_app
 from app import db
 from app.models.dashboard_summary_cache import DashboardSummaryCache
+from app.services import json_cache_lru
+from app.services.cache_rebuild_state_service import classify_dates
 from app.utils.perf_timing import new_tick, perf_mark
 
 
@@ -83,13 +89,82 @@ def _now_signature(data: dict) -> str:
         # Fallback: forzar update si algo raro ocurre
         return str(datetime.utcnow().timestamp())
 
+def _now_inputs_stamp(user_id: int) -> str:
+    """
+    Sello de las entradas de mercado de la parte NOW: último precio de los activos en cartera
+    y de los metales del widget, cotizaciones/series globales de índices y FX diario.
+    Las escrituras del usuario no entran aquí: marcan dirty_now al hacer commit.
+    """
+    from sqlalchemy import func, or_, select
+    from app.models.asset import Asset
+    from app.models.benchmark_global_daily import BenchmarkGlobalState
+    from app.models.benchmark_global_quote import BenchmarkGlobalQuote
+    from app.models.fx_rate import FxRateDaily
+    from app.models.portfolio import PortfolioHolding
+    from app.services.metales_metrics import PRECIOUS_METAL_YAHOO_SYMBOLS
+
+    held = select(PortfolioHolding.asset_id).where(
+        PortfolioHolding.user_id == user_id,
+        PortfolioHolding.quantity > 0,
+    )
+    row = db.session.query(
+        select(func.max(Asset.last_price_update))
+        .where(or_(Asset.id.in_(held), Asset.symbol.in_(PRECIOUS_METAL_YAHOO_SYMBOLS)))
+        .scalar_subquery(),
+        select(func.max(BenchmarkGlobalQuote.updated_at)).scalar_subquery(),
+        select(func.max(BenchmarkGlobalState.daily_data_version)).scalar_subquery(),
+        select(func.max(FxRateDaily.updated_at)).scalar_subquery(),
+    ).one()
+    return "|".join("" if v is None else str(v) for v in row)
+
+
+def _now_is_fresh(meta: dict) -> bool:
+    """NOW recalculado hace menos de DASHBOARD_NOW_MAX_AGE_SECONDS (cubre entradas sin sello)."""
+    raw = meta.get("_now_computed_at")
+    if not raw:
+        return False
+    try:
+        computed_at = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    max_age = current_app.config.get("DASHBOARD_NOW_MAX_AGE_SECONDS", 300)
+    age = datetime.now(timezone.utc) - computed_at
+    return age.total_seconds() < max_age
+
+
+def _changed_sections(prev: dict, data: dict) -> list[str]:
+    """Claves de primer nivel (salvo meta y privadas) cuyo JSON difiere entre dos snapshots."""
+    keys = {k for k in (*prev.keys(), *data.keys()) if k != "meta" and not str(k).startswith("_")}
+    return sorted(
+        k for k in keys
+        if json.dumps(prev.get(k), default=str) != json.dumps(data.get(k), default=str)
+    )
+
+
+def sections_since(summary: dict, client_version) -> list[str] | None:
+    """
+    Secciones del snapshot que cambiaron después de `client_version` (meta.version del cliente).
+    None: el cliente necesita el snapshot completo (versión desconocida o anterior al último set).
+    """
+    meta = summary.get("meta") or {}
+    versions = meta.get("section_versions")
+    try:
+        client_version = int(client_version)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(versions, dict) or client_version < int(meta.get("base_version") or 0):
+        return None
+    return sorted(k for k, v in versions.items() if k in summary and int(v) > client_version)
+
+
 class DashboardSummaryCacheService:
     @staticmethod
     def get(user_id: int):
-        cache = DashboardSummaryCache.query.filter_by(user_id=user_id).first()
+        # JSON compartido (caché en memoria): solo copias superficiales a partir de aquí
+        cache = json_cache_lru.read(DashboardSummaryCache, user_id)
         if not cache or not cache.is_valid:
             if cache:
-                db.session.delete(cache)
+                DashboardSummaryCache.query.filter_by(user_id=user_id).delete()
                 db.session.commit()
             return None
         cached = cache.cached_data or {}
@@ -99,6 +174,14 @@ class DashboardSummaryCacheService:
         # ajuste de reconciliación (que sí lee la BD en vivo). Forzar miss hasta rebuild.
         if meta_pre.get("needs_full_rebuild"):
             return None
+        if meta_pre.get("dirty_now"):
+            # Escritura de hoy pendiente: NOW completo antes de servir el snapshot
+            if DashboardSummaryCacheService.recompute_current_from_cache(user_id) is None:
+                return None
+            cache = json_cache_lru.read(DashboardSummaryCache, user_id)
+            if not cache:
+                return None
+            cached = cache.cached_data or {}
         data = cached.copy()
         data['_from_cache'] = True
         # Siempre exponer timestamp UTC explícito
@@ -137,9 +220,15 @@ class DashboardSummaryCacheService:
             meta.pop("now_sig", None)
         # Cualquier marca de reconstrucción pendiente deja de aplicar tras un set completo
         meta.pop("needs_full_rebuild", None)
+        meta.pop("dirty_now", None)
+        # Snapshot completo: todas las secciones son nuevas para cualquier cliente. Sin sello de
+        # entradas: el primer poll recalcula NOW y lo registra.
+        meta["base_version"] = meta["version"]
+        meta["section_versions"] = {k: meta["version"] for k in clean if k != "meta"}
+        meta.pop("inputs_stamp", None)
         clean["meta"] = meta
 
-        cache = DashboardSummaryCache.query.filter_by(user_id=user_id).first()
+        cache = json_cache_lru.row_for_update(DashboardSummaryCache, user_id)
         if cache:
             cache.cached_data = clean
             cache.created_at = now.replace(tzinfo=None)
@@ -152,92 +241,118 @@ class DashboardSummaryCacheService:
                 expires_at=DashboardSummaryCache.get_default_expiry(),
             )
             db.session.add(cache)
-        db.session.commit()
+        json_cache_lru.commit_and_remember(cache, clean)
         return cache
 
     @staticmethod
     def invalidate(user_id: int) -> bool:
-        cache = DashboardSummaryCache.query.filter_by(user_id=user_id).first()
-        if cache:
-            data = dict(cache.cached_data or {})
-            meta = dict(data.get("meta") or {})
-            # Marcar que hace falta una reconstrucción completa de HIST en background,
-            # pero mantener el snapshot actual para que el usuario vea datos viejos
-            # hasta que el polling lo renueve.
-            meta["needs_full_rebuild"] = True
-            data["meta"] = meta
-            cache.cached_data = _make_json_serializable(data)
-            db.session.commit()
+        # Marcar que hace falta una reconstrucción completa de HIST en background,
+        # pero mantener el snapshot actual para que el usuario vea datos viejos
+        # hasta que el polling lo renueve.
+        if not DashboardSummaryCacheService.mark_dirty(user_id, full_rebuild=True):
+            return False
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def mark_dirty(user_id: int, full_rebuild: bool) -> bool:
+        """
+        Marca el snapshot sin commit (lo escribe el commit en curso):
+        - full_rebuild -> needs_full_rebuild (get() falla hasta reconstruir)
+        - si no -> dirty_now (el siguiente get()/poll recalcula NOW completo)
+
+        No reescribe el JSON si la marca ya estaba. Devuelve False si no hay caché.
+        """
+        cached = json_cache_lru.read(DashboardSummaryCache, user_id)
+        if not cached:
+            return False
+        data = dict(cached.cached_data or {})
+        meta = dict(data.get("meta") or {})
+        if meta.get("needs_full_rebuild") or (meta.get("dirty_now") and not full_rebuild):
             return True
-        return False
+        if full_rebuild:
+            meta["needs_full_rebuild"] = True
+            meta.pop("dirty_now", None)
+        else:
+            meta["dirty_now"] = True
+        data["meta"] = meta
+        cache = json_cache_lru.row_for_update(DashboardSummaryCache, user_id)
+        if cache is None:
+            return False
+        cache.cached_data = _make_json_serializable(data)
+        return True
 
     @staticmethod
     def touch_for_dates(user_id: int, dates=None, month_refs=None) -> None:
         """
         Criterio unificado de invalidación basado en fechas afectadas.
 
-        - Si TODAS las fechas/meses son "hoy" / mes actual -> recompute_current_from_cache
+        - Si TODAS las fechas/meses son "hoy" / mes actual -> dirty_now (NOW en el siguiente get/poll)
         - Si alguna fecha/mes es pasada (≠ hoy / ≠ mes actual) -> invalidate completo
 
         Parámetros:
         - dates: iterable de datetime.date o datetime (se usa .date())
         - month_refs: iterable de tuplas (year, month) para casos tipo bancos,
           donde solo se conoce año/mes (sin día).
-        """
-        today = datetime.utcnow().date()
-
-        any_past = False
-        any_today_or_current = False
-
-        if dates:
-            for d in dates:
-                if isinstance(d, datetime):
-                    d = d.date()
-                if not isinstance(d, date):
-                    continue
-                if d == today:
-                    any_today_or_current = True
-                elif d < today:
-                    any_past = True
-
-        if month_refs:
-            for year, month in month_refs:
-                try:
-                    year = int(year)
-                    month = int(month)
-                except (TypeError, ValueError):
-                    continue
-                if year == today.year and month == today.month:
-                    any_today_or_current = True
-                else:
-                    any_past = True
 
+        Las escrituras ORM de ingresos, gastos y saldos ya marcan la caché al hacer commit
+        (cache_invalidation_bus); esto queda para llamadas explícitas.
+        """
+        any_past, any_today_or_current = classify_dates(dates, month_refs)
         # Sin información -> comportamiento conservador: invalidar completo
-        if not any_today_or_current and not any_past:
+        if any_past or not any_today_or_current:
             DashboardSummaryCacheService.invalidate(user_id)
-            return
+        elif DashboardSummaryCacheService.mark_dirty(user_id, full_rebuild=False):
+            db.session.commit()
 
-        if any_past:
-            DashboardSummaryCacheService.invalidate(user_id)
-        else:
-            # Solo hoy / mes actual -> intentar recompute parcial
-            updated = DashboardSummaryCacheService.recompute_current_from_cache(user_id)
-            if updated is None:
-                DashboardSummaryCacheService.invalidate(user_id)
+    @staticmethod
+    def refresh_for_poll(user_id: int) -> dict | None:
+        """
+        Polling de /dashboard/state: recalcula NOW solo si cambiaron sus entradas.
+
+        - needs_full_rebuild -> recompute_current_from_cache (reconstrucción completa)
+        - dirty_now (escritura del usuario de hoy) -> NOW completo
+        - mismo día, mismo sello de mercado y NOW reciente -> snapshot cacheado, sin recálculo
+        - mismo día -> solo las secciones que dependen de precios
+        - cambio de día -> NOW completo
+
+        Devuelve el snapshot (JSON compartido: no mutar) o None si no hay caché utilizable.
+        """
+        cache = json_cache_lru.read(DashboardSummaryCache, user_id)
+        if not cache or not cache.cached_data:
+            return None
+        meta = cache.cached_data.get("meta") or {}
+        if meta.get("needs_full_rebuild") or meta.get("dirty_now"):
+            return DashboardSummaryCacheService.recompute_current_from_cache(user_id)
+
+        stamp = _now_inputs_stamp(user_id)
+        same_day = meta.get("now_day") == date.today().isoformat()
+        if same_day and meta.get("inputs_stamp") == stamp and _now_is_fresh(meta):
+            return cache.cached_data
+        return DashboardSummaryCacheService.recompute_current_from_cache(
+            user_id, prices_only=same_day, inputs_stamp=stamp
+        )
 
     @staticmethod
-    def recompute_current_from_cache(user_id: int) -> dict | None:
+    def recompute_current_from_cache(
+        user_id: int, prices_only: bool = False, inputs_stamp: str | None = None
+    ) -> dict | None:
         """
         Recalcula NOW (breakdown, detalles, widgets) y alinea el ÚLTIMO punto del
         histórico con ese breakdown; meses anteriores no se recalculan.
 
+        prices_only=True: conserva del snapshot las secciones que solo cambian con escrituras
+        del usuario o con el día (gastos, ingresos, bancos, inmuebles, deudas, próximos pagos).
+
         Devuelve el diccionario cacheado actualizado, o None si no es posible
         (por ejemplo, si falta history).
         """
         tick = new_tick()
-        perf_mark("recompute_current_from_cache", user_id, tick, "enter")
+        perf_mark("recompute_current_from_cache", user_id, tick, "enter", prices_only=prices_only)
+        if inputs_stamp is None:
+            inputs_stamp = _now_inputs_stamp(user_id)
 
-        cache = DashboardSummaryCache.query.filter_by(user_id=user_id).first()
+        cache = json_cache_lru.read(DashboardSummaryCache, user_id)
         perf_mark("recompute_current_from_cache", user_id, tick, "cache_row_loaded", has=bool(cache and cache.cached_data))
         if not cache or not cache.cached_data:
             return None
@@ -271,24 +386,26 @@ class DashboardSummaryCacheService:
         # Recalcular breakdown y detalles actuales (NOW), reutilizando histórico (HIST)
         breakdown = nws.get_net_worth_breakdown(user_id)
         data["breakdown"] = breakdown
-        data["cash_details"] = nws.get_cash_details(user_id)
         data["portfolio_details"] = nws.get_portfolio_details(user_id)
         data["crypto_details"] = nws.get_crypto_details(user_id)
         data["metales_details"] = nws.get_metales_details(user_id)
-        data["real_estate_details"] = nws.get_real_estate_details(user_id)
-        data["debt_details"] = nws.get_debt_details(user_id)
+        if not prices_only:
+            data["cash_details"] = nws.get_cash_details(user_id)
+            data["real_estate_details"] = nws.get_real_estate_details(user_id)
+            data["debt_details"] = nws.get_debt_details(user_id)
         perf_mark("recompute_current_from_cache", user_id, tick, "after_breakdown_and_details")
 
         # Métricas derivadas de NOW (no tocan history_block)
-        data["savings"] = nws.get_savings_rate(user_id, months=12)
+        if not prices_only:
+            data["savings"] = nws.get_savings_rate(user_id, months=12)
+            data["income_expense_monthly"] = nws.get_income_expense_by_month(user_id, months=12)
+            data["top_expenses"] = nws.get_top_expenses_month(user_id)
+            data["upcoming_payments"] = nws.get_upcoming_payments(user_id)
+            data["recent_transactions"] = nws.get_recent_transactions(user_id)
         data["projections"] = nws.get_net_worth_projection(
             user_id, net_worth_now=breakdown["net_worth"]
         )
-        data["income_expense_monthly"] = nws.get_income_expense_by_month(user_id, months=12)
-        data["top_expenses"] = nws.get_top_expenses_month(user_id)
-        data["upcoming_payments"] = nws.get_upcoming_payments(user_id)
         data["investments_summary"] = nws.get_investments_summary(user_id)
-        data["recent_transactions"] = nws.get_recent_transactions(user_id)
         data["currency_exposure"] = nws.get_currency_exposure(user_id)
         data["year_comparison"] = nws.get_year_comparison(user_id)
         data["health_score"] = nws.get_financial_health_score(
@@ -305,16 +422,17 @@ class DashboardSummaryCacheService:
             )
         except Exception:
             data["recommendations"] = data.get("recommendations") or []
-        from app.services.income_expense_aggregator import (
-            get_expense_category_summary_with_adjustment,
-            get_income_category_summary_with_adjustment,
-        )
-        data["expense_category_summary"] = get_expense_category_summary_with_adjustment(
-            user_id, months=12
-        )
-        data["income_category_summary"] = get_income_category_summary_with_adjustment(
-            user_id, months=12
-        )
+        if not prices_only:
+            from app.services.income_expense_aggregator import (
+                get_expense_category_summary_with_adjustment,
+                get_income_category_summary_with_adjustment,
+            )
+            data["expense_category_summary"] = get_expense_category_summary_with_adjustment(
+                user_id, months=12
+            )
+            data["income_category_summary"] = get_income_category_summary_with_adjustment(
+                user_id, months=12
+            )
         data["top_movers"] = nws.get_top_movers_for_user(user_id, limit=5)
         from app.services.portfolio_benchmarks_cache import get_market_indices_snapshot
 
@@ -332,12 +450,10 @@ class DashboardSummaryCacheService:
             if day_inv:
                 day_pct, day_eur = day_inv
             if isinstance(data.get("changes"), dict):
-                data["changes"]["day_pct"] = day_pct
-                data["changes"]["day_eur"] = day_eur
+                data["changes"] = {**data["changes"], "day_pct": day_pct, "day_eur": day_eur}
         except Exception:
             if isinstance(data.get("changes"), dict):
-                data["changes"]["day_pct"] = None
-                data["changes"]["day_eur"] = None
+                data["changes"] = {**data["changes"], "day_pct": None, "day_eur": None}
 
         perf_mark("recompute_current_from_cache", user_id, tick, "after_day_change")
 
@@ -365,7 +481,7 @@ class DashboardSummaryCacheService:
         data["history"] = new_history
         hb = data.get("history_block")
         if isinstance(hb, dict):
-            hb = copy.deepcopy(hb)
+            hb = dict(hb)
             hb["history"] = new_history
             data["history_block"] = hb
 
@@ -389,24 +505,44 @@ class DashboardSummaryCacheService:
         perf_mark("recompute_current_from_cache", user_id, tick, "after_align_last_history")
 
         # Actualizar metadatos y TTL:
-        # - version/_now_cached_at: SOLO si cambió NOW (firma distinta).
+        # - version: SOLO si cambió alguna sección (section_versions guarda cuáles).
+        # - _now_cached_at: SOLO si cambió NOW (firma distinta).
         # - _cached_at: NO se toca aquí; representa la edad del HIST.
         now = datetime.utcnow().replace(tzinfo=timezone.utc)
         meta = dict(prev_meta)
-        new_sig = _now_signature(data)
+        clean = _make_json_serializable(data)
+        changed = _changed_sections(cache.cached_data, clean)
+        if changed:
+            version = max(int(now.timestamp() * 1000), int(prev_meta.get("version") or 0) + 1)
+            meta["version"] = version
+            if not isinstance(meta.get("section_versions"), dict):
+                # Snapshot anterior al versionado por secciones: los clientes previos reciben todo
+                meta["base_version"] = version
+            section_versions = dict(meta.get("section_versions") or {})
+            section_versions.update({k: version for k in changed})
+            meta["section_versions"] = section_versions
+        new_sig = _now_signature(clean)
         if new_sig != (prev_meta.get("now_sig") or ""):
-            meta["version"] = int(now.timestamp() * 1000)
             meta["_now_cached_at"] = _utc_iso_z(now)
             meta["now_sig"] = new_sig
+        meta["inputs_stamp"] = inputs_stamp
+        meta["now_day"] = date.today().isoformat()
+        meta["_now_computed_at"] = _utc_iso_z(now)
+        meta.pop("dirty_now", None)
         data["meta"] = meta
+        clean["meta"] = meta
+        perf_mark("recompute_current_from_cache", user_id, tick, "sections_diffed", changed=len(changed))
 
-        cache.cached_data = _make_json_serializable(data)
+        row = json_cache_lru.row_for_update(DashboardSummaryCache, user_id)
+        if row is None:
+            return data
+        row.cached_data = clean
         # NO tocar created_at aquí: created_at representa la edad del snapshot completo (HIST).
         # Si lo actualizamos en cada recompute NOW (polling), el frontend siempre mostrará
         # "Actualizado hace menos de 1 min".
-        cache.expires_at = DashboardSummaryCache.get_default_expiry()
+        row.expires_at = DashboardSummaryCache.get_default_expiry()
         perf_mark("recompute_current_from_cache", user_id, tick, "before_db_commit")
-        db.session.commit()
+        json_cache_lru.commit_and_remember(row, clean)
         perf_mark("recompute_current_from_cache", user_id, tick, "exit_ok")
 
         return data
@@ -263,6 +263,13 @@ class DebtService:
             db.session.commit()
             return len(future_expenses)
         else:
+            from app.services.monthly_rollup_service import MonthlyRollupService
+
+            # El borrado masivo no pasa por los hooks de flush: invalidar los agregados a mano
+            first_date = db.session.query(func.min(Expense.date)).filter(
+                Expense.debt_plan_id == plan_id
+            ).scalar()
+            MonthlyRollupService.invalidate(user_id, from_date=first_date or plan.start_date)
             Expense.query.filter_by(debt_plan_id=plan_id).delete()
             db.session.delete(plan)
             db.session.commit()
@@ -119,7 +119,7 @@ def reconcile_delistings(user_id: int = None) -> Dict[str, Any]:
                     )
                     if created:
                         result['created'] += 1
-                        recalculate_holdings(uid, account_id)
+                        recalculate_holdings(uid, account_id, [asset.id])
                     else:
                         result['skipped'] += 1
                 except Exception as e:
@@ -22,6 +22,9 @@ class FIFOLot:
 class FIFOCalculator:
     """Calculadora FIFO robusta para holdings"""
     
+    _lot_class = FIFOLot
+    _number = Decimal  # Tipo numérico de cantidades/costes (from_dict)
+    
     def __init__(self, symbol: str = "Unknown"):
         self.symbol = symbol
         self.lots: deque = deque()  # Cola FIFO de lotes de compra
@@ -134,6 +137,32 @@ class FIFOCalculator:
             'last_transaction_date': self.last_transaction_date
         }
     
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializa el estado (lotes, corto, fechas) sin pérdida de precisión (Decimal -> str)."""
+        return {
+            'symbol': self.symbol,
+            'lots': [
+                [str(lot.quantity), str(lot.price), lot.date.isoformat(), str(lot.total_cost)]
+                for lot in self.lots
+            ],
+            'short_position': str(self.short_position),
+            'first_purchase_date': self.first_purchase_date.isoformat() if self.first_purchase_date else None,
+            'last_transaction_date': self.last_transaction_date.isoformat() if self.last_transaction_date else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FIFOCalculator':
+        """Reconstruye una calculadora desde to_dict()."""
+        calc = cls(symbol=data.get('symbol') or "Unknown")
+        for quantity, price, lot_date, total_cost in data.get('lots') or []:
+            calc.lots.append(cls._lot_class(quantity, price, datetime.fromisoformat(lot_date), total_cost))
+        calc.short_position = cls._number(data.get('short_position') or '0')
+        first = data.get('first_purchase_date')
+        last = data.get('last_transaction_date')
+        calc.first_purchase_date = date_type.fromisoformat(first) if first else None
+        calc.last_transaction_date = date_type.fromisoformat(last) if last else None
+        return calc
+
     def is_closed(self) -> bool:
         """Verifica si la posición está cerrada (vendida completamente y sin shorts pendientes)"""
         return len(self.lots) == 0 and self.short_position == 0
@@ -143,6 +172,133 @@ class FIFOCalculator:
         return f"FIFOCalculator({pos['quantity']} lots, qty={pos['quantity']}, avg={pos['average_buy_price']:.2f})"
 
 
+class FloatLot:
+    """Lote de compra con float64 (sin Decimal por lote)"""
+    __slots__ = ('quantity', 'price', 'date', 'total_cost')
+
+    def __init__(self, quantity: float, price: float, date: datetime, total_cost: float):
+        self.quantity = float(quantity)
+        self.price = float(price)
+        self.date = date
+        self.total_cost = float(total_cost)
+
+    def __repr__(self):
+        return f"Lot({self.quantity} @ {self.price} on {self.date.date()})"
+
+
+class FloatFIFOCalculator(FIFOCalculator):
+    """
+    Calculadora FIFO con aritmética float64 y lotes __slots__, misma API que FIFOCalculator.
+
+    Pensada para los bucles de replay (valoración histórica, checkpoints, evolución), donde
+    construir Decimal por lote y operación domina el tiempo de CPU. Los restos de cantidad
+    por debajo de epsilon (deriva de float) se tratan como cero, de modo que el resultado
+    coincide con FIFOCalculator dentro de ese margen.
+    """
+
+    _lot_class = FloatLot
+    _number = float
+
+    EPSILON = 1e-10
+
+    def __init__(self, symbol: str = "Unknown", epsilon: float = None):
+        super().__init__(symbol=symbol)
+        self.short_position = 0.0
+        self.epsilon = self.EPSILON if epsilon is None else epsilon
+
+    def add_buy(self, quantity: float, price: float, date: datetime, total_cost: float):
+        """Añade una compra como un nuevo lote, liquidando primero cualquier posición corta"""
+        date = self._normalize_dt(date)
+        eps = self.epsilon
+        qty = float(quantity)
+        cost = float(total_cost)
+
+        # Si hay posición en corto, primero liquidarla
+        if self.short_position > 0:
+            if qty >= self.short_position - eps:
+                qty -= self.short_position
+                if quantity > 0:
+                    cost = cost * (qty / float(quantity))
+                self.short_position = 0.0
+            else:
+                self.short_position -= qty
+                qty = 0.0
+                cost = 0.0
+
+        if qty > eps:
+            self.lots.append(FloatLot(qty, price, date, cost))
+
+        d = date.date()
+        if self.first_purchase_date is None or d < self.first_purchase_date:
+            self.first_purchase_date = d
+
+        self.last_transaction_date = d
+
+    def add_sell(self, quantity: float, date: datetime) -> float:
+        """
+        Procesa una venta consumiendo lotes FIFO (oversell -> posición corta).
+        Retorna el coste de las acciones vendidas (para P&L).
+        """
+        date = self._normalize_dt(date)
+        eps = self.epsilon
+        lots = self.lots
+        remaining = float(quantity)
+        total_cost_sold = 0.0
+
+        while remaining > eps and lots:
+            oldest_lot = lots[0]
+            if oldest_lot.quantity <= remaining + eps:
+                remaining -= oldest_lot.quantity
+                total_cost_sold += oldest_lot.total_cost
+                lots.popleft()
+            else:
+                cost_sold_from_lot = oldest_lot.total_cost / oldest_lot.quantity * remaining
+                oldest_lot.quantity -= remaining
+                oldest_lot.total_cost -= cost_sold_from_lot
+                total_cost_sold += cost_sold_from_lot
+                remaining = 0.0
+
+        self.last_transaction_date = date.date()
+
+        if remaining > eps:
+            print(
+                f"⚠️  Advertencia ({self.symbol}): Se intentó vender {remaining} más de lo disponible en fecha {date} "
+                "- Registrado como posición corta temporal"
+            )
+            self.short_position += remaining
+
+        return total_cost_sold
+
+    def get_current_position(self) -> Dict[str, Any]:
+        """Obtiene la posición actual calculada desde los lotes"""
+        if not self.lots:
+            return {
+                'quantity': 0,
+                'total_cost': 0,
+                'average_buy_price': 0,
+                'first_purchase_date': None,
+                'last_transaction_date': self.last_transaction_date
+            }
+
+        total_quantity = 0.0
+        total_cost = 0.0
+        for lot in self.lots:
+            total_quantity += lot.quantity
+            total_cost += lot.total_cost
+
+        return {
+            'quantity': total_quantity,
+            'total_cost': total_cost,
+            'average_buy_price': total_cost / total_quantity if total_quantity > 0 else 0,
+            'first_purchase_date': self.first_purchase_date,
+            'last_transaction_date': self.last_transaction_date
+        }
+
+    def is_closed(self) -> bool:
+        """Verifica si la posición está cerrada (vendida completamente y sin shorts pendientes)"""
+        return len(self.lots) == 0 and self.short_position <= self.epsilon
+
+
 def calculate_holdings_fifo(transactions: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
     """
     Calcula holdings usando FIFO robusto desde una lista de transacciones.
@@ -0,0 +1,412 @@
+"""
+FIFO Checkpoint Service
+
+Checkpoints persistidos (tabla fifo_checkpoints) del estado FIFO de un ledger a fin
+de mes, por cuenta (account_id) o para el ledger completo del usuario (account_id NULL).
+
+- LedgerState: estado reanudable (lotes, cortos, caja por divisa, P&L realizado acumulado)
+- FifoCheckpointService.state_at(): reanuda desde el checkpoint más cercano <= fecha y
+  replaya solo la cola de transacciones posteriores
+- Invalidación automática: cualquier INSERT/UPDATE/DELETE ORM de Transaction con fecha D
+  borra los checkpoints de ese usuario con as_of >= D (cuenta afectada + ledger completo)
+
+Los importes de caja y P&L se guardan en divisa local (por divisa) y se convierten a EUR
+al leer: así el checkpoint no queda obsoleto cuando cambian las tasas de cambio.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app import db
+from app.models.fifo_checkpoint import FifoCheckpoint
+from app.models.transaction import Transaction
+from app.services import transaction_frame
+from app.services.currency_service import convert_to_eur
+from app.services.fifo_calculator import FloatFIFOCalculator
+
+logger = logging.getLogger(__name__)
+
+# Columnas de Transaction que afectan al estado FIFO/caja (cambios en notas, descripción... no invalidan)
+_LEDGER_COLUMNS = (
+    'user_id', 'account_id', 'asset_id', 'transaction_type', 'transaction_date',
+    'quantity', 'price', 'amount', 'currency', 'commission', 'fees', 'tax',
+)
+
+_SESSION_KEY = '_fifo_checkpoint_invalidations'
+_registered = False
+
+
+def _month_end(d: date) -> date:
+    first_next = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first_next - timedelta(days=1)
+
+
+def _add(bucket: Dict[str, float], currency: Optional[str], amount: float) -> None:
+    key = currency or ''
+    bucket[key] = bucket.get(key, 0.0) + amount
+
+
+class LedgerState:
+    """
+    Estado FIFO reanudable de un ledger ordenado por (transaction_date, id).
+
+    positions usa la semántica de P&L realizado/holdings (una venta sin lotes abre corto).
+    PortfolioValuation ignora las ventas de un activo sin compra previa: esos activos
+    ("huérfanos") llevan un FIFO paralelo en valuation_only (None hasta la primera compra).
+    """
+
+    def __init__(self):
+        self.positions: Dict[int, FloatFIFOCalculator] = {}
+        self.valuation_only: Dict[int, Optional[FloatFIFOCalculator]] = {}
+        self.external_cash: Dict[str, float] = {}  # DEPOSIT/WITHDRAWAL/DIVIDEND/FEE por divisa
+        self.trade_cash: Dict[int, Dict[str, float]] = {}  # Caja de BUY/SELL por activo y divisa
+        self.realized: Dict[int, Dict[str, List[float]]] = {}  # [ingresos, coste FIFO, nº ventas]
+        self.txn_count = 0
+
+    # ------------------------------------------------------------------
+    # Replay
+    # ------------------------------------------------------------------
+
+    def apply(self, txn) -> None:
+        """Aplica una transacción (en orden cronológico)."""
+        txn_type = txn.transaction_type
+        asset_id = txn.asset_id
+        self.txn_count += 1
+
+        if txn_type == 'DEPOSIT' or txn_type == 'DIVIDEND':
+            _add(self.external_cash, txn.currency, abs(txn.amount))
+        elif txn_type == 'WITHDRAWAL' or txn_type == 'FEE':
+            _add(self.external_cash, txn.currency, -abs(txn.amount))
+
+        elif txn_type == 'BUY' and asset_id:
+            total_cost = (txn.quantity * txn.price) + (txn.commission or 0) + \
+                (txn.fees or 0) + (txn.tax or 0)
+            _add(self.trade_cash.setdefault(asset_id, {}), txn.currency, -total_cost)
+
+            if asset_id not in self.positions:
+                self.positions[asset_id] = FloatFIFOCalculator(symbol=f"Asset_{asset_id}")
+            self.positions[asset_id].add_buy(
+                quantity=txn.quantity,
+                price=txn.price,
+                date=txn.transaction_date,
+                total_cost=total_cost
+            )
+
+            if asset_id in self.valuation_only:
+                if self.valuation_only[asset_id] is None:
+                    self.valuation_only[asset_id] = FloatFIFOCalculator(symbol=f"Asset_{asset_id}")
+                self.valuation_only[asset_id].add_buy(
+                    quantity=txn.quantity,
+                    price=txn.price,
+                    date=txn.transaction_date,
+                    total_cost=total_cost
+                )
+
+        elif txn_type == 'SELL' and asset_id:
+            proceeds = (txn.quantity * txn.price) - (txn.commission or 0) - \
+                (txn.fees or 0) - (txn.tax or 0)
+            _add(self.trade_cash.setdefault(asset_id, {}), txn.currency, proceeds)
+
+            if asset_id not in self.positions:
+                self.positions[asset_id] = FloatFIFOCalculator(symbol=f"Asset_{asset_id}")
+                self.valuation_only[asset_id] = None
+            cost_basis = float(self.positions[asset_id].add_sell(
+                quantity=txn.quantity,
+                date=txn.transaction_date
+            ))
+
+            if self.valuation_only.get(asset_id) is not None:
+                self.valuation_only[asset_id].add_sell(
+                    quantity=txn.quantity,
+                    date=txn.transaction_date
+                )
+
+            acc = self.realized.setdefault(asset_id, {}).setdefault(txn.currency or '', [0.0, 0.0, 0])
+            acc[0] += proceeds
+            acc[1] += cost_basis
+            acc[2] += 1
+
+    # ------------------------------------------------------------------
+    # Lecturas
+    # ------------------------------------------------------------------
+
+    def valuation_fifos(self) -> Dict[int, FloatFIFOCalculator]:
+        """FIFOs con la semántica de PortfolioValuation (ventas huérfanas ignoradas)."""
+        result = {}
+        for asset_id, fifo in self.positions.items():
+            if asset_id in self.valuation_only:
+                fifo = self.valuation_only[asset_id]
+                if fifo is None:
+                    continue
+            result[asset_id] = fifo
+        return result
+
+    def cash_balance_eur(self, asset_ids: Optional[Iterable[int]] = None, on_date=None) -> float:
+        """
+        Caja en EUR = flujos externos + caja de compras/ventas.
+        asset_ids limita la caja de trading a esos activos (None = todos).
+        on_date: fecha del tipo de cambio (None = tasa actual).
+        """
+        allowed = None if asset_ids is None else set(asset_ids)
+        total = 0.0
+        for currency, amount in self.external_cash.items():
+            total += convert_to_eur(amount, currency, on_date)
+        for asset_id, buckets in self.trade_cash.items():
+            if allowed is not None and asset_id not in allowed:
+                continue
+            for currency, amount in buckets.items():
+                total += convert_to_eur(amount, currency, on_date)
+        return total
+
+    def realized_totals_eur(self, asset_ids: Optional[Iterable[int]] = None) -> Dict[str, float]:
+        """P&L realizado acumulado en EUR (mismo criterio que BasicMetrics.calculate_pl_realized)."""
+        allowed = None if asset_ids is None else set(asset_ids)
+        realized_pl = 0.0
+        cost_basis = 0.0
+        sales = 0
+        for asset_id, buckets in self.realized.items():
+            if allowed is not None and asset_id not in allowed:
+                continue
+            for currency, (proceeds, cost, count) in buckets.items():
+                cost_eur = convert_to_eur(cost, currency)
+                realized_pl += convert_to_eur(proceeds, currency) - cost_eur
+                cost_basis += cost_eur
+                sales += count
+        return {'realized_pl': realized_pl, 'cost_basis': cost_basis, 'total_sales': sales}
+
+    # ------------------------------------------------------------------
+    # Serialización
+    # ------------------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'positions': {str(k): v.to_dict() for k, v in self.positions.items()},
+            'valuation_only': {
+                str(k): (v.to_dict() if v is not None else None) for k, v in self.valuation_only.items()
+            },
+            'external_cash': dict(self.external_cash),
+            'trade_cash': {str(k): dict(v) for k, v in self.trade_cash.items()},
+            'realized': {str(k): {c: list(a) for c, a in v.items()} for k, v in self.realized.items()},
+            'txn_count': self.txn_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LedgerState':
+        state = cls()
+        state.positions = {int(k): FloatFIFOCalculator.from_dict(v) for k, v in (data.get('positions') or {}).items()}
+        state.valuation_only = {
+            int(k): (FloatFIFOCalculator.from_dict(v) if v is not None else None)
+            for k, v in (data.get('valuation_only') or {}).items()
+        }
+        state.external_cash = dict(data.get('external_cash') or {})
+        state.trade_cash = {int(k): dict(v) for k, v in (data.get('trade_cash') or {}).items()}
+        state.realized = {
+            int(k): {c: list(a) for c, a in v.items()} for k, v in (data.get('realized') or {}).items()
+        }
+        state.txn_count = int(data.get('txn_count') or 0)
+        return state
+
+
+class FifoCheckpointService:
+    """Lectura/escritura de checkpoints FIFO y reanudación de estados."""
+
+    @staticmethod
+    def _scope(query, user_id: int, account_id: Optional[int]):
+        query = query.filter(FifoCheckpoint.user_id == user_id)
+        if account_id is None:
+            return query.filter(FifoCheckpoint.account_id.is_(None))
+        return query.filter(FifoCheckpoint.account_id == account_id)
+
+    @staticmethod
+    def _to_datetime(target) -> datetime:
+        if isinstance(target, datetime):
+            return target
+        return datetime.combine(target, time.max)
+
+    @staticmethod
+    def latest_checkpoint(user_id: int, target, account_id: Optional[int] = None) -> Optional[FifoCheckpoint]:
+        """Checkpoint más reciente cuyo fin de día (as_of 23:59:59.999999) es <= target."""
+        target_dt = FifoCheckpointService._to_datetime(target)
+        limit = target_dt.date() if target_dt.time() == time.max else target_dt.date() - timedelta(days=1)
+        query = FifoCheckpointService._scope(FifoCheckpoint.query, user_id, account_id)
+        return query.filter(FifoCheckpoint.as_of <= limit).order_by(FifoCheckpoint.as_of.desc()).first()
+
+    @staticmethod
+    def state_at(
+        user_id: int,
+        target,
+        account_id: Optional[int] = None,
+        transaction_types: Optional[Iterable[str]] = None,
+        save: bool = False,
+    ) -> LedgerState:
+        """
+        Estado del ledger tras aplicar todas las transacciones con fecha <= target.
+
+        Args:
+            account_id: Cuenta concreta o None para el ledger completo del usuario
+            transaction_types: Si se indica, solo carga esos tipos en la cola (p.ej. BUY/SELL).
+                               El checkpoint reanudado conserva el estado completo.
+            save: Si True, añade a la sesión checkpoints de los meses completos recorridos
+                  (sin commit: lo decide el llamador)
+        """
+        target_dt = FifoCheckpointService._to_datetime(target)
+        checkpoint = FifoCheckpointService.latest_checkpoint(user_id, target_dt, account_id)
+
+        if checkpoint:
+            state = LedgerState.from_dict(checkpoint.state)
+            resume_after = datetime.combine(checkpoint.as_of, time.max)
+        else:
+            state = LedgerState()
+            resume_after = None
+
+        if transaction_types is not None:
+            # Un checkpoint guardado desde una cola filtrada no tendría la caja completa
+            save = False
+        frame = transaction_frame.for_user(user_id)
+        tail = frame.rows(frame.mask(
+            types=transaction_types,
+            after=resume_after,
+            end=target_dt,
+            account_ids=[account_id] if account_id is not None else None,
+        ))
+
+        new_checkpoints: List[Tuple[date, Dict[str, Any], int]] = []
+        current_month_start = date.today().replace(day=1)
+        pending_month_end = None
+
+        for txn in tail:
+            month_end = _month_end(txn.transaction_date.date())
+            if save and pending_month_end is not None and month_end != pending_month_end:
+                if pending_month_end < current_month_start:
+                    new_checkpoints.append((pending_month_end, state.to_dict(), state.txn_count))
+            state.apply(txn)
+            pending_month_end = month_end
+
+        if (save and pending_month_end is not None and pending_month_end < current_month_start
+                and datetime.combine(pending_month_end, time.max) <= target_dt):
+            new_checkpoints.append((pending_month_end, state.to_dict(), state.txn_count))
+
+        if new_checkpoints:
+            FifoCheckpointService._store(user_id, account_id, new_checkpoints)
+
+        return state
+
+    @staticmethod
+    def _store(user_id: int, account_id: Optional[int], checkpoints: List[Tuple[date, Dict[str, Any], int]]) -> None:
+        as_of_dates = [c[0] for c in checkpoints]
+        FifoCheckpointService._scope(FifoCheckpoint.query, user_id, account_id).filter(
+            FifoCheckpoint.as_of.in_(as_of_dates)
+        ).delete(synchronize_session=False)
+        for as_of, state_dict, txn_count in checkpoints:
+            db.session.add(FifoCheckpoint(
+                user_id=user_id,
+                account_id=account_id,
+                as_of=as_of,
+                state=state_dict,
+                txn_count=txn_count,
+            ))
+
+    @staticmethod
+    def refresh(user_id: int, commit: bool = True) -> None:
+        """
+        Completa los checkpoints de fin de mes (ledger completo + cada cuenta) hasta el último
+        mes cerrado. Incremental: reanuda desde el último checkpoint válido.
+        """
+        from app.models.broker import BrokerAccount
+
+        last_closed = date.today().replace(day=1) - timedelta(days=1)
+        FifoCheckpointService.state_at(user_id, last_closed, account_id=None, save=True)
+        for account in BrokerAccount.query.filter_by(user_id=user_id).all():
+            FifoCheckpointService.state_at(user_id, last_closed, account_id=account.id, save=True)
+        if commit:
+            db.session.commit()
+
+    @staticmethod
+    def invalidate(user_id: int, from_date=None, account_id: Optional[int] = None) -> None:
+        """
+        Borra checkpoints con as_of >= from_date (None = todos) de la cuenta indicada y del
+        ledger completo del usuario. Sin account_id borra los de todas las cuentas.
+        """
+        query = FifoCheckpoint.query.filter(FifoCheckpoint.user_id == user_id)
+        if account_id is not None:
+            query = query.filter(
+                (FifoCheckpoint.account_id == account_id) | (FifoCheckpoint.account_id.is_(None))
+            )
+        if from_date is not None:
+            if isinstance(from_date, datetime):
+                from_date = from_date.date()
+            query = query.filter(FifoCheckpoint.as_of >= from_date)
+        query.delete(synchronize_session=False)
+
+
+# ----------------------------------------------------------------------
+# Invalidación automática en flush
+# ----------------------------------------------------------------------
+
+def _txn_scopes(txn, state) -> List[Tuple[int, int, date]]:
+    """(user_id, account_id, fecha mínima afectada) para valores actuales y previos."""
+    values = {}
+    for column in ('user_id', 'account_id', 'transaction_date'):
+        history = state.attrs[column].history
+        current = getattr(txn, column)
+        previous = history.deleted[0] if history.deleted else current
+        values[column] = (current, previous)
+
+    dates = [d for d in values['transaction_date'] if d is not None]
+    if not dates:
+        return []
+    min_date = min(d.date() if isinstance(d, datetime) else d for d in dates)
+
+    scopes = []
+    for user_id, account_id in {(values['user_id'][0], values['account_id'][0]),
+                                (values['user_id'][1], values['account_id'][1])}:
+        if user_id is not None:
+            scopes.append((user_id, account_id, min_date))
+    return scopes
+
+
+def _collect_invalidations(session, flush_context, instances) -> None:
+    pending = session.info.setdefault(_SESSION_KEY, [])
+    for txn in list(session.new) + list(session.deleted):
+        if isinstance(txn, Transaction):
+            pending.extend(_txn_scopes(txn, db.inspect(txn)))
+    for txn in session.dirty:
+        if not isinstance(txn, Transaction):
+            continue
+        state = db.inspect(txn)
+        if any(state.attrs[c].history.has_changes() for c in _LEDGER_COLUMNS):
+            pending.extend(_txn_scopes(txn, state))
+
+
+def _apply_invalidations(session, flush_context) -> None:
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending:
+        return
+    table = FifoCheckpoint.__table__
+    connection = session.connection()
+    earliest: Dict[Tuple[int, Optional[int]], date] = {}
+    for user_id, account_id, min_date in pending:
+        key = (user_id, account_id)
+        if key not in earliest or min_date < earliest[key]:
+            earliest[key] = min_date
+    for (user_id, account_id), min_date in earliest.items():
+        scope = table.c.account_id.is_(None)
+        if account_id is not None:
+            scope = scope | (table.c.account_id == account_id)
+        connection.execute(
+            table.delete().where(table.c.user_id == user_id, scope, table.c.as_of >= min_date)
+        )
+
+
+def register_fifo_checkpoint_invalidation(db) -> None:
+    """Registra before_flush/after_flush para invalidar checkpoints al escribir transacciones."""
+    global _registered
+    if _registered:
+        return
+    from sqlalchemy import event
+
+    event.listen(db.session, 'before_flush', _collect_invalidations)
+    event.listen(db.session, 'after_flush', _apply_invalidations)
+    _registered = True
@@ -0,0 +1,259 @@
+"""
+FX Rate Service - Tipos de cambio históricos diarios a EUR
+
+- Tabla global fx_rates_daily (una fila por divisa y día hábil del BCE)
+- Backfill incremental desde Frankfurter (tipos de referencia del BCE, sin API key)
+- Fichero CSV de fallback (date,currency,rate_to_eur) para entornos sin red
+- Serie en memoria por divisa (arrays NumPy de ordinales de fecha + tasas) para resolver
+  la tasa de muchas fechas con un único np.searchsorted
+
+Regla de lectura: la tasa de una fecha es la del último día publicado <= fecha (fines de
+semana/festivos); antes del primer dato se usa el primero. Las fechas >= hoy y las divisas
+sin histórico usan la tasa actual de currency_service.
+"""
+from __future__ import annotations
+
+import csv
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import requests
+
+from app import db
+from app.models.fx_rate import FxRateDaily
+
+logger = logging.getLogger(__name__)
+
+FRANKFURTER_URL = "https://api.frankfurter.app"
+_MEMORY_TTL_S = 60 * 60
+
+# Serie en memoria: {currency: (ordinales int64 ascendentes, tasas float64)}
+_history: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+_history_loaded_at: Optional[float] = None
+_history_lock = Lock()
+
+
+class FxRateService:
+    """Mantenimiento y lectura de la serie diaria de tipos de cambio."""
+
+    # ------------------------------------------------------------------
+    # Lectura (memoria)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_history() -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        global _history, _history_loaded_at
+
+        if _history_loaded_at is not None and time.time() - _history_loaded_at < _MEMORY_TTL_S:
+            return _history
+
+        from flask import has_app_context
+
+        if not has_app_context():
+            return _history
+
+        with _history_lock:
+            if _history_loaded_at is not None and time.time() - _history_loaded_at < _MEMORY_TTL_S:
+                return _history
+            # Conexión propia: un fallo (tabla sin migrar) no debe afectar a la sesión del llamador
+            table = FxRateDaily.__table__
+            try:
+                with db.engine.connect() as connection:
+                    rows = connection.execute(
+                        db.select(table.c.currency, table.c.rate_date, table.c.rate_to_eur)
+                        .order_by(table.c.currency, table.c.rate_date)
+                    ).all()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer fx_rates_daily: {e}")
+                rows = []
+
+            grouped: Dict[str, Tuple[list, list]] = {}
+            for currency, rate_date, rate in rows:
+                days, rates = grouped.setdefault(currency, ([], []))
+                days.append(rate_date.toordinal())
+                rates.append(rate)
+
+            if not rows:
+                grouped = FxRateService._read_fallback_file()
+
+            _history = {
+                currency: (np.asarray(days, dtype=np.int64), np.asarray(rates, dtype=np.float64))
+                for currency, (days, rates) in grouped.items()
+            }
+            _history_loaded_at = time.time()
+            return _history
+
+    @staticmethod
+    def clear_memory() -> None:
+        """Fuerza recarga de la serie en memoria en la siguiente lectura."""
+        global _history_loaded_at
+        with _history_lock:
+            _history_loaded_at = None
+
+    @staticmethod
+    def rates_on(currency: str, ordinals: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Tasas a EUR de currency para cada ordinal de fecha, o None si no hay histórico.
+
+        Args:
+            currency: Código ya normalizado (USD, GBP, GBX...)
+            ordinals: np.ndarray int64 de date.toordinal()
+        """
+        history = FxRateService._load_history()
+        scale = 1.0
+        series = history.get(currency)
+        if series is None and currency == 'GBX':
+            series = history.get('GBP')
+            scale = 0.01
+        if series is None or len(series[0]) == 0:
+            return None
+
+        days, rates = series
+        idx = np.searchsorted(days, ordinals, side='right') - 1
+        np.clip(idx, 0, len(days) - 1, out=idx)
+        return rates[idx] * scale
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fetch_range(start: date, end: date) -> Dict[date, Dict[str, float]]:
+        """Tipos BCE (EUR->X) entre start y end, invertidos a X->EUR."""
+        url = f"{FRANKFURTER_URL}/{start.isoformat()}..{end.isoformat()}"
+        response = requests.get(url, params={'from': 'EUR'}, timeout=15)
+        response.raise_for_status()
+        data = response.json()
+
+        try:
+            from app.services.api_log_service import log_api_call
+            log_api_call(
+                api_name='frankfurter',
+                endpoint_or_operation=url,
+                response_status=response.status_code,
+                value_reported={'days': len(data.get('rates') or {})},
+            )
+        except Exception:
+            pass
+
+        result = {}
+        for day_str, rates_from_eur in (data.get('rates') or {}).items():
+            day = date.fromisoformat(day_str)
+            result[day] = {c: 1 / r for c, r in rates_from_eur.items() if r and r > 0}
+        return result
+
+    @staticmethod
+    def _upsert(rows_by_day: Dict[date, Dict[str, float]], source: str) -> int:
+        if not rows_by_day:
+            return 0
+        table = FxRateDaily.__table__
+        days = sorted(rows_by_day.keys())
+        db.session.execute(
+            table.delete().where(table.c.rate_date >= days[0], table.c.rate_date <= days[-1])
+        )
+        now = datetime.utcnow()
+        rows = [
+            {'currency': currency, 'rate_date': day, 'rate_to_eur': rate, 'source': source, 'updated_at': now}
+            for day in days
+            for currency, rate in rows_by_day[day].items()
+        ]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        return len(rows)
+
+    @staticmethod
+    def _default_start() -> date:
+        from app.models.transaction import Transaction
+
+        first = db.session.query(db.func.min(Transaction.transaction_date)).scalar()
+        if first:
+            return first.date() if isinstance(first, datetime) else first
+        return date.today() - timedelta(days=365)
+
+    @staticmethod
+    def backfill(start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """
+        Rellena fx_rates_daily desde el proveedor. Incremental: sin start reanuda tras el
+        último día guardado (o desde la primera transacción de cualquier usuario).
+        Si el proveedor falla, carga el fichero de fallback. Devuelve filas escritas.
+        """
+        end = end or date.today()
+        if start is None:
+            last = db.session.query(db.func.max(FxRateDaily.rate_date)).scalar()
+            start = (last + timedelta(days=1)) if last else FxRateService._default_start()
+        if start > end:
+            return 0
+
+        written = 0
+        try:
+            chunk_start = start
+            while chunk_start <= end:
+                chunk_end = min(end, chunk_start.replace(month=12, day=31))
+                written += FxRateService._upsert(FxRateService._fetch_range(chunk_start, chunk_end), 'ecb')
+                chunk_start = chunk_end + timedelta(days=1)
+        except Exception as e:
+            logger.error(f"❌ Error al obtener histórico de tipos de cambio: {e}")
+            db.session.rollback()
+            written = FxRateService.load_fallback_file()
+
+        db.session.commit()
+        FxRateService.clear_memory()
+        return written
+
+    # ------------------------------------------------------------------
+    # Fichero de fallback
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _fallback_path() -> Optional[str]:
+        from flask import current_app, has_app_context
+
+        if not has_app_context():
+            return None
+        return current_app.config.get('FX_RATES_FALLBACK_FILE')
+
+    @staticmethod
+    def _read_fallback_file(path: Optional[str] = None) -> Dict[str, Tuple[list, list]]:
+        path = path or FxRateService._fallback_path()
+        grouped: Dict[str, Tuple[list, list]] = {}
+        if not path or not os.path.exists(path):
+            return grouped
+        with open(path, newline='') as f:
+            rows = sorted(
+                (r['currency'], date.fromisoformat(r['date']), float(r['rate_to_eur']))
+                for r in csv.DictReader(f)
+            )
+        for currency, day, rate in rows:
+            days, rates = grouped.setdefault(currency, ([], []))
+            days.append(day.toordinal())
+            rates.append(rate)
+        return grouped
+
+    @staticmethod
+    def load_fallback_file(path: Optional[str] = None) -> int:
+        """Carga el CSV de fallback en fx_rates_daily (sin commit). Devuelve filas escritas."""
+        rows_by_day: Dict[date, Dict[str, float]] = {}
+        for currency, (days, rates) in FxRateService._read_fallback_file(path).items():
+            for ordinal, rate in zip(days, rates):
+                rows_by_day.setdefault(date.fromordinal(ordinal), {})[currency] = rate
+        return FxRateService._upsert(rows_by_day, 'file')
+
+    @staticmethod
+    def export_fallback_file(path: Optional[str] = None) -> int:
+        """Vuelca fx_rates_daily al CSV de fallback. Devuelve filas escritas."""
+        path = path or FxRateService._fallback_path()
+        rows = db.session.query(
+            FxRateDaily.rate_date, FxRateDaily.currency, FxRateDaily.rate_to_eur
+        ).order_by(FxRateDaily.rate_date, FxRateDaily.currency).all()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['date', 'currency', 'rate_to_eur'])
+            for rate_date, currency, rate in rows:
+                writer.writerow([rate_date.isoformat(), currency, repr(rate)])
+        return len(rows)
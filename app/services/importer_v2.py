@@ -1,10 +1,18 @@
 """
 CSV Importer V2 - Usa AssetRegistry como cache global
+
+Resolución de ISINs con consultas IN (registro y assets locales) y escritura de las
+transacciones con INSERT masivo: el lock de escritura de SQLite solo se mantiene durante el
+insert y el recálculo de holdings.
+
+import_data() recibe el resultado completo de parse(); import_events() consume en bloques de
+tamaño fijo los eventos de parser.iter_events() (memoria acotada en extractos grandes).
 """
 import logging
-from typing import Dict, List, Any, Callable, Union, Optional
+from typing import Dict, Iterable, List, Any, Callable, Union, Optional
 from datetime import datetime
 from decimal import Decimal
+from sqlalchemy import insert
 from app import db
 
 # Logger específico para importaciones
@@ -14,8 +22,16 @@ from app.models import (
     User, BrokerAccount, Asset, AssetRegistry,
     PortfolioHolding, Transaction, CashFlow
 )
-from app.services.fifo_calculator import FIFOCalculator
+from app.services.fifo_checkpoint_service import FifoCheckpointService, LedgerState
+from app.services import cache_invalidation_bus
 from app.services.asset_registry_service import AssetRegistryService
+from app.services.monthly_rollup_service import BROKER_FLOW_TYPES, MonthlyRollupService
+from app.services.portfolio_holding_service import upsert_holdings
+from app.services.parsers.streaming import ParsedEvent, ThroughputCounter, chunked, collect_events
+from app.services.transaction_frame import bump_ledger_version
+
+# Eventos por bloque en la importación en streaming (import_events)
+IMPORT_CHUNK_SIZE = 5000
 
 
 def parse_datetime(date_value: Union[str, datetime, None]) -> Union[datetime, None]:
@@ -96,6 +112,10 @@ class CSVImporterV2:
         
         # Cache local de assets creados en esta importación
         self.asset_cache = {}  # {isin: Asset}
+        self.asset_ids = {}  # {isin: asset_id} (None = sin asset); válido tras los commits
+        self.registry_cache = {}  # {isin: AssetRegistry} cargado con consultas IN
+        # Filas de Transaction pendientes de INSERT masivo
+        self.pending_rows = []
         # Cache compartido de ISINs cuyo enriquecimiento ya falló (evita reintentos en la misma sesión)
         self.failed_enrichment_cache = failed_enrichment_cache if failed_enrichment_cache is not None else set()
         self.asset_ids_touched = set()  # ids de Asset referenciados en este CSV (post-commit: refresco consenso)
@@ -118,45 +138,157 @@ class CSVImporterV2:
         # 1. Crear snapshot de transacciones existentes
         self._create_transaction_snapshot()
         
-        # 2. Procesar assets y detectar los que necesitan enriquecimiento
+        # 2-4. Registrar, enriquecer y crear Assets locales
+        self._resolve_assets(parsed_data, progress_callback)
+        
+        # 5. Importar transacciones, dividendos, fees, etc.
+        pending_count = self._import_records(parsed_data)
+        _idebug.debug(f"Transacciones pendientes de commit: {pending_count}")
+        
+        return self._finish_import()
+
+    def import_events(
+        self,
+        events: Iterable[ParsedEvent],
+        broker: str = 'CSV',
+        progress_callback: Callable[[int, int, str], None] = None,
+        chunk_size: int = IMPORT_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Importa en streaming los eventos de `parser.iter_events()` en bloques de `chunk_size`
+
+        Cada bloque resuelve solo sus ISINs nuevos (registro, enriquecimiento, assets),
+        inserta sus filas y hace commit antes de leer el siguiente: la memoria no depende del
+        tamaño del archivo y el lock de SQLite se libera entre bloques. Reimportar un archivo
+        a medias es seguro porque el snapshot de duplicados descarta lo ya insertado.
+
+        Args:
+            events: Eventos normalizados (ParsedEvent) del parser
+            broker: Origen de las transacciones (parser.BROKER)
+            progress_callback: Función para reportar progreso(current, total, message)
+            chunk_size: Eventos por bloque
+        """
+        _idebug.info(f"importer_v2: import_events INICIO broker={broker}, chunk_size={chunk_size}")
+        self._create_transaction_snapshot()
+        
+        # rows = transacciones insertadas, events = eventos consumidos del parser
+        throughput = ThroughputCounter()
+        throughput.start()
+        for chunk in chunked(events, chunk_size):
+            chunk_data = collect_events(chunk)
+            chunk_data['broker'] = broker
+            self._resolve_assets(chunk_data, progress_callback)
+            inserted = self._import_records(chunk_data)
+            db.session.commit()
+            throughput.events += len(chunk)
+            throughput.rows += inserted
+            _idebug.debug(f"importer_v2: bloque de {len(chunk)} eventos -> {inserted} transacciones")
+        throughput.stop()
+        self.stats['throughput'] = throughput.as_dict()
+        _idebug.info(f"importer_v2: eventos importados {self.stats['throughput']}")
+        
+        return self._finish_import()
+
+    def import_batch(
+        self,
+        parsed_files: List[Dict[str, Any]],
+        progress_callback: Callable[[int, int, str], None] = None
+    ) -> Dict[str, Any]:
+        """
+        Importa varios archivos ya parseados de esta cuenta con un único recálculo de holdings
+
+        Los archivos se escriben en orden con el mismo snapshot de duplicados; tras cada uno se
+        añaden al snapshot sus filas, de modo que extractos solapados no duplican operaciones
+        (dentro de un mismo archivo, como en import_data, las filas repetidas se respetan).
+        Cada archivo hace commit por separado: si uno falla se descarta solo ese y su error
+        queda en stats['file_errors'] ({índice: mensaje}).
+
+        Args:
+            parsed_files: Resultados de parse() (con 'broker') en el orden a importar
+            progress_callback: Función para reportar progreso(current, total, message)
+        """
+        _idebug.info(f"importer_v2: import_batch INICIO archivos={len(parsed_files)}")
+        self._create_transaction_snapshot()
+        self.stats['file_errors'] = {}
+        
+        for idx, parsed_data in enumerate(parsed_files):
+            counters = {k: v for k, v in self.stats.items() if isinstance(v, int)}
+            skipped_len = len(self.stats['deposits_skipped'])
+            try:
+                self._resolve_assets(parsed_data, progress_callback)
+                self._queue_records(parsed_data)
+                new_keys = {
+                    self._snapshot_key(
+                        row['transaction_type'], row.get('asset_id'), row.get('transaction_date'),
+                        row.get('amount'), row.get('quantity'), row.get('price')
+                    )
+                    for row in self.pending_rows
+                }
+                inserted = self._insert_pending_transactions()
+                db.session.commit()
+                self.existing_transactions_snapshot.update(new_keys)
+                _idebug.debug(f"importer_v2: archivo {idx + 1}/{len(parsed_files)} -> {inserted} transacciones")
+            except Exception as e:
+                db.session.rollback()
+                # Descartar lo que dependía del archivo fallido (assets sin confirmar incluidos)
+                self.pending_rows = []
+                self.asset_ids = {}
+                self.asset_cache = {}
+                self.stats.update(counters)
+                del self.stats['deposits_skipped'][skipped_len:]
+                self.stats['file_errors'][idx] = str(e)
+                _idebug.error(f"importer_v2: archivo {idx + 1}/{len(parsed_files)} ERROR {e}")
+        
+        return self._finish_import()
+
+    def _resolve_assets(
+        self,
+        parsed_data: Dict[str, Any],
+        progress_callback: Callable[[int, int, str], None] = None
+    ) -> None:
+        """Registra los ISINs en AssetRegistry, los enriquece si procede y crea los Assets locales"""
+        # Procesar assets y detectar los que necesitan enriquecimiento
         isins_needed = self._process_assets_to_registry(parsed_data)
         _idebug.info(f"importer_v2: _process_assets_to_registry -> {len(isins_needed)} ISINs necesitan enriquecimiento")
 
-        # 3. Enriquecer assets que lo necesiten (con progreso) - SOLO si está habilitado
+        # Enriquecer assets que lo necesiten (con progreso) - SOLO si está habilitado
         _idebug.debug(f"importer_v2: isins_needed={len(isins_needed) if isins_needed else 0}, enable_enrichment={self.enable_enrichment}")
-        if isins_needed and self.enable_enrichment:
-            self.stats['enrichment_needed'] = len(isins_needed)
-            _idebug.info(f"Iniciando enriquecimiento de {len(isins_needed)} assets")
-            self._enrich_assets_with_progress(isins_needed, progress_callback)
-        elif isins_needed:
-            # Si no está habilitado, solo marcar cuántos quedan pendientes
-            self.stats['enrichment_needed'] = len(isins_needed)
-            self.stats['enrichment_success'] = 0
-            self.stats['enrichment_failed'] = 0
-            _idebug.info(f"{len(isins_needed)} assets sin enriquecer (enrichment deshabilitado)")
-        
-        # 4. Crear Assets locales desde AssetRegistry
-        self._create_local_assets_from_registry(parsed_data)
+        if isins_needed:
+            self.stats['enrichment_needed'] += len(isins_needed)
+            if self.enable_enrichment:
+                _idebug.info(f"Iniciando enriquecimiento de {len(isins_needed)} assets")
+                self._enrich_assets_with_progress(isins_needed, progress_callback)
+            else:
+                # Si no está habilitado, solo queda marcado cuántos quedan pendientes
+                _idebug.info(f"{len(isins_needed)} assets sin enriquecer (enrichment deshabilitado)")
         
-        # 5. Importar transacciones, dividendos, fees, etc.
+        # Crear Assets locales desde AssetRegistry
+        self._create_local_assets_from_registry(parsed_data)
+
+    def _queue_records(self, parsed_data: Dict[str, Any]) -> None:
+        """Prepara transacciones, dividendos, fees y movimientos de caja (filtrando duplicados)"""
         self._import_transactions(parsed_data)
         self._import_dividends(parsed_data)
         self._import_fees(parsed_data)
         self._import_cash_movements(parsed_data)
+
+    def _import_records(self, parsed_data: Dict[str, Any]) -> int:
+        """Prepara los registros y los inserta (sin commit)"""
+        self._queue_records(parsed_data)
+        return self._insert_pending_transactions()
+
+    def _finish_import(self) -> Dict[str, Any]:
+        """Recalcula holdings, hace commit y reconcilia delistings; devuelve las estadísticas"""
+        # Recalcular holdings con FIFO
+        self._recalculate_holdings(self.asset_ids_touched)
         
-        # 6. Recalcular holdings con FIFO
-        self._recalculate_holdings()
-        
-        # 7. Limpiar holdings cerrados
+        # Limpiar holdings cerrados
         self._cleanup_zero_holdings()
         
-        pending_count = len([obj for obj in db.session.new if isinstance(obj, Transaction)])
-        _idebug.debug(f"Transacciones pendientes de commit: {pending_count}")
-        
         db.session.commit()
         _idebug.info("importer_v2: commit OK")
 
-        # 8. Reconciliar delistings: generar SELL automáticas para activos con baja de cotización
+        # Reconciliar delistings: generar SELL automáticas para activos con baja de cotización
         try:
             from app.services.delisting_reconciliation_service import reconcile_delistings
             result = reconcile_delistings(user_id=self.user_id)
@@ -169,7 +301,7 @@ class CSVImporterV2:
         _idebug.debug(f"Transacciones total en cuenta: {saved_count}")
         
         self.stats['asset_ids_touched'] = sorted(self.asset_ids_touched)
-        _idebug.info(f"importer_v2: import_data FIN - stats={self.stats}")
+        _idebug.info(f"importer_v2: import FIN - stats={self.stats}")
         return self.stats
 
     def _note_asset_touched(self, asset: Optional[Asset]) -> None:
@@ -177,34 +309,47 @@ class CSVImporterV2:
             self.asset_ids_touched.add(asset.id)
 
     def _create_transaction_snapshot(self):
-        """Crea snapshot de transacciones existentes"""
-        existing = Transaction.query.filter_by(
-            user_id=self.user_id,
-            account_id=self.broker_account_id
-        ).all()
+        """Crea snapshot de transacciones existentes (solo las columnas de la clave)"""
+        existing = db.session.query(
+            Transaction.transaction_type,
+            Transaction.asset_id,
+            Transaction.transaction_date,
+            Transaction.amount,
+            Transaction.quantity,
+            Transaction.price,
+        ).filter(
+            Transaction.user_id == self.user_id,
+            Transaction.account_id == self.broker_account_id
+        )
         
         for txn in existing:
-            # Para depósitos/retiros/comisiones/dividendos, usar amount en lugar de quantity/price
-            if txn.transaction_type in ('DEPOSIT', 'WITHDRAWAL', 'FEE', 'DIVIDEND'):
-                key = (
-                    txn.transaction_type,
-                    txn.asset_id,
-                    txn.transaction_date.isoformat() if txn.transaction_date else None,
-                    float(txn.amount) if txn.amount else 0,
-                    0  # placeholder para mantener estructura
-                )
-            else:
-                # Para transacciones normales (BUY/SELL), usar quantity y price
-                key = (
-                    txn.transaction_type,
-                    txn.asset_id,
-                    txn.transaction_date.isoformat() if txn.transaction_date else None,
-                    float(txn.quantity) if txn.quantity else 0,
-                    float(txn.price) if txn.price else 0
-                )
-            self.existing_transactions_snapshot.add(key)
+            self.existing_transactions_snapshot.add(self._snapshot_key(
+                txn.transaction_type, txn.asset_id, txn.transaction_date,
+                txn.amount, txn.quantity, txn.price
+            ))
         _idebug.debug(f"importer_v2: snapshot con {len(self.existing_transactions_snapshot)} transacciones existentes")
 
+    @staticmethod
+    def _snapshot_key(transaction_type, asset_id, transaction_date, amount, quantity, price) -> tuple:
+        """Clave de duplicado de una transacción (misma forma que las de cada _import_*)"""
+        # Para depósitos/retiros/comisiones/dividendos, usar amount en lugar de quantity/price
+        if transaction_type in ('DEPOSIT', 'WITHDRAWAL', 'FEE', 'DIVIDEND'):
+            return (
+                transaction_type,
+                asset_id,
+                transaction_date.isoformat() if transaction_date else None,
+                float(amount) if amount else 0,
+                0  # placeholder para mantener estructura
+            )
+        # Para transacciones normales (BUY/SELL), usar quantity y price
+        return (
+            transaction_type,
+            asset_id,
+            transaction_date.isoformat() if transaction_date else None,
+            float(quantity) if quantity else 0,
+            float(price) if price else 0
+        )
+
     def _process_assets_to_registry(self, parsed_data: Dict[str, Any]) -> List[str]:
         """
         Procesa todos los assets del CSV y los registra en AssetRegistry
@@ -213,9 +358,9 @@ class CSVImporterV2:
         isins_in_csv = set()
         assets_dict = {}
         
-        # Recopilar assets únicos del CSV
+        # Recopilar assets únicos del CSV (los ya resueltos en un bloque anterior se omiten)
         for trade in parsed_data.get('trades', []):
-            if trade.get('isin'):
+            if trade.get('isin') and trade['isin'] not in self.asset_ids:
                 isin = trade['isin']
                 isins_in_csv.add(isin)
                 
@@ -232,7 +377,7 @@ class CSVImporterV2:
                     }
         
         for holding in parsed_data.get('holdings', []):
-            if holding.get('isin'):
+            if holding.get('isin') and holding['isin'] not in self.asset_ids:
                 isin = holding['isin']
                 isins_in_csv.add(isin)
                 
@@ -249,7 +394,7 @@ class CSVImporterV2:
                     }
         
         for dividend in parsed_data.get('dividends', []):
-            if dividend.get('isin'):
+            if dividend.get('isin') and dividend['isin'] not in self.asset_ids:
                 isin = dividend['isin']
                 isins_in_csv.add(isin)
                 
@@ -265,9 +410,10 @@ class CSVImporterV2:
                         'asset_type': dividend.get('asset_type', 'Stock')
                     }
         
-        # Registrar en AssetRegistry
+        # Registrar en AssetRegistry (registros existentes en una sola consulta)
+        self._load_registries(assets_dict.keys())
         for asset_data in assets_dict.values():
-            registry = self.registry_service.get_or_create_from_isin(**asset_data)
+            registry = self.registry_service.get_or_create_from_isin(**asset_data, cache=self.registry_cache)
             
             if hasattr(registry, 'id') and registry.id:
                 # Ya existía
@@ -277,6 +423,8 @@ class CSVImporterV2:
                 self.stats['registry_created'] += 1
         
         db.session.commit()
+        # El commit expira los registros: recargarlos juntos en vez de uno a uno
+        self._load_registries(isins_in_csv)
         
         # Identificar cuáles necesitan enriquecimiento
         isins_needing_enrichment = [
@@ -287,6 +435,19 @@ class CSVImporterV2:
         _idebug.debug(f"importer_v2: isins_needing_enrichment={isins_needing_enrichment[:10]}{'...' if len(isins_needing_enrichment) > 10 else ''}")
         return isins_needing_enrichment
     
+    def _load_registries(self, isins) -> None:
+        """Carga (o refresca) en registry_cache los AssetRegistry de los ISINs con una consulta IN"""
+        isins = [isin for isin in set(isins) if isin]
+        if not isins:
+            return
+        for registry in AssetRegistry.query.filter(AssetRegistry.isin.in_(isins)):
+            self.registry_cache[registry.isin] = registry
+    
+    def _get_registry(self, isin: str) -> Optional[AssetRegistry]:
+        if isin in self.registry_cache:
+            return self.registry_cache[isin]
+        return AssetRegistry.query.filter_by(isin=isin).first()
+    
     def _registry_needs_enrichment(self, isin: str) -> bool:
         """
         Verifica si un registro necesita enriquecimiento
@@ -301,7 +462,7 @@ class CSVImporterV2:
         if isin and isin.startswith('CRYPTO:'):
             return False
 
-        registry = AssetRegistry.query.filter_by(isin=isin).first()
+        registry = self._get_registry(isin)
         if not registry:
             return False
         
@@ -321,9 +482,10 @@ class CSVImporterV2:
         progress_callback: Callable[[int, int, str], None] = None
     ):
         """
-        Enriquece assets con OpenFIGI, reportando progreso.
+        Enriquece assets con OpenFIGI en lotes (una request por cada `max_jobs` ISINs), reportando progreso.
         Solo enriquece si el registro NO está ya enriquecido en BD (tiene symbol y mic).
-        Usa failed_enrichment_cache para no reintentar ISINs que ya fallaron en esta sesión.
+        Usa failed_enrichment_cache para no reintentar ISINs que ya fallaron en esta sesión y la
+        cache negativa persistente para los que OpenFIGI no reconoció en importaciones anteriores.
         """
         # Filtrar ISINs ya en caché de fallos (evitar reintentos)
         isins_to_try = [i for i in isins if i not in self.failed_enrichment_cache]
@@ -331,35 +493,43 @@ class CSVImporterV2:
         if skipped_cached > 0:
             self.stats['enrichment_failed'] += skipped_cached
             _idebug.info(f"importer_v2: {skipped_cached} ISINs omitidos (ya fallaron en sesión anterior)")
-        total = len(isins_to_try)
 
-        for idx, isin in enumerate(isins_to_try, 1):
-            registry = AssetRegistry.query.filter_by(isin=isin).first()
+        negative = self.registry_service.negative_cached_isins(isins_to_try)
+        if negative:
+            self.stats['enrichment_failed'] += len(negative)
+            self.failed_enrichment_cache.update(negative)
+            _idebug.info(f"importer_v2: {len(negative)} ISINs omitidos (cache negativa de OpenFIGI)")
+
+        registries = []
+        for isin in isins_to_try:
+            if isin in negative:
+                continue
+            registry = self._get_registry(isin)
             if not registry:
                 continue
             # Verificar de nuevo si ya está enriquecido (puede haberse actualizado por otro archivo)
             if not self._registry_needs_enrichment(isin):
                 _idebug.debug(f"importer_v2: ISIN {isin} ya enriquecido en BD - omitido")
                 continue
+            registries.append(registry)
 
-            missing = []
-            if not registry.symbol:
-                missing.append('Symbol')
-            if not registry.mic:
-                missing.append('MIC')
-            missing_str = ' + '.join(missing) if missing else 'datos'
-
+        total = len(registries)
+        done = 0
+        for batch in chunked(registries, self.registry_service.enricher.openfigi.max_jobs):
             if progress_callback:
-                progress_callback(idx, total, f"🔍 {registry.name or isin[:12]}: obteniendo {missing_str}...")
+                progress_callback(done + 1, total, f"🔍 OpenFIGI: obteniendo Symbol + MIC de {len(batch)} activos...")
 
-            success, message = self.registry_service.enrich_from_openfigi(registry, update_db=False)
+            results = self.registry_service.enrich_many_from_openfigi(batch, update_db=False)
+            done += len(batch)
 
-            if success:
-                self.stats['enrichment_success'] += 1
-            else:
-                self.stats['enrichment_failed'] += 1
-                self.failed_enrichment_cache.add(isin)
-                _idebug.warning(f"importer_v2: enriquecimiento fallido ISIN={isin}")
+            for registry in batch:
+                success, message = results.get(registry.isin, (False, 'sin respuesta'))
+                if success:
+                    self.stats['enrichment_success'] += 1
+                else:
+                    self.stats['enrichment_failed'] += 1
+                    self.failed_enrichment_cache.add(registry.isin)
+                    _idebug.warning(f"importer_v2: enriquecimiento fallido ISIN={registry.isin}")
 
         db.session.commit()
     
@@ -381,14 +551,23 @@ class CSVImporterV2:
         for dividend in parsed_data.get('dividends', []):
             if dividend.get('isin'):
                 isins_needed.add(dividend['isin'])
+        isins_needed.difference_update(self.asset_ids)
+        
+        # Assets y registros de todos los ISINs en dos consultas IN
+        self._load_registries(isins_needed)
+        existing_by_isin = {}
+        if isins_needed:
+            for asset in Asset.query.filter(Asset.isin.in_(isins_needed)).order_by(Asset.id):
+                existing_by_isin.setdefault(asset.isin, asset)
         
         # Crear Assets locales
+        created = []
         for isin in isins_needed:
             # Verificar si ya existe
-            existing = Asset.query.filter_by(isin=isin).first()
+            existing = existing_by_isin.get(isin)
+            registry = self.registry_cache.get(isin)
             if existing:
                 # Si existe, actualizar desde AssetRegistry enriquecido
-                registry = AssetRegistry.query.filter_by(isin=isin).first()
                 if registry:
                     # Actualizar campos desde registry si están disponibles
                     if registry.symbol and not existing.symbol:
@@ -402,20 +581,25 @@ class CSVImporterV2:
                     if registry.ibkr_exchange and not existing.exchange:
                         existing.exchange = registry.ibkr_exchange
                 self.asset_cache[isin] = existing
+                self.asset_ids[isin] = existing.id
                 self._note_asset_touched(existing)
                 continue
             
             # Obtener desde registro
-            registry = AssetRegistry.query.filter_by(isin=isin).first()
             if not registry:
+                self.asset_ids[isin] = None
                 continue
             
-            # Crear Asset local
-            asset = self.registry_service.create_asset_from_registry(registry, self.user_id)
+            # Crear Asset local (INSERT agrupado en un solo flush)
+            asset = self.registry_service.create_asset_from_registry(registry, self.user_id, flush=False)
             self.asset_cache[isin] = asset
+            created.append((isin, asset))
             self.stats['assets_created'] += 1
-            self._note_asset_touched(asset)
         
+        db.session.flush()
+        for isin, asset in created:
+            self.asset_ids[isin] = asset.id
+            self._note_asset_touched(asset)
         db.session.commit()
     
     def _find_asset_by_isin(self, isin: str) -> Asset:
@@ -429,6 +613,48 @@ class CSVImporterV2:
         
         return asset
     
+    def _find_asset_id_by_isin(self, isin: str) -> Optional[int]:
+        """Id del asset por ISIN sin refrescar objetos expirados por el commit (cache primero)"""
+        if isin in self.asset_ids:
+            return self.asset_ids[isin]
+        asset_id = db.session.query(Asset.id).filter_by(isin=isin).order_by(Asset.id).limit(1).scalar()
+        self.asset_ids[isin] = asset_id
+        return asset_id
+    
+    def _queue_transaction(self, **values) -> None:
+        """Prepara una fila de Transaction para el INSERT masivo"""
+        values.setdefault('user_id', self.user_id)
+        values.setdefault('account_id', self.broker_account_id)
+        self.pending_rows.append(values)
+    
+    def _insert_pending_transactions(self) -> int:
+        """
+        Inserta todas las filas preparadas con un único INSERT (executemany), sin commit.
+        
+        El insert masivo no pasa por el flush del ORM: invalida a mano los checkpoints FIFO
+        de la cuenta, los agregados mensuales (DEPOSIT/WITHDRAWAL) y la versión del ledger, y
+        publica la fecha más antigua en el bus de invalidación de cachés.
+        """
+        rows, self.pending_rows = self.pending_rows, []
+        if not rows:
+            return 0
+        db.session.execute(insert(Transaction), rows)
+        
+        dates = [r['transaction_date'] for r in rows if r.get('transaction_date')]
+        if dates:
+            FifoCheckpointService.invalidate(
+                self.user_id, account_id=self.broker_account_id, from_date=min(dates)
+            )
+            cache_invalidation_bus.publish(self.user_id, cache_invalidation_bus.LEDGER, dates=[min(dates)])
+        flow_dates = [
+            r['transaction_date'] for r in rows
+            if r['transaction_type'] in BROKER_FLOW_TYPES and r.get('transaction_date')
+        ]
+        if flow_dates:
+            MonthlyRollupService.invalidate(self.user_id, from_date=min(flow_dates))
+        bump_ledger_version([self.user_id])
+        return len(rows)
+    
     # Métodos de importación (copiados del importer original)
     def _import_transactions(self, parsed_data: Dict[str, Any]):
         """Importa transacciones (BUY/SELL)"""
@@ -447,8 +673,8 @@ class CSVImporterV2:
                 skipped_forex += 1
                 continue
             
-            asset = self._find_asset_by_isin(trade_data.get('isin'))
-            if not asset:
+            asset_id = self._find_asset_id_by_isin(trade_data.get('isin'))
+            if not asset_id:
                 skipped_no_asset += 1
                 _idebug.warning(f"importer_v2: trade sin asset ISIN={trade_data.get('isin')} -> saltado")
                 continue
@@ -461,7 +687,7 @@ class CSVImporterV2:
             
             txn_key = (
                 trade_data['transaction_type'],
-                asset.id,
+                asset_id,
                 trade_date_str,
                 float(trade_data.get('quantity', 0)),
                 float(trade_data.get('price', 0))
@@ -484,10 +710,8 @@ class CSVImporterV2:
             txn_date = parse_datetime(txn_date_raw)
             settlement = parse_datetime(settlement_raw)
             
-            transaction = Transaction(
-                user_id=self.user_id,
-                account_id=self.broker_account_id,
-                asset_id=asset.id,
+            self._queue_transaction(
+                asset_id=asset_id,
                 transaction_type=trade_data['transaction_type'],
                 transaction_date=txn_date,
                 settlement_date=settlement,
@@ -502,11 +726,9 @@ class CSVImporterV2:
                 description=trade_data.get('description', ''),
                 source=parsed_data.get('broker', 'CSV')
             )
-            
-            db.session.add(transaction)
             self.stats['transactions_created'] += 1
             created += 1
-            self._note_asset_touched(asset)
+            self.asset_ids_touched.add(asset_id)
         
         _idebug.info(f"importer_v2: transacciones -> Forex={skipped_forex}, NoAsset={skipped_no_asset}, Duplicados={skipped_duplicate}, Creadas={created}")
     
@@ -515,8 +737,8 @@ class CSVImporterV2:
         skipped_duplicate = 0
         
         for div_data in parsed_data.get('dividends', []):
-            asset = self._find_asset_by_isin(div_data.get('isin'))
-            if not asset:
+            asset_id = self._find_asset_id_by_isin(div_data.get('isin'))
+            if not asset_id:
                 _idebug.warning(f"importer_v2: dividendo sin asset ISIN={div_data.get('isin')} -> saltado")
                 continue
             
@@ -534,7 +756,7 @@ class CSVImporterV2:
             div_amount = float(div_data['amount'])
             div_key = (
                 'DIVIDEND',
-                asset.id,  # asset_id es importante para dividendos
+                asset_id,  # asset_id es importante para dividendos
                 div_date_str,
                 div_amount,  # amount es clave para detectar duplicados
                 0  # placeholder
@@ -544,10 +766,8 @@ class CSVImporterV2:
                 skipped_duplicate += 1
                 continue
             
-            transaction = Transaction(
-                user_id=self.user_id,
-                account_id=self.broker_account_id,
-                asset_id=asset.id,
+            self._queue_transaction(
+                asset_id=asset_id,
                 transaction_type='DIVIDEND',
                 transaction_date=div_date,
                 settlement_date=div_date,
@@ -562,10 +782,8 @@ class CSVImporterV2:
                 description=div_data.get('description', 'Dividendo'),
                 source=parsed_data.get('broker', 'CSV')
             )
-            
-            db.session.add(transaction)
             self.stats['dividends_created'] += 1
-            self._note_asset_touched(asset)
+            self.asset_ids_touched.add(asset_id)
         
         if skipped_duplicate > 0:
             _idebug.info(f"importer_v2: dividendos duplicados saltados={skipped_duplicate}")
@@ -599,9 +817,7 @@ class CSVImporterV2:
                 skipped_duplicate += 1
                 continue
             
-            transaction = Transaction(
-                user_id=self.user_id,
-                account_id=self.broker_account_id,
+            self._queue_transaction(
                 asset_id=None,
                 transaction_type='FEE',
                 transaction_date=fee_date,
@@ -613,8 +829,6 @@ class CSVImporterV2:
                 description=fee_data.get('description', 'Comisión'),
                 source=parsed_data.get('broker', 'CSV')
             )
-            
-            db.session.add(transaction)
             self.stats['fees_created'] += 1
         
         if skipped_duplicate > 0:
@@ -657,9 +871,7 @@ class CSVImporterV2:
                 _idebug.debug(f"Depósito duplicado: {deposit_date.date()} | {deposit_amount:,.2f} | {desc}")
                 continue
 
-            transaction = Transaction(
-                user_id=self.user_id,
-                account_id=self.broker_account_id,
+            self._queue_transaction(
                 asset_id=None,
                 transaction_type='DEPOSIT',
                 transaction_date=deposit_date,
@@ -671,8 +883,6 @@ class CSVImporterV2:
                 description=deposit_data.get('description', 'Depósito'),
                 source=parsed_data.get('broker', 'CSV')
             )
-            
-            db.session.add(transaction)
             self.stats['deposits_created'] += 1
         
         for withdrawal_data in parsed_data.get('withdrawals', []):
@@ -700,9 +910,7 @@ class CSVImporterV2:
                 skipped_duplicate += 1
                 continue
             
-            transaction = Transaction(
-                user_id=self.user_id,
-                account_id=self.broker_account_id,
+            self._queue_transaction(
                 asset_id=None,
                 transaction_type='WITHDRAWAL',
                 transaction_date=withdrawal_date,
@@ -714,8 +922,6 @@ class CSVImporterV2:
                 description=withdrawal_data.get('description', 'Retiro'),
                 source=parsed_data.get('broker', 'CSV')
             )
-            
-            db.session.add(transaction)
             self.stats['withdrawals_created'] += 1
         
         total_deposits_in_csv = len(parsed_data.get('deposits', []))
@@ -723,71 +929,51 @@ class CSVImporterV2:
         _idebug.info(f"importer_v2: cash_movements -> deposits CSV={total_deposits_in_csv} importados={self.stats.get('deposits_created', 0)} duplicados={skipped_duplicate}")
         _idebug.info(f"importer_v2: cash_movements -> withdrawals CSV={total_withdrawals} importados={self.stats.get('withdrawals_created', 0)}")
     
-    def _recalculate_holdings(self):
-        """Recalcula holdings con FIFO robusto"""
+    def _recalculate_holdings(self, asset_ids: Optional[Iterable[int]] = None):
+        """
+        Recalcula holdings con FIFO robusto
+        
+        Args:
+            asset_ids: Activos cuyas operaciones cambiaron; solo se replayan y reescriben esos
+                       holdings. None = toda la cuenta (reanudando desde el checkpoint FIFO).
+        """
         _idebug.info("Recalculando holdings con FIFO")
         
         # Hacer flush para que las transacciones recién creadas sean visibles en queries
         # (pero NO commit, solo flush)
         db.session.flush()
         
-        # Borrar holdings existentes
-        PortfolioHolding.query.filter_by(
-            user_id=self.user_id,
-            account_id=self.broker_account_id
-        ).delete()
-        
-        # Obtener todas las transacciones ordenadas (incluyendo las recién creadas)
-        transactions = Transaction.query.filter_by(
-            user_id=self.user_id,
-            account_id=self.broker_account_id
-        ).filter(
-            Transaction.transaction_type.in_(['BUY', 'SELL'])
-        ).order_by(Transaction.transaction_date, Transaction.id).all()
-        
-        _idebug.debug(f"Procesando {len(transactions)} transacciones para FIFO")
-        
-        # Agrupar por asset
-        positions = {}
-        for txn in transactions:
-            if txn.asset_id not in positions:
-                asset = Asset.query.get(txn.asset_id)
-                positions[txn.asset_id] = FIFOCalculator(asset.symbol if asset else f'Asset_{txn.asset_id}')
-            
-            fifo = positions[txn.asset_id]
-            
-            if txn.transaction_type == 'BUY':
-                fifo.add_buy(
-                    date=txn.transaction_date,
-                    quantity=txn.quantity,
-                    price=txn.price,
-                    total_cost=abs(txn.amount) + txn.commission + txn.fees + txn.tax
-                )
-            elif txn.transaction_type == 'SELL':
-                fifo.add_sell(
-                    quantity=txn.quantity,
-                    date=txn.transaction_date
-                )
-        
-        # Crear holdings solo para posiciones abiertas
-        holdings_created = 0
-        for asset_id, fifo in positions.items():
-            position = fifo.get_current_position()
-            
-            if position['quantity'] > 0:
-                holding = PortfolioHolding(
-                    user_id=self.user_id,
-                    account_id=self.broker_account_id,
-                    asset_id=asset_id,
-                    quantity=position['quantity'],
-                    average_buy_price=position['average_buy_price'],
-                    total_cost=position['total_cost'],
-                    first_purchase_date=position['first_purchase_date'],
-                    last_transaction_date=position['last_transaction_date']
-                )
-                
-                db.session.add(holding)
-                holdings_created += 1
+        if asset_ids is None:
+            # Estado FIFO de la cuenta (incluyendo las transacciones recién creadas): reanuda desde
+            # el último checkpoint de fin de mes válido y deja en sesión los de los meses cerrados
+            state = FifoCheckpointService.state_at(
+                self.user_id, datetime.max, account_id=self.broker_account_id, save=True
+            )
+            scope = None
+        else:
+            # Las posiciones FIFO son independientes por activo: basta replayar los tocados
+            scope = set(asset_ids)
+            state = LedgerState()
+            if scope:
+                trades = db.session.query(
+                    Transaction.id, Transaction.asset_id, Transaction.transaction_type,
+                    Transaction.transaction_date, Transaction.quantity, Transaction.price,
+                    Transaction.amount, Transaction.currency, Transaction.commission,
+                    Transaction.fees, Transaction.tax,
+                ).filter(
+                    Transaction.user_id == self.user_id,
+                    Transaction.account_id == self.broker_account_id,
+                    Transaction.asset_id.in_(scope),
+                    Transaction.transaction_type.in_(['BUY', 'SELL']),
+                ).order_by(Transaction.transaction_date, Transaction.id)
+                for txn in trades:
+                    state.apply(txn)
+        positions = state.positions
+        
+        _idebug.debug(f"FIFO: {state.txn_count} transacciones en {len(positions)} activos")
+        
+        # Actualizar holdings (solo posiciones abiertas; los cerrados del alcance se eliminan)
+        holdings_created = upsert_holdings(self.user_id, self.broker_account_id, positions, scope)
         
         _idebug.info(f"Holdings creados: {holdings_created}")
         self.stats['holdings_created'] = holdings_created
@@ -2,30 +2,21 @@
 Agregador de ingresos/gastos que incluye el ajuste de reconciliación dinámico
 y los importes de broker (WITHDRAWAL→Stock Market income, DEPOSIT→Stock Market expenses).
 Inyecta el ajuste calculado por ReconciliationService en totales y resúmenes por categoría.
+Las cifras por mes salen de MonthlyRollupService (una lectura de rango, no consultas por mes).
 """
 from datetime import date
 from typing import Any, Dict, List
 
 from dateutil.relativedelta import relativedelta
 
-from app import db
 from app.models import Income, Expense
-from app.services.reconciliation_service import (
-    adjustment_amount_for_expense_metrics,
-    adjustment_amount_for_income_metrics,
-    get_adjustment_for_month,
-    is_adjustment_included_in_metrics,
-)
 from app.services.category_helpers import (
     get_or_create_ajustes_income_category,
     get_or_create_ajustes_expense_category,
     get_or_create_stock_market_income_category,
     get_or_create_stock_market_expense_category,
 )
-from app.services.broker_sync_service import (
-    get_broker_withdrawals_by_month,
-    get_broker_deposits_total_by_month,
-)
+from app.services.monthly_rollup_service import MonthlyRollupService
 
 
 def period_months_from_monthly_totals(monthly: List[Dict[str, Any]]) -> int:
@@ -47,6 +38,58 @@ def period_months_from_monthly_totals(monthly: List[Dict[str, Any]]) -> int:
     return len(monthly) - i_first
 
 
+def _last_months_figures(user_id, months):
+    """Cifras de los últimos `months` meses (incluido el actual), en orden cronológico."""
+    if months <= 0:
+        return []
+    today = date.today()
+    first = today - relativedelta(months=months - 1)
+    return MonthlyRollupService.get_figures(
+        user_id, (first.year, first.month), (today.year, today.month), today=today
+    )
+
+
+def _figures_since_first_transaction(user_id, months):
+    """Como _last_months_figures; months=None = desde la primera transacción del usuario."""
+    from app.models import Transaction
+    today = date.today()
+
+    # Si months es None, calcular desde la primera transacción del usuario
+    if months is None:
+        first_txn = Transaction.query.filter_by(user_id=user_id).order_by(
+            Transaction.transaction_date.asc()
+        ).first()
+        if first_txn:
+            first_date = first_txn.transaction_date
+            if hasattr(first_date, 'date'):
+                first_date = first_date.date()
+            # Calcular meses desde la primera transacción
+            months = (today.year - first_date.year) * 12 + (today.month - first_date.month) + 1
+        else:
+            months = 12  # Default si no hay transacciones
+    return _last_months_figures(user_id, months)
+
+
+def _income_monthly_totals(figures):
+    return [
+        {
+            'month_label': f.month_label,
+            'total': round(f.income_total + f.income_adjustment + f.broker_withdrawals, 2),
+        }
+        for f in figures
+    ]
+
+
+def _expense_monthly_totals(figures):
+    return [
+        {
+            'month_label': f.month_label,
+            'total': round(f.expense_total + f.expense_adjustment + f.broker_deposits, 2),
+        }
+        for f in figures
+    ]
+
+
 def _add_expense_average_fields(summary, period_months: int):
     """Añade average y period_months (divisor global) a padres e hijos."""
     for parent in summary:
@@ -105,19 +148,14 @@ def flatten_expense_category_chips_sorted(summary: List[Dict[str, Any]]) -> List
 
 def get_income_category_summary_with_adjustment(user_id, months=12):
     """Resumen por categoría de ingresos incluyendo ajuste y retiradas broker (Stock Market)."""
-    today = date.today()
-    monthly_series = get_income_monthly_totals_with_adjustment(user_id, months=months)
-    period_months = period_months_from_monthly_totals(monthly_series)
+    figures = _last_months_figures(user_id, months)
+    period_months = period_months_from_monthly_totals(_income_monthly_totals(figures))
 
     summary = Income.get_category_summary(user_id, months=months)
 
-    # Sumar ajustes negativos (ingresos no registrados) por mes
-    ajustes_total = 0.0
-    broker_withdrawals_total = 0.0
-    for i in range(months - 1, -1, -1):
-        d = today - relativedelta(months=i)
-        ajustes_total += adjustment_amount_for_income_metrics(user_id, d.year, d.month)
-        broker_withdrawals_total += get_broker_withdrawals_by_month(user_id, d.year, d.month)
+    # Ajustes negativos (ingresos no registrados) y retiradas broker del período
+    ajustes_total = sum(f.income_adjustment for f in figures)
+    broker_withdrawals_total = sum(f.broker_withdrawals for f in figures)
 
     if ajustes_total > 0:
         cat = get_or_create_ajustes_income_category(user_id)
@@ -160,19 +198,14 @@ def get_income_category_summary_with_adjustment(user_id, months=12):
 
 def get_expense_category_summary_with_adjustment(user_id, months=12):
     """Resumen por categoría de gastos incluyendo ajuste y depósitos broker (Stock Market)."""
-    today = date.today()
-    monthly_series = get_expense_monthly_totals_with_adjustment(user_id, months=months)
-    period_months = period_months_from_monthly_totals(monthly_series)
+    figures = _last_months_figures(user_id, months)
+    period_months = period_months_from_monthly_totals(_expense_monthly_totals(figures))
 
     summary = Expense.get_category_summary(user_id, months=months)
 
-    # Sumar ajustes positivos (gastos no registrados) por mes
-    ajustes_total = 0.0
-    broker_deposits_total = 0.0
-    for i in range(months - 1, -1, -1):
-        d = today - relativedelta(months=i)
-        ajustes_total += adjustment_amount_for_expense_metrics(user_id, d.year, d.month)
-        broker_deposits_total += get_broker_deposits_total_by_month(user_id, d.year, d.month)
+    # Ajustes positivos (gastos no registrados) y depósitos broker del período
+    ajustes_total = sum(f.expense_adjustment for f in figures)
+    broker_deposits_total = sum(f.broker_deposits for f in figures)
 
     if ajustes_total > 0:
         cat = get_or_create_ajustes_expense_category(user_id)
@@ -209,38 +242,12 @@ def get_expense_category_summary_with_adjustment(user_id, months=12):
 
 def get_income_monthly_totals_with_adjustment(user_id, months=12):
     """Totales mensuales de ingresos incluyendo ajuste y retiradas broker por mes."""
-    base = Income.get_monthly_totals(user_id, months=months)
-    today = date.today()
-
-    result = []
-    for i, item in enumerate(base):
-        d = today - relativedelta(months=months - 1 - i)
-        year, month = d.year, d.month
-        extra = adjustment_amount_for_income_metrics(user_id, year, month)
-        broker = get_broker_withdrawals_by_month(user_id, year, month)
-        result.append({
-            'month_label': item['month_label'],
-            'total': round(item['total'] + extra + broker, 2)
-        })
-    return result
+    return _income_monthly_totals(_last_months_figures(user_id, months))
 
 
 def get_expense_monthly_totals_with_adjustment(user_id, months=12):
     """Totales mensuales de gastos incluyendo ajuste y depósitos broker por mes."""
-    base = Expense.get_monthly_totals(user_id, months=months)
-    today = date.today()
-
-    result = []
-    for i, item in enumerate(base):
-        d = today - relativedelta(months=months - 1 - i)
-        year, month = d.year, d.month
-        extra = adjustment_amount_for_expense_metrics(user_id, year, month)
-        broker = get_broker_deposits_total_by_month(user_id, year, month)
-        result.append({
-            'month_label': item['month_label'],
-            'total': round(item['total'] + extra + broker, 2)
-        })
-    return result
+    return _expense_monthly_totals(_last_months_figures(user_id, months))
 
 
 def get_synthetic_income_entries_by_month(user_id, months=None):
@@ -253,51 +260,25 @@ def get_synthetic_income_entries_by_month(user_id, months=None):
         user_id: ID del usuario
         months: Número de meses hacia atrás (None = todo el histórico desde la primera transacción)
     """
-    from app.models import Transaction
-    today = date.today()
     result = {}
-    
-    # Si months es None, calcular desde la primera transacción del usuario
-    if months is None:
-        first_txn = Transaction.query.filter_by(user_id=user_id).order_by(
-            Transaction.transaction_date.asc()
-        ).first()
-        if first_txn:
-            first_date = first_txn.transaction_date
-            if hasattr(first_date, 'date'):
-                first_date = first_date.date()
-            # Calcular meses desde la primera transacción
-            months = (today.year - first_date.year) * 12 + (today.month - first_date.month) + 1
-        else:
-            months = 12  # Default si no hay transacciones
-    
-    for i in range(months - 1, -1, -1):
-        d = today - relativedelta(months=i)
-        year, month = d.year, d.month
-        
+    for f in _figures_since_first_transaction(user_id, months):
         # Ajuste negativo = ingreso no registrado
-        adj = get_adjustment_for_month(user_id, year, month)
+        adj = f.adjustment
         ajuste_amount = abs(adj) if adj is not None and adj < 0 else 0
-        
+
         # Retiradas del broker = ingreso
-        stock_market_amount = get_broker_withdrawals_by_month(user_id, year, month)
-        
+        stock_market_amount = f.broker_withdrawals
+
         if ajuste_amount > 0 or stock_market_amount > 0:
-            month_label = d.strftime('%b %Y')
-            inc_metrics = (
-                is_adjustment_included_in_metrics(user_id, year, month)
-                if ajuste_amount > 0
-                else True
-            )
-            result[(year, month)] = {
+            result[(f.year, f.month)] = {
                 'ajuste': round(ajuste_amount, 2),
                 'stock_market': round(stock_market_amount, 2),
-                'month_label': month_label,
-                'year': year,
-                'month': month,
-                'include_adjustment_in_metrics': inc_metrics,
+                'month_label': f.month_label,
+                'year': f.year,
+                'month': f.month,
+                'include_adjustment_in_metrics': f.include_adjustment if ajuste_amount > 0 else True,
             }
-    
+
     return result
 
 
@@ -311,49 +292,23 @@ def get_synthetic_expense_entries_by_month(user_id, months=None):
         user_id: ID del usuario
         months: Número de meses hacia atrás (None = todo el histórico desde la primera transacción)
     """
-    from app.models import Transaction
-    today = date.today()
     result = {}
-    
-    # Si months es None, calcular desde la primera transacción del usuario
-    if months is None:
-        first_txn = Transaction.query.filter_by(user_id=user_id).order_by(
-            Transaction.transaction_date.asc()
-        ).first()
-        if first_txn:
-            first_date = first_txn.transaction_date
-            if hasattr(first_date, 'date'):
-                first_date = first_date.date()
-            # Calcular meses desde la primera transacción
-            months = (today.year - first_date.year) * 12 + (today.month - first_date.month) + 1
-        else:
-            months = 12  # Default si no hay transacciones
-    
-    for i in range(months - 1, -1, -1):
-        d = today - relativedelta(months=i)
-        year, month = d.year, d.month
-        
+    for f in _figures_since_first_transaction(user_id, months):
         # Ajuste positivo = gasto no registrado
-        adj = get_adjustment_for_month(user_id, year, month)
+        adj = f.adjustment
         ajuste_amount = adj if adj is not None and adj > 0 else 0
-        
+
         # Depósitos al broker = gasto
-        stock_market_amount = get_broker_deposits_total_by_month(user_id, year, month)
-        
+        stock_market_amount = f.broker_deposits
+
         if ajuste_amount > 0 or stock_market_amount > 0:
-            month_label = d.strftime('%b %Y')
-            inc_metrics = (
-                is_adjustment_included_in_metrics(user_id, year, month)
-                if ajuste_amount > 0
-                else True
-            )
-            result[(year, month)] = {
+            result[(f.year, f.month)] = {
                 'ajuste': round(ajuste_amount, 2),
                 'stock_market': round(stock_market_amount, 2),
-                'month_label': month_label,
-                'year': year,
-                'month': month,
-                'include_adjustment_in_metrics': inc_metrics,
+                'month_label': f.month_label,
+                'year': f.year,
+                'month': f.month,
+                'include_adjustment_in_metrics': f.include_adjustment if ajuste_amount > 0 else True,
             }
-    
+
     return result
@@ -0,0 +1,208 @@
+"""
+JSON Cache LRU - Caché en memoria (por proceso) delante de las tablas de caché JSON
+
+Tablas: dashboard_summary_cache, portfolio_evolution_cache, portfolio_benchmarks_cache y
+metrics_cache (una fila por usuario con un JSON grande en cached_data).
+
+Cada lectura hace solo una SELECT ligera (id, revision, created_at, expires_at). Si
+(id, revision, created_at) coincide con la entrada en memoria, se devuelve el JSON ya
+parseado sin leer el blob ni hacer deepcopy. La columna revision la incrementa la BD en
+cada UPDATE, así que las escrituras de otros procesos (cron, worker, otros Gunicorn)
+invalidan solas; created_at distingue una fila borrada y recreada con el mismo id.
+
+El JSON devuelto es COMPARTIDO entre peticiones: los llamantes no deben mutarlo
+(copiar superficialmente el nivel que se quiera modificar).
+
+Tamaño acotado por JSON_CACHE_LRU_MAX_MB (tamaño del JSON serializado; 0 lo desactiva).
+"""
+from __future__ import annotations
+
+import json
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, NamedTuple, Optional
+
+from sqlalchemy import Text, type_coerce
+from sqlalchemy.orm import defer
+
+from app import db
+
+_DEFAULT_MAX_MB = 64
+_SESSION_TOUCHED_KEY = '_json_cache_touched'
+
+# {(tabla, user_id): ((row_id, revision, created_at), data, size)}
+_entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+_total_bytes = 0
+_lock = Lock()
+_registered = False
+
+
+class CachedRow(NamedTuple):
+    """Fila de caché en solo lectura (cached_data compartido: no mutar)."""
+    id: int
+    user_id: int
+    revision: int
+    created_at: datetime
+    expires_at: datetime
+    cached_data: Any
+
+    @property
+    def is_valid(self) -> bool:
+        return self.expires_at > datetime.utcnow()
+
+
+def _max_bytes() -> int:
+    from flask import current_app
+
+    return int(current_app.config.get('JSON_CACHE_LRU_MAX_MB', _DEFAULT_MAX_MB)) * 1024 * 1024
+
+
+def _lookup(key: tuple, stamp: tuple):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or entry[0] != stamp:
+            return None
+        _entries.move_to_end(key)
+        return entry[1]
+
+
+def _store(key: tuple, stamp: tuple, data: Any, size: int) -> None:
+    global _total_bytes
+    max_bytes = _max_bytes()
+    if size > max_bytes // 4:
+        discard(key[0], key[1])  # Un solo usuario no puede vaciar la caché
+        return
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= old[2]
+        _entries[key] = (stamp, data, size)
+        _total_bytes += size
+        while _total_bytes > max_bytes and _entries:
+            _, evicted = _entries.popitem(last=False)
+            _total_bytes -= evicted[2]
+
+
+def discard(table: str, user_id: int) -> None:
+    """Elimina la entrada en memoria de (tabla, usuario)."""
+    global _total_bytes
+    with _lock:
+        old = _entries.pop((table, user_id), None)
+        if old is not None:
+            _total_bytes -= old[2]
+
+
+def clear() -> None:
+    global _total_bytes
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+
+
+def read(model, user_id: int) -> Optional[CachedRow]:
+    """
+    Fila de caché de `model` para el usuario, o None si no existe (no filtra por TTL).
+    """
+    key = (model.__tablename__, user_id)
+    probe = (
+        db.session.query(model.id, model.revision, model.created_at, model.expires_at)
+        .filter(model.user_id == user_id)
+        .first()
+    )
+    if probe is None:
+        discard(*key)
+        return None
+
+    data = _lookup(key, (probe.id, probe.revision, probe.created_at))
+    if data is None:
+        # Blob + sello en la misma SELECT: el sello guardado corresponde a ese JSON
+        row = (
+            db.session.query(
+                model.id, model.revision, model.created_at, model.expires_at,
+                type_coerce(model.cached_data, Text),
+            )
+            .filter(model.id == probe.id)
+            .first()
+        )
+        if row is None:
+            return None
+        probe, raw = row[:4], row[4]
+        data = json.loads(raw) if raw else None
+        if _max_bytes() > 0 and raw:
+            _store(key, tuple(probe[:3]), data, len(raw))
+    return CachedRow(probe[0], user_id, probe[1], probe[2], probe[3], data)
+
+
+def row_for_update(model, user_id: int):
+    """Fila ORM para escribir sin cargar el blob JSON (cached_data diferido)."""
+    return model.query.options(defer(model.cached_data)).filter_by(user_id=user_id).first()
+
+
+def commit_and_remember(row, data: Any) -> None:
+    """
+    Confirma la escritura de `data` en `row` y lo deja en memoria, para que la siguiente
+    lectura no vuelva a leer de la BD el blob recién escrito.
+
+    El sello se lee tras el flush, dentro de la misma transacción: es la revision de ESTA
+    escritura (la fila queda bloqueada hasta el commit). Leerlo después del commit podría
+    devolver la revision de otro proceso que escribió entremedias y asociarle este JSON.
+
+    Se guarda la ida y vuelta por JSON (claves int -> str, tuplas -> listas), igual que
+    lo que devolvería la BD.
+    """
+    model = type(row)
+    db.session.flush()
+    stamp = (
+        db.session.query(model.id, model.revision, model.created_at)
+        .filter(model.id == row.id)
+        .one()
+    )
+    db.session.commit()
+    if _max_bytes() <= 0:
+        return
+    raw = json.dumps(data)
+    _store((model.__tablename__, row.user_id), tuple(stamp), json.loads(raw), len(raw))
+
+
+# ----------------------------------------------------------------------
+# Rollback: una revision no confirmada puede reutilizarse por otra escritura
+# ----------------------------------------------------------------------
+
+def _cache_models():
+    from app.models.dashboard_summary_cache import DashboardSummaryCache
+    from app.models.metrics_cache import MetricsCache
+    from app.models.portfolio_benchmarks_cache import PortfolioBenchmarksCache
+    from app.models.portfolio_evolution_cache import PortfolioEvolutionCache
+
+    return (DashboardSummaryCache, MetricsCache, PortfolioBenchmarksCache, PortfolioEvolutionCache)
+
+
+def _collect_touched(session, flush_context) -> None:
+    models = _cache_models()
+    touched = session.info.setdefault(_SESSION_TOUCHED_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models) and obj.user_id is not None:
+            touched.add((obj.__tablename__, obj.user_id))
+
+
+def _after_commit(session) -> None:
+    session.info.pop(_SESSION_TOUCHED_KEY, None)
+
+
+def _after_rollback(session) -> None:
+    for key in session.info.pop(_SESSION_TOUCHED_KEY, ()):
+        discard(*key)
+
+
+def register_json_cache_tracking(db) -> None:
+    """Registra los hooks que descartan entradas escritas en transacciones revertidas."""
+    global _registered
+    if _registered:
+        return
+    from sqlalchemy import event
+
+    event.listen(db.session, 'after_flush', _collect_touched)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+    _registered = True
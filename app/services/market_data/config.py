@@ -1,15 +1,32 @@
 """
 Configuración centralizada para Market Data Services
 """
+import os
 
 # OpenFIGI API
 OPENFIGI_URL = 'https://api.openfigi.com/v3/mapping'
 OPENFIGI_RATE_LIMIT_DELAY = 2.5  # segundos entre llamadas (OpenFIGI limit: 25 req/min = 1 cada 2.4s)
 OPENFIGI_TIMEOUT = 10  # segundos
+OPENFIGI_API_KEY = os.environ.get('OPENFIGI_API_KEY') or None
+# Mapping en lote: límites documentados por OpenFIGI (jobs por request, requests por ventana)
+OPENFIGI_MAX_JOBS = 10  # sin API key
+OPENFIGI_MAX_JOBS_WITH_KEY = 100
+OPENFIGI_RATE_LIMIT = 25  # requests por ventana
+OPENFIGI_RATE_WINDOW = 60  # segundos sin API key
+OPENFIGI_RATE_WINDOW_WITH_KEY = 6  # segundos con API key
+OPENFIGI_MAX_RETRIES = 3  # reintentos de un lote tras HTTP 429
+OPENFIGI_NEGATIVE_CACHE_TTL = 7 * 86400  # ISINs que OpenFIGI no conoce: no reintentar en 7 días
 
 # Yahoo Finance
 YAHOO_RATE_LIMIT_DELAY = 0.1  # segundos entre llamadas
 YAHOO_TIMEOUT = 10  # segundos
+YAHOO_CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart'
+YAHOO_QUOTE_SUMMARY_URL = 'https://query2.finance.yahoo.com/v10/finance/quoteSummary'
+
+# Actualización de precios en lote (PriceUpdater.update_asset_prices)
+PRICE_BATCH_MAX_WORKERS = 8  # hilos concurrentes
+PRICE_BATCH_RATE = 20.0  # requests/segundo sostenidos hacia Yahoo (token bucket)
+PRICE_BATCH_BURST = 20  # ráfaga máxima del token bucket
 
 # Cache
 ENABLE_CACHE = True
@@ -1,14 +1,29 @@
 """
 OpenFIGI Provider para enriquecimiento de assets
 Estrategia simple: ISIN + Currency → Tomar primer resultado
+
+`enrich_many_by_isin` agrupa hasta OPENFIGI_MAX_JOBS(_WITH_KEY) jobs por POST y reparte las
+requests con un token bucket ajustado al límite documentado (25 requests por ventana).
 """
 import requests
 import json
 from time import sleep
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable, List, Tuple
 from ..interfaces.enrichment_provider import EnrichmentProvider
 from ..exceptions import ProviderException, RateLimitException, AssetNotFoundException
-from ..config import OPENFIGI_URL, OPENFIGI_RATE_LIMIT_DELAY, OPENFIGI_TIMEOUT
+from ..config import (
+    OPENFIGI_API_KEY,
+    OPENFIGI_MAX_JOBS,
+    OPENFIGI_MAX_JOBS_WITH_KEY,
+    OPENFIGI_MAX_RETRIES,
+    OPENFIGI_RATE_LIMIT,
+    OPENFIGI_RATE_LIMIT_DELAY,
+    OPENFIGI_RATE_WINDOW,
+    OPENFIGI_RATE_WINDOW_WITH_KEY,
+    OPENFIGI_TIMEOUT,
+    OPENFIGI_URL,
+)
+from ..services.batch_quote_fetcher import TokenBucket
 
 class OpenFIGIProvider(EnrichmentProvider):
     """
@@ -20,11 +35,15 @@ class OpenFIGIProvider(EnrichmentProvider):
         Args:
             api_key: API key de OpenFIGI (opcional, pero recomendado para rate limits más altos)
         """
-        self.api_key = api_key
+        self.api_key = api_key or OPENFIGI_API_KEY
         self.base_url = OPENFIGI_URL
         self.rate_limit_delay = OPENFIGI_RATE_LIMIT_DELAY
         self.timeout = OPENFIGI_TIMEOUT
         self.cache = {}
+        # Lotes: sin ráfaga (capacidad 1) para no pasar nunca de OPENFIGI_RATE_LIMIT por ventana
+        self.max_jobs = OPENFIGI_MAX_JOBS_WITH_KEY if self.api_key else OPENFIGI_MAX_JOBS
+        window = OPENFIGI_RATE_WINDOW_WITH_KEY if self.api_key else OPENFIGI_RATE_WINDOW
+        self.bucket = TokenBucket(OPENFIGI_RATE_LIMIT / window, 1)
     
     def enrich_by_isin(self, isin: str, currency: Optional[str] = None) -> Optional[Dict]:
         """
@@ -60,21 +79,7 @@ class OpenFIGIProvider(EnrichmentProvider):
                 return None
             
             # Estrategia simple: Tomar el primer resultado
-            first_result = results[0]
-            
-            # Mapear a formato interno
-            enriched_data = {
-                'symbol': first_result.get('ticker'),
-                'name': first_result.get('name'),
-                'exchange': first_result.get('exchCode'),  # Código interno OpenFIGI
-                'mic': first_result.get('micCode'),  # MIC ISO 10383 (puede ser None)
-                'currency': first_result.get('currency'),
-                'asset_type': self._map_security_type(first_result.get('securityType')),
-                'sector': first_result.get('marketSector'),
-                'composite_figi': first_result.get('compositeFIGI'),
-                'figi': first_result.get('figi'),
-                'security_type_2': first_result.get('securityType2'),
-            }
+            enriched_data = self._map_isin_result(results[0])
             
             # Cache result
             self.cache[cache_key] = enriched_data
@@ -94,6 +99,57 @@ class OpenFIGIProvider(EnrichmentProvider):
         except Exception as e:
             raise ProviderException(f"Error enriching asset by ISIN {isin}: {str(e)}")
     
+    def enrich_many_by_isin(
+        self,
+        items: Iterable[Tuple[str, Optional[str]]]
+    ) -> Dict[Tuple[str, Optional[str]], Optional[Dict]]:
+        """
+        Enriquece varios ISINs con el mínimo de requests (hasta `max_jobs` jobs por POST)
+        
+        Args:
+            items: Pares (isin, currency); currency puede ser None
+            
+        Returns:
+            Dict {(isin, currency): datos} con None si OpenFIGI no conoce el ISIN.
+            Los pares cuyo lote o job falló por otro motivo no aparecen (se pueden reintentar).
+        """
+        results = {}
+        pending = []
+        for isin, currency in dict.fromkeys(items):
+            cache_key = f"{isin}_{currency or 'NONE'}"
+            if cache_key in self.cache:
+                results[(isin, currency)] = self.cache[cache_key]
+            else:
+                pending.append((isin, currency))
+        
+        for start in range(0, len(pending), self.max_jobs):
+            batch = pending[start:start + self.max_jobs]
+            jobs = []
+            for isin, currency in batch:
+                query = {'idType': 'ID_ISIN', 'idValue': isin}
+                if currency:
+                    query['currency'] = currency
+                jobs.append(query)
+            
+            try:
+                responses = self._query_openfigi_batch(jobs)
+            except ProviderException as e:
+                print(f"Warning: OpenFIGI lote de {len(jobs)} ISINs fallido: {str(e)}")
+                continue
+            
+            for (isin, currency), job in zip(batch, responses):
+                job = job or {}
+                if job.get('data'):
+                    enriched_data = self._map_isin_result(job['data'][0])
+                elif 'No identifier found' in (job.get('warning') or job.get('error') or ''):
+                    enriched_data = None
+                else:
+                    continue
+                self.cache[f"{isin}_{currency or 'NONE'}"] = enriched_data
+                results[(isin, currency)] = enriched_data
+        
+        return results
+    
     def enrich_by_symbol(self, symbol: str, exchange: Optional[str] = None) -> Optional[Dict]:
         """
         Enriquece un asset usando su símbolo
@@ -153,6 +209,53 @@ class OpenFIGIProvider(EnrichmentProvider):
         except Exception as e:
             raise ProviderException(f"Error enriching asset by symbol {symbol}: {str(e)}")
     
+    def _query_openfigi_batch(self, jobs: List[Dict]) -> List[Dict]:
+        """
+        Envía varios jobs en un único POST respetando el rate limit
+        
+        Args:
+            jobs: Lista de queries (como mucho `max_jobs`)
+            
+        Returns:
+            Lista de respuestas por job, en el mismo orden ({'data': [...]}, {'warning': ...} o {'error': ...})
+        """
+        headers = {'Content-Type': 'application/json'}
+        
+        if self.api_key:
+            headers['X-OPENFIGI-APIKEY'] = self.api_key
+        
+        for attempt in range(OPENFIGI_MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                response = requests.post(
+                    self.base_url,
+                    headers=headers,
+                    data=json.dumps(jobs),
+                    timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                raise ProviderException(f"OpenFIGI request error: {str(e)}")
+            
+            if response.status_code == 200:
+                data = response.json()
+                if not isinstance(data, list) or len(data) != len(jobs):
+                    raise ProviderException("OpenFIGI: respuesta de lote inesperada")
+                return data
+            
+            if response.status_code != 429:
+                raise ProviderException(f"OpenFIGI HTTP error {response.status_code}")
+            
+            # Rate limit: esperar lo que indique la cabecera (o 60s) y reintentar el lote
+            if attempt < OPENFIGI_MAX_RETRIES:
+                try:
+                    wait = float(response.headers.get('ratelimit-reset') or 60)
+                except ValueError:
+                    wait = 60
+                print(f"⚠️  OpenFIGI rate limit alcanzado. Esperando {wait:.0f}s...")
+                sleep(wait)
+        
+        raise RateLimitException("OpenFIGI rate limit exceeded")
+    
     def _query_openfigi(self, query: Dict) -> list:
         """
         Ejecuta una query a OpenFIGI API
@@ -200,6 +303,21 @@ class OpenFIGIProvider(EnrichmentProvider):
         except requests.exceptions.RequestException as e:
             raise ProviderException(f"OpenFIGI request error: {str(e)}")
     
+    def _map_isin_result(self, first_result: Dict) -> Dict:
+        """Mapea un resultado de OpenFIGI (búsqueda por ISIN) al formato interno"""
+        return {
+            'symbol': first_result.get('ticker'),
+            'name': first_result.get('name'),
+            'exchange': first_result.get('exchCode'),  # Código interno OpenFIGI
+            'mic': first_result.get('micCode'),  # MIC ISO 10383 (puede ser None)
+            'currency': first_result.get('currency'),
+            'asset_type': self._map_security_type(first_result.get('securityType')),
+            'sector': first_result.get('marketSector'),
+            'composite_figi': first_result.get('compositeFIGI'),
+            'figi': first_result.get('figi'),
+            'security_type_2': first_result.get('securityType2'),
+        }
+    
     def _map_security_type(self, openfigi_type: Optional[str]) -> str:
         """
         Mapea el tipo de seguridad de OpenFIGI a nuestro formato
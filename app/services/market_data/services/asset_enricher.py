@@ -2,7 +2,7 @@
 Servicio de enriquecimiento de assets
 Orquesta el uso de providers y mappers para completar datos de assets
 """
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from ..providers.openfigi import OpenFIGIProvider
 from ..mappers.exchange_mapper import ExchangeMapper
 from ..mappers.yahoo_suffix_mapper import YahooSuffixMapper
@@ -44,6 +44,57 @@ class AssetEnricher:
         Returns:
             Dict con todos los datos enriquecidos
         """
+        result = self._base_isin_result(currency, degiro_exchange, degiro_mic)
+        
+        # 3. Enriquecer con OpenFIGI (obtener symbol, name, asset_type)
+        try:
+            openfigi_data = self.openfigi.enrich_by_isin(isin, currency)
+            self._apply_openfigi_isin_data(result, openfigi_data)
+        
+        except Exception as e:
+            # Si falla OpenFIGI, continuamos con los datos que tenemos
+            result['source'] = 'Partial'
+            print(f"Warning: Failed to enrich {isin} with OpenFIGI: {str(e)}")
+        
+        # 4. Si aún no tenemos yahoo_suffix pero tenemos MIC, generarlo
+        if not result['yahoo_suffix'] and result['mic']:
+            result['yahoo_suffix'] = self.yahoo_suffix_mapper.mic_to_yahoo_suffix(result['mic'])
+        
+        return result
+    
+    def enrich_many_from_isin(self, items: List[Dict]) -> Dict[str, Dict]:
+        """
+        Versión en lote de enrich_from_isin: una request a OpenFIGI por cada `max_jobs` ISINs
+        
+        Args:
+            items: Dicts con isin, currency y opcionalmente degiro_exchange / degiro_mic
+            
+        Returns:
+            Dict {isin: datos enriquecidos}; source es 'OpenFIGI', 'Manual' (OpenFIGI no lo
+            conoce) o 'Partial' (falló la consulta)
+        """
+        found = self.openfigi.enrich_many_by_isin((item['isin'], item.get('currency')) for item in items)
+        
+        results = {}
+        for item in items:
+            result = self._base_isin_result(item.get('currency'), item.get('degiro_exchange'), item.get('degiro_mic'))
+            key = (item['isin'], item.get('currency'))
+            if key in found:
+                self._apply_openfigi_isin_data(result, found[key])
+            else:
+                result['source'] = 'Partial'
+            if not result['yahoo_suffix'] and result['mic']:
+                result['yahoo_suffix'] = self.yahoo_suffix_mapper.mic_to_yahoo_suffix(result['mic'])
+            results[item['isin']] = result
+        return results
+    
+    def _base_isin_result(
+        self,
+        currency: str,
+        degiro_exchange: Optional[str] = None,
+        degiro_mic: Optional[str] = None
+    ) -> Dict:
+        """Resultado inicial con los datos de DeGiro (pasos 1 y 2 de enrich_from_isin)"""
         result = {
             'symbol': None,
             'name': None,
@@ -64,39 +115,28 @@ class AssetEnricher:
         if degiro_exchange:
             result['exchange'] = self.exchange_mapper.degiro_to_unified(degiro_exchange)
         
-        # 3. Enriquecer con OpenFIGI (obtener symbol, name, asset_type)
-        try:
-            openfigi_data = self.openfigi.enrich_by_isin(isin, currency)
-            
-            if openfigi_data:
-                # OpenFIGI prevalece para symbol, name, asset_type
-                result['symbol'] = openfigi_data.get('symbol')
-                result['name'] = openfigi_data.get('name')
-                result['asset_type'] = openfigi_data.get('asset_type', 'Stock')
-                result['source'] = 'OpenFIGI'
-                
-                # Si OpenFIGI tiene MIC, prevalece sobre el de DeGiro
-                if openfigi_data.get('mic'):
-                    result['mic'] = openfigi_data['mic']
-                    result['yahoo_suffix'] = self.yahoo_suffix_mapper.mic_to_yahoo_suffix(openfigi_data['mic'])
-                
-                # Si no teníamos exchange, usar el de OpenFIGI
-                if not result['exchange'] and openfigi_data.get('exchange'):
-                    result['exchange'] = openfigi_data['exchange']
-            else:
-                result['source'] = 'Manual'
-        
-        except Exception as e:
-            # Si falla OpenFIGI, continuamos con los datos que tenemos
-            result['source'] = 'Partial'
-            print(f"Warning: Failed to enrich {isin} with OpenFIGI: {str(e)}")
-        
-        # 4. Si aún no tenemos yahoo_suffix pero tenemos MIC, generarlo
-        if not result['yahoo_suffix'] and result['mic']:
-            result['yahoo_suffix'] = self.yahoo_suffix_mapper.mic_to_yahoo_suffix(result['mic'])
-        
         return result
     
+    def _apply_openfigi_isin_data(self, result: Dict, openfigi_data: Optional[Dict]) -> None:
+        """Aplica la respuesta de OpenFIGI (o None si no encontró el ISIN) sobre el resultado"""
+        if openfigi_data:
+            # OpenFIGI prevalece para symbol, name, asset_type
+            result['symbol'] = openfigi_data.get('symbol')
+            result['name'] = openfigi_data.get('name')
+            result['asset_type'] = openfigi_data.get('asset_type', 'Stock')
+            result['source'] = 'OpenFIGI'
+            
+            # Si OpenFIGI tiene MIC, prevalece sobre el de DeGiro
+            if openfigi_data.get('mic'):
+                result['mic'] = openfigi_data['mic']
+                result['yahoo_suffix'] = self.yahoo_suffix_mapper.mic_to_yahoo_suffix(openfigi_data['mic'])
+            
+            # Si no teníamos exchange, usar el de OpenFIGI
+            if not result['exchange'] and openfigi_data.get('exchange'):
+                result['exchange'] = openfigi_data['exchange']
+        else:
+            result['source'] = 'Manual'
+    
     def enrich_from_symbol(
         self,
         symbol: str,
@@ -0,0 +1,295 @@
+"""
+BatchQuoteFetcher - Descarga concurrente de cotizaciones de Yahoo Finance
+
+- Pool acotado de hilos; cada hilo reutiliza su propia requests.Session (keep-alive por host)
+- Token bucket compartido: limita las requests/segundo globales hacia Yahoo
+- Deadline global: lo que no empezó a tiempo se descarta (no se espera a la cola entera)
+
+Los hilos solo descargan y parsean (sin BD ni app context); el llamante aplica los
+resultados en el hilo principal.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from app.services.market_data.config import (
+    PRICE_BATCH_BURST,
+    PRICE_BATCH_MAX_WORKERS,
+    PRICE_BATCH_RATE,
+    YAHOO_CHART_URL,
+    YAHOO_QUOTE_SUMMARY_URL,
+    YAHOO_TIMEOUT,
+)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+QUOTE_SUMMARY_MODULES = 'assetProfile,summaryDetail,defaultKeyStatistics,financialData'
+
+
+def _safe_float(data: dict, key: str) -> Optional[float]:
+    """Float de data[key] admitiendo el formato {raw, fmt} de Yahoo; None si no es numérico."""
+    try:
+        value = data.get(key)
+        if isinstance(value, dict):
+            value = value.get('raw')
+        if value is None or value == 'N/A' or (isinstance(value, float) and value != value):
+            return None
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def format_market_cap(market_cap: float) -> str:
+    """1500000000 -> "1.5B", 234000000 -> "234M", 45000 -> "45K"."""
+    if market_cap >= 1_000_000_000:
+        return f"{market_cap / 1_000_000_000:.1f}B"
+    elif market_cap >= 1_000_000:
+        return f"{market_cap / 1_000_000:.0f}M"
+    elif market_cap >= 1_000:
+        return f"{market_cap / 1_000:.0f}K"
+    return f"{market_cap:.0f}"
+
+
+def parse_chart(data: dict) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Campos de precio desde la respuesta de la Chart API.
+
+    Returns:
+        (campos, None) o (None, mensaje de error)
+    """
+    chart = data.get('chart', {}) if isinstance(data, dict) else {}
+    if chart.get('error'):
+        return None, chart['error'].get('description', 'Error desconocido')
+    if not chart.get('result'):
+        return None, 'No hay datos disponibles'
+    meta = chart['result'][0].get('meta', {})
+    if 'regularMarketPrice' not in meta:
+        return None, 'No se encontró precio'
+
+    price = _safe_float(meta, 'regularMarketPrice')
+    previous_close = _safe_float(meta, 'chartPreviousClose') or _safe_float(meta, 'previousClose')
+    day_change = None
+    if price and previous_close and previous_close > 0:
+        day_change = (price - previous_close) / previous_close * 100
+    return {
+        'current_price': price,
+        'previous_close': previous_close,
+        'day_change_percent': day_change,
+    }, None
+
+
+def parse_quote_summary(data: dict) -> Optional[Dict[str, Any]]:
+    """
+    Campos de perfil, valoración y consenso desde quoteSummary (None si no hay resultado).
+
+    Solo incluye las claves que la respuesta trae, para no pisar datos previos del activo.
+    market_cap_eur lo calcula el llamante (necesita el servicio de divisas).
+    """
+    if not isinstance(data, dict) or not (data.get('quoteSummary') or {}).get('result'):
+        return None
+    result = data['quoteSummary']['result'][0]
+    fields: Dict[str, Any] = {}
+
+    if 'assetProfile' in result:
+        profile = result['assetProfile']
+        fields['sector'] = profile.get('sector')
+        fields['industry'] = profile.get('industry')
+        fields['country'] = profile.get('country')
+
+    summary = result.get('summaryDetail', {})
+    stats = result.get('defaultKeyStatistics', {})
+
+    market_cap_raw = summary.get('marketCap', {}).get('raw')
+    if market_cap_raw:
+        fields['market_cap'] = float(market_cap_raw)
+        fields['market_cap_formatted'] = format_market_cap(fields['market_cap'])
+
+    fields['trailing_pe'] = _safe_float(summary, 'trailingPE')
+    fields['forward_pe'] = _safe_float(stats, 'forwardPE')
+    fields['beta'] = _safe_float(stats, 'beta')
+
+    div_rate_raw = summary.get('dividendRate', {})
+    if isinstance(div_rate_raw, dict):
+        fields['dividend_rate'] = div_rate_raw.get('raw')
+    div_yield_raw = summary.get('dividendYield', {})
+    if isinstance(div_yield_raw, dict) and div_yield_raw.get('raw'):
+        fields['dividend_yield'] = div_yield_raw['raw'] * 100  # Convertir a porcentaje
+
+    financial = result.get('financialData', {})
+    fields['recommendation_key'] = financial.get('recommendationKey')
+    # number_of_analyst_opinions puede ser un dict o un número
+    num_analysts = financial.get('numberOfAnalystOpinions')
+    if isinstance(num_analysts, dict):
+        fields['number_of_analyst_opinions'] = num_analysts.get('raw')
+    elif isinstance(num_analysts, (int, float)):
+        fields['number_of_analyst_opinions'] = int(num_analysts)
+    else:
+        fields['number_of_analyst_opinions'] = None
+    target_price_raw = financial.get('targetMeanPrice', {})
+    if isinstance(target_price_raw, dict):
+        fields['target_mean_price'] = target_price_raw.get('raw')
+    return fields
+
+
+class TokenBucket:
+    """Limitador de tasa thread-safe: `rate` tokens/segundo con ráfaga máxima `capacity`."""
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None) -> bool:
+        """Espera hasta obtener un token; False si no llega antes de `deadline` (reloj del bucket)."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class BatchQuoteFetcher:
+    """
+    Descarga Chart API (+ quoteSummary si hay crumb) de muchos tickers en paralelo.
+
+    Las URLs base son configurables para poder probarlo contra un servidor HTTP local.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = PRICE_BATCH_MAX_WORKERS,
+        rate: float = PRICE_BATCH_RATE,
+        burst: int = PRICE_BATCH_BURST,
+        chart_url: str = YAHOO_CHART_URL,
+        quote_summary_url: str = YAHOO_QUOTE_SUMMARY_URL,
+        timeout: float = YAHOO_TIMEOUT,
+    ):
+        self.max_workers = max(1, int(max_workers))
+        self.bucket = TokenBucket(rate, burst)
+        self.chart_url = chart_url.rstrip('/')
+        self.quote_summary_url = quote_summary_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._sessions_lock = threading.Lock()
+        self._cookies = None
+        self._crumb = None
+
+    def _session(self) -> requests.Session:
+        """Sesión del hilo actual (mantiene vivas las conexiones a cada host de Yahoo)."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({'User-Agent': USER_AGENT})
+            if self._cookies is not None:
+                session.cookies.update(self._cookies)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _fetch_one(self, ticker: str, deadline: float) -> Dict[str, Any]:
+        """Chart (+ quoteSummary) de un ticker. Nunca lanza: los errores van en 'error'."""
+        result: Dict[str, Any] = {'ticker': ticker, 'fields': None, 'quote': None, 'error': None, 'calls': []}
+        if not self.bucket.acquire(deadline):
+            result['error'] = 'timeout'
+            return result
+        session = self._session()
+        url = f"{self.chart_url}/{ticker}"
+        try:
+            response = session.get(url, timeout=self.timeout)
+            if response.status_code == 404:
+                result['error'] = 'Símbolo no encontrado en Yahoo Finance'
+                return result
+            if response.status_code != 200:
+                result['error'] = f'Error HTTP {response.status_code}'
+                return result
+            try:
+                data = response.json()
+            except ValueError:
+                result['error'] = 'Respuesta inválida de Yahoo Finance'
+                return result
+            result['fields'], result['error'] = parse_chart(data)
+            if result['error']:
+                return result
+            result['calls'].append(('yahoo_chart', url, {'ticker': ticker, 'price': result['fields']['current_price']}))
+        except requests.RequestException as e:
+            result['error'] = str(e)
+            return result
+
+        # quoteSummary es opcional: si falla, el precio sigue siendo válido
+        if self._crumb and self.bucket.acquire(deadline):
+            quote_url = f"{self.quote_summary_url}/{ticker}"
+            try:
+                response = session.get(
+                    quote_url,
+                    params={'modules': QUOTE_SUMMARY_MODULES, 'crumb': self._crumb},
+                    timeout=self.timeout,
+                )
+                if response.status_code == 200:
+                    result['calls'].append(('yahoo_quote', quote_url, {'ticker': ticker}))
+                    result['quote'] = parse_quote_summary(response.json())
+            except (requests.RequestException, ValueError, KeyError, IndexError, TypeError):
+                pass
+        return result
+
+    def fetch_many(
+        self,
+        tickers: Iterable[str],
+        deadline: float,
+        crumb: Optional[str] = None,
+        cookies=None,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Descarga todos los tickers (sin duplicados) antes de `deadline` (time.monotonic()).
+
+        Args:
+            crumb/cookies: autenticación de Yahoo para quoteSummary (opcional)
+            on_result: callback en el hilo llamante según va terminando cada ticker
+
+        Returns:
+            {ticker: {'fields', 'quote', 'error', 'calls'}}; los no procesados a tiempo
+            tienen error 'timeout'.
+        """
+        self._crumb = crumb
+        self._cookies = cookies
+        unique = list(dict.fromkeys(t for t in tickers if t))
+        results: Dict[str, Dict[str, Any]] = {}
+        if not unique:
+            return results
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique)))
+        try:
+            futures = {executor.submit(self._fetch_one, t, deadline): t for t in unique}
+            try:
+                for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic()) + self.timeout):
+                    res = future.result()
+                    results[res['ticker']] = res
+                    if on_result:
+                        on_result(res)
+            except TimeoutError:
+                pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            with self._sessions_lock:
+                sessions, self._sessions = self._sessions, []
+            self._local = threading.local()
+            for session in sessions:
+                session.close()
+
+        for ticker in unique:
+            results.setdefault(ticker, {'ticker': ticker, 'fields': None, 'quote': None, 'error': 'timeout', 'calls': []})
+        return results
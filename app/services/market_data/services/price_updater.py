@@ -7,10 +7,19 @@ from typing import Collection, Dict, List, Optional, Tuple
 import time
 import requests
 import yfinance as yf
+from sqlalchemy import update
 from app import db
 from app.models.asset import Asset
+from app.services.market_data.config import YAHOO_CHART_URL, YAHOO_QUOTE_SUMMARY_URL
 from app.services.market_data.exceptions import PriceUpdateException
-from app.services.currency_service import convert_to_eur
+from app.services.market_data.services.batch_quote_fetcher import (
+    QUOTE_SUMMARY_MODULES,
+    USER_AGENT,
+    BatchQuoteFetcher,
+    parse_chart,
+    parse_quote_summary,
+)
+from app.services.currency_service import convert_many, convert_to_eur
 
 # Logging para debug
 import logging
@@ -30,7 +39,7 @@ yf.session.headers.update({
 # Timeouts para evitar colgadas
 REQUEST_TIMEOUT = 10  # segundos por request individual
 MAX_UPDATE_TIME = 180  # segundos máximos para toda la actualización (3 min)
-DELAY_BETWEEN_REQUESTS = 0.5  # segundos entre requests
+DELAY_BETWEEN_REQUESTS = 0.5  # segundos entre requests secuenciales (el lote usa token bucket)
 
 
 class PriceUpdater:
@@ -201,115 +210,91 @@ class PriceUpdater:
             logger.warning("   Solo se actualizarán precios básicos (sin sector/industry)")
         logger.info("")
         
-        # Timer para timeout máximo
-        start_time = time.time()
+        # Deadline global para toda la actualización (no por activo)
+        deadline = time.monotonic() + MAX_UPDATE_TIME
         
-        for idx, asset in enumerate(assets):
-            # Verificar timeout máximo
-            elapsed_time = time.time() - start_time
-            if elapsed_time > MAX_UPDATE_TIME:
-                remaining = len(assets) - idx
-                logger.warning(f"⏱️ TIMEOUT: Se alcanzó el límite de {MAX_UPDATE_TIME}s")
-                logger.warning(f"   {remaining} assets restantes no se actualizarán")
-                self.warnings.append(f"Timeout: {remaining} assets no procesados por límite de tiempo")
-                break
-            logger.info(f"\n{'='*60}")
-            logger.info(f"📈 [{idx+1}/{total}] Procesando: {asset.symbol or asset.name}")
-            logger.info(f"   ISIN: {asset.isin}")
-            logger.info(f"   Yahoo Ticker: {asset.yahoo_ticker or 'N/A'}")
-            
-            try:
-                # Verificar que tenga ticker válido
-                if not asset.yahoo_ticker:
-                    skipped += 1
-                    err_msg = "Sin ticker de Yahoo Finance"
-                    logger.warning(f"   ⚠️ OMITIDO: {err_msg}")
-                    self.warnings.append(f"❌ {asset.symbol or asset.name}: {err_msg}")
-                    self.skipped_assets.append({
-                        'asset_id': asset.id,
-                        'symbol': asset.symbol or '',
-                        'name': asset.name or '',
-                        'isin': asset.isin or '',
-                        'error': err_msg,
-                        'currency': asset.currency or 'EUR',
-                    })
-                    continue
-                
-                logger.info(f"   🔍 Consultando Yahoo Finance: {asset.yahoo_ticker}")
-                
-                # Obtener datos de Yahoo Finance
-                start_time = time.time()
-                success_update = self._update_single_asset(asset)
-                elapsed = time.time() - start_time
-                
-                if success_update:
-                    success += 1
-                    logger.info(f"   ✅ ÉXITO (en {elapsed:.2f}s)")
-                    if asset.current_price:
-                        logger.info(f"   💰 Precio actualizado: {asset.current_price} {asset.currency}")
-                        if asset.day_change_percent:
-                            logger.info(f"   📊 Cambio del día: {asset.day_change_percent:+.2f}%")
-                else:
-                    failed += 1
-                    logger.error(f"   ❌ FALLÓ (en {elapsed:.2f}s)")
-                    last_error = self.errors[-1] if self.errors else "Error desconocido"
-                    self.failed_assets.append({
-                        'asset_id': asset.id,
-                        'symbol': asset.symbol or '',
-                        'name': asset.name or '',
-                        'isin': asset.isin or '',
-                        'error': last_error.replace('❌ ', '').strip(),
-                        'currency': asset.currency or 'EUR',
-                    })
-                
-                # Reportar progreso (si hay callback)
-                if self.progress_callback:
-                    self.progress_callback({
-                        'current': idx + 1,
-                        'total': total,
-                        'current_asset': f"{asset.symbol or asset.name}",
-                        'success': success,
-                        'failed': failed,
-                        'skipped': skipped,
-                        'errors': self.errors[-3:] if len(self.errors) > 0 else []  # Últimos 3 errores
-                    })
-                
-                # Delay para evitar rate limiting
-                # Solo si no es el último activo
-                if idx < len(assets) - 1:
-                    logger.info(f"   ⏳ Esperando {DELAY_BETWEEN_REQUESTS}s antes del siguiente...")
-                    time.sleep(DELAY_BETWEEN_REQUESTS)
-            
-            except Exception as e:
-                failed += 1
-                error_msg = str(e)
-                logger.error(f"   ❌ ERROR: {error_msg}")
-                self.errors.append(f"❌ {asset.symbol or asset.name}: {error_msg}")
-                self.failed_assets.append({
-                    'asset_id': asset.id,
-                    'symbol': asset.symbol or '',
-                    'name': asset.name or '',
-                    'isin': asset.isin or '',
-                    'error': error_msg[:120],
-                    'currency': asset.currency or 'EUR',
+        # Agrupar por ticker (varios activos pueden compartir ticker) y omitir los que no tienen
+        assets_by_ticker: Dict[str, List[Asset]] = {}
+        for asset in assets:
+            if asset.yahoo_ticker:
+                assets_by_ticker.setdefault(asset.yahoo_ticker, []).append(asset)
+                continue
+            skipped += 1
+            err_msg = "Sin ticker de Yahoo Finance"
+            logger.warning(f"   ⚠️ OMITIDO {asset.symbol or asset.name}: {err_msg}")
+            self.warnings.append(f"❌ {asset.symbol or asset.name}: {err_msg}")
+            self.skipped_assets.append(self._asset_summary(asset, err_msg))
+        
+        # Descarga concurrente; el progreso se reporta desde este hilo según termina cada ticker
+        progress = {'current': skipped, 'success': 0, 'failed': 0}
+        
+        def on_result(res):
+            n = len(assets_by_ticker[res['ticker']])
+            progress['current'] += n
+            progress['failed' if res['error'] else 'success'] += n
+            if self.progress_callback:
+                self.progress_callback({
+                    'current': progress['current'],
+                    'total': total,
+                    'current_asset': res['ticker'],
+                    'success': progress['success'],
+                    'failed': progress['failed'],
+                    'skipped': skipped,
+                    'errors': [f"❌ {res['ticker']}: {res['error']}"] if res['error'] else []
                 })
-                
-                # Reportar error en progreso
-                if self.progress_callback:
-                    self.progress_callback({
-                        'current': idx + 1,
-                        'total': total,
-                        'current_asset': f"{asset.symbol or asset.name} (error)",
-                        'success': success,
-                        'failed': failed,
-                        'skipped': skipped,
-                        'errors': self.errors[-3:]
-                    })
+        
+        logger.info(f"🔍 Consultando Yahoo Finance: {len(assets_by_ticker)} tickers en paralelo")
+        fetch_start = time.monotonic()
+        results = BatchQuoteFetcher().fetch_many(
+            assets_by_ticker.keys(),
+            deadline,
+            crumb=self.crumb if auth_success else None,
+            cookies=self.session.cookies if auth_success and self.session else None,
+            on_result=on_result,
+        )
+        logger.info(f"   ⏱️ Descarga completada en {time.monotonic() - fetch_start:.2f}s")
+        
+        # Aplicar resultados: una sola UPDATE masiva por clave primaria
+        now = datetime.utcnow()
+        rows = []
+        api_calls = []
+        timed_out = 0
+        for ticker, ticker_assets in assets_by_ticker.items():
+            res = results[ticker]
+            if res['error'] == 'timeout':
+                timed_out += len(ticker_assets)
+                continue
+            api_calls.extend(res['calls'])
+            for asset in ticker_assets:
+                if res['error']:
+                    failed += 1
+                    logger.error(f"   ❌ FALLÓ {asset.symbol or asset.name}: {res['error']}")
+                    self.errors.append(f"❌ {asset.symbol}: {res['error']}")
+                    self.failed_assets.append(self._asset_summary(asset, res['error']))
+                    continue
+                row = self._price_fields(res['fields'], res['quote'], now)
+                row['id'] = asset.id
+                rows.append((row, asset.currency))
+                success += 1
+        
+        # Market cap en EUR: una sola conversión vectorizada para todo el lote
+        with_cap = [(row, currency) for row, currency in rows if 'market_cap' in row]
+        if with_cap:
+            caps_eur = convert_many([row['market_cap'] for row, _ in with_cap], [c for _, c in with_cap])
+            for (row, _), cap_eur in zip(with_cap, caps_eur):
+                row['market_cap_eur'] = float(cap_eur)
+        
+        if timed_out:
+            logger.warning(f"⏱️ TIMEOUT: Se alcanzó el límite de {MAX_UPDATE_TIME}s")
+            logger.warning(f"   {timed_out} assets restantes no se actualizarán")
+            self.warnings.append(f"Timeout: {timed_out} assets no procesados por límite de tiempo")
         
         # Commit de todos los cambios
         logger.info("\n" + "=" * 80)
         logger.info("💾 Guardando cambios en base de datos...")
         try:
+            if rows:
+                db.session.execute(update(Asset), [row for row, _ in rows])
             db.session.commit()
             logger.info("✅ Cambios guardados correctamente")
         except Exception as e:
@@ -317,6 +302,12 @@ class PriceUpdater:
             db.session.rollback()
             raise PriceUpdateException(f"Error al guardar precios: {str(e)}")
         
+        try:
+            from app.services.api_log_service import log_api_calls
+            log_api_calls(api_calls, user_id=self.user_id)
+        except Exception:
+            pass
+        
         # Resumen final
         logger.info("\n" + "=" * 80)
         logger.info("📊 RESUMEN FINAL:")
@@ -336,6 +327,31 @@ class PriceUpdater:
             'skipped_assets': self.skipped_assets,
         }
     
+    @staticmethod
+    def _asset_summary(asset: Asset, error: str) -> Dict:
+        """Entrada de failed_assets / skipped_assets."""
+        return {
+            'asset_id': asset.id,
+            'symbol': asset.symbol or '',
+            'name': asset.name or '',
+            'isin': asset.isin or '',
+            'error': error.replace('❌ ', '').strip()[:120],
+            'currency': asset.currency or 'EUR',
+        }
+    
+    @staticmethod
+    def _price_fields(fields: Dict, quote: Optional[Dict], now: datetime) -> Dict:
+        """
+        Columnas de Asset a escribir a partir de Chart API (+ quoteSummary si lo hay).
+        market_cap_eur lo añade el llamante (conversión de divisa).
+        """
+        values = dict(fields)
+        values['last_price_update'] = now
+        if quote is not None:
+            values.update(quote)
+            values['analyst_consensus_updated_at'] = now
+        return values
+    
     def _update_single_asset(self, asset: Asset) -> bool:
         """
         Actualiza un solo activo con datos de Yahoo Finance usando la Chart API directa.
@@ -347,13 +363,11 @@ class PriceUpdater:
             logger.debug(f"      Consultando Chart API para {asset.yahoo_ticker}")
             
             # Usar API directa en vez de yfinance.info (evita problemas con crumbs/cookies)
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{asset.yahoo_ticker}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
+            url = f"{YAHOO_CHART_URL}/{asset.yahoo_ticker}"
+            headers = {'User-Agent': USER_AGENT}
             
             try:
-                response = requests.get(url, headers=headers, timeout=10)
+                response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
                 response.raise_for_status()
                 logger.debug(f"      ✓ Respuesta recibida: {response.status_code}")
             except requests.exceptions.HTTPError as http_error:
@@ -376,45 +390,16 @@ class PriceUpdater:
                 self.errors.append(f"❌ {asset.symbol}: Respuesta inválida de Yahoo Finance")
                 return False
             
-            # Verificar si hay error en la respuesta
-            if data.get('chart', {}).get('error'):
-                error_msg = data['chart']['error'].get('description', 'Error desconocido')
-                logger.warning(f"      ⚠️ Error de API: {error_msg}")
+            fields, error_msg = parse_chart(data)
+            if error_msg:
+                logger.warning(f"      ⚠️ {error_msg}")
                 self.errors.append(f"❌ {asset.symbol}: {error_msg}")
                 return False
             
-            # Extraer datos del chart
-            if not data.get('chart', {}).get('result'):
-                logger.warning(f"      ⚠️ Sin resultados en chart")
-                self.errors.append(f"❌ {asset.symbol}: No hay datos disponibles")
-                return False
-            
-            result = data['chart']['result'][0]
-            meta = result.get('meta', {})
-            
-            logger.debug(f"      Meta keys disponibles: {list(meta.keys())}")
-            
-            # Verificar que tengamos precio
-            if 'regularMarketPrice' not in meta:
-                logger.warning(f"      ⚠️ No se encontró precio en meta")
-                self.errors.append(f"❌ {asset.symbol}: No se encontró precio")
-                return False
-            
-            # PRECIOS Y CAMBIOS (desde Chart API)
-            asset.current_price = self._safe_get_float(meta, 'regularMarketPrice')
-            asset.previous_close = self._safe_get_float(meta, 'chartPreviousClose') or \
-                                   self._safe_get_float(meta, 'previousClose')
-            
-            # Calcular cambio del día
-            if asset.current_price and asset.previous_close and asset.previous_close > 0:
-                change = asset.current_price - asset.previous_close
-                asset.day_change_percent = (change / asset.previous_close) * 100
-                logger.debug(f"      ✓ Precio: {asset.current_price}, Cambio: {asset.day_change_percent:+.2f}%")
-            else:
-                asset.day_change_percent = None
-            
-            # Actualizar timestamp
-            asset.last_price_update = datetime.utcnow()
+            now = datetime.utcnow()
+            for key, value in self._price_fields(fields, None, now).items():
+                setattr(asset, key, value)
+            logger.debug(f"      ✓ Precio: {asset.current_price}, Cambio: {asset.day_change_percent}")
 
             try:
                 from app.services.api_log_service import log_api_call
@@ -432,9 +417,9 @@ class PriceUpdater:
             if self.session and self.crumb:
                 logger.debug(f"      📊 Consultando quoteSummary para datos avanzados...")
                 try:
-                    quote_url = f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{asset.yahoo_ticker}"
+                    quote_url = f"{YAHOO_QUOTE_SUMMARY_URL}/{asset.yahoo_ticker}"
                     params = {
-                        'modules': 'assetProfile,summaryDetail,defaultKeyStatistics,financialData',
+                        'modules': QUOTE_SUMMARY_MODULES,
                         'crumb': self.crumb
                     }
                     
@@ -452,76 +437,14 @@ class PriceUpdater:
                             )
                         except Exception:
                             pass
-                        quote_data = quote_response.json()
-                        
-                        if 'quoteSummary' in quote_data and quote_data['quoteSummary'].get('result'):
-                            result = quote_data['quoteSummary']['result'][0]
-                            
-                            # SECTOR, INDUSTRY Y COUNTRY (assetProfile)
-                            if 'assetProfile' in result:
-                                profile = result['assetProfile']
-                                asset.sector = profile.get('sector')
-                                asset.industry = profile.get('industry')
-                                asset.country = profile.get('country')
-                                logger.debug(f"      ✅ Sector: {asset.sector}, Industry: {asset.industry}, Country: {asset.country}")
-                            
-                            # VALORACIÓN (summaryDetail + defaultKeyStatistics)
-                            summary = result.get('summaryDetail', {})
-                            stats = result.get('defaultKeyStatistics', {})
-                            
-                            # Market Cap
-                            market_cap_raw = summary.get('marketCap', {}).get('raw')
-                            if market_cap_raw:
-                                asset.market_cap = float(market_cap_raw)
-                                asset.market_cap_formatted = self._format_market_cap(asset.market_cap)
+                        quote = parse_quote_summary(quote_response.json())
+                        if quote is not None:
+                            for key, value in self._price_fields({}, quote, now).items():
+                                if key != 'last_price_update':
+                                    setattr(asset, key, value)
+                            if 'market_cap' in quote:
                                 # Convertir a EUR usando servicio de divisas (con cache)
                                 asset.market_cap_eur = convert_to_eur(asset.market_cap, asset.currency)
-                                logger.debug(f"      💰 Market Cap: {asset.market_cap_formatted}")
-                            
-                            # P/E Ratios
-                            asset.trailing_pe = self._safe_get_float(summary, 'trailingPE')
-                            asset.forward_pe = self._safe_get_float(stats, 'forwardPE')
-                            if asset.trailing_pe:
-                                logger.debug(f"      📊 P/E (trailing): {asset.trailing_pe:.2f}")
-                            
-                            # RIESGO Y RENDIMIENTO
-                            asset.beta = self._safe_get_float(stats, 'beta')
-                            
-                            # Dividendos
-                            div_rate_raw = summary.get('dividendRate', {})
-                            if isinstance(div_rate_raw, dict):
-                                asset.dividend_rate = div_rate_raw.get('raw')
-                            
-                            div_yield_raw = summary.get('dividendYield', {})
-                            if isinstance(div_yield_raw, dict):
-                                div_yield = div_yield_raw.get('raw')
-                                if div_yield:
-                                    asset.dividend_yield = div_yield * 100  # Convertir a porcentaje
-                            
-                            if asset.dividend_yield:
-                                logger.debug(f"      💵 Dividend Yield: {asset.dividend_yield:.2f}%")
-                            
-                            # ANÁLISIS DE MERCADO (financialData)
-                            financial = result.get('financialData', {})
-                            asset.recommendation_key = financial.get('recommendationKey')
-                            
-                            # number_of_analyst_opinions puede ser un dict o un número
-                            num_analysts = financial.get('numberOfAnalystOpinions')
-                            if isinstance(num_analysts, dict):
-                                asset.number_of_analyst_opinions = num_analysts.get('raw')
-                            elif isinstance(num_analysts, (int, float)):
-                                asset.number_of_analyst_opinions = int(num_analysts)
-                            else:
-                                asset.number_of_analyst_opinions = None
-                            
-                            target_price_raw = financial.get('targetMeanPrice', {})
-                            if isinstance(target_price_raw, dict):
-                                asset.target_mean_price = target_price_raw.get('raw')
-                            
-                            if asset.recommendation_key:
-                                logger.debug(f"      🎯 Recomendación: {asset.recommendation_key}")
-                            
-                            asset.analyst_consensus_updated_at = datetime.utcnow()
                             logger.debug(f"      ✅ Datos avanzados obtenidos (consenso analistas)")
                         else:
                             logger.debug(f"      ⚠️ quoteSummary sin resultados")
@@ -536,6 +459,7 @@ class PriceUpdater:
             
             return True
         
+
         except Exception as e:
             import traceback
             error_detail = traceback.format_exc()
@@ -569,24 +493,6 @@ class PriceUpdater:
         except (ValueError, TypeError):
             return None
     
-    def _format_market_cap(self, market_cap: float) -> str:
-        """
-        Formatea la capitalización de mercado en formato legible.
-        
-        Examples:
-            1500000000 -> "1.5B"
-            234000000 -> "234M"
-            45000 -> "45K"
-        """
-        if market_cap >= 1_000_000_000:
-            return f"{market_cap / 1_000_000_000:.1f}B"
-        elif market_cap >= 1_000_000:
-            return f"{market_cap / 1_000_000:.0f}M"
-        elif market_cap >= 1_000:
-            return f"{market_cap / 1_000:.0f}K"
-        else:
-            return f"{market_cap:.0f}"
-    
     def update_single_asset_price_only(self, asset: Asset) -> bool:
         """
         Actualiza solo precio básico (Chart API). Sin autenticación, sin quoteSummary.
@@ -2,13 +2,16 @@
 Basic Metrics Service - Sprint 4 HITO 1 + Refinamientos
 Cálculo de métricas financieras básicas con soporte para períodos
 """
+from datetime import datetime, timedelta
 from decimal import Decimal
+
+import numpy as np
 from sqlalchemy import func
-from app.models import Transaction, PortfolioHolding
+from app.models import Asset, PortfolioHolding
+from app.services import transaction_frame
 from app.services.currency_service import convert_to_eur
-from app.services.fifo_calculator import FIFOCalculator
+from app.services.fifo_checkpoint_service import FifoCheckpointService
 from app.services.period_utils import filter_transactions_by_period
-from collections import defaultdict
 
 
 class BasicMetrics:
@@ -26,8 +29,9 @@ class BasicMetrics:
         2. Para cada venta, obtener el coste real de los lotes vendidos (FIFO)
         3. P&L Realizado = Ingresos venta - Coste real FIFO
         
-        IMPORTANTE: Siempre procesa TODAS las transacciones para mantener el estado FIFO,
-        pero solo cuenta el P&L de las ventas dentro del período (start_date, end_date)
+        IMPORTANTE: El estado FIFO se mantiene con TODAS las transacciones (reanudando desde
+        checkpoints de fin de mes), pero solo cuenta el P&L de las ventas dentro del período
+        (start_date, end_date): acumulado hasta end_date - acumulado antes de start_date
         
         Args:
             user_id: ID del usuario
@@ -41,72 +45,24 @@ class BasicMetrics:
                 'total_sales': int,  # Número de ventas (solo del período)
             }
         """
-        # Obtener TODAS las transacciones BUY/SELL por asset, en orden cronológico
-        # NOTA: Necesitamos TODAS para mantener el estado FIFO correcto
-        transactions = Transaction.query.filter_by(user_id=user_id).filter(
-            Transaction.transaction_type.in_(['BUY', 'SELL'])
-        ).order_by(Transaction.transaction_date, Transaction.created_at).all()
-        
-        # Agrupar por asset
-        asset_transactions = defaultdict(list)
-        for txn in transactions:
-            if txn.asset_id:
-                asset_transactions[txn.asset_id].append(txn)
+        # Estado FIFO acumulado al final del período (reanuda desde el checkpoint de fin de mes
+        # más cercano). Las ventas anteriores al período se restan con el estado en start_date.
+        end_state = FifoCheckpointService.state_at(
+            user_id, end_date or datetime.max, transaction_types=['BUY', 'SELL']
+        )
+        totals = end_state.realized_totals_eur()
         
-        total_realized_pl_eur = 0.0
-        total_cost_basis_eur = 0.0
-        total_sales_count = 0
+        if start_date:
+            start_state = FifoCheckpointService.state_at(
+                user_id, start_date - timedelta(microseconds=1), transaction_types=['BUY', 'SELL']
+            )
+            before = start_state.realized_totals_eur()
+            for key in totals:
+                totals[key] -= before[key]
         
-        # Procesar cada asset con FIFO
-        for asset_id, txns in asset_transactions.items():
-            fifo = FIFOCalculator(symbol=f"Asset_{asset_id}")
-            
-            for txn in txns:
-                if txn.transaction_type == 'BUY':
-                    # Coste total de la compra (precio + comisiones)
-                    total_cost = (txn.quantity * txn.price) + \
-                                (txn.commission or 0) + \
-                                (txn.fees or 0) + \
-                                (txn.tax or 0)
-                    
-                    fifo.add_buy(
-                        quantity=txn.quantity,
-                        price=txn.price,
-                        date=txn.transaction_date,
-                        total_cost=total_cost
-                    )
-                
-                elif txn.transaction_type == 'SELL':
-                    # Siempre procesar la venta en FIFO (para mantener estado correcto)
-                    cost_basis = float(fifo.add_sell(
-                        quantity=txn.quantity,
-                        date=txn.transaction_date
-                    ))
-                    cost_basis_eur = convert_to_eur(cost_basis, txn.currency)
-                    
-                    # SOLO contar el P&L si la venta está dentro del período
-                    txn_date = txn.transaction_date
-                    in_period = True
-                    
-                    if start_date and txn_date < start_date:
-                        in_period = False
-                    if end_date and txn_date > end_date:
-                        in_period = False
-                    
-                    if in_period:
-                        # Ingresos de la venta (después de comisiones/fees)
-                        proceeds = (txn.quantity * txn.price) - \
-                                  (txn.commission or 0) - \
-                                  (txn.fees or 0) - \
-                                  (txn.tax or 0)
-                        proceeds_eur = convert_to_eur(proceeds, txn.currency)
-                        
-                        # P&L de esta venta
-                        pl_eur = proceeds_eur - cost_basis_eur
-                        
-                        total_realized_pl_eur += pl_eur
-                        total_cost_basis_eur += cost_basis_eur
-                        total_sales_count += 1
+        total_realized_pl_eur = totals['realized_pl']
+        total_cost_basis_eur = totals['cost_basis']
+        total_sales_count = totals['total_sales']
         
         # Calcular porcentaje
         realized_pl_pct = (total_realized_pl_eur / total_cost_basis_eur * 100) if total_cost_basis_eur > 0 else 0
@@ -141,39 +97,10 @@ class BasicMetrics:
                 'absolute_return': float,  # Ganancia/Pérdida absoluta
             }
         """
-        # Obtener todos los depósitos
-        deposits = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DEPOSIT'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            deposits = [d for d in deposits if 
-                       (not start_date or d.transaction_date >= start_date) and
-                       (not end_date or d.transaction_date <= end_date)]
-        
-        total_deposits = 0.0
-        for dep in deposits:
-            amount_eur = convert_to_eur(abs(dep.amount), dep.currency)
-            total_deposits += amount_eur
-        
-        # Obtener todos los retiros
-        withdrawals = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='WITHDRAWAL'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            withdrawals = [w for w in withdrawals if 
-                          (not start_date or w.transaction_date >= start_date) and
-                          (not end_date or w.transaction_date <= end_date)]
-        
-        total_withdrawals = 0.0
-        for wit in withdrawals:
-            amount_eur = convert_to_eur(abs(wit.amount), wit.currency)
-            total_withdrawals += amount_eur
+        # Depósitos y retiros del período (frame columnar compartido por la petición)
+        frame = transaction_frame.for_user(user_id)
+        total_deposits = frame.sum_eur(frame.mask('DEPOSIT', start=start_date, end=end_date))
+        total_withdrawals = frame.sum_eur(frame.mask('WITHDRAWAL', start=start_date, end=end_date))
         
         # Capital neto invertido
         net_invested = total_deposits - total_withdrawals
@@ -225,35 +152,17 @@ class BasicMetrics:
                 'leverage_ratio': float,  # Ratio de apalancamiento
             }
         """
-        # 1. Obtener depósitos y retiradas
-        deposits = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DEPOSIT'
-        ).all()
-        
-        total_deposits = sum(convert_to_eur(abs(d.amount), d.currency) for d in deposits)
-        
-        withdrawals = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='WITHDRAWAL'
-        ).all()
+        frame = transaction_frame.for_user(user_id)
         
-        total_withdrawals = sum(convert_to_eur(abs(w.amount), w.currency) for w in withdrawals)
+        # 1. Depósitos y retiradas
+        total_deposits = frame.sum_eur(frame.mask('DEPOSIT'))
+        total_withdrawals = frame.sum_eur(frame.mask('WITHDRAWAL'))
         
-        # 2. Obtener dividendos (todo el histórico)
-        dividends = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DIVIDEND'
-        ).all()
+        # 2. Dividendos (todo el histórico)
+        total_dividends = frame.sum_eur(frame.mask('DIVIDEND'))
         
-        total_dividends = sum(convert_to_eur(abs(d.amount), d.currency) for d in dividends)
-        
-        # 3. Obtener comisiones/fees (todo el histórico)
-        fees = Transaction.query.filter_by(user_id=user_id).filter(
-            Transaction.transaction_type.in_(['FEE', 'COMMISSION'])
-        ).all()
-        
-        total_fees = sum(convert_to_eur(abs(f.amount), f.currency) for f in fees)
+        # 3. Comisiones/fees (todo el histórico)
+        total_fees = frame.sum_eur(frame.mask(['FEE', 'COMMISSION']))
         
         # 4. Obtener P&L Realizado
         pl_realized_data = BasicMetrics.calculate_pl_realized(user_id)
@@ -317,14 +226,13 @@ class BasicMetrics:
         """
         from collections import defaultdict
         
-        # Obtener todas las transacciones del usuario
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            transactions = [txn for txn in transactions if 
-                           (not start_date or txn.transaction_date >= start_date) and
-                           (not end_date or txn.transaction_date <= end_date)]
+        # Transacciones del período con activo
+        frame = transaction_frame.for_user(user_id)
+        period = frame.mask(start=start_date, end=end_date) & (frame.asset_ids != 0)
+        transactions = frame.rows(period)
+        assets = {
+            a.id: a for a in Asset.query.filter(Asset.id.in_(np.unique(frame.asset_ids[period]).tolist()))
+        } if period.any() else {}
         
         # Agrupar por asset
         by_asset = defaultdict(lambda: {
@@ -342,7 +250,7 @@ class BasicMetrics:
             
             asset_id = txn.asset_id
             if by_asset[asset_id]['asset'] is None:
-                by_asset[asset_id]['asset'] = txn.asset
+                by_asset[asset_id]['asset'] = assets.get(asset_id)
             
             if txn.transaction_type == 'BUY':
                 by_asset[asset_id]['buys'].append(txn)
@@ -459,48 +367,18 @@ class BasicMetrics:
         pl_realized_data = BasicMetrics.calculate_pl_realized(user_id, start_date, end_date)
         pl_realized = pl_realized_data['realized_pl']
         
-        # Obtener dividendos
-        dividends = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DIVIDEND'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            dividends = [d for d in dividends if 
-                        (not start_date or d.transaction_date >= start_date) and
-                        (not end_date or d.transaction_date <= end_date)]
+        frame = transaction_frame.for_user(user_id)
         
-        total_dividends = sum(convert_to_eur(abs(d.amount), d.currency) for d in dividends)
-        
-        # Obtener comisiones/fees
-        fees = Transaction.query.filter_by(user_id=user_id).filter(
-            Transaction.transaction_type.in_(['FEE', 'COMMISSION'])
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            fees = [f for f in fees if 
-                   (not start_date or f.transaction_date >= start_date) and
-                   (not end_date or f.transaction_date <= end_date)]
-        total_fees = sum(convert_to_eur(abs(f.amount), f.currency) for f in fees)
+        # Dividendos y comisiones/fees del período
+        total_dividends = frame.sum_eur(frame.mask('DIVIDEND', start=start_date, end=end_date))
+        total_fees = frame.sum_eur(frame.mask(['FEE', 'COMMISSION'], start=start_date, end=end_date))
         
         # P&L Total = Realizado + No Realizado + Dividendos - Comisiones
         total_pl = pl_realized + pl_unrealized + total_dividends - total_fees
         
-        # Obtener depósitos para calcular porcentaje
-        deposits = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DEPOSIT'
-        ).all()
-        total_deposits = sum(convert_to_eur(abs(d.amount), d.currency) for d in deposits)
-        
-        # Obtener retiradas
-        withdrawals = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='WITHDRAWAL'
-        ).all()
-        total_withdrawals = sum(convert_to_eur(abs(w.amount), w.currency) for w in withdrawals)
+        # Depósitos y retiradas (todo el histórico) para calcular porcentaje
+        total_deposits = frame.sum_eur(frame.mask('DEPOSIT'))
+        total_withdrawals = frame.sum_eur(frame.mask('WITHDRAWAL'))
         
         # Capital neto invertido
         net_capital = total_deposits - total_withdrawals
@@ -553,57 +431,12 @@ class BasicMetrics:
                 'fees': float,
             }
         """
-        # Ya tenemos estos cálculos en calculate_leverage, los reutilizamos
-        deposits = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DEPOSIT'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            deposits = [d for d in deposits if 
-                       (not start_date or d.transaction_date >= start_date) and
-                       (not end_date or d.transaction_date <= end_date)]
-        
-        total_deposits = sum(convert_to_eur(abs(d.amount), d.currency) for d in deposits)
-        
-        withdrawals = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='WITHDRAWAL'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            withdrawals = [w for w in withdrawals if 
-                          (not start_date or w.transaction_date >= start_date) and
-                          (not end_date or w.transaction_date <= end_date)]
-        
-        total_withdrawals = sum(convert_to_eur(abs(w.amount), w.currency) for w in withdrawals)
-        
-        dividends = Transaction.query.filter_by(
-            user_id=user_id,
-            transaction_type='DIVIDEND'
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            dividends = [d for d in dividends if 
-                        (not start_date or d.transaction_date >= start_date) and
-                        (not end_date or d.transaction_date <= end_date)]
-        
-        total_dividends = sum(convert_to_eur(abs(d.amount), d.currency) for d in dividends)
-        
-        fees = Transaction.query.filter_by(user_id=user_id).filter(
-            Transaction.transaction_type.in_(['FEE', 'COMMISSION'])
-        ).all()
-        
-        # Filtrar por período si se especifica
-        if start_date or end_date:
-            fees = [f for f in fees if 
-                   (not start_date or f.transaction_date >= start_date) and
-                   (not end_date or f.transaction_date <= end_date)]
-        
-        total_fees = sum(convert_to_eur(abs(f.amount), f.currency) for f in fees)
+        # Flujos del período sobre el frame columnar compartido por la petición
+        frame = transaction_frame.for_user(user_id)
+        total_deposits = frame.sum_eur(frame.mask('DEPOSIT', start=start_date, end=end_date))
+        total_withdrawals = frame.sum_eur(frame.mask('WITHDRAWAL', start=start_date, end=end_date))
+        total_dividends = frame.sum_eur(frame.mask('DIVIDEND', start=start_date, end=end_date))
+        total_fees = frame.sum_eur(frame.mask(['FEE', 'COMMISSION'], start=start_date, end=end_date))
         
         # Obtener P&L Realizado (con período)
         pl_realized_data = BasicMetrics.calculate_pl_realized(user_id, start_date, end_date)
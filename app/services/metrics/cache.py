@@ -7,6 +7,7 @@ para evitar recálculos costosos en cada visita al dashboard.
 from datetime import datetime
 from app import db
 from app.models.metrics_cache import MetricsCache
+from app.services import json_cache_lru
 
 
 class MetricsCacheService:
@@ -39,7 +40,8 @@ class MetricsCacheService:
         Returns:
             dict: Diccionario con las métricas cacheadas, o None si no existe o expiró
         """
-        cache = MetricsCache.query.filter_by(user_id=user_id).first()
+        # JSON compartido con la caché en memoria: solo copia superficial
+        cache = json_cache_lru.read(MetricsCache, user_id)
         
         # No existe cache
         if not cache:
@@ -48,7 +50,7 @@ class MetricsCacheService:
         # Cache expirado (>24 horas)
         if not cache.is_valid:
             # Eliminar cache expirado
-            db.session.delete(cache)
+            MetricsCache.query.filter_by(user_id=user_id).delete()
             db.session.commit()
             return None
         
@@ -72,7 +74,7 @@ class MetricsCacheService:
         Returns:
             MetricsCache: Instancia del cache guardado
         """
-        cache = MetricsCache.query.filter_by(user_id=user_id).first()
+        cache = json_cache_lru.row_for_update(MetricsCache, user_id)
         
         # Limpiar metadata interna si existe
         clean_data = {k: v for k, v in metrics_data.items() if not k.startswith('_')}
@@ -92,7 +94,7 @@ class MetricsCacheService:
             )
             db.session.add(cache)
         
-        db.session.commit()
+        json_cache_lru.commit_and_remember(cache, clean_data)
         return cache
     
     @staticmethod
@@ -0,0 +1,244 @@
+"""
+Cash Flow Returns - Rentabilidades de muchos sub-períodos sobre arrays de flujos y valoraciones
+
+Entrada (una sola vez):
+- boundaries: fechas de corte ascendentes b_0 < b_1 < ... < b_n
+- values: valor del portfolio en cada corte (EUR)
+- flujos externos (DEPOSIT +, WITHDRAWAL -) en EUR con su fecha
+
+Con sumas prefijo de importes e importe×día, cualquier período (b_i, b_j] se resuelve en O(1):
+- Modified Dietz: R = (VF - VI - CF) / (VI + Σ CF_k × (D_j - D_k) / (D_j - D_i))
+- TWR encadenado: Π (1 + R_k) de los sub-períodos consecutivos entre i y j (producto prefijo)
+- IRR (money-weighted, anualizada): raíz de VI·(1+r)^(T) + Σ CF_k·(1+r)^(t_k) = VF
+
+Los pesos se miden en días naturales (fecha de calendario de cada flujo y corte).
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DAYS_PER_YEAR = 365.25  # GIPS
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+def _day_ordinals(values) -> np.ndarray:
+    """Días naturales (int64) de una secuencia de date/datetime."""
+    return np.fromiter((v.toordinal() for v in values), dtype=np.int64)
+
+
+class CashFlowReturns:
+    """Modified Dietz, TWR e IRR vectorizados para sub-períodos entre cortes."""
+
+    def __init__(
+        self,
+        boundaries: Sequence[datetime],
+        values: Sequence[float],
+        flow_dates: Sequence[datetime],
+        flow_amounts: Sequence[float],
+    ):
+        if len(boundaries) != len(values):
+            raise ValueError("boundaries y values deben tener la misma longitud")
+
+        self.boundaries = list(boundaries)
+        self.values = np.asarray(values, dtype=np.float64)
+        self._boundary_days = _day_ordinals(self.boundaries)
+
+        flow_times = np.array(list(flow_dates), dtype='datetime64[us]')
+        amounts = np.asarray(flow_amounts, dtype=np.float64)
+        order = np.argsort(flow_times, kind='stable')
+        flow_times = flow_times[order]
+        amounts = amounts[order]
+        self._flow_days = flow_times.astype('datetime64[D]').astype(np.int64) + _EPOCH_ORDINAL
+        self._flow_amounts = amounts
+
+        # Flujos de (b_{i}, b_{j}] = posiciones [pos[i], pos[j])
+        self._pos = np.searchsorted(
+            flow_times, np.array(self.boundaries, dtype='datetime64[us]'), side='right'
+        )
+        self._cum_amount = np.concatenate(([0.0], np.cumsum(amounts)))
+        self._cum_amount_day = np.concatenate(([0.0], np.cumsum(amounts * self._flow_days)))
+
+        # Producto prefijo de (1 + R) de los sub-períodos consecutivos (para TWR)
+        if len(self.boundaries) > 1:
+            idx = np.arange(1, len(self.boundaries))
+            self._growth = 1.0 + self.modified_dietz(idx - 1, idx)['return']
+        else:
+            self._growth = np.zeros(0)
+        self._cum_growth = np.concatenate(([1.0], np.cumprod(self._growth)))
+
+    # ------------------------------------------------------------------
+    # Modified Dietz
+    # ------------------------------------------------------------------
+
+    def modified_dietz(self, i, j) -> Dict[str, np.ndarray]:
+        """
+        Modified Dietz de los períodos (b_i, b_j]; i y j escalares o arrays alineados.
+
+        Returns:
+            dict de arrays: return (decimal), absolute_gain, cash_flows, weighted_capital,
+            start_value, end_value, days
+        """
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        pi, pj = self._pos[i], self._pos[j]
+        end_day = self._boundary_days[j]
+
+        days = end_day - self._boundary_days[i]
+        days = np.where(days == 0, 1, days)  # Evitar división por 0
+
+        cash_flows = self._cum_amount[pj] - self._cum_amount[pi]
+        # Σ CF_k × (D_j - D_k) = D_j × Σ CF_k - Σ CF_k × D_k
+        weighted_flows = end_day * cash_flows - (self._cum_amount_day[pj] - self._cum_amount_day[pi])
+
+        start_value = self.values[i]
+        end_value = self.values[j]
+        weighted_capital = start_value + weighted_flows / days
+        absolute_gain = end_value - start_value - cash_flows
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            period_return = np.where(weighted_capital == 0, 0.0, absolute_gain / weighted_capital)
+
+        return {
+            'return': period_return,
+            'absolute_gain': absolute_gain,
+            'cash_flows': cash_flows,
+            'weighted_capital': weighted_capital,
+            'start_value': start_value,
+            'end_value': end_value,
+            'days': days,
+        }
+
+    # ------------------------------------------------------------------
+    # TWR / IRR
+    # ------------------------------------------------------------------
+
+    def twr(self, i, j) -> np.ndarray:
+        """Rentabilidad time-weighted (decimal) encadenando los sub-períodos entre b_i y b_j."""
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        start = self._cum_growth[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = self._cum_growth[j] / start - 1.0
+        # Un sub-período con -100% anula el producto prefijo: recalcular el tramo directamente
+        zero = np.atleast_1d(start == 0)
+        if zero.any():
+            result = np.atleast_1d(result)
+            for k in np.flatnonzero(zero):
+                a, b = int(np.atleast_1d(i)[k]), int(np.atleast_1d(j)[k])
+                result[k] = np.prod(self._growth[a:b]) - 1.0
+            if np.ndim(i) == 0 and np.ndim(j) == 0:
+                result = result[0]
+        return result
+
+    def irr(self, i: int, j: int, tolerance: float = 1e-10, max_iter: int = 100) -> Optional[float]:
+        """
+        Rentabilidad money-weighted anualizada (decimal) del período (b_i, b_j], o None si no
+        tiene solución (período vacío, sin capital o sin cambio de signo).
+        """
+        end_day = self._boundary_days[j]
+        total_years = (end_day - self._boundary_days[i]) / DAYS_PER_YEAR
+        if total_years <= 0:
+            return None
+
+        pi, pj = self._pos[i], self._pos[j]
+        amounts = np.concatenate(([self.values[i]], self._flow_amounts[pi:pj]))
+        # Años desde cada aportación hasta el final del período
+        years = np.concatenate(([total_years], (end_day - self._flow_days[pi:pj]) / DAYS_PER_YEAR))
+        end_value = float(self.values[j])
+
+        if not np.any(amounts) and end_value == 0:
+            return None
+
+        def npv(rate):
+            return float(np.sum(amounts * np.power(1.0 + rate, years))) - end_value
+
+        def npv_prime(rate):
+            return float(np.sum(amounts * years * np.power(1.0 + rate, years - 1.0)))
+
+        # Newton desde 10%; si no converge, bisección en [-99.99%, 1000%]
+        rate = 0.1
+        for _ in range(max_iter):
+            value = npv(rate)
+            if abs(value) < tolerance * max(1.0, abs(end_value)):
+                return rate
+            slope = npv_prime(rate)
+            if slope == 0 or not np.isfinite(slope):
+                break
+            next_rate = rate - value / slope
+            if not np.isfinite(next_rate) or next_rate <= -1.0:
+                break
+            rate = next_rate
+
+        low, high = -0.9999, 10.0
+        f_low, f_high = npv(low), npv(high)
+        if not (np.isfinite(f_low) and np.isfinite(f_high)) or f_low * f_high > 0:
+            return None
+        for _ in range(200):
+            mid = (low + high) / 2
+            f_mid = npv(mid)
+            if abs(f_mid) < tolerance * max(1.0, abs(end_value)) or high - low < tolerance:
+                return mid
+            if f_low * f_mid <= 0:
+                high = mid
+            else:
+                low, f_low = mid, f_mid
+        return (low + high) / 2
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def period(self, i: int, j: int) -> Dict[str, Any]:
+        """Modified Dietz de (b_i, b_j] en el formato de ModifiedDietzCalculator.calculate_return."""
+        md = self.modified_dietz(i, j)
+        period_return = float(md['return'])
+        weighted_capital = float(md['weighted_capital'])
+        start_value = float(md['start_value'])
+        end_value = float(md['end_value'])
+        total_cash_flows = float(md['cash_flows'])
+        days = int(md['days'])
+
+        if weighted_capital == 0:
+            return {
+                'return': 0.0,
+                'return_pct': 0.0,
+                'absolute_gain': 0.0,
+                'start_value': start_value,
+                'end_value': end_value,
+                'cash_flows': total_cash_flows,
+                'weighted_capital': weighted_capital,
+                'days': days
+            }
+
+        return {
+            'return': round(period_return, 6),
+            'return_pct': round(period_return * 100, 2),
+            'absolute_gain': round(float(md['absolute_gain']), 2),
+            'start_value': round(start_value, 2),
+            'end_value': round(end_value, 2),
+            'cash_flows': round(total_cash_flows, 2),
+            'weighted_capital': round(weighted_capital, 2),
+            'days': days
+        }
+
+
+def month_boundaries(first: datetime, now: datetime) -> List[datetime]:
+    """
+    [first, 00:00 del día 1 de cada mes posterior, now].
+
+    Cada corte incluye las transacciones <= corte: el cierre de un mes es el instante en
+    que empieza el siguiente (como el VI de calculate_return en el 1 de enero).
+    """
+    boundaries = [first]
+    year, month = first.year, first.month
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        month_start = datetime(year, month, 1)
+        if month_start >= now:
+            break
+        boundaries.append(month_start)
+    boundaries.append(now)
+    return boundaries
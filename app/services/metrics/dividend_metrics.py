@@ -6,8 +6,7 @@ Calcula métricas relacionadas con dividendos
 from datetime import datetime, timedelta
 from collections import defaultdict
 from sqlalchemy import func
-from app.models.transaction import Transaction
-from app.services.currency_service import convert_to_eur
+from app.services import transaction_frame
 
 
 class DividendMetrics:
@@ -39,25 +38,20 @@ class DividendMetrics:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=365)
         
-        # Obtener todos los dividendos en el período
-        dividends = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'DIVIDEND',
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
-        ).order_by(Transaction.transaction_date.desc()).all()
+        # Dividendos del período (EUR al tipo de cambio de la fecha de cada dividendo)
+        frame = transaction_frame.for_user(user_id)
+        mask = frame.mask('DIVIDEND', start=start_date, end=end_date)
         
         # Agrupar por año-mes
         monthly_data = defaultdict(lambda: {'dividends_eur': 0.0, 'dividends_count': 0})
         
-        for div in dividends:
+        amounts_eur = frame.amounts_eur(mask, at_flow_date=True)
+        for div, amount_eur in zip(frame.rows(mask), amounts_eur):
             year = div.transaction_date.year
             month = div.transaction_date.month
             period_key = f"{year}-{month:02d}"
             
-            # Convertir a EUR
-            amount_eur = convert_to_eur(abs(div.amount), div.currency)
-            monthly_data[period_key]['dividends_eur'] += amount_eur
+            monthly_data[period_key]['dividends_eur'] += float(amount_eur)
             monthly_data[period_key]['dividends_count'] += 1
         
         # Convertir a lista y formatear
@@ -99,11 +93,10 @@ class DividendMetrics:
             }
         """
         # Obtener primera transacción
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
+        frame = transaction_frame.for_user(user_id)
+        first_date = frame.first_date()
         
-        if not first_txn:
+        if first_date is None:
             return {
                 'total_dividends_ytd': 0.0,
                 'total_dividends_all_time': 0.0,
@@ -115,7 +108,6 @@ class DividendMetrics:
                 'ytd_days': 0
             }
         
-        first_date = first_txn.transaction_date
         current_year = datetime.now().year
         ytd_start = datetime(current_year, 1, 1)
         
@@ -129,28 +121,10 @@ class DividendMetrics:
             ytd_days = 1  # Evitar división por 0
         
         # Dividendos YTD (año actual)
-        ytd_dividends = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'DIVIDEND',
-            Transaction.transaction_date >= ytd_start,
-            Transaction.transaction_date <= today
-        ).all()
-        
-        total_ytd_eur = 0.0
-        for div in ytd_dividends:
-            amount_eur = convert_to_eur(abs(div.amount), div.currency)
-            total_ytd_eur += amount_eur
+        total_ytd_eur = frame.sum_eur(frame.mask('DIVIDEND', start=ytd_start, end=today), at_flow_date=True)
         
         # Dividendos totales (desde el inicio)
-        all_dividends = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'DIVIDEND'
-        ).all()
-        
-        total_all_time_eur = 0.0
-        for div in all_dividends:
-            amount_eur = convert_to_eur(abs(div.amount), div.currency)
-            total_all_time_eur += amount_eur
+        total_all_time_eur = frame.sum_eur(frame.mask('DIVIDEND'), at_flow_date=True)
         
         # Calcular proyección anualizada basada en YTD
         # Si han pasado X días del año y hemos recibido Y EUR, proyectamos: Y * (365 / X)
@@ -198,29 +172,25 @@ class DividendMetrics:
             Ordenado por año descendente (más reciente primero)
         """
         # Obtener primera transacción
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
+        frame = transaction_frame.for_user(user_id)
+        first_date = frame.first_date()
         
-        if not first_txn:
+        if first_date is None:
             return []
         
-        first_year = first_txn.transaction_date.year
+        first_year = first_date.year
         current_year = datetime.now().year
         
-        # Obtener todos los dividendos
-        all_dividends = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == 'DIVIDEND'
-        ).order_by(Transaction.transaction_date).all()
+        # Todos los dividendos
+        mask = frame.mask('DIVIDEND')
         
         # Agrupar por año
         yearly_data = defaultdict(lambda: {'dividends_eur': 0.0, 'dividends_count': 0})
         
-        for div in all_dividends:
+        amounts_eur = frame.amounts_eur(mask, at_flow_date=True)
+        for div, amount_eur in zip(frame.rows(mask), amounts_eur):
             year = div.transaction_date.year
-            amount_eur = convert_to_eur(abs(div.amount), div.currency)
-            yearly_data[year]['dividends_eur'] += amount_eur
+            yearly_data[year]['dividends_eur'] += float(amount_eur)
             yearly_data[year]['dividends_count'] += 1
         
         # Convertir a lista
@@ -0,0 +1,326 @@
+"""
+Ledger Replay Engine
+
+Recorre UNA sola vez el ledger ordenado de transacciones de un usuario y emite,
+en cada fecha de corte solicitada, el mismo desglose que hasta ahora se obtenía
+llamando por fecha a:
+- PortfolioValuation.get_detailed_value_at_date (valor, cash, holdings, P&L no realizado)
+- ModifiedDietzCalculator.calculate_return (rentabilidad acumulada desde el inicio)
+- PortfolioEvolutionService._get_capital_invested / _get_dividends_until /
+  _get_fees_until / _get_pl_realized_until
+
+Antes: O(fechas × transacciones) con varias queries por fecha.
+Ahora: O(transacciones + fechas × posiciones abiertas) con 2 queries en total.
+
+Tipos de cambio: los flujos (depósitos, retiradas, dividendos, comisiones) se convierten
+en bloque con el tipo de su fecha; caja y holdings con el tipo de cada fecha de corte.
+"""
+
+from datetime import datetime, time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.models.asset import Asset
+from app.services import transaction_frame
+from app.services.fifo_calculator import FloatFIFOCalculator
+from app.services.currency_service import convert_many, convert_to_eur
+from app.services.metrics.cash_flow_returns import CashFlowReturns
+from app.services.metrics.portfolio_valuation import OZ_TROY_TO_G
+
+FEE_TYPES = ('FEE', 'INTEREST', 'TAX')
+
+
+class LedgerReplayEngine:
+    """
+    Motor de replay en streaming del ledger de transacciones.
+
+    Mantiene dos juegos de FIFO, igual que el código original:
+    - valoración (PortfolioValuation): una venta sin compra previa se ignora
+    - P&L realizado (_get_pl_realized_until): una venta sin compra previa abre corto
+    """
+
+    def __init__(self, transactions: List[Any], assets: Dict[int, Any], start_date, end_date):
+        """
+        Args:
+            transactions: Transacciones ordenadas por (transaction_date, id)
+            assets: {asset_id: Asset} de los activos referenciados
+            start_date: Fecha inicio (date) para Modified Dietz acumulado
+            end_date: Fecha final (date); solo ese punto usa precios actuales
+        """
+        self.transactions = transactions
+        self.assets = assets
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @classmethod
+    def for_user(cls, user_id: int, start_date=None, end_date=None) -> Optional['LedgerReplayEngine']:
+        """Carga el ledger completo del usuario. None si no tiene transacciones."""
+        frame = transaction_frame.for_user(user_id)
+        if not len(frame):
+            return None
+        transactions = frame.rows()
+
+        asset_ids = np.unique(frame.asset_ids[frame.asset_ids != 0]).tolist()
+        assets = {}
+        if asset_ids:
+            assets = {a.id: a for a in Asset.query.filter(Asset.id.in_(asset_ids)).all()}
+
+        return cls(
+            transactions=transactions,
+            assets=assets,
+            start_date=start_date or transactions[0].transaction_date.date(),
+            end_date=end_date or datetime.now().date(),
+        )
+
+    # ------------------------------------------------------------------
+    # Estado del replay
+    # ------------------------------------------------------------------
+
+    def _reset(self):
+        self._idx = 0
+        self._cash_by_currency = {}  # Caja en divisa local; se valora al tipo de cada fecha
+        self._fifo_valuation = {}  # {asset_id: FloatFIFOCalculator}
+        self._fifo_realized = {}  # {asset_id: FloatFIFOCalculator}
+        self._deposits_sum = 0.0  # Suma bruta (sin convertir), como _get_capital_invested
+        self._withdrawals_sum = 0.0
+        self._dividends_eur = 0.0
+        self._fees_eur = 0.0
+        self._pl_realized_eur = 0.0
+        self._external_flows = []  # [(transaction_date, amount_eur con signo)] tras start_date
+        # Importe absoluto de cada transacción en EUR al tipo de su fecha (una pasada NumPy)
+        self._flow_eur = convert_many(
+            [abs(t.amount) if t.amount else 0.0 for t in self.transactions],
+            [t.currency for t in self.transactions],
+            [t.transaction_date for t in self.transactions],
+        )
+
+    def _symbol(self, asset_id: int) -> str:
+        asset = self.assets.get(asset_id)
+        return asset.symbol if asset else f"Asset_{asset_id}"
+
+    def _advance_to(self, cutoff: datetime, flows_after: datetime):
+        """Aplica todas las transacciones con transaction_date <= cutoff."""
+        transactions = self.transactions
+        n = len(transactions)
+        while self._idx < n and transactions[self._idx].transaction_date <= cutoff:
+            self._apply(transactions[self._idx], self._flow_eur[self._idx], flows_after)
+            self._idx += 1
+
+    def _add_cash(self, currency, amount: float):
+        key = currency or ''
+        self._cash_by_currency[key] = self._cash_by_currency.get(key, 0.0) + amount
+
+    def _apply(self, txn, amount_eur: float, flows_after: datetime):
+        txn_type = txn.transaction_type
+        asset_id = txn.asset_id if txn.asset_id else None
+
+        if txn_type == 'DEPOSIT':
+            self._add_cash(txn.currency, abs(txn.amount))
+            self._deposits_sum += txn.amount
+            if txn.transaction_date > flows_after:
+                self._external_flows.append((txn.transaction_date, float(amount_eur)))
+
+        elif txn_type == 'WITHDRAWAL':
+            self._add_cash(txn.currency, -abs(txn.amount))
+            self._withdrawals_sum += txn.amount
+            if txn.transaction_date > flows_after:
+                self._external_flows.append((txn.transaction_date, -float(amount_eur)))
+
+        elif txn_type == 'BUY' and asset_id:
+            total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
+            self._add_cash(txn.currency, -total_cost)
+
+            for calculators in (self._fifo_valuation, self._fifo_realized):
+                if asset_id not in calculators:
+                    calculators[asset_id] = FloatFIFOCalculator(symbol=self._symbol(asset_id))
+                calculators[asset_id].add_buy(
+                    quantity=txn.quantity,
+                    price=txn.price,
+                    date=txn.transaction_date,
+                    total_cost=total_cost
+                )
+
+        elif txn_type == 'SELL' and asset_id:
+            proceeds = (txn.quantity * txn.price) - txn.commission - txn.fees - txn.tax
+            self._add_cash(txn.currency, proceeds)
+
+            if asset_id in self._fifo_valuation:
+                self._fifo_valuation[asset_id].add_sell(
+                    quantity=txn.quantity,
+                    date=txn.transaction_date
+                )
+
+            if asset_id not in self._fifo_realized:
+                self._fifo_realized[asset_id] = FloatFIFOCalculator(symbol=self._symbol(asset_id))
+            cost_basis = self._fifo_realized[asset_id].add_sell(
+                quantity=txn.quantity,
+                date=txn.transaction_date
+            )
+            pl_this_sale = float(proceeds) - float(cost_basis)
+            self._pl_realized_eur += convert_to_eur(pl_this_sale, txn.currency)
+
+        elif txn_type == 'DIVIDEND':
+            self._add_cash(txn.currency, abs(txn.amount))
+            self._dividends_eur += float(amount_eur)
+
+        elif txn_type in FEE_TYPES:
+            self._fees_eur += float(amount_eur)
+            # PortfolioValuation solo descuenta FEE del cash (no INTEREST/TAX)
+            if txn_type == 'FEE':
+                self._add_cash(txn.currency, -abs(txn.amount))
+
+    def _valuate(self, use_current_prices: bool, is_today: bool, rates: Dict[str, float]) -> Dict[str, float]:
+        """
+        Misma valoración de holdings que PortfolioValuation.get_detailed_value_at_date.
+
+        Args:
+            rates: {divisa: tasa a EUR} del tipo de cambio de la fecha de corte
+        """
+        def to_eur(amount, currency):
+            if not amount or not currency:
+                return 0.0
+            return amount * rates[currency]
+
+        cash_balance = 0.0
+        for currency, amount in self._cash_by_currency.items():
+            cash_balance += to_eur(amount, currency)
+
+        holdings_value = 0.0
+        holdings_cost = 0.0
+        use_current = use_current_prices and is_today
+
+        for asset_id, fifo in self._fifo_valuation.items():
+            position = fifo.get_current_position()
+            current_quantity = position['quantity']
+            if current_quantity <= 0:
+                continue
+
+            asset = self.assets.get(asset_id)
+            if not asset:
+                continue
+
+            if use_current and asset.current_price:
+                price = asset.current_price
+            else:
+                price = position['average_buy_price']
+
+            if getattr(asset, 'asset_type', None) == 'Commodity':
+                if use_current and asset.current_price:
+                    value_eur = to_eur((current_quantity / OZ_TROY_TO_G) * price, 'USD')
+                else:
+                    value_eur = to_eur(current_quantity * price, 'EUR')
+                cost_eur = to_eur(current_quantity * position['average_buy_price'], 'EUR')
+            else:
+                value_eur = to_eur(current_quantity * price, asset.currency)
+                cost_eur = to_eur(current_quantity * position['average_buy_price'], asset.currency)
+
+            holdings_value += value_eur
+            holdings_cost += cost_eur
+
+        return {
+            'total_value': cash_balance + holdings_value,
+            'cash_balance': cash_balance,
+            'holdings_value': holdings_value,
+            'holdings_cost': holdings_cost,
+            'pl_unrealized': holdings_value - holdings_cost,
+        }
+
+    def _rates_by_date(self, dates: List) -> List[Dict[str, float]]:
+        """{divisa: tasa a EUR} para cada fecha de corte (una pasada NumPy por divisa)."""
+        currencies = {t.currency for t in self.transactions if t.currency}
+        currencies |= {a.currency for a in self.assets.values() if getattr(a, 'currency', None)}
+        currencies |= {'EUR', 'USD'}
+        n = len(dates)
+        columns = {c: convert_many([1.0] * n, [c] * n, dates) for c in currencies}
+        return [{c: float(col[i]) for c, col in columns.items()} for i in range(n)]
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def replay(self, dates: Iterable) -> List[Dict[str, Any]]:
+        """
+        Recorre el ledger una vez y devuelve un snapshot por fecha (orden ascendente).
+
+        Cada snapshot contiene: date, total_value, cash_balance, holdings_value,
+        holdings_cost, pl_unrealized, capital_invested, return_pct, dividends,
+        fees, pl_realized, pl_total, leverage.
+        """
+        self._reset()
+        start_dt = datetime.combine(self.start_date, time.min)
+        dates = sorted(dates)
+        rates_by_date = self._rates_by_date([self.start_date] + dates)
+
+        # Valor inicial (VI) de Modified Dietz: sin precios actuales
+        self._advance_to(start_dt, start_dt)
+        start_value = self._valuate(use_current_prices=False, is_today=False, rates=rates_by_date[0])['total_value']
+
+        snapshots = []
+        end_dts = []
+        for i, date in enumerate(dates, start=1):
+            end_dt = datetime.combine(date, time.max)
+            end_dts.append(end_dt)
+            self._advance_to(end_dt, start_dt)
+
+            is_last = (date == self.end_date)
+            detail = self._valuate(use_current_prices=is_last, is_today=(date >= self.end_date),
+                                   rates=rates_by_date[i])
+
+            capital = float(self._deposits_sum - abs(self._withdrawals_sum))
+
+            dividends = float(self._dividends_eur)
+            fees = float(self._fees_eur)
+            pl_realized = float(self._pl_realized_eur)
+            pl_unrealized = detail['pl_unrealized']
+
+            # P&L No Realizado solo en el último punto (HOY) con precios actuales
+            if is_last:
+                pl_total = pl_realized + pl_unrealized + dividends - fees
+            else:
+                pl_total = pl_realized + dividends - fees
+            user_money = capital + pl_realized + dividends - fees
+            # Apalancamiento/Cash = Dinero del usuario - coste de holdings
+            leverage = user_money - float(detail['holdings_value'] - pl_unrealized)
+
+            snapshots.append({
+                'date': date,
+                **detail,
+                'capital_invested': capital,
+                'dividends': dividends,
+                'fees': fees,
+                'pl_realized': pl_realized,
+                'pl_total': pl_total,
+                'leverage': leverage,
+            })
+
+        # Modified Dietz acumulado desde start_dt en cada fecha (sumas prefijo de los flujos)
+        if snapshots:
+            returns = CashFlowReturns(
+                [start_dt] + end_dts,
+                [start_value] + [s['total_value'] for s in snapshots],
+                [flow_date for flow_date, _ in self._external_flows],
+                [amount for _, amount in self._external_flows],
+            ).modified_dietz(0, np.arange(1, len(snapshots) + 1))['return']
+            for snapshot, period_return in zip(snapshots, returns):
+                snapshot['return_pct'] = round(float(period_return) * 100, 2)
+
+        return snapshots
+
+    def values_at(self, cutoffs: Iterable[datetime]) -> List[float]:
+        """
+        Valor total del portfolio (EUR) en cada instante de corte, en un único recorrido.
+
+        Igual que PortfolioValuation.get_value_at_date con use_current_prices=True: los
+        precios actuales solo se usan en cortes de hoy (>= end_date).
+        """
+        self._reset()
+        cutoffs = sorted(cutoffs)
+        rates_by_date = self._rates_by_date(cutoffs)
+        values = []
+        for cutoff, rates in zip(cutoffs, rates_by_date):
+            self._advance_to(cutoff, datetime.max)
+            is_today = cutoff.date() >= self.end_date
+            detail = self._valuate(use_current_prices=is_today, is_today=is_today, rates=rates)
+            values.append(detail['total_value'])
+        return values
@@ -11,13 +11,23 @@ Donde:
 - VF = Valor Final
 - VI = Valor Inicial
 - CF = Flujos de Caja totales
-- W_i = Peso temporal del flujo i = días_restantes / días_totales
+- W_i = Peso temporal del flujo i = días_restantes / días_totales (días naturales)
+
+Rentabilidades de varios períodos (total, anualizada, YTD, año a año, mes a mes): una sola
+rejilla de cortes de fin de mes valorada con un recorrido del ledger (LedgerReplayEngine) y
+resuelta con sumas prefijo (CashFlowReturns), que además da TWR encadenado e IRR.
 """
 
-from datetime import datetime, timedelta
-from app.models.transaction import Transaction
+from datetime import datetime
+
+import numpy as np
+
+from app.services import transaction_frame
+from app.services.metrics.cash_flow_returns import CashFlowReturns, month_boundaries
+from app.services.metrics.ledger_replay import LedgerReplayEngine
 from app.services.metrics.portfolio_valuation import PortfolioValuation
-from app.services.currency_service import convert_to_eur
+
+_G_KEY = '_return_grids'
 
 
 class ModifiedDietzCalculator:
@@ -68,70 +78,55 @@ class ModifiedDietzCalculator:
             use_current_prices=use_current_prices_end
         )
         
-        # 3. Obtener cash flows externos en el período
-        # Solo DEPOSIT y WITHDRAWAL (dinero que entra/sale desde fuera)
+        # 3. Cash flows externos en el período (DEPOSIT +, WITHDRAWAL -)
         # DIVIDENDS NO son cash flows externos, son ingresos del portfolio
-        cash_flows = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_date > start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.transaction_type.in_(['DEPOSIT', 'WITHDRAWAL'])
-        ).order_by(Transaction.transaction_date).all()
-        
-        # 4. Calcular capital ponderado y flujos netos
-        total_days = (end_date - start_date).days
-        if total_days == 0:
-            total_days = 1  # Evitar división por 0
-        
-        weighted_capital = VI
-        total_cash_flows = 0.0
-        
-        for cf in cash_flows:
-            # Días desde el cash flow hasta el final del período
-            days_remaining = (end_date - cf.transaction_date).days
-            weight = days_remaining / total_days
-            
-            # Convertir monto a EUR
-            amount_eur = convert_to_eur(abs(cf.amount), cf.currency)
-            
-            # Ajustar signo según tipo
-            if cf.transaction_type == 'WITHDRAWAL':
-                amount_eur = -amount_eur
-            # DEPOSIT y DIVIDEND son positivos
-            
-            # Sumar al capital ponderado
-            weighted_capital += amount_eur * weight
-            total_cash_flows += amount_eur
-        
-        # 5. Calcular rentabilidad
-        if weighted_capital == 0:
-            return {
-                'return': 0.0,
-                'return_pct': 0.0,
-                'absolute_gain': 0.0,
-                'start_value': VI,
-                'end_value': VF,
-                'cash_flows': total_cash_flows,
-                'weighted_capital': weighted_capital,
-                'days': total_days
-            }
+        flow_dates, flow_amounts = ModifiedDietzCalculator._external_flows(
+            user_id, after=start_date, end=end_date
+        )
         
-        # Ganancia absoluta = Valor Final - Valor Inicial - Flujos Netos
-        absolute_gain = VF - VI - total_cash_flows
+        # 4-5. Capital ponderado, flujos netos y rentabilidad
+        returns = CashFlowReturns([start_date, end_date], [VI, VF], flow_dates, flow_amounts)
+        return returns.period(0, 1)
+    
+    @staticmethod
+    def _external_flows(user_id, after=None, end=None):
+        """(fechas, importes EUR con signo) de DEPOSIT/WITHDRAWAL, al tipo de cambio de su fecha."""
+        frame = transaction_frame.for_user(user_id)
+        mask = frame.mask(['DEPOSIT', 'WITHDRAWAL'], after=after, end=end)
+        amounts = frame.amounts_eur(mask, at_flow_date=True)
+        amounts[frame.types[mask] == 'WITHDRAWAL'] *= -1
+        return frame.dates[mask], amounts
+    
+    @staticmethod
+    def returns_grid(user_id):
+        """
+        Rejilla de rentabilidades del usuario: cortes [primera transacción, inicio de cada
+        mes, ahora] valorados en un único recorrido del ledger. None sin transacciones.
         
-        # Rentabilidad = Ganancia / Capital Ponderado
-        period_return = absolute_gain / weighted_capital
+        Se reutiliza dentro de la petición mientras no cambien las transacciones.
         
-        return {
-            'return': round(period_return, 6),  # Decimal
-            'return_pct': round(period_return * 100, 2),  # Porcentaje
-            'absolute_gain': round(absolute_gain, 2),
-            'start_value': round(VI, 2),
-            'end_value': round(VF, 2),
-            'cash_flows': round(total_cash_flows, 2),
-            'weighted_capital': round(weighted_capital, 2),
-            'days': total_days
-        }
+        Returns:
+            CashFlowReturns (boundaries[0] = primera transacción, boundaries[-1] = ahora)
+        """
+        from flask import g, has_app_context
+        
+        frame = transaction_frame.for_user(user_id)
+        first_date = frame.first_date()
+        if first_date is None:
+            return None
+        
+        grids = g.setdefault(_G_KEY, {}) if has_app_context() else {}
+        cached = grids.get(user_id)
+        if cached is not None and cached[0] == frame.version:
+            return cached[1]
+        
+        boundaries = month_boundaries(first_date, datetime.now())
+        engine = LedgerReplayEngine.for_user(user_id)
+        values = engine.values_at(boundaries)
+        flow_dates, flow_amounts = ModifiedDietzCalculator._external_flows(user_id)
+        grid = CashFlowReturns(boundaries, values, flow_dates, flow_amounts)
+        grids[user_id] = (frame.version, grid)
+        return grid
     
     @staticmethod
     def calculate_annualized_return(user_id):
@@ -159,12 +154,9 @@ class ModifiedDietzCalculator:
                 'end_value': float
             }
         """
-        # Buscar primera transacción del usuario
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
+        grid = ModifiedDietzCalculator.returns_grid(user_id)
         
-        if not first_txn:
+        if grid is None:
             return {
                 'annualized_return': 0.0,
                 'annualized_return_pct': 0.0,
@@ -176,16 +168,18 @@ class ModifiedDietzCalculator:
                 'start_date': None,
                 'end_date': None,
                 'start_value': 0.0,
-                'end_value': 0.0
+                'end_value': 0.0,
+                'twr_pct': 0.0,
+                'irr_pct': None
             }
         
-        start_date = first_txn.transaction_date
-        end_date = datetime.now()
+        last = len(grid.boundaries) - 1
+        start_date = grid.boundaries[0]
+        end_date = grid.boundaries[last]
         
-        # Calcular rentabilidad del período completo
-        result = ModifiedDietzCalculator.calculate_return(
-            user_id, start_date, end_date
-        )
+        # Rentabilidad del período completo
+        result = grid.period(0, last)
+        irr = grid.irr(0, last)
         
         # Anualizar rentabilidad
         years = result['days'] / 365.25  # GIPS usa 365.25 días/año
@@ -206,7 +200,10 @@ class ModifiedDietzCalculator:
             'start_date': start_date,
             'end_date': end_date,
             'start_value': result['start_value'],
-            'end_value': result['end_value']
+            'end_value': result['end_value'],
+            # Time-weighted (sub-períodos mensuales encadenados) y money-weighted (anualizada)
+            'twr_pct': round(float(grid.twr(0, last)) * 100, 2),
+            'irr_pct': round(irr * 100, 2) if irr is not None else None
         }
     
     @staticmethod
@@ -220,35 +217,28 @@ class ModifiedDietzCalculator:
         Returns:
             dict: Similar a calculate_return pero solo para el año actual
         """
-        # Fecha inicio: 1 enero del año actual
-        current_year = datetime.now().year
-        start_date = datetime(current_year, 1, 1)
-        end_date = datetime.now()
-        
-        # Verificar si hay transacciones antes del 1 enero
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
-        
-        if not first_txn or first_txn.transaction_date > start_date:
-            # No hay datos antes del 1 enero, usar fecha de primera transacción
-            if first_txn:
-                start_date = first_txn.transaction_date
-            else:
-                return {
-                    'return': 0.0,
-                    'return_pct': 0.0,
-                    'absolute_gain': 0.0,
-                    'start_value': 0.0,
-                    'end_value': 0.0,
-                    'days': 0
-                }
-        
-        result = ModifiedDietzCalculator.calculate_return(
-            user_id, start_date, end_date
-        )
+        grid = ModifiedDietzCalculator.returns_grid(user_id)
+        if grid is None:
+            return {
+                'return': 0.0,
+                'return_pct': 0.0,
+                'absolute_gain': 0.0,
+                'start_value': 0.0,
+                'end_value': 0.0,
+                'days': 0
+            }
         
-        return result
+        # Inicio: 1 ene del año actual, o la primera transacción si es posterior
+        last = len(grid.boundaries) - 1
+        start = ModifiedDietzCalculator._year_end_index(grid, grid.boundaries[last].year - 1)
+        return grid.period(start, last)
+    
+    @staticmethod
+    def _year_end_index(grid, year):
+        """Índice del corte de cierre de year (1 ene siguiente; 0 si es anterior a la primera transacción)."""
+        year_end = np.datetime64(datetime(year + 1, 1, 1), 'us')
+        boundaries = np.array(grid.boundaries, dtype='datetime64[us]')
+        return max(int(np.searchsorted(boundaries, year_end, side='right')) - 1, 0)
     
     @staticmethod
     def get_yearly_returns(user_id):
@@ -269,40 +259,31 @@ class ModifiedDietzCalculator:
                 ...
             ]
         """
-        # Obtener primera transacción para saber desde cuándo calcular
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
+        grid = ModifiedDietzCalculator.returns_grid(user_id)
         
-        if not first_txn:
+        if grid is None:
             return []
         
-        first_year = first_txn.transaction_date.year
-        current_year = datetime.now().year
+        first_date = grid.boundaries[0]
+        last = len(grid.boundaries) - 1
+        first_year = first_date.year
+        current_year = grid.boundaries[last].year
         yearly_returns = []
         
-        # Calcular para cada año desde el primero hasta el actual
+        # Cada año es el tramo (1 ene, 1 ene siguiente] de la rejilla mensual.
+        # Años pasados valorados a precios históricos; solo el año actual (YTD) usa precios actuales
         for year in range(first_year, current_year + 1):
-            # Fechas del año
-            year_start = datetime(year, 1, 1)
-            year_end = datetime(year, 12, 31, 23, 59, 59)
-            
-            # Si es el año actual, usar fecha de hoy como fin
             is_ytd = (year == current_year)
-            if is_ytd:
-                year_end = datetime.now()
+            start = ModifiedDietzCalculator._year_end_index(grid, year - 1)
+            end = last if is_ytd else ModifiedDietzCalculator._year_end_index(grid, year)
             
-            # Si la primera transacción es después del 1 enero, usar esa fecha
-            if year == first_year and first_txn.transaction_date > year_start:
-                year_start = first_txn.transaction_date
+            # Si la primera transacción es después del 1 enero, el año empieza en esa fecha
+            year_start = datetime(year, 1, 1)
+            if year == first_year and first_date > year_start:
+                year_start = first_date
+            year_end = grid.boundaries[last] if is_ytd else datetime(year, 12, 31, 23, 59, 59)
             
-            # Calcular rentabilidad del año
-            # Para años pasados, NO usar precios actuales en el valor final
-            # Solo usar precios actuales si es el año actual (YTD)
-            use_current_for_end = is_ytd
-            result = ModifiedDietzCalculator.calculate_return(
-                user_id, year_start, year_end, use_current_prices_end=use_current_for_end
-            )
+            result = grid.period(start, end)
             
             yearly_returns.append({
                 'year': year,
@@ -312,7 +293,8 @@ class ModifiedDietzCalculator:
                 'start_date': year_start,
                 'end_date': year_end,
                 'start_value': result.get('start_value', 0.0),
-                'end_value': result.get('end_value', 0.0)
+                'end_value': result.get('end_value', 0.0),
+                'twr_pct': round(float(grid.twr(start, end)) * 100, 2)
             })
         
         # Ordenar por año descendente (más reciente primero)
@@ -320,6 +302,39 @@ class ModifiedDietzCalculator:
         
         return yearly_returns
     
+    @staticmethod
+    def get_monthly_returns(user_id):
+        """
+        Calcula rentabilidades mes a mes desde el inicio hasta hoy (misma rejilla que los años)
+        
+        Returns:
+            list: [{'year', 'month', 'period' ('2024-01'), 'return_pct', 'absolute_gain',
+                    'start_value', 'end_value', 'is_current'}, ...]
+            Ordenado por fecha descendente (más reciente primero)
+        """
+        grid = ModifiedDietzCalculator.returns_grid(user_id)
+        if grid is None:
+            return []
+        
+        last = len(grid.boundaries) - 1
+        monthly_returns = []
+        for end in range(1, last + 1):
+            result = grid.period(end - 1, end)
+            month_date = grid.boundaries[end]
+            monthly_returns.append({
+                'year': month_date.year,
+                'month': month_date.month,
+                'period': f"{month_date.year}-{month_date.month:02d}",
+                'return_pct': result['return_pct'],
+                'absolute_gain': result['absolute_gain'],
+                'start_value': result['start_value'],
+                'end_value': result['end_value'],
+                'is_current': end == last
+            })
+        
+        monthly_returns.reverse()
+        return monthly_returns
+    
     @staticmethod
     def get_all_returns(user_id, start_date=None, end_date=None):
         """
@@ -341,11 +356,7 @@ class ModifiedDietzCalculator:
             }
         """
         # Verificar que hay transacciones
-        first_txn = Transaction.query.filter_by(
-            user_id=user_id
-        ).order_by(Transaction.transaction_date).first()
-        
-        if not first_txn:
+        if transaction_frame.for_user(user_id).first_date() is None:
             return {
                 'total': {
                     'return_pct': 0.0,
@@ -410,7 +421,9 @@ class ModifiedDietzCalculator:
                 'absolute_gain': annualized['absolute_gain'],
                 'start_value': annualized['start_value'],
                 'end_value': annualized['end_value'],
-                'days': annualized['days']
+                'days': annualized['days'],
+                'twr_pct': annualized['twr_pct'],
+                'irr_pct': annualized['irr_pct']
             },
             'annualized': {
                 'return_pct': annualized['annualized_return_pct'],
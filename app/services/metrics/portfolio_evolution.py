@@ -5,13 +5,9 @@ Calcula la evolución histórica del portfolio para gráficos.
 
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
-from sqlalchemy import func
-from app import db
-from app.models.transaction import Transaction
 from app.models.portfolio import PortfolioHolding
-from app.services.metrics.portfolio_valuation import PortfolioValuation
-from app.services.metrics.modified_dietz import ModifiedDietzCalculator
-from app.services.metrics.basic_metrics import BasicMetrics
+from app.services import transaction_frame
+from app.services.metrics.ledger_replay import LedgerReplayEngine
 from app.services.currency_service import convert_to_eur
 
 
@@ -31,94 +27,27 @@ class PortfolioEvolutionService:
         Returns:
             Dict con labels y datasets para Chart.js
         """
-        # Obtener rango de fechas
-        first_transaction = Transaction.query.filter_by(user_id=self.user_id)\
-            .order_by(Transaction.transaction_date.asc()).first()
-        
-        if not first_transaction:
+        # Cargar el ledger una sola vez (ordenado por fecha, id)
+        engine = LedgerReplayEngine.for_user(self.user_id)
+        if engine is None:
             return self._empty_response()
         
-        start_date = first_transaction.transaction_date.date()
-        end_date = datetime.now().date()
-        
-        # Convertir start_date a datetime para Modified Dietz
-        start_date_dt = datetime.combine(start_date, datetime.min.time())
+        start_date = engine.start_date
+        end_date = engine.end_date
         
         # Generar fechas según frecuencia
         dates = self._generate_dates(start_date, end_date, frequency)
         
-        # Calcular valores del portfolio en cada fecha
-        portfolio_values = []
-        capital_invested = []
-        returns_pct = []
-        leverage_data = []  # Nuevo: Apalancamiento/Cash
-        cash_flows_cumulative = []  # Nuevo: Flujos acumulados
-        pl_accumulated = []  # Nuevo: P&L total acumulado
+        # Un único recorrido del ledger emite valor, capital, Modified Dietz acumulado,
+        # apalancamiento y P&L en cada fecha (antes: replay completo por fecha)
+        snapshots = engine.replay(dates)
         
-        for date in dates:
-            # Obtener valores detallados del portfolio
-            date_datetime = datetime.combine(date, datetime.max.time())
-            portfolio_data = PortfolioValuation.get_detailed_value_at_date(
-                user_id=self.user_id,
-                target_date=date_datetime,
-                use_current_prices=(date == end_date)
-            )
-            
-            value = portfolio_data['total_value']
-            holdings_value = portfolio_data['holdings_value']  # Nuevo: valor de acciones
-            pl_unrealized_at_date = portfolio_data['pl_unrealized']
-            
-            portfolio_values.append(float(value))
-
-            # Capital invertido neto (deposits - withdrawals)
-            capital = self._get_capital_invested(date)
-            capital_invested.append(float(capital))
-            
-            # Rentabilidad acumulada (Modified Dietz) - usar método estático
-            date_datetime_end = datetime.combine(date, datetime.max.time())
-            return_data = ModifiedDietzCalculator.calculate_return(
-                user_id=self.user_id,
-                start_date=start_date_dt,
-                end_date=date_datetime_end
-            )
-            if return_data and return_data['return_pct'] is not None:
-                returns_pct.append(float(return_data['return_pct']))
-            else:
-                returns_pct.append(0.0)
-            
-            # Nuevo: Apalancamiento/Cash y P&L
-            # Obtener componentes para el cálculo
-            dividends = self._get_dividends_until(date)
-            fees = self._get_fees_until(date)
-            pl_realized = self._get_pl_realized_until(date)
-            
-            # P&L No Realizado SOLO aplica al último punto (HOY) con precios actuales
-            # Para fechas históricas, no tenemos precios de mercado, solo precio medio de compra
-            if date == end_date:
-                # HOY: Incluir P&L No Realizado para el P&L total,
-                # pero NO para calcular apalancamiento/cash (Dinero usuario).
-                pl_total = pl_realized + pl_unrealized_at_date + dividends - fees
-                user_money = float(capital) + pl_realized + dividends - fees  # excluye pl_unrealized
-                user_money_for_leverage = user_money
-            else:
-                # HISTÓRICO: Solo P&L Realizado (ventas completadas)
-                pl_total = pl_realized + dividends - fees
-                user_money = float(capital) + pl_realized + dividends - fees
-                user_money_for_leverage = user_money
-            
-            # Gráfico 3: Apalancamiento/Cash = Dinero del Usuario - Holdings Value
-            # Si positivo: tienes cash sin invertir
-            # Si negativo: has invertido más de lo que tienes (apalancamiento)
-            # holdings_value incluye P&L no realizado; restarlo para medir apalancamiento
-            broker_money = user_money_for_leverage - float(holdings_value - pl_unrealized_at_date)
-            
-            leverage_data.append(float(broker_money))
-            
-            # Nuevo: Flujos acumulados (capital invertido es la suma neta)
-            cash_flows_cumulative.append(float(capital))
-            
-            # Nuevo: P&L Acumulado
-            pl_accumulated.append(float(pl_total))
+        portfolio_values = [float(s['total_value']) for s in snapshots]
+        capital_invested = [float(s['capital_invested']) for s in snapshots]
+        returns_pct = [float(s['return_pct']) for s in snapshots]
+        leverage_data = [float(s['leverage']) for s in snapshots]  # Apalancamiento/Cash
+        cash_flows_cumulative = [float(s['capital_invested']) for s in snapshots]  # Flujos acumulados
+        pl_accumulated = [float(s['pl_total']) for s in snapshots]  # P&L total acumulado
         
         # Obtener cash flows para marcadores
         cash_flows = self._get_cash_flows()
@@ -165,28 +94,17 @@ class PortfolioEvolutionService:
     
     def _get_capital_invested(self, date: datetime.date) -> float:
         """Calcula el capital invertido neto hasta una fecha"""
-        deposits = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == self.user_id,
-                Transaction.transaction_type == 'DEPOSIT',
-                Transaction.transaction_date <= datetime.combine(date, datetime.max.time())
-            ).scalar() or 0
-        
-        withdrawals = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == self.user_id,
-                Transaction.transaction_type == 'WITHDRAWAL',
-                Transaction.transaction_date <= datetime.combine(date, datetime.max.time())
-            ).scalar() or 0
+        frame = transaction_frame.for_user(self.user_id)
+        date_dt = datetime.combine(date, datetime.max.time())
+        deposits = frame.amount[frame.mask('DEPOSIT', end=date_dt)].sum()
+        withdrawals = frame.amount[frame.mask('WITHDRAWAL', end=date_dt)].sum()
         
         return float(deposits - abs(withdrawals))
     
     def _get_cash_flows(self) -> List[Dict[str, Any]]:
         """Obtiene todos los deposits y withdrawals para marcadores"""
-        cash_flows = Transaction.query.filter(
-            Transaction.user_id == self.user_id,
-            Transaction.transaction_type.in_(['DEPOSIT', 'WITHDRAWAL'])
-        ).order_by(Transaction.transaction_date.asc()).all()
+        frame = transaction_frame.for_user(self.user_id)
+        cash_flows = frame.rows(frame.mask(['DEPOSIT', 'WITHDRAWAL']))
         
         return [{
             'date': cf.transaction_date.strftime('%Y-%m-%d'),
@@ -200,22 +118,13 @@ class PortfolioEvolutionService:
         Fórmula simple: P&L ≈ Valor Portfolio - Capital Invertido + Dividendos - Comisiones
         """
         date_dt = datetime.combine(date, datetime.max.time())
+        frame = transaction_frame.for_user(self.user_id)
         
         # Dividendos recibidos hasta la fecha
-        dividends = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == self.user_id,
-                Transaction.transaction_type == 'DIVIDEND',
-                Transaction.transaction_date <= date_dt
-            ).scalar() or 0
+        dividends = frame.amount[frame.mask('DIVIDEND', end=date_dt)].sum()
         
         # Comisiones pagadas hasta la fecha
-        fees = db.session.query(func.sum(Transaction.amount))\
-            .filter(
-                Transaction.user_id == self.user_id,
-                Transaction.transaction_type.in_(['FEE', 'INTEREST', 'TAX']),
-                Transaction.transaction_date <= date_dt
-            ).scalar() or 0
+        fees = frame.amount[frame.mask(['FEE', 'INTEREST', 'TAX'], end=date_dt)].sum()
         
         # P&L aproximado = Portfolio - Capital + Dividendos - Comisiones
         pl_approx = portfolio_value - capital_invested + dividends - abs(fees)
@@ -226,27 +135,15 @@ class PortfolioEvolutionService:
         """Obtener dividendos acumulados hasta la fecha (convertidos a EUR)"""
         date_dt = datetime.combine(date, datetime.max.time())
         
-        dividends = Transaction.query.filter(
-            Transaction.user_id == self.user_id,
-            Transaction.transaction_type == 'DIVIDEND',
-            Transaction.transaction_date <= date_dt
-        ).all()
-        
-        total_eur = sum(convert_to_eur(abs(txn.amount), txn.currency) for txn in dividends)
-        return float(total_eur)
+        frame = transaction_frame.for_user(self.user_id)
+        return frame.sum_eur(frame.mask('DIVIDEND', end=date_dt))
     
     def _get_fees_until(self, date: datetime.date) -> float:
         """Obtener comisiones acumuladas hasta la fecha (convertidas a EUR)"""
         date_dt = datetime.combine(date, datetime.max.time())
         
-        fees = Transaction.query.filter(
-            Transaction.user_id == self.user_id,
-            Transaction.transaction_type.in_(['FEE', 'INTEREST', 'TAX']),
-            Transaction.transaction_date <= date_dt
-        ).all()
-        
-        total_eur = sum(convert_to_eur(abs(txn.amount), txn.currency) for txn in fees)
-        return float(total_eur)
+        frame = transaction_frame.for_user(self.user_id)
+        return frame.sum_eur(frame.mask(['FEE', 'INTEREST', 'TAX'], end=date_dt))
     
     def _get_pl_realized_until(self, date: datetime.date) -> float:
         """Calcular P&L Realizado histórico hasta la fecha usando FIFO"""
@@ -255,11 +152,8 @@ class PortfolioEvolutionService:
         date_dt = datetime.combine(date, datetime.max.time())
         
         # Obtener transacciones hasta la fecha
-        transactions = Transaction.query.filter(
-            Transaction.user_id == self.user_id,
-            Transaction.transaction_date <= date_dt,
-            Transaction.transaction_type.in_(['BUY', 'SELL'])
-        ).order_by(Transaction.transaction_date, Transaction.id).all()
+        frame = transaction_frame.for_user(self.user_id)
+        transactions = frame.rows(frame.mask(['BUY', 'SELL'], end=date_dt))
         
         # Reconstruir FIFO por asset
         fifo_by_asset = {}
@@ -273,8 +167,7 @@ class PortfolioEvolutionService:
             
             # Crear FIFO si no existe
             if asset_id not in fifo_by_asset:
-                symbol = txn.asset.symbol if txn.asset else f"Asset_{asset_id}"
-                fifo_by_asset[asset_id] = FIFOCalculator(symbol=symbol)
+                fifo_by_asset[asset_id] = FIFOCalculator(symbol=f"Asset_{asset_id}")
             
             fifo = fifo_by_asset[asset_id]
             
@@ -5,12 +5,14 @@ Calcula el valor del portfolio en cualquier fecha usando:
 - Transacciones históricas (FIFO)
 - Precios de compra/venta
 - Precios actuales (solo para holdings actuales)
+- Tipo de cambio de la fecha valorada (serie diaria de fx_rate_service)
 """
 
 from datetime import datetime
 from app.models.transaction import Transaction
 from app.models.asset import Asset
 from app.services.fifo_calculator import FIFOCalculator
+from app.services.fifo_checkpoint_service import FifoCheckpointService
 from app.services.currency_service import convert_to_eur
 
 # Metales: cantidad en gramos, Yahoo precio USD/oz. 1 oz troy = 31.1035 g
@@ -36,71 +38,11 @@ class PortfolioValuation:
         Returns:
             float: Valor total del portfolio en EUR
         """
-        # 1. Obtener todas las transacciones hasta la fecha objetivo
-        transactions = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_date <= target_date
-        ).order_by(Transaction.transaction_date, Transaction.id).all()
-        
-        # 2. Reconstruir estado del portfolio con FIFO
-        fifo_calculators = {}  # {asset_id: FIFOCalculator}
-        cash_balance = 0.0
-        
-        for txn in transactions:
-            asset_id = txn.asset_id if txn.asset_id else None
-            
-            # DEPOSIT: Añade cash
-            if txn.transaction_type == 'DEPOSIT':
-                amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance += amount_eur
-            
-            # WITHDRAWAL: Quita cash
-            elif txn.transaction_type == 'WITHDRAWAL':
-                amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance -= amount_eur
-            
-            # BUY: Compra activo (quita cash, añade holding)
-            elif txn.transaction_type == 'BUY' and asset_id:
-                # Coste total = precio × cantidad + comisiones + fees + tax
-                total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
-                cost_eur = convert_to_eur(total_cost, txn.currency)
-                cash_balance -= cost_eur
-                
-                # Registrar compra en FIFO
-                if asset_id not in fifo_calculators:
-                    asset_symbol = txn.asset.symbol if txn.asset else f"Asset_{asset_id}"
-                    fifo_calculators[asset_id] = FIFOCalculator(symbol=asset_symbol)
-                
-                fifo_calculators[asset_id].add_buy(
-                    quantity=txn.quantity,
-                    price=txn.price,
-                    date=txn.transaction_date,
-                    total_cost=total_cost
-                )
-            
-            # SELL: Vende activo (añade cash, quita holding)
-            elif txn.transaction_type == 'SELL' and asset_id:
-                # Ingresos = precio × cantidad - comisiones - fees - tax
-                proceeds = (txn.quantity * txn.price) - txn.commission - txn.fees - txn.tax
-                proceeds_eur = convert_to_eur(proceeds, txn.currency)
-                cash_balance += proceeds_eur
-                
-                # Actualizar FIFO (quitar holdings vendidos)
-                if asset_id in fifo_calculators:
-                    fifo_calculators[asset_id].add_sell(
-                        quantity=txn.quantity,
-                        date=txn.transaction_date
-                    )
-            
-            # DIVIDEND: Añade cash
-            elif txn.transaction_type == 'DIVIDEND':
-                dividend_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance += dividend_eur
-            
-            # FEE: Quita cash
-            elif txn.transaction_type == 'FEE':
-                fee_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance -= fee_eur
+        # 1-2. Estado FIFO + cash a la fecha: reanuda desde el checkpoint de fin de mes
+        # más cercano y solo replaya las transacciones posteriores
+        state = FifoCheckpointService.state_at(user_id, target_date)
+        fifo_calculators = state.valuation_fifos()  # {asset_id: FIFOCalculator}
+        cash_balance = state.cash_balance_eur(on_date=target_date)
         
         # 3. Calcular valor de holdings actuales y P&L No Realizado
         holdings_value = 0.0
@@ -133,17 +75,17 @@ class PortfolioValuation:
                 oz_from_g = current_quantity / OZ_TROY_TO_G
                 if use_current_prices and is_today and asset.current_price:
                     value_local = oz_from_g * price  # USD
-                    value_eur = convert_to_eur(value_local, 'USD')
+                    value_eur = convert_to_eur(value_local, 'USD', target_date)
                 else:
                     value_local = current_quantity * price  # EUR (avg_buy en EUR/g)
-                    value_eur = convert_to_eur(value_local, 'EUR')
+                    value_eur = convert_to_eur(value_local, 'EUR', target_date)
                 cost_local = current_quantity * position['average_buy_price']  # EUR/g * g = EUR
-                cost_eur = convert_to_eur(cost_local, 'EUR')
+                cost_eur = convert_to_eur(cost_local, 'EUR', target_date)
             else:
                 value_local = current_quantity * price
                 cost_local = current_quantity * position['average_buy_price']
-                value_eur = convert_to_eur(value_local, asset.currency)
-                cost_eur = convert_to_eur(cost_local, asset.currency)
+                value_eur = convert_to_eur(value_local, asset.currency, target_date)
+                cost_eur = convert_to_eur(cost_local, asset.currency, target_date)
             
             holdings_value += value_eur
             holdings_cost += cost_eur
@@ -168,54 +110,9 @@ class PortfolioValuation:
             }
         """
         # Reutilizar la misma lógica que get_value_at_date
-        transactions = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_date <= target_date
-        ).order_by(Transaction.transaction_date, Transaction.id).all()
-
-        fifo_calculators = {}
-        cash_balance = 0.0
-
-        for txn in transactions:
-            asset_id = txn.asset_id if txn.asset_id else None
-
-            if txn.transaction_type == 'DEPOSIT':
-                amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance += amount_eur
-            elif txn.transaction_type == 'WITHDRAWAL':
-                amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance -= amount_eur
-            elif txn.transaction_type == 'BUY' and asset_id:
-                total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
-                cost_eur = convert_to_eur(total_cost, txn.currency)
-                cash_balance -= cost_eur
-
-                if asset_id not in fifo_calculators:
-                    asset_symbol = txn.asset.symbol if txn.asset else f"Asset_{asset_id}"
-                    fifo_calculators[asset_id] = FIFOCalculator(symbol=asset_symbol)
-
-                fifo_calculators[asset_id].add_buy(
-                    quantity=txn.quantity,
-                    price=txn.price,
-                    date=txn.transaction_date,
-                    total_cost=total_cost
-                )
-            elif txn.transaction_type == 'SELL' and asset_id:
-                proceeds = (txn.quantity * txn.price) - txn.commission - txn.fees - txn.tax
-                proceeds_eur = convert_to_eur(proceeds, txn.currency)
-                cash_balance += proceeds_eur
-
-                if asset_id in fifo_calculators:
-                    fifo_calculators[asset_id].add_sell(
-                        quantity=txn.quantity,
-                        date=txn.transaction_date
-                    )
-            elif txn.transaction_type == 'DIVIDEND':
-                dividend_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance += dividend_eur
-            elif txn.transaction_type == 'FEE':
-                fee_eur = convert_to_eur(abs(txn.amount), txn.currency)
-                cash_balance -= fee_eur
+        state = FifoCheckpointService.state_at(user_id, target_date)
+        fifo_calculators = state.valuation_fifos()
+        cash_balance = state.cash_balance_eur(on_date=target_date)
 
         # Calcular valores de holdings
         holdings_value = 0.0
@@ -243,17 +140,17 @@ class PortfolioValuation:
                 oz_from_g = current_quantity / OZ_TROY_TO_G
                 if use_current_prices and is_today and asset.current_price:
                     value_local = oz_from_g * price
-                    value_eur = convert_to_eur(value_local, 'USD')
+                    value_eur = convert_to_eur(value_local, 'USD', target_date)
                 else:
                     value_local = current_quantity * price
-                    value_eur = convert_to_eur(value_local, 'EUR')
+                    value_eur = convert_to_eur(value_local, 'EUR', target_date)
                 cost_local = current_quantity * position['average_buy_price']
-                cost_eur = convert_to_eur(cost_local, 'EUR')
+                cost_eur = convert_to_eur(cost_local, 'EUR', target_date)
             else:
                 value_local = current_quantity * price
                 cost_local = current_quantity * position['average_buy_price']
-                value_eur = convert_to_eur(value_local, asset.currency)
-                cost_eur = convert_to_eur(cost_local, asset.currency)
+                value_eur = convert_to_eur(value_local, asset.currency, target_date)
+                cost_eur = convert_to_eur(cost_local, asset.currency, target_date)
             
             holdings_value += value_eur
             holdings_cost += cost_eur
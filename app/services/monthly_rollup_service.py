@@ -0,0 +1,441 @@
+"""
+Monthly Rollup Service - Agregados mensuales de ingresos, gastos, ajustes y broker
+
+Las series mensuales (totales con ajuste, resúmenes por categoría, entradas sintéticas de
+Ajustes/Stock Market) necesitaban varias consultas por mes. Aquí se resuelven con una sola
+lectura de rango sobre monthly_rollups:
+
+- Meses cerrados: fila materializada; las que faltan se construyen en lote (una consulta
+  agrupada por tabla para todo el rango) y se guardan.
+- Mes en curso: se calcula al vuelo con las mismas consultas, sin guardar (las cuotas de
+  deuda con fecha > hoy no cuentan todavía).
+
+Los importes del broker se guardan en divisa original y se convierten a EUR al leer; el
+ajuste de reconciliación se deriva de las filas del mes y del anterior (saldo inicial).
+
+Escribir ingresos, gastos, saldos bancarios, DEPOSIT/WITHDRAWAL o la preferencia de
+métricas de un mes borra su fila en el flush. Los borrados masivos (query.delete) no
+disparan eventos: usar MonthlyRollupService.invalidate.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import extract
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import db
+from app.models import (
+    BankBalance,
+    Expense,
+    Income,
+    MonthlyRollup,
+    ReconciliationAdjustmentMetricPreference,
+    Transaction,
+)
+from app.services.currency_service import convert_to_eur
+
+logger = logging.getLogger(__name__)
+
+YearMonth = Tuple[int, int]
+
+BROKER_FLOW_TYPES = ('DEPOSIT', 'WITHDRAWAL')
+
+_SESSION_KEY = '_monthly_rollup_invalidations'
+_registered = False
+
+
+@dataclass
+class MonthFigures:
+    """Cifras de un mes ya en EUR (lo que antes se calculaba con varias consultas por mes)."""
+    year: int
+    month: int
+    income_total: float  # Todos los ingresos del mes
+    expense_total: float  # Todos los gastos (cuotas de deuda solo hasta hoy)
+    broker_withdrawals: float  # WITHDRAWAL IBKR/DeGiro (ingreso Stock Market)
+    broker_deposits: float  # DEPOSIT IBKR/DeGiro (gasto Stock Market)
+    adjustment: Optional[float]  # Ajuste de reconciliación (None sin saldos en mes y anterior)
+    include_adjustment: bool = True
+
+    @property
+    def month_label(self) -> str:
+        return date(self.year, self.month, 1).strftime('%b %Y')
+
+    @property
+    def income_adjustment(self) -> float:
+        """Parte del ajuste que suma como ingreso en métricas."""
+        if self.adjustment is None or self.adjustment >= 0 or not self.include_adjustment:
+            return 0.0
+        return float(abs(self.adjustment))
+
+    @property
+    def expense_adjustment(self) -> float:
+        """Parte del ajuste que suma como gasto en métricas."""
+        if self.adjustment is None or self.adjustment <= 0 or not self.include_adjustment:
+            return 0.0
+        return float(self.adjustment)
+
+
+def _ym_code(year: int, month: int) -> int:
+    return year * 12 + (month - 1)
+
+
+def _ym_from_code(code: int) -> YearMonth:
+    return code // 12, code % 12 + 1
+
+
+def _month_bounds(first: YearMonth, last: YearMonth) -> Tuple[date, date]:
+    """(primer día de first, primer día del mes siguiente a last)."""
+    next_year, next_month = _ym_from_code(_ym_code(*last) + 1)
+    return date(first[0], first[1], 1), date(next_year, next_month, 1)
+
+
+# ----------------------------------------------------------------------
+# Construcción en lote
+# ----------------------------------------------------------------------
+
+def _build_rows(user_id: int, first: YearMonth, last: YearMonth, today: date) -> Dict[YearMonth, MonthlyRollup]:
+    """Filas (sin añadir a la sesión) para todos los meses de [first, last]: 5 consultas agrupadas."""
+    start, end = _month_bounds(first, last)
+    rows = {}
+    for code in range(_ym_code(*first), _ym_code(*last) + 1):
+        year, month = _ym_from_code(code)
+        rows[(year, month)] = MonthlyRollup(
+            user_id=user_id, year=year, month=month,
+            income_by_category={}, expense_by_category={},
+            bank_cash=0.0, has_bank_balance=False,
+            broker_withdrawals={}, broker_deposits={},
+            include_adjustment=True,
+        )
+
+    income_year, income_month = extract('year', Income.date), extract('month', Income.date)
+    for year, month, category_id, total in (
+        db.session.query(income_year, income_month, Income.category_id, db.func.sum(Income.amount))
+        .filter(Income.user_id == user_id, Income.date >= start, Income.date < end)
+        .group_by(income_year, income_month, Income.category_id)
+    ):
+        rows[(int(year), int(month))].income_by_category[str(category_id)] = float(total or 0)
+
+    expense_year, expense_month = extract('year', Expense.date), extract('month', Expense.date)
+    for year, month, category_id, total in (
+        db.session.query(expense_year, expense_month, Expense.category_id, db.func.sum(Expense.amount))
+        .filter(
+            Expense.user_id == user_id,
+            Expense.date >= start,
+            Expense.date < end,
+            db.or_(Expense.debt_plan_id.is_(None), Expense.date <= today),
+        )
+        .group_by(expense_year, expense_month, Expense.category_id)
+    ):
+        rows[(int(year), int(month))].expense_by_category[str(category_id)] = float(total or 0)
+
+    balance_code = BankBalance.year * 12 + (BankBalance.month - 1)
+    for year, month, total in (
+        db.session.query(BankBalance.year, BankBalance.month, db.func.sum(BankBalance.amount))
+        .filter(
+            BankBalance.user_id == user_id,
+            balance_code >= _ym_code(*first),
+            balance_code <= _ym_code(*last),
+        )
+        .group_by(BankBalance.year, BankBalance.month)
+    ):
+        row = rows[(year, month)]
+        row.bank_cash = float(total or 0)
+        row.has_bank_balance = True
+
+    txn_year = extract('year', Transaction.transaction_date)
+    txn_month = extract('month', Transaction.transaction_date)
+    for year, month, account_id, txn_type, currency, total in (
+        db.session.query(
+            txn_year, txn_month, Transaction.account_id, Transaction.transaction_type,
+            Transaction.currency, db.func.sum(db.func.abs(Transaction.amount)),
+        )
+        .filter(
+            Transaction.user_id == user_id,
+            Transaction.transaction_type.in_(BROKER_FLOW_TYPES),
+            Transaction.transaction_date >= datetime.combine(start, datetime.min.time()),
+            Transaction.transaction_date < datetime.combine(end, datetime.min.time()),
+        )
+        .group_by(txn_year, txn_month, Transaction.account_id, Transaction.transaction_type, Transaction.currency)
+    ):
+        row = rows[(int(year), int(month))]
+        flows = row.broker_withdrawals if txn_type == 'WITHDRAWAL' else row.broker_deposits
+        flows.setdefault(str(account_id), {})[currency or ''] = float(total or 0)
+
+    pref_code = (
+        ReconciliationAdjustmentMetricPreference.year * 12
+        + (ReconciliationAdjustmentMetricPreference.month - 1)
+    )
+    for pref in ReconciliationAdjustmentMetricPreference.query.filter(
+        ReconciliationAdjustmentMetricPreference.user_id == user_id,
+        pref_code >= _ym_code(*first),
+        pref_code <= _ym_code(*last),
+    ):
+        rows[(pref.year, pref.month)].include_adjustment = bool(pref.include_in_metrics)
+
+    return rows
+
+
+# ----------------------------------------------------------------------
+# Lectura: filas -> cifras en EUR
+# ----------------------------------------------------------------------
+
+def _flows_eur(flows: Dict[str, Dict[str, float]], broker_names: Dict[int, str]) -> Dict[str, float]:
+    """{broker_name: EUR} solo para cuentas IBKR/DeGiro (redondeado por broker)."""
+    by_broker: Dict[str, float] = {}
+    for account_id, by_currency in flows.items():
+        broker = broker_names.get(int(account_id))
+        if broker is None:
+            continue
+        for currency, amount in by_currency.items():
+            by_broker[broker] = by_broker.get(broker, 0) + convert_to_eur(amount, currency)
+    return {k: round(v, 2) for k, v in by_broker.items()}
+
+
+def _summarize(
+    rows: Dict[YearMonth, MonthlyRollup],
+    months: Iterable[YearMonth],
+    excluded_income: set,
+    excluded_expense: set,
+    broker_names: Dict[int, str],
+) -> List[MonthFigures]:
+    """
+    Cifras por mes. `rows` debe incluir también el mes anterior al primero (saldo inicial
+    del ajuste). Misma aritmética que reconciliation_service.get_adjustment_for_month.
+    """
+    result = []
+    for year, month in months:
+        row = rows[(year, month)]
+        prev = rows.get(_ym_from_code(_ym_code(year, month) - 1))
+
+        income_total = sum(row.income_by_category.values())
+        expense_total = sum(row.expense_by_category.values())
+        withdrawals = round(sum(_flows_eur(row.broker_withdrawals, broker_names).values()), 2)
+        deposits = sum(_flows_eur(row.broker_deposits, broker_names).values())
+
+        adjustment = None
+        if row.has_bank_balance and prev is not None and prev.has_bank_balance:
+            income = sum(
+                v for k, v in row.income_by_category.items() if int(k) not in excluded_income
+            ) + withdrawals
+            expenses_recorded = float(sum(
+                v for k, v in row.expense_by_category.items() if int(k) not in excluded_expense
+            )) + deposits
+            real_expenses = prev.bank_cash + income - row.bank_cash
+            adjustment = round(real_expenses - expenses_recorded, 2)
+
+        result.append(MonthFigures(
+            year=year,
+            month=month,
+            income_total=float(income_total),
+            expense_total=float(expense_total),
+            broker_withdrawals=withdrawals,
+            broker_deposits=deposits,
+            adjustment=adjustment,
+            include_adjustment=row.include_adjustment,
+        ))
+    return result
+
+
+_STORE_BUSY_TIMEOUT_MS = 500
+
+
+def _store_rows(values: List[dict]) -> None:
+    """
+    Guarda meses cerrados en su propia conexión, sin tocar la sesión del llamador (lectura).
+    Si otro proceso ya los construyó, ON CONFLICT los ignora (sus valores son iguales).
+    Es solo caché: si la BD está bloqueada (p. ej. por la transacción abierta del llamador),
+    se desiste enseguida y se guardan en otra lectura.
+    """
+    table = MonthlyRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        insert = None
+    try:
+        with db.engine.begin() as conn:
+            if dialect == 'sqlite':
+                conn.exec_driver_sql(f'PRAGMA busy_timeout={_STORE_BUSY_TIMEOUT_MS}')
+            if insert is not None:
+                conn.execute(insert(table).on_conflict_do_nothing(), values)
+            else:
+                conn.execute(table.insert(), values)
+    except IntegrityError:
+        # Motor sin ON CONFLICT: otro proceso construyó los mismos meses a la vez
+        pass
+    except OperationalError as e:
+        logger.warning('monthly_rollup: no se guardaron %s meses: %s', len(values), e)
+
+
+class MonthlyRollupService:
+    """Servicio de agregados mensuales materializados"""
+
+    @staticmethod
+    def get_rows(user_id: int, first: YearMonth, last: YearMonth, today: Optional[date] = None) -> Dict[YearMonth, MonthlyRollup]:
+        """
+        Filas de [first, last]. Meses cerrados desde la tabla (construyendo y guardando las
+        que falten); el mes en curso y posteriores, calculados al vuelo.
+        """
+        today = today or date.today()
+        first_code, last_code = _ym_code(*first), _ym_code(*last)
+        if first_code > last_code:
+            return {}
+        current_code = _ym_code(today.year, today.month)
+
+        closed_last = min(last_code, current_code - 1)
+        row_code = MonthlyRollup.year * 12 + (MonthlyRollup.month - 1)
+        in_range = (
+            MonthlyRollup.user_id == user_id,
+            row_code >= first_code,
+            row_code <= closed_last,
+        )
+
+        # Solo lectura para el llamador: sin autoflush no se abre una transacción de escritura
+        # con sus cambios pendientes (bloquearía el guardado en conexión propia)
+        with db.session.no_autoflush:
+            rows = {(r.year, r.month): r for r in MonthlyRollup.query.filter(*in_range)}
+            missing = [
+                _ym_from_code(code) for code in range(first_code, closed_last + 1)
+                if _ym_from_code(code) not in rows
+            ]
+            if missing:
+                built = _build_rows(user_id, missing[0], missing[-1], today)
+                values = [
+                    {
+                        c.name: getattr(built[ym], c.name)
+                        for c in MonthlyRollup.__table__.columns if c.name not in ('id', 'created_at')
+                    }
+                    for ym in missing
+                ]
+                _store_rows(values)
+                for ym in missing:
+                    rows[ym] = built[ym]
+
+            if last_code >= current_code:
+                live_first = _ym_from_code(max(first_code, current_code))
+                rows.update(_build_rows(user_id, live_first, last, today))
+        return rows
+
+    @staticmethod
+    def get_figures(user_id: int, first: YearMonth, last: YearMonth, today: Optional[date] = None) -> List[MonthFigures]:
+        """Cifras en EUR de cada mes de [first, last], en orden cronológico."""
+        from app.services.broker_sync_service import broker_account_names
+        from app.services.reconciliation_service import (
+            _reconciliation_excluded_expense_category_ids,
+            _reconciliation_excluded_income_category_ids,
+        )
+
+        first_code, last_code = _ym_code(*first), _ym_code(*last)
+        if first_code > last_code:
+            return []
+        rows = MonthlyRollupService.get_rows(user_id, _ym_from_code(first_code - 1), last, today)
+        return _summarize(
+            rows,
+            [_ym_from_code(code) for code in range(first_code, last_code + 1)],
+            set(_reconciliation_excluded_income_category_ids(user_id)),
+            set(_reconciliation_excluded_expense_category_ids(user_id)),
+            broker_account_names(user_id),
+        )
+
+    @staticmethod
+    def invalidate(user_id: int, from_date: Optional[date] = None) -> None:
+        """
+        Borra los agregados del usuario desde el mes de from_date (None = todos).
+        No hace commit (se confirma con la transacción del llamante).
+        """
+        query = MonthlyRollup.query.filter(MonthlyRollup.user_id == user_id)
+        if from_date is not None:
+            query = query.filter(
+                MonthlyRollup.year * 12 + (MonthlyRollup.month - 1) >= _ym_code(from_date.year, from_date.month)
+            )
+        query.delete(synchronize_session=False)
+
+
+# ----------------------------------------------------------------------
+# Invalidación automática en flush
+# ----------------------------------------------------------------------
+
+_WATCHED_COLUMNS = {
+    Income: ('user_id', 'date', 'amount', 'category_id'),
+    Expense: ('user_id', 'date', 'amount', 'category_id', 'debt_plan_id'),
+    BankBalance: ('user_id', 'year', 'month', 'amount'),
+    Transaction: ('user_id', 'transaction_date', 'transaction_type', 'amount', 'currency', 'account_id'),
+    ReconciliationAdjustmentMetricPreference: ('user_id', 'year', 'month', 'include_in_metrics'),
+}
+
+
+def _month_key(obj, values: Dict) -> Optional[Tuple[int, int]]:
+    """(user_id, código de mes) afectado por una versión (actual o previa) del objeto."""
+    if values['user_id'] is None:
+        return None
+    if isinstance(obj, (BankBalance, ReconciliationAdjustmentMetricPreference)):
+        if values['year'] is None or values['month'] is None:
+            return None
+        return values['user_id'], _ym_code(values['year'], values['month'])
+    if isinstance(obj, Transaction):
+        if values['transaction_type'] not in BROKER_FLOW_TYPES or values['transaction_date'] is None:
+            return None
+        d = values['transaction_date']
+    else:
+        d = values['date']
+        if d is None:
+            return None
+    return values['user_id'], _ym_code(d.year, d.month)
+
+
+def _month_keys(obj, state, columns) -> List[Tuple[int, int]]:
+    current = {c: getattr(obj, c) for c in columns}
+    previous = {}
+    for c in columns:
+        history = state.attrs[c].history
+        previous[c] = history.deleted[0] if history.deleted else current[c]
+    return [k for k in {_month_key(obj, current), _month_key(obj, previous)} if k is not None]
+
+
+def _collect_invalidations(session, flush_context, instances) -> None:
+    pending = session.info.setdefault(_SESSION_KEY, set())
+    watched = tuple(_WATCHED_COLUMNS)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, watched):
+            pending.update(_month_keys(obj, db.inspect(obj), _WATCHED_COLUMNS[type(obj)]))
+    for obj in session.dirty:
+        if not isinstance(obj, watched):
+            continue
+        columns = _WATCHED_COLUMNS[type(obj)]
+        state = db.inspect(obj)
+        if any(state.attrs[c].history.has_changes() for c in columns):
+            pending.update(_month_keys(obj, state, columns))
+
+
+def _apply_invalidations(session, flush_context) -> None:
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending:
+        return
+    table = MonthlyRollup.__table__
+    connection = session.connection()
+    by_user: Dict[int, set] = {}
+    for user_id, code in pending:
+        by_user.setdefault(user_id, set()).add(code)
+    for user_id, codes in by_user.items():
+        connection.execute(
+            table.delete().where(
+                table.c.user_id == user_id,
+                (table.c.year * 12 + (table.c.month - 1)).in_(sorted(codes)),
+            )
+        )
+
+
+def register_monthly_rollup_invalidation(db) -> None:
+    """Registra before_flush/after_flush para borrar los agregados de los meses escritos."""
+    global _registered
+    if _registered:
+        return
+    from sqlalchemy import event
+
+    event.listen(db.session, 'before_flush', _collect_invalidations)
+    event.listen(db.session, 'after_flush', _apply_invalidations)
+    _registered = True
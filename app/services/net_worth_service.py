@@ -15,6 +15,7 @@ from app import db
 from app.models.portfolio import PortfolioHolding
 from app.models.asset import Asset
 from app.models.user import User
+from app.services import transaction_frame
 from app.services.bank_service import BankService
 from app.services.crypto_metrics import compute_crypto_metrics
 from app.services.metales_metrics import compute_metales_metrics, PRECIOUS_METAL_YAHOO_SYMBOLS
@@ -221,10 +222,10 @@ def get_net_worth_history(user_id: int, months: int = 12) -> List[Dict[str, Any]
     history = []
     debt = get_debt_total(user_id)
     
+    months_list = []
     for i in range(months - 1, -1, -1):
         d = today - relativedelta(months=i)
-        year, month = d.year, d.month
-        is_current_month = (year == today.year and month == today.month)
+        is_current_month = (d.year == today.year and d.month == today.month)
         
         # Fecha final del mes (o hoy si es el mes actual)
         if is_current_month:
@@ -234,17 +235,20 @@ def get_net_worth_history(user_id: int, months: int = 12) -> List[Dict[str, Any]
             next_month = d + relativedelta(months=1)
             target_date = datetime(next_month.year, next_month.month, 1) - relativedelta(days=1)
             target_date = datetime.combine(target_date.date(), datetime.max.time())
+        months_list.append((d, target_date, is_current_month))
+    
+    # Broker (con apalancamiento), crypto y metales (valor directo) en todos los fines de mes
+    # con un único replay del ledger
+    investment_values = _get_investment_values_at_dates(
+        user_id, [(target_date, is_current_month) for _, target_date, is_current_month in months_list]
+    )
+    
+    for (d, target_date, _), (broker_total, crypto, metales) in zip(months_list, investment_values):
+        year, month = d.year, d.month
         
         # Cash histórico de bancos externos
         cash = get_cash_total(user_id, year, month)
         
-        # Broker (solo acciones) - tiene apalancamiento, calcular valor real
-        broker_data = _get_broker_value_at_date(user_id, target_date, is_current_month)
-        broker_total = broker_data['total_value']  # Valor real considerando apalancamiento
-        
-        # Crypto y Metales - NO tienen apalancamiento, valor directo de holdings
-        crypto = _get_holdings_value_at_date(user_id, target_date, ['Crypto'], is_current_month)
-        metales = _get_holdings_value_at_date(user_id, target_date, ['Commodity'], is_current_month)
         real_estate = _get_real_estate_value_at_date(user_id, target_date)
 
         # Patrimonio = Cash + Broker + Crypto + Metales + Inmuebles (dinero real del usuario)
@@ -267,6 +271,10 @@ def get_net_worth_history(user_id: int, months: int = 12) -> List[Dict[str, Any]
     return history
 
 
+STOCK_TYPES = ['Stock', 'ETF', 'ADR']
+OZ_TROY_TO_G = 31.1035
+
+
 def _get_broker_value_at_date(
     user_id: int,
     target_date,
@@ -277,76 +285,41 @@ def _get_broker_value_at_date(
     Calcula el valor real del broker (solo acciones: Stock, ETF, ADR) en una fecha.
     Considera el apalancamiento (cash_balance puede ser negativo).
     """
-    from app.models.transaction import Transaction
-    from app.services.fifo_calculator import FIFOCalculator
-    
-    STOCK_TYPES = ['Stock', 'ETF', 'ADR']
-    
-    # Obtener transacciones hasta la fecha
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_date <= target_date
-    ).order_by(Transaction.transaction_date, Transaction.id).all()
-    
-    fifo_calculators = {}
-    cash_balance = 0.0
-    
-    for txn in transactions:
-        asset_id = txn.asset_id if txn.asset_id else None
-        
-        # Solo procesar transacciones relacionadas con acciones o cash del broker
-        asset = txn.asset if asset_id else None
-        is_stock_txn = asset and asset.asset_type in STOCK_TYPES
-        
-        # DEPOSIT: Añade cash al broker
-        if txn.transaction_type == 'DEPOSIT':
-            amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-            cash_balance += amount_eur
-        
-        # WITHDRAWAL: Quita cash del broker
-        elif txn.transaction_type == 'WITHDRAWAL':
-            amount_eur = convert_to_eur(abs(txn.amount), txn.currency)
-            cash_balance -= amount_eur
-        
-        # BUY acciones: quita cash, añade holding
-        elif txn.transaction_type == 'BUY' and is_stock_txn:
-            total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
-            cost_eur = convert_to_eur(total_cost, txn.currency)
-            cash_balance -= cost_eur
-            
-            if asset_id not in fifo_calculators:
-                fifo_calculators[asset_id] = {
-                    'fifo': FIFOCalculator(symbol=asset.symbol),
-                    'asset': asset
-                }
-            fifo_calculators[asset_id]['fifo'].add_buy(
-                quantity=txn.quantity,
-                price=txn.price,
-                date=txn.transaction_date,
-                total_cost=total_cost
-            )
-        
-        # SELL acciones: añade cash, quita holding
-        elif txn.transaction_type == 'SELL' and is_stock_txn:
-            proceeds = (txn.quantity * txn.price) - txn.commission - txn.fees - txn.tax
-            proceeds_eur = convert_to_eur(proceeds, txn.currency)
-            cash_balance += proceeds_eur
-            
-            if asset_id in fifo_calculators:
-                fifo_calculators[asset_id]['fifo'].add_sell(
-                    quantity=txn.quantity,
-                    date=txn.transaction_date
-                )
-        
-        # DIVIDEND: Añade cash
-        elif txn.transaction_type == 'DIVIDEND':
-            dividend_eur = convert_to_eur(abs(txn.amount), txn.currency)
-            cash_balance += dividend_eur
-        
-        # FEE: Quita cash
-        elif txn.transaction_type == 'FEE':
-            fee_eur = convert_to_eur(abs(txn.amount), txn.currency)
-            cash_balance -= fee_eur
+    from app.services.fifo_checkpoint_service import FifoCheckpointService
+    
+    # Estado FIFO + caja a la fecha (reanuda desde el checkpoint de fin de mes más cercano)
+    state = FifoCheckpointService.state_at(user_id, target_date)
+    
+    # Solo acciones/ETF/ADR y la caja de sus compras/ventas
+    traded_ids = set(state.trade_cash.keys()) | set(state.valuation_fifos().keys())
+    stock_assets = {}
+    if traded_ids:
+        stock_assets = {
+            a.id: a for a in Asset.query.filter(
+                Asset.id.in_(traded_ids),
+                Asset.asset_type.in_(STOCK_TYPES)
+            ).all()
+        }
+    return _broker_value_from_state(state, stock_assets, target_date, use_current_prices, price_source)
+
+
+def _broker_value_from_state(
+    state,
+    stock_assets: Dict[int, Asset],
+    target_date,
+    use_current_prices: bool = False,
+    price_source: str = "current",
+) -> Dict[str, float]:
+    """
+    Valor del broker a partir de un LedgerState ya replayado hasta target_date.
+    stock_assets: activos Stock/ETF/ADR (puede incluir activos aún no operados).
+    """
+    fifo_calculators = {
+        asset_id: {'fifo': fifo, 'asset': stock_assets[asset_id]}
+        for asset_id, fifo in state.valuation_fifos().items()
+        if asset_id in stock_assets
+    }
+    cash_balance = state.cash_balance_eur(asset_ids=stock_assets.keys(), on_date=target_date)
     
     # Calcular valor de holdings de acciones
     holdings_value = 0.0
@@ -371,7 +344,7 @@ def _get_broker_value_at_date(
             price = position['average_buy_price']
         
         value_local = current_quantity * price
-        value_eur = convert_to_eur(value_local, asset.currency)
+        value_eur = convert_to_eur(value_local, asset.currency, target_date)
         holdings_value += value_eur
     
     # Valor total del broker = cash + holdings
@@ -395,51 +368,61 @@ def _get_holdings_value_at_date(
     Calcula el valor directo de holdings de ciertos tipos de asset.
     NO considera apalancamiento - valor directo de las posiciones.
     """
-    from app.models.transaction import Transaction
-    from app.services.fifo_calculator import FIFOCalculator
-    
-    OZ_TROY_TO_G = 31.1035
-    
-    # Obtener transacciones hasta la fecha
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_date <= target_date
-    ).order_by(Transaction.transaction_date, Transaction.id).all()
+    # Obtener transacciones hasta la fecha (frame columnar compartido por la petición)
+    frame = transaction_frame.for_user(user_id)
+    mask = frame.mask(end=target_date) & (frame.asset_ids != 0)
+    transactions = frame.rows(mask)
+    assets = {
+        a.id: a for a in Asset.query.filter(Asset.id.in_(np.unique(frame.asset_ids[mask]).tolist()))
+    } if mask.any() else {}
     
     fifo_calculators = {}
     
     for txn in transactions:
-        asset_id = txn.asset_id
-        if not asset_id:
-            continue
-        
-        asset = txn.asset
+        asset = assets.get(txn.asset_id)
         if not asset or asset.asset_type not in asset_types:
             continue
-        if asset.asset_type == 'Commodity' and (asset.symbol or '') not in PRECIOUS_METAL_YAHOO_SYMBOLS:
-            continue
+        _apply_holding_txn(fifo_calculators, txn, asset)
+    
+    return _holdings_value_from_fifos(fifo_calculators, target_date, use_current_prices, price_source)
 
-        if asset_id not in fifo_calculators:
-            fifo_calculators[asset_id] = {
-                'fifo': FIFOCalculator(symbol=asset.symbol),
-                'asset': asset
-            }
-        
-        if txn.transaction_type == 'BUY':
-            total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
-            fifo_calculators[asset_id]['fifo'].add_buy(
-                quantity=txn.quantity,
-                price=txn.price,
-                date=txn.transaction_date,
-                total_cost=total_cost
-            )
-        elif txn.transaction_type == 'SELL':
-            fifo_calculators[asset_id]['fifo'].add_sell(
-                quantity=txn.quantity,
-                date=txn.transaction_date
-            )
+
+def _apply_holding_txn(fifo_calculators: Dict[int, Dict[str, Any]], txn, asset: Asset) -> None:
+    """Aplica una BUY/SELL al FIFO (Decimal) de su activo; solo metales preciosos entre Commodity."""
+    from app.services.fifo_calculator import FIFOCalculator
+
+    if asset.asset_type == 'Commodity' and (asset.symbol or '') not in PRECIOUS_METAL_YAHOO_SYMBOLS:
+        return
+
+    asset_id = txn.asset_id
+    if asset_id not in fifo_calculators:
+        fifo_calculators[asset_id] = {
+            'fifo': FIFOCalculator(symbol=asset.symbol),
+            'asset': asset
+        }
     
-    # Calcular valor total
+    if txn.transaction_type == 'BUY':
+        total_cost = (txn.quantity * txn.price) + txn.commission + txn.fees + txn.tax
+        fifo_calculators[asset_id]['fifo'].add_buy(
+            quantity=txn.quantity,
+            price=txn.price,
+            date=txn.transaction_date,
+            total_cost=total_cost
+        )
+    elif txn.transaction_type == 'SELL':
+        fifo_calculators[asset_id]['fifo'].add_sell(
+            quantity=txn.quantity,
+            date=txn.transaction_date
+        )
+
+
+def _holdings_value_from_fifos(
+    fifo_calculators: Dict[int, Dict[str, Any]],
+    target_date,
+    use_current_prices: bool = False,
+    price_source: str = "current",
+) -> float:
+    """Valor en EUR de las posiciones abiertas en los FIFOs (sin apalancamiento)."""
     total_value = 0.0
     today = date.today()
     is_today = (target_date.date() >= today) if hasattr(target_date, 'date') else (target_date >= today)
@@ -478,6 +461,54 @@ def _get_holdings_value_at_date(
     return total_value
 
 
+def _get_investment_values_at_dates(user_id: int, targets: List[Tuple[datetime, bool]]) -> List[Tuple[float, float, float]]:
+    """
+    (broker_total, crypto, metales) en cada fecha de `targets` [(fecha, use_current_prices)],
+    ordenadas ascendentemente, con UN solo replay del ledger.
+
+    Mismo resultado que _get_broker_value_at_date + 2× _get_holdings_value_at_date por fecha:
+    el broker reanuda desde el checkpoint FIFO de la primera fecha y avanza el mismo
+    LedgerState; crypto/metales avanzan sus FIFOs (Decimal) por la cola de transacciones.
+    """
+    from app.services.fifo_checkpoint_service import FifoCheckpointService
+
+    if not targets:
+        return []
+    first_date, last_date = targets[0][0], targets[-1][0]
+
+    frame = transaction_frame.for_user(user_id)
+    mask = frame.mask(end=last_date) & (frame.asset_ids != 0)
+    assets = {
+        a.id: a for a in Asset.query.filter(Asset.id.in_(np.unique(frame.asset_ids[mask]).tolist()))
+    } if mask.any() else {}
+    stock_assets = {aid: a for aid, a in assets.items() if a.asset_type in STOCK_TYPES}
+    holding_ids = [aid for aid, a in assets.items() if a.asset_type in ('Crypto', 'Commodity')]
+
+    state = FifoCheckpointService.state_at(user_id, first_date)
+    broker_tail = frame.rows(frame.mask(after=first_date, end=last_date))
+    holding_rows = frame.rows(frame.mask(end=last_date, asset_ids=holding_ids)) if holding_ids else []
+
+    crypto_fifos: Dict[int, Dict[str, Any]] = {}
+    metales_fifos: Dict[int, Dict[str, Any]] = {}
+    bi = hi = 0
+    results = []
+    for target_date, use_current_prices in targets:
+        while bi < len(broker_tail) and broker_tail[bi].transaction_date <= target_date:
+            state.apply(broker_tail[bi])
+            bi += 1
+        while hi < len(holding_rows) and holding_rows[hi].transaction_date <= target_date:
+            txn = holding_rows[hi]
+            asset = assets[txn.asset_id]
+            _apply_holding_txn(crypto_fifos if asset.asset_type == 'Crypto' else metales_fifos, txn, asset)
+            hi += 1
+
+        broker_total = _broker_value_from_state(state, stock_assets, target_date, use_current_prices)['total_value']
+        crypto = _holdings_value_from_fifos(crypto_fifos, target_date, use_current_prices)
+        metales = _holdings_value_from_fifos(metales_fifos, target_date, use_current_prices)
+        results.append((broker_total, crypto, metales))
+    return results
+
+
 def _user_has_module(user_id: int, key: str) -> bool:
     """
     Back-end equivalente al filtro user_has_module.
@@ -691,7 +722,6 @@ def _get_holdings_breakdown_at_date(user_id: int, target_date, use_current_price
     Calcula el valor de holdings por tipo de asset en una fecha específica.
     Solo para mostrar desglose visual, no para calcular patrimonio real.
     """
-    from app.models.transaction import Transaction
     from app.services.fifo_calculator import FIFOCalculator
     
     OZ_TROY_TO_G = 31.1035
@@ -705,11 +735,13 @@ def _get_holdings_breakdown_at_date(user_id: int, target_date, use_current_price
         'Commodity': 'metales'
     }
     
-    # Obtener transacciones hasta la fecha
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_date <= target_date
-    ).order_by(Transaction.transaction_date, Transaction.id).all()
+    # Obtener transacciones hasta la fecha (frame columnar compartido por la petición)
+    frame = transaction_frame.for_user(user_id)
+    mask = frame.mask(end=target_date) & (frame.asset_ids != 0)
+    transactions = frame.rows(mask)
+    assets = {
+        a.id: a for a in Asset.query.filter(Asset.id.in_(np.unique(frame.asset_ids[mask]).tolist()))
+    } if mask.any() else {}
     
     # Reconstruir FIFO por asset
     fifo_calculators = {}
@@ -719,7 +751,7 @@ def _get_holdings_breakdown_at_date(user_id: int, target_date, use_current_price
         if not asset_id:
             continue
         
-        asset = txn.asset
+        asset = assets.get(asset_id)
         if not asset or asset.asset_type not in type_mapping:
             continue
         if asset.asset_type == 'Commodity' and (asset.symbol or '') not in PRECIOUS_METAL_YAHOO_SYMBOLS:
@@ -789,7 +821,7 @@ def get_full_net_worth_history(user_id: int) -> Dict[str, Any]:
     Histórico completo de patrimonio desde el primer registro.
     Devuelve datos y metadatos sobre el rango disponible.
     """
-    from app.models import BankBalance, Income, Expense, Transaction
+    from app.models import BankBalance, Income, Expense
     from datetime import datetime
     
     def to_date(d):
@@ -821,11 +853,9 @@ def get_full_net_worth_history(user_id: int) -> Dict[str, Any]:
         dates.append(to_date(oldest_expense.date))
     
     # Transaction (operaciones de broker)
-    oldest_transaction = Transaction.query.filter_by(user_id=user_id).order_by(
-        Transaction.transaction_date.asc()
-    ).first()
-    if oldest_transaction and oldest_transaction.transaction_date:
-        dates.append(to_date(oldest_transaction.transaction_date))
+    oldest_transaction_date = transaction_frame.for_user(user_id).first_date()
+    if oldest_transaction_date:
+        dates.append(to_date(oldest_transaction_date))
     
     if not dates:
         return {
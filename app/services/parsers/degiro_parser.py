@@ -8,12 +8,16 @@ import logging
 _idebug = logging.getLogger('import_debug')
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
 
+from app.services.parsers.streaming import ParsedEvent, StreamingParser, collect_events
 
-class DeGiroParser:
+
+class DeGiroParser(StreamingParser):
     """Parser para archivos CSV de DeGiro Estado de Cuenta"""
     
+    BROKER = 'DEGIRO'
+    
     # Tipos de transacción detectados
     TRANSACTION_TYPES = {
         'Compra': 'BUY',
@@ -32,6 +36,7 @@ class DeGiroParser:
     }
     
     def __init__(self):
+        super().__init__()
         self.account_info = {}
         self.trades = []
         self.holdings = {}  # Se calcularán desde trades
@@ -59,30 +64,18 @@ class DeGiroParser:
         """
         try:
             _idebug.debug(f"DeGiroParser.parse: inicio {file_path}")
-            # Leer CSV con `reader` para acceder por índice
-            with open(file_path, 'r', encoding='utf-8') as f:
-                raw_reader = csv.reader(f)
-                header = next(raw_reader)
-                for raw_values in raw_reader:
-                    row = {}
-                    for i, col_name in enumerate(header):
-                        if i < len(raw_values):
-                            if col_name:
-                                row[col_name] = raw_values[i]
-                            elif i == 8:
-                                row['__amount__'] = raw_values[i]
-                            elif i == 10:
-                                row['__balance__'] = raw_values[i]
-                    self._process_row(row)
-
-            self._calculate_holdings()
-            self._consolidate_dividends()
+            data = collect_events(self.iter_events(file_path))
+            self.trades = data['trades']
+            self.dividends = data['dividends']
+            self.deposits = data['deposits']
+            self.withdrawals = data['withdrawals']
+            self.fees = data['fees']
 
             result = {
                 'broker': 'DEGIRO',
                 'account_info': self.account_info,
                 'trades': self.trades,
-                'holdings': list(self.holdings.values()),
+                'holdings': data['holdings'],
                 'dividends': self.dividends,
                 'deposits': self.deposits,
                 'withdrawals': self.withdrawals,
@@ -95,6 +88,53 @@ class DeGiroParser:
             _idebug.error(f"DeGiroParser.parse: ERROR {e}")
             raise
     
+    def _iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        """
+        Emite comisiones, depósitos y retiros al leer su fila.
+        
+        Los dividendos necesitan ver todas sus filas relacionadas (retenciones y cambios de
+        divisa) antes de consolidarse: se emiten al final, junto con los holdings.
+        """
+        # Leer CSV con `reader` para acceder por índice
+        with open(file_path, 'r', encoding='utf-8') as f:
+            raw_reader = self.throughput.count(csv.reader(f))
+            header = next(raw_reader, None)
+            if header is None:
+                return
+            for raw_values in raw_reader:
+                row = {}
+                for i, col_name in enumerate(header):
+                    if i < len(raw_values):
+                        if col_name:
+                            row[col_name] = raw_values[i]
+                        elif i == 8:
+                            row['__amount__'] = raw_values[i]
+                        elif i == 10:
+                            row['__balance__'] = raw_values[i]
+                self._process_row(row)
+                yield from self._drain_row_events()
+
+        self._close_holdings()
+        self._consolidate_dividends()
+        for dividend in self.dividends:
+            yield ParsedEvent('dividend', dividend)
+        for holding in self.holdings.values():
+            yield ParsedEvent('holding', holding)
+    
+    def _drain_row_events(self) -> Iterator[ParsedEvent]:
+        """Emite y vacía los registros producidos por la última fila"""
+        for trade in self.trades:
+            self._update_holding(trade)
+        for kind, pending in (
+            ('trade', self.trades),
+            ('fee', self.fees),
+            ('deposit', self.deposits),
+            ('withdrawal', self.withdrawals),
+        ):
+            for record in pending:
+                yield ParsedEvent(kind, record)
+            pending.clear()
+    
     def _process_row(self, row: Dict[str, str]):
         """Procesa una fila del CSV"""
         description = row.get('Descripción', '').strip()
@@ -647,52 +687,52 @@ class DeGiroParser:
         
         self.deposits.append(deposit)
     
-    def _calculate_holdings(self):
-        """Calcula holdings actuales desde las transacciones"""
-        for trade in self.trades:
-            symbol = trade['symbol']
-            name = trade.get('name', '')
-            isin = trade['isin']
-            
-            # Usar ISIN como key principal (nunca cambia), fallback a símbolo si no hay ISIN
-            # Esto asegura que compras/ventas del mismo activo se agrupen correctamente
-            # incluso si el nombre del símbolo varía ligeramente
-            key = isin if isin else symbol
+    def _update_holding(self, trade: Dict[str, Any]):
+        """Acumula un trade en el holding de su ISIN"""
+        symbol = trade['symbol']
+        name = trade.get('name', '')
+        isin = trade['isin']
+        
+        # Usar ISIN como key principal (nunca cambia), fallback a símbolo si no hay ISIN
+        # Esto asegura que compras/ventas del mismo activo se agrupen correctamente
+        # incluso si el nombre del símbolo varía ligeramente
+        key = isin if isin else symbol
+        
+        if key not in self.holdings:
+            self.holdings[key] = {
+                'symbol': symbol,  # Vacío para DeGiro
+                'name': name,  # Nombre del producto
+                'isin': isin,
+                'currency': trade['currency'],
+                'quantity': 0,
+                'total_cost': Decimal('0'),
+                'average_buy_price': Decimal('0')
+            }
+        
+        holding = self.holdings[key]
+        
+        if trade['transaction_type'] == 'BUY':
+            # Actualizar cantidad y coste
+            new_quantity = holding['quantity'] + trade['quantity']
+            new_cost = holding['total_cost'] + (trade['price'] * trade['quantity'])
             
-            if key not in self.holdings:
-                self.holdings[key] = {
-                    'symbol': symbol,  # Vacío para DeGiro
-                    'name': name,  # Nombre del producto
-                    'isin': isin,
-                    'currency': trade['currency'],
-                    'quantity': 0,
-                    'total_cost': Decimal('0'),
-                    'average_buy_price': Decimal('0')
-                }
+            holding['quantity'] = new_quantity
+            holding['total_cost'] = new_cost
+            holding['average_buy_price'] = new_cost / new_quantity if new_quantity > 0 else Decimal('0')
             
-            holding = self.holdings[key]
+        elif trade['transaction_type'] == 'SELL':
+            # Reducir cantidad
+            holding['quantity'] -= trade['quantity']
             
-            if trade['transaction_type'] == 'BUY':
-                # Actualizar cantidad y coste
-                new_quantity = holding['quantity'] + trade['quantity']
-                new_cost = holding['total_cost'] + (trade['price'] * trade['quantity'])
-                
-                holding['quantity'] = new_quantity
-                holding['total_cost'] = new_cost
-                holding['average_buy_price'] = new_cost / new_quantity if new_quantity > 0 else Decimal('0')
-                
-            elif trade['transaction_type'] == 'SELL':
-                # Reducir cantidad
-                holding['quantity'] -= trade['quantity']
-                
-                # Reducir coste proporcional
-                if holding['quantity'] > 0:
-                    cost_per_share = holding['total_cost'] / (holding['quantity'] + trade['quantity'])
-                    holding['total_cost'] -= cost_per_share * trade['quantity']
-                else:
-                    holding['total_cost'] = Decimal('0')
-        
-        # Eliminar holdings con cantidad 0
+            # Reducir coste proporcional
+            if holding['quantity'] > 0:
+                cost_per_share = holding['total_cost'] / (holding['quantity'] + trade['quantity'])
+                holding['total_cost'] -= cost_per_share * trade['quantity']
+            else:
+                holding['total_cost'] = Decimal('0')
+    
+    def _close_holdings(self):
+        """Descarta los holdings cerrados (cantidad 0)"""
         self.holdings = {k: v for k, v in self.holdings.items() if v['quantity'] > 0}
     
     # Helper methods
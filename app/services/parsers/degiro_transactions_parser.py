@@ -9,13 +9,18 @@ _idebug = logging.getLogger('import_debug')
 import re
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional
 
+from app.services.parsers.streaming import ParsedEvent, StreamingParser, collect_events
 
-class DeGiroTransactionsParser:
+
+class DeGiroTransactionsParser(StreamingParser):
     """Parser para el reporte de Transacciones de DeGiro (más completo que Estado de Cuenta)"""
     
+    BROKER = 'DEGIRO'
+    
     def __init__(self):
+        super().__init__()
         self.account_info = {}
         self.trades = []
         self.holdings = {}
@@ -46,20 +51,13 @@ class DeGiroTransactionsParser:
         """
         try:
             _idebug.debug(f"DeGiroTransactionsParser.parse: inicio {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                header = next(reader)
-                for row in reader:
-                    if len(row) < 9:
-                        continue
-                    self._process_row(row)
-
-            self._calculate_holdings()
+            data = collect_events(self.iter_events(file_path))
+            self.trades = data['trades']
             result = {
                 'broker': 'DEGIRO',
                 'account_info': self.account_info,
                 'trades': self.trades,
-                'holdings': list(self.holdings.values()),
+                'holdings': data['holdings'],
                 'dividends': [],
                 'deposits': [],
                 'fees': [],
@@ -71,7 +69,26 @@ class DeGiroTransactionsParser:
             _idebug.error(f"DeGiroTransactionsParser.parse: ERROR {e}")
             raise
     
-    def _process_row(self, row: List[str]):
+    def _iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        """Emite cada trade al leer su fila y los holdings (acumulados por ISIN) al final"""
+        self.holdings = {}
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = self.throughput.count(csv.reader(f))
+            if next(reader, None) is None:  # header
+                return
+            for row in reader:
+                if len(row) < 9:
+                    continue
+                trade = self._process_row(row)
+                if trade:
+                    self._update_holding(trade)
+                    yield ParsedEvent('trade', trade)
+
+        self._close_holdings()
+        for holding in self.holdings.values():
+            yield ParsedEvent('holding', holding)
+    
+    def _process_row(self, row: List[str]) -> Optional[Dict[str, Any]]:
         """
         Procesa una fila del CSV de Transacciones usando índices de columna
         
@@ -86,10 +103,10 @@ class DeGiroTransactionsParser:
             numero_str = row[6].replace(',', '.') if len(row) > 6 else '0'
             quantity = float(numero_str)
         except:
-            return
+            return None
         
         if quantity == 0:
-            return
+            return None
         
         # Extraer datos básicos
         fecha = row[0] if len(row) > 0 else ''
@@ -151,55 +168,55 @@ class DeGiroTransactionsParser:
         # Calcular monto total
         trade['amount'] = abs(price * Decimal(str(abs(quantity))))
         
-        self.trades.append(trade)
+        return trade
     
-    def _calculate_holdings(self):
-        """Calcula holdings actuales desde las transacciones usando ISIN como key"""
-        for trade in self.trades:
-            symbol = trade['symbol']
-            name = trade.get('name', '')
-            isin = trade['isin']
-            
-            # Usar ISIN como key principal (nunca cambia)
-            key = isin if isin else symbol
+    def _update_holding(self, trade: Dict[str, Any]):
+        """Acumula un trade en el holding de su ISIN"""
+        symbol = trade['symbol']
+        name = trade.get('name', '')
+        isin = trade['isin']
+        
+        # Usar ISIN como key principal (nunca cambia)
+        key = isin if isin else symbol
+        
+        if key not in self.holdings:
+            self.holdings[key] = {
+                'symbol': symbol,
+                'name': name,  # Incluir nombre del producto
+                'isin': isin,
+                'currency': trade['currency'],
+                'quantity': 0,
+                'total_cost': Decimal('0'),
+                'average_buy_price': Decimal('0'),
+                # Incluir exchange y MIC para enriquecimiento
+                'degiro_exchange': trade.get('degiro_exchange', ''),
+                'mic': trade.get('mic', ''),
+            }
+        
+        holding = self.holdings[key]
+        
+        if trade['transaction_type'] == 'BUY':
+            # Actualizar cantidad y coste
+            new_quantity = holding['quantity'] + trade['quantity']
+            new_cost = holding['total_cost'] + (trade['price'] * trade['quantity'])
             
-            if key not in self.holdings:
-                self.holdings[key] = {
-                    'symbol': symbol,
-                    'name': name,  # Incluir nombre del producto
-                    'isin': isin,
-                    'currency': trade['currency'],
-                    'quantity': 0,
-                    'total_cost': Decimal('0'),
-                    'average_buy_price': Decimal('0'),
-                    # Incluir exchange y MIC para enriquecimiento
-                    'degiro_exchange': trade.get('degiro_exchange', ''),
-                    'mic': trade.get('mic', ''),
-                }
+            holding['quantity'] = new_quantity
+            holding['total_cost'] = new_cost
+            holding['average_buy_price'] = new_cost / new_quantity if new_quantity > 0 else Decimal('0')
             
-            holding = self.holdings[key]
+        elif trade['transaction_type'] == 'SELL':
+            # Reducir cantidad
+            holding['quantity'] -= trade['quantity']
             
-            if trade['transaction_type'] == 'BUY':
-                # Actualizar cantidad y coste
-                new_quantity = holding['quantity'] + trade['quantity']
-                new_cost = holding['total_cost'] + (trade['price'] * trade['quantity'])
-                
-                holding['quantity'] = new_quantity
-                holding['total_cost'] = new_cost
-                holding['average_buy_price'] = new_cost / new_quantity if new_quantity > 0 else Decimal('0')
-                
-            elif trade['transaction_type'] == 'SELL':
-                # Reducir cantidad
-                holding['quantity'] -= trade['quantity']
-                
-                # Reducir coste proporcional (FIFO simplificado)
-                if holding['quantity'] > 0:
-                    cost_per_share = holding['total_cost'] / (holding['quantity'] + trade['quantity'])
-                    holding['total_cost'] -= cost_per_share * trade['quantity']
-                else:
-                    holding['total_cost'] = Decimal('0')
-        
-        # Eliminar holdings con cantidad <= 0
+            # Reducir coste proporcional (FIFO simplificado)
+            if holding['quantity'] > 0:
+                cost_per_share = holding['total_cost'] / (holding['quantity'] + trade['quantity'])
+                holding['total_cost'] -= cost_per_share * trade['quantity']
+            else:
+                holding['total_cost'] = Decimal('0')
+    
+    def _close_holdings(self):
+        """Descarta los holdings cerrados (cantidad <= 0)"""
         self.holdings = {k: v for k, v in self.holdings.items() if v['quantity'] > 0}
     
     # Helper methods
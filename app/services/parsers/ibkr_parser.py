@@ -5,15 +5,83 @@ import csv
 import logging
 
 _idebug = logging.getLogger('import_debug')
+from collections import defaultdict
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Any
+from typing import Callable, Dict, Iterator, List, Any, Optional
 
+from app.services.parsers.streaming import ParsedEvent, StreamingParser, collect_events
 
-class IBKRParser:
+
+class _CurrencyGroups:
+    """
+    Agrupa filas consecutivas de una misma divisa (dividendos, intereses).
+    
+    Las filas Total / Total en EUR llegan al final de cada grupo y dan su tipo de cambio:
+    el grupo se cierra cuando aparece la siguiente divisa (o al terminar la sección).
+    """
+    
+    def __init__(self, total_labels: tuple, parse_decimal: Callable[[str], Decimal]):
+        self.total_labels = total_labels
+        self.parse_decimal = parse_decimal
+        self.currency = None
+        self.items = []
+        self.total_local = Decimal('0')
+        self.total_eur = Decimal('0')
+    
+    def feed(self, row: List[str], build_item: Callable[[List[str]], Optional[Dict[str, Any]]]) -> Optional[tuple]:
+        """Añade una fila; devuelve el grupo anterior si la fila abre una divisa nueva"""
+        if len(row) < 4:
+            return None
+        
+        currency_field = row[0]
+        date_field = row[1]
+        amount_str = row[3]
+        closed = None
+        
+        # Entrada individual (con moneda real: HKD, USD, CAD...)
+        if currency_field and currency_field not in self.total_labels and date_field:
+            if self.currency and self.currency != currency_field:
+                closed = self.close()
+            self.currency = currency_field
+            item = build_item(row)
+            if item is not None:
+                self.items.append(item)
+        # Total (en moneda local)
+        elif currency_field == 'Total' and amount_str:
+            self.total_local = self.parse_decimal(amount_str)
+        # Total en EUR
+        elif currency_field == 'Total en EUR' and amount_str:
+            self.total_eur = self.parse_decimal(amount_str)
+        return closed
+    
+    def close(self) -> Optional[tuple]:
+        """Cierra el grupo en curso: (divisa, items, total_local, total_eur) o None si está vacío"""
+        group = (self.currency, self.items, self.total_local, self.total_eur) if self.items else None
+        self.items = []
+        self.total_local = Decimal('0')
+        self.total_eur = Decimal('0')
+        return group
+
+
+class IBKRParser(StreamingParser):
     """Parser para archivos CSV de IBKR Activity Statement"""
     
+    BROKER = 'IBKR'
+    
+    # Nombres de sección (español / inglés)
+    ACCOUNT_SECTIONS = ('Información sobre la cuenta', 'Account Information')
+    INSTRUMENT_SECTIONS = ('Información de instrumento financiero', 'Financial Instrument Information')
+    TRADE_SECTIONS = ('Operaciones', 'Trades')
+    HOLDING_SECTIONS = ('Posiciones abiertas', 'Open Positions')
+    DIVIDEND_SECTIONS = ('Dividendos', 'Dividends')
+    CASH_SECTIONS = ('Depósitos y retiradas', 'Deposits & Withdrawals')
+    INTEREST_SECTIONS = ('Interés', 'Interest')
+    # Secciones pequeñas que se cargan enteras en la primera pasada
+    REFERENCE_SECTIONS = ACCOUNT_SECTIONS + INSTRUMENT_SECTIONS
+    
     def __init__(self):
+        super().__init__()
         self.sections = {}
         self.account_info = {}
         self.trades = []
@@ -68,14 +136,13 @@ class IBKRParser:
         """
         try:
             _idebug.debug(f"IBKRParser.parse: inicio {file_path}")
-            self._read_sections(file_path)
-            self._parse_account_info()
-            self._parse_financial_instruments()
-            self._parse_trades()
-            self._parse_holdings()
-            self._parse_dividends()
-            self._parse_deposits_withdrawals()
-            self._parse_interest()
+            data = collect_events(self.iter_events(file_path))
+            self.trades = data['trades']
+            self.holdings = data['holdings']
+            self.dividends = data['dividends']
+            self.deposits = data['deposits']
+            self.withdrawals = data['withdrawals']
+            self.fees = data['fees']
 
             result = {
                 'broker': 'IBKR',
@@ -93,10 +160,88 @@ class IBKRParser:
             _idebug.error(f"IBKRParser.parse: ERROR {e}")
             raise
     
-    def _read_sections(self, file_path: str):
-        """Lee el CSV y organiza las líneas por secciones"""
+    def _iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        """
+        Lee el archivo en dos pasadas con memoria acotada.
+        
+        1. Cabeceras de todas las secciones + datos de cuenta e instrumentos (la sección de
+           instrumentos suele venir DESPUÉS de las operaciones y aporta ISIN/nombre/tipo).
+        2. Operaciones, posiciones y depósitos se emiten fila a fila; los dividendos al
+           cerrar cada grupo de divisa (sus totales dan el tipo de cambio) y los intereses
+           al final, porque se agrupan por fecha entre divisas.
+        """
+        self._read_sections(file_path, data_sections=self.REFERENCE_SECTIONS)
+        self._parse_account_info()
+        self._parse_financial_instruments()
+        
+        # Misma prioridad que antes: la sección en español gana si existen ambas
+        handlers = {}
+        for kind, names, needs_headers in (
+            ('trade', self.TRADE_SECTIONS, True),
+            ('holding', self.HOLDING_SECTIONS, True),
+            ('dividend', self.DIVIDEND_SECTIONS, False),
+            ('cash', self.CASH_SECTIONS, False),
+            ('interest', self.INTEREST_SECTIONS, False),
+        ):
+            name = next((n for n in names if n in self.sections), None)
+            if name and (self.sections[name]['headers'] or not needs_headers):
+                handlers[name] = kind
+        
+        dividend_groups = _CurrencyGroups(('Total', 'Total en EUR', 'Total Dividendos en EUR'), self._parse_decimal)
+        interest_groups = _CurrencyGroups(('Total', 'Total en EUR', 'Total Interés en EUR'), self._parse_decimal)
+        closed_interest = []
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for row in self.throughput.count(csv.reader(f)):
+                if len(row) < 2 or row[1] != 'Data':
+                    continue
+                kind = handlers.get(row[0])
+                if kind is None:
+                    continue
+                data = row[2:]
+                
+                if kind == 'trade':
+                    trade = self._trade_from_row(self.sections[row[0]]['headers'], data)
+                    if trade:
+                        yield ParsedEvent('trade', trade)
+                elif kind == 'holding':
+                    holding = self._holding_from_row(self.sections[row[0]]['headers'], data)
+                    if holding:
+                        yield ParsedEvent('holding', holding)
+                elif kind == 'dividend':
+                    group = dividend_groups.feed(data, self._dividend_from_row)
+                    if group:
+                        for dividend in self._dividends_from_group(*group):
+                            yield ParsedEvent('dividend', dividend)
+                elif kind == 'cash':
+                    event = self._cash_movement_from_row(data)
+                    if event:
+                        yield event
+                else:
+                    group = interest_groups.feed(data, self._interest_from_row)
+                    if group:
+                        closed_interest.append(group)
+        
+        # Último grupo de cada sección
+        group = dividend_groups.close()
+        if group:
+            for dividend in self._dividends_from_group(*group):
+                yield ParsedEvent('dividend', dividend)
+        group = interest_groups.close()
+        if group:
+            closed_interest.append(group)
+        for fee in self._fees_from_interest_groups(closed_interest):
+            yield ParsedEvent('fee', fee)
+    
+    def _read_sections(self, file_path: str, data_sections=None):
+        """
+        Lee el CSV y organiza las líneas por secciones
+        
+        Con `data_sections` solo se guardan las filas Data de esas secciones (del resto
+        únicamente la cabecera); sin él se carga el archivo completo.
+        """
         with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
+            reader = self.throughput.count(csv.reader(f))
             
             for row in reader:
                 if not row or len(row) < 2:
@@ -119,7 +264,7 @@ class IBKRParser:
                 # Guardar header o data
                 if row_type == 'Header':
                     self.sections[section_name]['headers'] = row[2:]
-                elif row_type == 'Data':
+                elif row_type == 'Data' and (data_sections is None or section_name in data_sections):
                     self.sections[section_name]['data'].append(row[2:])
     
     def _parse_account_info(self):
@@ -205,262 +350,197 @@ class IBKRParser:
                 print(f"Error parseando instrumento: {e}")
                 continue
     
-    def _parse_trades(self):
-        """Parsea las operaciones/trades"""
-        section = self.sections.get('Operaciones') or \
-                  self.sections.get('Trades')
+    def _trade_from_row(self, headers: List[str], row: List[str]) -> Optional[Dict[str, Any]]:
+        """Construye una operación desde una fila de Operaciones/Trades (None si no es una orden)"""
+        if len(row) < len(headers):
+            return None
         
-        if not section or not section['headers']:
-            return
+        # Crear dict con headers
+        trade_dict = dict(zip(headers, row))
         
-        headers = section['headers']
+        # Filtrar solo órdenes reales (no subtotales ni totales)
+        discriminator = trade_dict.get('DataDiscriminator', '')
+        if discriminator != 'Order':
+            return None
         
-        for row in section['data']:
-            if len(row) < len(headers):
-                continue
+        # Extraer información relevante
+        try:
+            raw_symbol = trade_dict.get('Símbolo', trade_dict.get('Symbol', ''))
+            normalized_symbol = self._normalize_symbol(raw_symbol)
             
-            # Crear dict con headers
-            trade_dict = dict(zip(headers, row))
+            # Obtener info completa del instrumento
+            instrument = self.instrument_info.get(normalized_symbol, {})
+            isin = instrument.get('isin', '')
+            name = instrument.get('name', normalized_symbol)
+            exchange = instrument.get('exchange', '')
             
-            # Filtrar solo órdenes reales (no subtotales ni totales)
-            discriminator = trade_dict.get('DataDiscriminator', '')
-            if discriminator != 'Order':
-                continue
+            # Para asset_type: usar instrument_info (normalizado: ETF o Stock)
+            # Pero pasar también la categoría del CSV para filtrar Forex en el importer
+            asset_type = instrument.get('asset_type', 'Stock')
+            asset_type_csv = trade_dict.get('Categoría de activo', trade_dict.get('Asset Category', ''))
             
-            # Extraer información relevante
-            try:
-                raw_symbol = trade_dict.get('Símbolo', trade_dict.get('Symbol', ''))
-                normalized_symbol = self._normalize_symbol(raw_symbol)
-                
-                # Obtener info completa del instrumento
-                instrument = self.instrument_info.get(normalized_symbol, {})
-                isin = instrument.get('isin', '')
-                name = instrument.get('name', normalized_symbol)
-                exchange = instrument.get('exchange', '')
-                
-                # Para asset_type: usar instrument_info (normalizado: ETF o Stock)
-                # Pero pasar también la categoría del CSV para filtrar Forex en el importer
-                asset_type = instrument.get('asset_type', 'Stock')
-                asset_type_csv = trade_dict.get('Categoría de activo', trade_dict.get('Asset Category', ''))
-                
-                trade = {
-                    'asset_type': asset_type,
-                    'asset_type_csv': asset_type_csv,  # Categoría original del CSV (para filtrar Forex)
-                    'currency': trade_dict.get('Divisa', trade_dict.get('Currency', '')),
-                    'symbol': normalized_symbol,
-                    'isin': isin,
-                    'name': name,
-                    'exchange': exchange,
-                    'date_time': self._parse_datetime(trade_dict.get('Fecha/Hora', trade_dict.get('Date/Time', ''))),
-                    'quantity': self._parse_decimal(trade_dict.get('Cantidad', trade_dict.get('Quantity', '0'))),
-                    'price': self._parse_decimal(trade_dict.get('Precio trans.', trade_dict.get('T. Price', '0'))),
-                    'amount': self._parse_decimal(trade_dict.get('Productos', trade_dict.get('Proceeds', '0'))),
-                    'commission': self._parse_decimal(trade_dict.get('Tarifa/com.', trade_dict.get('Comm/Fee', '0'))),
-                    'realized_pl': self._parse_decimal(trade_dict.get('PyG realizadas', trade_dict.get('Realized P/L', '0'))),
-                    'code': trade_dict.get('Código', trade_dict.get('Code', ''))
-                }
-                
-                # Determinar si es compra o venta
-                qty = trade['quantity']
-                if qty > 0:
-                    trade['transaction_type'] = 'BUY'
-                elif qty < 0:
-                    trade['transaction_type'] = 'SELL'
-                    trade['quantity'] = abs(qty)
-                else:
-                    continue
-                
-                self.trades.append(trade)
-                
-            except Exception as e:
-                print(f"Error parseando trade: {e}")
-                continue
+            trade = {
+                'asset_type': asset_type,
+                'asset_type_csv': asset_type_csv,  # Categoría original del CSV (para filtrar Forex)
+                'currency': trade_dict.get('Divisa', trade_dict.get('Currency', '')),
+                'symbol': normalized_symbol,
+                'isin': isin,
+                'name': name,
+                'exchange': exchange,
+                'date_time': self._parse_datetime(trade_dict.get('Fecha/Hora', trade_dict.get('Date/Time', ''))),
+                'quantity': self._parse_decimal(trade_dict.get('Cantidad', trade_dict.get('Quantity', '0'))),
+                'price': self._parse_decimal(trade_dict.get('Precio trans.', trade_dict.get('T. Price', '0'))),
+                'amount': self._parse_decimal(trade_dict.get('Productos', trade_dict.get('Proceeds', '0'))),
+                'commission': self._parse_decimal(trade_dict.get('Tarifa/com.', trade_dict.get('Comm/Fee', '0'))),
+                'realized_pl': self._parse_decimal(trade_dict.get('PyG realizadas', trade_dict.get('Realized P/L', '0'))),
+                'code': trade_dict.get('Código', trade_dict.get('Code', ''))
+            }
+            
+            # Determinar si es compra o venta
+            qty = trade['quantity']
+            if qty > 0:
+                trade['transaction_type'] = 'BUY'
+            elif qty < 0:
+                trade['transaction_type'] = 'SELL'
+                trade['quantity'] = abs(qty)
+            else:
+                return None
+            
+            return trade
+            
+        except Exception as e:
+            print(f"Error parseando trade: {e}")
+            return None
     
-    def _parse_holdings(self):
-        """Parsea las posiciones abiertas/holdings"""
-        section = self.sections.get('Posiciones abiertas') or \
-                  self.sections.get('Open Positions')
+    def _holding_from_row(self, headers: List[str], row: List[str]) -> Optional[Dict[str, Any]]:
+        """Construye una posición abierta desde una fila Summary de Posiciones abiertas"""
+        if len(row) < len(headers):
+            return None
         
-        if not section or not section['headers']:
-            return
+        holding_dict = dict(zip(headers, row))
         
-        headers = section['headers']
+        # Filtrar solo Summary (no totales)
+        discriminator = holding_dict.get('DataDiscriminator', '')
+        if discriminator != 'Summary':
+            return None
         
-        for row in section['data']:
-            if len(row) < len(headers):
-                continue
+        try:
+            raw_symbol = holding_dict.get('Símbolo', holding_dict.get('Symbol', ''))
+            normalized_symbol = self._normalize_symbol(raw_symbol)
             
-            holding_dict = dict(zip(headers, row))
+            # Obtener info completa del instrumento
+            instrument = self.instrument_info.get(normalized_symbol, {})
+            isin = instrument.get('isin', '')
+            name = instrument.get('name', normalized_symbol)
+            exchange = instrument.get('exchange', '')
+            asset_type = instrument.get('asset_type', 'Stock')
             
-            # Filtrar solo Summary (no totales)
-            discriminator = holding_dict.get('DataDiscriminator', '')
-            if discriminator != 'Summary':
-                continue
+            holding = {
+                'asset_type': asset_type,
+                'currency': holding_dict.get('Divisa', holding_dict.get('Currency', '')),
+                'symbol': normalized_symbol,
+                'isin': isin,
+                'name': name,
+                'exchange': exchange,
+                'quantity': self._parse_decimal(holding_dict.get('Cantidad', holding_dict.get('Quantity', '0'))),
+                'cost_price': self._parse_decimal(holding_dict.get('Precio de coste', holding_dict.get('Cost Price', '0'))),
+                'cost_basis': self._parse_decimal(holding_dict.get('Base de coste', holding_dict.get('Cost Basis', '0'))),
+                'current_price': self._parse_decimal(holding_dict.get('Precio de cierre', holding_dict.get('Close Price', '0'))),
+                'current_value': self._parse_decimal(holding_dict.get('Valor', holding_dict.get('Value', '0'))),
+                'unrealized_pl': self._parse_decimal(holding_dict.get('PyG no realizadas', holding_dict.get('Unreal P/L', '0'))),
+                'code': holding_dict.get('Código', holding_dict.get('Code', ''))
+            }
             
-            try:
-                raw_symbol = holding_dict.get('Símbolo', holding_dict.get('Symbol', ''))
-                normalized_symbol = self._normalize_symbol(raw_symbol)
-                
-                # Obtener info completa del instrumento
-                instrument = self.instrument_info.get(normalized_symbol, {})
-                isin = instrument.get('isin', '')
-                name = instrument.get('name', normalized_symbol)
-                exchange = instrument.get('exchange', '')
-                asset_type = instrument.get('asset_type', 'Stock')
-                
-                holding = {
-                    'asset_type': asset_type,
-                    'currency': holding_dict.get('Divisa', holding_dict.get('Currency', '')),
-                    'symbol': normalized_symbol,
-                    'isin': isin,
-                    'name': name,
-                    'exchange': exchange,
-                    'quantity': self._parse_decimal(holding_dict.get('Cantidad', holding_dict.get('Quantity', '0'))),
-                    'cost_price': self._parse_decimal(holding_dict.get('Precio de coste', holding_dict.get('Cost Price', '0'))),
-                    'cost_basis': self._parse_decimal(holding_dict.get('Base de coste', holding_dict.get('Cost Basis', '0'))),
-                    'current_price': self._parse_decimal(holding_dict.get('Precio de cierre', holding_dict.get('Close Price', '0'))),
-                    'current_value': self._parse_decimal(holding_dict.get('Valor', holding_dict.get('Value', '0'))),
-                    'unrealized_pl': self._parse_decimal(holding_dict.get('PyG no realizadas', holding_dict.get('Unreal P/L', '0'))),
-                    'code': holding_dict.get('Código', holding_dict.get('Code', ''))
-                }
+            return holding if holding['quantity'] > 0 else None
                 
-                if holding['quantity'] > 0:
-                    self.holdings.append(holding)
-                    
-            except Exception as e:
-                print(f"Error parseando holding: {e}")
-                continue
+        except Exception as e:
+            print(f"Error parseando holding: {e}")
+            return None
     
-    def _parse_dividends(self):
+    def _dividend_from_row(self, row: List[str]) -> Optional[Dict[str, Any]]:
         """
-        Parsea dividendos con conversión EUR y agrupación inteligente
+        Dividendo individual de la sección Dividendos
         
         ESTRUCTURA DEL CSV:
         row[0] = Divisa (HKD, USD, Total, Total en EUR)
         row[1] = Fecha
         row[2] = Descripción
         row[3] = Cantidad
-        
-        Lógica:
-        1. Agrupar por moneda (la sección viene ordenada así)
-        2. Para cada moneda, extraer: dividendos individuales + Total + Total en EUR
-        3. Calcular exchange_rate = total_eur / total_local
-        4. Agrupar dividendos por (fecha + símbolo)
-        5. Aplicar exchange_rate a cada grupo
         """
-        section = self.sections.get('Dividendos') or \
-                  self.sections.get('Dividends')
-        
-        if not section or not section['data']:
-            return
-        
-        from collections import defaultdict
-        
-        currency_groups = []  # [(currency, [dividends], total_local, total_eur)]
-        current_currency = None
-        current_dividends = []
-        total_local = Decimal('0')
-        total_eur = Decimal('0')
-        
-        for row in section['data']:
-            if len(row) < 4:
-                continue
-            
-            currency_field = row[0]  # Divisa
-            date_field = row[1]      # Fecha
-            description = row[2]     # Descripción
-            amount_str = row[3]      # Cantidad
+        try:
+            raw_symbol, isin = self._extract_symbol_and_isin_from_div_description(row[2])
+            normalized_symbol = self._normalize_symbol(raw_symbol)
             
-            # Detectar dividendo individual (con moneda real: HKD, USD, etc.)
-            if currency_field and currency_field not in ['Total', 'Total en EUR', 'Total Dividendos en EUR'] and date_field:
-                # Si cambia la moneda, guardar el grupo anterior
-                if current_currency and current_currency != currency_field:
-                    currency_groups.append((current_currency, current_dividends, total_local, total_eur))
-                    current_dividends = []
-                    total_local = Decimal('0')
-                    total_eur = Decimal('0')
-                
-                current_currency = currency_field
-                
-                # Extraer dividendo individual
-                try:
-                    raw_symbol, isin = self._extract_symbol_and_isin_from_div_description(description)
-                    normalized_symbol = self._normalize_symbol(raw_symbol)
-                    
-                    dividend = {
-                        'currency': currency_field,
-                        'date': self._parse_date(date_field),
-                        'description': description,
-                        'symbol': normalized_symbol,
-                        'isin': isin,
-                        'amount_local': self._parse_decimal(amount_str)
-                    }
-                    
-                    if dividend['amount_local'] > 0:
-                        current_dividends.append(dividend)
-                except Exception as e:
-                    print(f"Error parseando dividendo individual: {e}")
-                    
-            # Detectar Total (en moneda local)
-            elif currency_field == 'Total' and amount_str:
-                total_local = self._parse_decimal(amount_str)
-                
-            # Detectar Total en EUR
-            elif currency_field == 'Total en EUR' and amount_str:
-                total_eur = self._parse_decimal(amount_str)
+            dividend = {
+                'currency': row[0],
+                'date': self._parse_date(row[1]),
+                'description': row[2],
+                'symbol': normalized_symbol,
+                'isin': isin,
+                'amount_local': self._parse_decimal(row[3])
+            }
+        except Exception as e:
+            print(f"Error parseando dividendo individual: {e}")
+            return None
         
-        # Guardar el último grupo
-        if current_currency and current_dividends:
-            currency_groups.append((current_currency, current_dividends, total_local, total_eur))
+        return dividend if dividend['amount_local'] > 0 else None
+    
+    def _dividends_from_group(self, currency: str, dividends_list: List[Dict[str, Any]],
+                              total_local: Decimal, total_eur: Decimal) -> List[Dict[str, Any]]:
+        """
+        Dividendos finales de un grupo de divisa, convertidos a EUR
         
-        # Paso 2: Procesar cada grupo de moneda
-        for currency, dividends_list, total_local, total_eur in currency_groups:
-            # Calcular exchange_rate
-            if total_local > 0 and total_eur > 0:
-                exchange_rate = total_eur / total_local
-            else:
-                exchange_rate = Decimal('1')  # Fallback
+        Lógica:
+        1. exchange_rate = total_eur / total_local (totales del propio grupo)
+        2. Agrupar dividendos por (fecha + símbolo)
+        3. Aplicar exchange_rate a cada grupo
+        """
+        # Calcular exchange_rate
+        if total_local > 0 and total_eur > 0:
+            exchange_rate = total_eur / total_local
+        else:
+            exchange_rate = Decimal('1')  # Fallback
+        
+        # Agrupar por (fecha + símbolo)
+        grouped_dividends = defaultdict(list)
+        for div in dividends_list:
+            key = (div['date'], div['symbol'])
+            grouped_dividends[key].append(div)
+        
+        # Crear dividendos finales
+        dividends = []
+        for (date, symbol), divs in grouped_dividends.items():
+            # Sumar montos locales del mismo día/símbolo
+            amount_local_total = sum(d['amount_local'] for d in divs)
             
-            # Agrupar por (fecha + símbolo)
-            grouped_dividends = defaultdict(list)
-            for div in dividends_list:
-                key = (div['date'], div['symbol'])
-                grouped_dividends[key].append(div)
+            # Convertir a EUR
+            amount_eur = amount_local_total * exchange_rate
             
-            # Crear dividendos finales
-            for (date, symbol), divs in grouped_dividends.items():
-                # Sumar montos locales del mismo día/símbolo
-                amount_local_total = sum(d['amount_local'] for d in divs)
-                
-                # Convertir a EUR
-                amount_eur = amount_local_total * exchange_rate
-                
-                # Obtener info del instrumento
-                instrument = self.instrument_info.get(symbol, {})
-                isin = divs[0]['isin'] or instrument.get('isin', '')
-                name = instrument.get('name', symbol)
-                exchange = instrument.get('exchange', '')
-                asset_type = instrument.get('asset_type', 'Stock')
-                
-                final_dividend = {
-                    'currency': 'EUR',  # Moneda convertida
-                    'currency_original': currency,  # Moneda local
-                    'date': date,
-                    'symbol': symbol,
-                    'isin': isin,
-                    'name': name,
-                    'exchange': exchange,
-                    'asset_type': asset_type,
-                    'amount': float(amount_eur),  # EUR
-                    'amount_original': float(amount_local_total),  # Moneda local
-                    'description': f"Dividendo {symbol}"
-                }
-                
-                self.dividends.append(final_dividend)
+            # Obtener info del instrumento
+            instrument = self.instrument_info.get(symbol, {})
+            isin = divs[0]['isin'] or instrument.get('isin', '')
+            name = instrument.get('name', symbol)
+            exchange = instrument.get('exchange', '')
+            asset_type = instrument.get('asset_type', 'Stock')
+            
+            dividends.append({
+                'currency': 'EUR',  # Moneda convertida
+                'currency_original': currency,  # Moneda local
+                'date': date,
+                'symbol': symbol,
+                'isin': isin,
+                'name': name,
+                'exchange': exchange,
+                'asset_type': asset_type,
+                'amount': float(amount_eur),  # EUR
+                'amount_original': float(amount_local_total),  # Moneda local
+                'description': f"Dividendo {symbol}"
+            })
+        return dividends
     
-    def _parse_deposits_withdrawals(self):
+    def _cash_movement_from_row(self, row: List[str]) -> Optional[ParsedEvent]:
         """
-        Parsea depósitos y retiros
+        Depósito o retiro de la sección Depósitos y retiradas
         
         ESTRUCTURA DEL CSV:
         row[0] = Divisa
@@ -468,128 +548,68 @@ class IBKRParser:
         row[2] = Descripción
         row[3] = Cantidad (positivo = depósito, negativo = retiro)
         """
-        section = self.sections.get('Depósitos y retiradas') or \
-                  self.sections.get('Deposits & Withdrawals')
+        if len(row) < 4:
+            return None
         
-        if not section or not section['data']:
-            return
+        currency = row[0]
+        date = row[1]
+        description = row[2]
+        amount_str = row[3]
         
-        for row in section['data']:
-            if len(row) < 4:
-                continue
-            
-            currency = row[0]
-            date = row[1]
-            description = row[2]
-            amount_str = row[3]
-            
-            # Filtrar líneas de Total
-            if currency in ['Total', 'Total en EUR'] or not date:
-                continue
+        # Filtrar líneas de Total
+        if currency in ['Total', 'Total en EUR'] or not date:
+            return None
+        
+        try:
+            amount = self._parse_decimal(amount_str)
             
-            try:
-                amount = self._parse_decimal(amount_str)
-                
-                # Determinar si es depósito o retiro
-                if amount > 0:
-                    # DEPÓSITO
-                    deposit = {
-                        'currency': currency,
-                        'date': self._parse_date(date),
-                        'description': description,
-                        'amount': float(amount)
-                    }
-                    self.deposits.append(deposit)
-                elif amount < 0:
-                    # RETIRO (convertir a positivo)
-                    withdrawal = {
-                        'currency': currency,
-                        'date': self._parse_date(date),
-                        'description': description,
-                        'amount': float(abs(amount))
-                    }
-                    self.withdrawals.append(withdrawal)
-            except Exception as e:
-                print(f"Error parseando depósito/retiro: {e}")
-                continue
+            # Determinar si es depósito o retiro
+            if amount > 0:
+                # DEPÓSITO
+                return ParsedEvent('deposit', {
+                    'currency': currency,
+                    'date': self._parse_date(date),
+                    'description': description,
+                    'amount': float(amount)
+                })
+            elif amount < 0:
+                # RETIRO (convertir a positivo)
+                return ParsedEvent('withdrawal', {
+                    'currency': currency,
+                    'date': self._parse_date(date),
+                    'description': description,
+                    'amount': float(abs(amount))
+                })
+        except Exception as e:
+            print(f"Error parseando depósito/retiro: {e}")
+        return None
     
-    def _parse_interest(self):
+    def _interest_from_row(self, row: List[str]) -> Optional[Dict[str, Any]]:
         """
-        Parsea intereses (apalancamiento) con conversión EUR
-        
-        ESTRUCTURA DEL CSV (similar a dividendos):
-        row[0] = Divisa (CAD, EUR, Total, Total en EUR)
-        row[1] = Fecha
-        row[2] = Descripción
-        row[3] = Cantidad (negativo = coste apalancamiento, positivo = interés ganado)
+        Interés individual de la sección Interés (misma estructura que dividendos;
+        Cantidad negativa = coste de apalancamiento, positiva = interés ganado)
+        """
+        try:
+            return {
+                'currency': row[0],
+                'date': self._parse_date(row[1]),
+                'description': row[2],
+                'amount_local': self._parse_decimal(row[3])
+            }
+        except Exception as e:
+            print(f"Error parseando interés individual: {e}")
+            return None
+    
+    def _fees_from_interest_groups(self, currency_groups: List[tuple]) -> List[Dict[str, Any]]:
+        """
+        FEEs de intereses con conversión EUR
         
         Lógica:
-        1. Agrupar por moneda
-        2. Extraer Total local + Total en EUR
-        3. Calcular exchange_rate = total_eur / total_local
-        4. Agrupar intereses por fecha (misma fecha, diferentes monedas)
-        5. Aplicar exchange_rate a cada interés individual
+        1. exchange_rate = total_eur / total_local de cada grupo de divisa
+        2. Aplicar exchange_rate a cada interés individual
+        3. Agrupar intereses por fecha (misma fecha, diferentes monedas)
         """
-        section = self.sections.get('Interés') or self.sections.get('Interest')
-        
-        if not section or not section['data']:
-            return
-        
-        from collections import defaultdict
-        
-        # Paso 1: Agrupar por moneda (similar a dividendos)
-        currency_groups = []  # [(currency, [interests], total_local, total_eur)]
-        current_currency = None
-        current_interests = []
-        total_local = Decimal('0')
-        total_eur = Decimal('0')
-        
-        for row in section['data']:
-            if len(row) < 4:
-                continue
-            
-            currency_field = row[0]
-            date_field = row[1]
-            description = row[2]
-            amount_str = row[3]
-            
-            # Detectar entrada individual (con moneda real: CAD, EUR, USD, etc.)
-            if currency_field and currency_field not in ['Total', 'Total en EUR', 'Total Interés en EUR'] and date_field:
-                # Si cambia la moneda, guardar el grupo anterior
-                if current_currency and current_currency != currency_field:
-                    if current_interests:
-                        currency_groups.append((current_currency, current_interests, total_local, total_eur))
-                    current_interests = []
-                    total_local = Decimal('0')
-                    total_eur = Decimal('0')
-                
-                current_currency = currency_field
-                
-                # Extraer interés individual
-                try:
-                    interest = {
-                        'currency': currency_field,
-                        'date': self._parse_date(date_field),
-                        'description': description,
-                        'amount_local': self._parse_decimal(amount_str)
-                    }
-                    current_interests.append(interest)
-                except Exception as e:
-                    print(f"Error parseando interés individual: {e}")
-            
-            # Detectar Total (en moneda local)
-            elif currency_field == 'Total' and amount_str:
-                total_local = self._parse_decimal(amount_str)
-            
-            # Detectar Total en EUR
-            elif currency_field == 'Total en EUR' and amount_str:
-                total_eur = self._parse_decimal(amount_str)
-        
-        # Guardar el último grupo
-        if current_currency and current_interests:
-            currency_groups.append((current_currency, current_interests, total_local, total_eur))
-        
-        # Paso 2: Convertir cada interés individual a EUR
+        # Paso 1: Convertir cada interés individual a EUR
         all_interests = []  # Lista de todos los intereses con EUR
         
         for currency, interests_list, total_local, total_eur in currency_groups:
@@ -611,12 +631,13 @@ class IBKRParser:
                     'description': interest['description']
                 })
         
-        # Paso 3: Agrupar por fecha (mismo día, diferentes monedas)
+        # Paso 2: Agrupar por fecha (mismo día, diferentes monedas)
         grouped_by_date = defaultdict(list)
         for interest in all_interests:
             grouped_by_date[interest['date']].append(interest)
         
-        # Paso 4: Crear FEEs agrupados por fecha
+        # Paso 3: Crear FEEs agrupados por fecha
+        fees = []
         for date, interests in grouped_by_date.items():
             # Sumar todos los intereses del mismo día
             total_eur = sum(i['amount_eur'] for i in interests)
@@ -625,14 +646,13 @@ class IBKRParser:
             currencies = list(set(i['currency'] for i in interests))
             description = f"Interés {', '.join(currencies)}"
             
-            fee = {
+            fees.append({
                 'date': date,
                 'currency': 'EUR',
                 'amount': float(abs(total_eur)),  # Positivo (coste)
                 'description': description
-            }
-            
-            self.fees.append(fee)
+            })
+        return fees
     
     # Helper methods
     
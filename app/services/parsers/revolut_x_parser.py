@@ -9,7 +9,9 @@ _idebug = logging.getLogger('import_debug')
 import re
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
+
+from app.services.parsers.streaming import ParsedEvent, StreamingParser, collect_events
 
 
 def _parse_amount(val: str) -> float:
@@ -64,10 +66,13 @@ def _normalize_type(csv_type: str) -> str:
     return 'BUY'
 
 
-class RevolutXParser:
+class RevolutXParser(StreamingParser):
     """Parser para extracto Revolut X (criptomonedas)"""
 
+    BROKER = 'REVOLUT_X'
+
     def __init__(self):
+        super().__init__()
         self.trades: List[Dict[str, Any]] = []
         self.dividends: List[Dict[str, Any]] = []
         self.fees: List[Dict[str, Any]] = []
@@ -76,18 +81,11 @@ class RevolutXParser:
         """Parsea un archivo CSV de Revolut X"""
         try:
             _idebug.debug(f"RevolutXParser.parse: inicio {file_path}")
-            self.trades = []
-            self.dividends = []
-            self.fees = []
-
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                if not reader.fieldnames:
-                    return self._empty_result()
-                for row in reader:
-                    self._process_row(row)
-
-            holdings = self._calculate_holdings()
+            data = collect_events(self.iter_events(file_path))
+            self.trades = data['trades']
+            self.dividends = data['dividends']
+            self.fees = data['fees']
+            holdings = data['holdings']
 
             result = {
                 'broker': 'REVOLUT_X',
@@ -106,23 +104,26 @@ class RevolutXParser:
             _idebug.error(f"RevolutXParser.parse: ERROR {e}")
             raise
 
-    def _empty_result(self) -> Dict[str, Any]:
-        return {
-            'broker': 'REVOLUT_X',
-            'format': 'REVOLUT_X',
-            'account_info': {},
-            'trades': [],
-            'dividends': [],
-            'holdings': [],
-            'deposits': [],
-            'fees': [],
-            'fx_transactions': [],
-        }
-
-    def _process_row(self, row: Dict[str, str]) -> None:
+    def _iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        """Emite cada trade al leer su fila y las posiciones abiertas al final del archivo"""
+        positions: Dict[str, Dict[str, Any]] = {}
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames:
+                return
+            for row in self.throughput.count(reader):
+                trade = self._process_row(row)
+                if trade:
+                    self._update_position(positions, trade)
+                    yield ParsedEvent('trade', trade)
+
+        for holding in self._open_positions(positions):
+            yield ParsedEvent('holding', holding)
+
+    def _process_row(self, row: Dict[str, str]) -> Optional[Dict[str, Any]]:
         symbol = (row.get('Symbol') or '').strip()
         if not symbol:
-            return
+            return None
 
         csv_type = (row.get('Type') or '').strip()
         tx_type = _normalize_type(csv_type)
@@ -133,7 +134,7 @@ class RevolutXParser:
             quantity = 0.0
 
         if quantity <= 0 and tx_type != 'STAKING_REWARD':
-            return
+            return None
 
         price = _parse_amount(row.get('Price', ''))
         value = _parse_amount(row.get('Value', ''))
@@ -141,7 +142,7 @@ class RevolutXParser:
         date_dt = _parse_date(row.get('Date', ''))
 
         if not date_dt:
-            return
+            return None
 
         isin = f"CRYPTO:{symbol}"[:12]
 
@@ -167,7 +168,7 @@ class RevolutXParser:
                 'asset_type_csv': 'Crypto',
                 'is_reward': True,
             }
-            self.trades.append(trade)
+            return trade
         else:
             amount = value if value else abs(price * quantity)
             if tx_type == 'SELL':
@@ -194,47 +195,48 @@ class RevolutXParser:
                 'asset_type_csv': 'Crypto',
                 'is_reward': False,
             }
-            self.trades.append(trade)
-
-    def _calculate_holdings(self) -> List[Dict[str, Any]]:
-        """Calcula posiciones actuales por symbol"""
-        pos: Dict[str, Dict[str, Any]] = {}
-
-        for trade in self.trades:
-            symbol = trade['symbol']
-            isin = trade['isin']
-
-            if symbol not in pos:
-                pos[symbol] = {
-                    'symbol': symbol,
-                    'name': f'{symbol} (Crypto)',
-                    'isin': isin,
-                    'currency': 'EUR',
-                    'quantity': Decimal('0'),
-                    'total_cost': Decimal('0'),
-                    'average_buy_price': Decimal('0'),
-                    'asset_type': 'Crypto',
-                }
-
-            h = pos[symbol]
-            qty = Decimal(str(trade['quantity']))
-            price = Decimal(str(trade['price']))
-            cost = qty * price + Decimal(str(trade.get('commission', 0) or 0))
-
-            if trade['transaction_type'] == 'BUY':
-                h['quantity'] += qty
-                h['total_cost'] += cost
-            else:
-                h['quantity'] -= qty
-                if h['quantity'] > Decimal('0'):
-                    cost_per = h['total_cost'] / (h['quantity'] + qty)
-                    h['total_cost'] -= cost_per * qty
-                else:
-                    h['total_cost'] = Decimal('0')
+            return trade
 
+    @staticmethod
+    def _update_position(pos: Dict[str, Dict[str, Any]], trade: Dict[str, Any]) -> None:
+        """Acumula un trade en las posiciones por symbol"""
+        symbol = trade['symbol']
+        isin = trade['isin']
+
+        if symbol not in pos:
+            pos[symbol] = {
+                'symbol': symbol,
+                'name': f'{symbol} (Crypto)',
+                'isin': isin,
+                'currency': 'EUR',
+                'quantity': Decimal('0'),
+                'total_cost': Decimal('0'),
+                'average_buy_price': Decimal('0'),
+                'asset_type': 'Crypto',
+            }
+
+        h = pos[symbol]
+        qty = Decimal(str(trade['quantity']))
+        price = Decimal(str(trade['price']))
+        cost = qty * price + Decimal(str(trade.get('commission', 0) or 0))
+
+        if trade['transaction_type'] == 'BUY':
+            h['quantity'] += qty
+            h['total_cost'] += cost
+        else:
+            h['quantity'] -= qty
             if h['quantity'] > Decimal('0'):
-                h['average_buy_price'] = h['total_cost'] / h['quantity']
+                cost_per = h['total_cost'] / (h['quantity'] + qty)
+                h['total_cost'] -= cost_per * qty
+            else:
+                h['total_cost'] = Decimal('0')
+
+        if h['quantity'] > Decimal('0'):
+            h['average_buy_price'] = h['total_cost'] / h['quantity']
 
+    @staticmethod
+    def _open_positions(pos: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Posiciones actuales (cantidad > 0) por symbol"""
         result = []
         for h in pos.values():
             if h['quantity'] > Decimal('0'):
@@ -0,0 +1,122 @@
+"""
+Interfaz de parseo en streaming para los extractos de broker.
+
+Cada parser expone `iter_events(file_path)`: un generador de `ParsedEvent(kind, data)` con los
+mismos dicts normalizados que devuelve `parse()` (trade, holding, dividend, fee, deposit,
+withdrawal). Las filas se leen de una en una con el módulo csv; solo se retiene lo que el
+formato obliga (grupos de dividendos/intereses hasta su fila de totales, posiciones por ISIN),
+de modo que la memoria no crece con el número de operaciones del archivo.
+
+`parse()` se mantiene como envoltorio que materializa las listas (`collect_events`).
+"""
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+
+# Tipo de evento -> clave de la lista equivalente en el resultado de parse()
+EVENT_KEYS = {
+    'trade': 'trades',
+    'holding': 'holdings',
+    'dividend': 'dividends',
+    'fee': 'fees',
+    'deposit': 'deposits',
+    'withdrawal': 'withdrawals',
+}
+
+
+class ParsedEvent(NamedTuple):
+    kind: str  # Una de las claves de EVENT_KEYS
+    data: Dict[str, Any]
+
+
+class ThroughputCounter:
+    """Contador de filas/eventos procesados y su ritmo (por segundo)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rows = 0
+        self.events = 0
+        self._started = None
+        self._finished = None
+
+    def start(self):
+        self.reset()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        if self._started is not None and self._finished is None:
+            self._finished = time.perf_counter()
+
+    def count(self, rows: Iterable) -> Iterator:
+        """Envuelve un iterable de filas contándolas al vuelo"""
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    @property
+    def elapsed(self) -> float:
+        if self._started is None:
+            return 0.0
+        end = self._finished if self._finished is not None else time.perf_counter()
+        return end - self._started
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def events_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.events / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'events': self.events,
+            'elapsed_s': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'events_per_sec': round(self.events_per_sec, 1),
+        }
+
+
+class StreamingParser:
+    """Base de los parsers: `iter_events()` con contadores de rendimiento y `parse()` en memoria"""
+
+    BROKER = 'CSV'
+
+    def __init__(self):
+        self.throughput = ThroughputCounter()
+
+    def iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        """Genera los eventos normalizados del archivo sin cargarlo entero en memoria"""
+        self.throughput.start()
+        try:
+            for event in self._iter_events(file_path):
+                self.throughput.events += 1
+                yield event
+        finally:
+            self.throughput.stop()
+
+    def _iter_events(self, file_path: str) -> Iterator[ParsedEvent]:
+        raise NotImplementedError
+
+
+def collect_events(events: Iterable[ParsedEvent]) -> Dict[str, List[Dict[str, Any]]]:
+    """Agrupa eventos en las listas de parse() (trades, holdings, dividends, ...)"""
+    data = {key: [] for key in EVENT_KEYS.values()}
+    for kind, record in events:
+        data[EVENT_KEYS[kind]].append(record)
+    return data
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """Divide un iterable en listas de como mucho `size` elementos"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
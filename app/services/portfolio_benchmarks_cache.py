@@ -3,7 +3,7 @@ Cache HIST/NOW para:
 - /portfolio/index-comparison (benchmarks vs portfolio)
 
 Estrategia:
-- HIST índices: tabla global `benchmark_global_daily` mantenida por `benchmark-global-daily-once` (Yahoo compartido).
+- HIST índices: tablas globales `benchmark_global_daily` / `benchmark_global_daily_point` mantenidas por `benchmark-global-daily-once` (Yahoo compartido).
 - Por usuario: `portfolio_benchmarks_cache` guarda comparación, recorte diario y meta; al subir `daily_data_version` global se recompute sin Yahoo por índice.
 - NOW intradía índices: `benchmark_global_quote` + price-poll-one y fusión en `get_comparison_state`.
 """
@@ -20,6 +20,8 @@ from sqlalchemy import func
 
 from app import db
 from app.models.portfolio_benchmarks_cache import PortfolioBenchmarksCache
+from app.services import json_cache_lru
+from app.services.cache_rebuild_state_service import classify_dates
 from app.services.metrics.benchmark_comparison import BenchmarkComparisonService, BENCHMARKS
 from app.services.metrics.modified_dietz import ModifiedDietzCalculator
 from app.services.benchmark_global_service import BenchmarkGlobalService
@@ -90,14 +92,31 @@ def _to_json_safe(obj: Any) -> Any:
 
 class PortfolioBenchmarksCacheService:
     @staticmethod
-    def _get_cache_row(user_id: int) -> PortfolioBenchmarksCache | None:
-        cache = PortfolioBenchmarksCache.query.filter_by(user_id=user_id).first()
+    def _get_cache_row(user_id: int) -> json_cache_lru.CachedRow | None:
+        """Fila en solo lectura (JSON compartido con la caché en memoria: no mutar)."""
+        cache = json_cache_lru.read(PortfolioBenchmarksCache, user_id)
         if cache and not cache.is_valid:
-            db.session.delete(cache)
+            PortfolioBenchmarksCache.query.filter_by(user_id=user_id).delete()
             db.session.commit()
             return None
         return cache
 
+    @staticmethod
+    def _save(user_id: int, data: dict[str, Any], renew_expiry: bool = True, renew_created: bool = True) -> None:
+        """Escribe el snapshot sin cargar el blob anterior y lo deja en la caché en memoria."""
+        cache = json_cache_lru.row_for_update(PortfolioBenchmarksCache, user_id)
+        if cache is None:
+            if not renew_expiry:
+                return
+            cache = PortfolioBenchmarksCache(user_id=user_id, cached_data=data)
+            db.session.add(cache)
+        cache.cached_data = data
+        if renew_expiry:
+            cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
+        if renew_created:
+            cache.created_at = datetime.utcnow()
+        json_cache_lru.commit_and_remember(cache, data)
+
     @staticmethod
     def get_cached_meta(user_id: int) -> dict[str, Any] | None:
         """Lee meta del caché (si existe y TTL válido) sin disparar recomputes."""
@@ -124,7 +143,7 @@ class PortfolioBenchmarksCacheService:
         if not cache or not cache.cached_data:
             return None
         cached = cache.cached_data or {}
-        out = copy.deepcopy(cached.get("comparison_data") or {})
+        out = dict(cached.get("comparison_data") or {})
         out["meta"] = _meta_defaults((cached.get("meta") or {}))
         return out
 
@@ -153,44 +172,46 @@ class PortfolioBenchmarksCacheService:
 
     @staticmethod
     def touch_for_dates(user_id: int, dates: list[date]) -> None:
-        today = datetime.now().date()
-        any_past = any(d < today for d in dates if isinstance(d, date))
-        any_today = any(d == today for d in dates if isinstance(d, date))
+        any_past, any_today = classify_dates(dates, today=datetime.now().date())
         if not any_past and not any_today:
             return
+        if PortfolioBenchmarksCacheService.mark_dirty(user_id, full_rebuild=any_past):
+            db.session.commit()
 
-        cache = PortfolioBenchmarksCacheService._get_cache_row(user_id)
+    @staticmethod
+    def touch_for_prices_update(user_id: int) -> None:
+        if PortfolioBenchmarksCacheService.mark_dirty(user_id, full_rebuild=False):
+            db.session.commit()
+
+    @staticmethod
+    def mark_dirty(user_id: int, full_rebuild: bool) -> bool:
+        """
+        Marca needs_full_rebuild o dirty_now sin commit (lo escribe el commit en curso) y sin
+        reescribir el JSON si la marca ya estaba. Devuelve False si no hay caché.
+        """
+        cache = json_cache_lru.read(PortfolioBenchmarksCache, user_id)
         if not cache:
-            return
+            return False
 
-        data = copy.deepcopy(cache.cached_data or {})
+        data = dict(cache.cached_data or {})
         meta = _meta_defaults(data.get("meta") or {})
-        if any_past:
+        if meta["needs_full_rebuild"] or (meta["dirty_now"] and not full_rebuild):
+            return True
+        if full_rebuild:
             meta["needs_full_rebuild"] = True
             meta["dirty_now"] = False
-        elif any_today:
+        else:
             meta["dirty_now"] = True
         data["meta"] = meta
-        cache.cached_data = data
-        db.session.commit()
-
-    @staticmethod
-    def touch_for_prices_update(user_id: int) -> None:
-        cache = PortfolioBenchmarksCacheService._get_cache_row(user_id)
-        if not cache:
-            return
-        data = copy.deepcopy(cache.cached_data or {})
-        meta = _meta_defaults(data.get("meta") or {})
-        meta["dirty_now"] = True
-        data["meta"] = meta
-        cache.cached_data = data
-        db.session.commit()
+        row = json_cache_lru.row_for_update(PortfolioBenchmarksCache, user_id)
+        if row is None:
+            return False
+        row.cached_data = data
+        return True
 
     @staticmethod
     def invalidate(user_id: int) -> None:
-        cache = PortfolioBenchmarksCacheService._get_cache_row(user_id)
-        if cache:
-            db.session.delete(cache)
+        if PortfolioBenchmarksCache.query.filter_by(user_id=user_id).delete():
             db.session.commit()
 
     @staticmethod
@@ -251,9 +272,7 @@ class PortfolioBenchmarksCacheService:
         if len(benchmark_data_daily) < len(BENCHMARKS):
             BenchmarkGlobalService.refresh_daily_if_stale(force=True)
             benchmark_data_daily = BenchmarkGlobalService.get_sliced_daily_for_user(user_id)
-        benchmark_data_daily, _ = PortfolioBenchmarksCacheService._merge_global_quotes_into_daily(
-            copy.deepcopy(benchmark_data_daily)
-        )
+        benchmark_data_daily, _ = PortfolioBenchmarksCacheService._merge_global_quotes_into_daily(benchmark_data_daily)
 
         # 2) Recalcular comparación (portfolio+benchmarks)
         start_datetime = datetime.combine(start_date, time.min)
@@ -480,15 +499,7 @@ class PortfolioBenchmarksCacheService:
 
         if not cache or not cache.cached_data:
             rebuilt = PortfolioBenchmarksCacheService._full_rebuild(user_id)
-            safe_rebuilt = _to_json_safe(rebuilt)
-            if cache:
-                cache.cached_data = safe_rebuilt
-            else:
-                cache = PortfolioBenchmarksCache(user_id=user_id, cached_data=safe_rebuilt, expires_at=PortfolioBenchmarksCache.get_default_expiry())
-                db.session.add(cache)
-            cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-            cache.created_at = datetime.utcnow()
-            db.session.commit()
+            PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(rebuilt))
             result = copy.deepcopy(rebuilt.get("comparison_data") or {})
             result["meta"] = rebuilt.get("meta") or {}
             return result
@@ -498,10 +509,7 @@ class PortfolioBenchmarksCacheService:
 
         if meta.get("needs_full_rebuild") or (meta.get("hist_end_date") and meta.get("hist_end_date") != today_str):
             rebuilt = PortfolioBenchmarksCacheService._full_rebuild(user_id)
-            cache.cached_data = _to_json_safe(rebuilt)
-            cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-            cache.created_at = datetime.utcnow()
-            db.session.commit()
+            PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(rebuilt))
             result = copy.deepcopy(rebuilt.get("comparison_data") or {})
             result["meta"] = rebuilt.get("meta") or {}
             return result
@@ -511,9 +519,7 @@ class PortfolioBenchmarksCacheService:
             BenchmarkGlobalService.refresh_daily_if_stale()
             sliced = BenchmarkGlobalService.get_sliced_daily_for_user(user_id)
             if sliced:
-                merged_daily, _ = PortfolioBenchmarksCacheService._merge_global_quotes_into_daily(
-                    copy.deepcopy(sliced)
-                )
+                merged_daily, _ = PortfolioBenchmarksCacheService._merge_global_quotes_into_daily(sliced)
                 updated = PortfolioBenchmarksCacheService._recompute_now(
                     user_id, {**cached, "benchmark_data_daily": merged_daily}
                 )
@@ -523,18 +529,15 @@ class PortfolioBenchmarksCacheService:
                 if mq:
                     um["benchmark_quotes_applied_at"] = _utc_iso_z(_dt_as_utc(mq))
                 updated["meta"] = um
-                cache.cached_data = _to_json_safe(updated)
-                cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-                cache.created_at = datetime.utcnow()
-                db.session.commit()
+                PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(updated))
                 result = copy.deepcopy(updated.get("comparison_data") or {})
                 result["meta"] = updated.get("meta") or {}
                 return result
 
         if meta.get("dirty_now"):
-            daily_base = copy.deepcopy(BenchmarkGlobalService.get_sliced_daily_for_user(user_id))
+            daily_base = BenchmarkGlobalService.get_sliced_daily_for_user(user_id)
             if not daily_base:
-                daily_base = copy.deepcopy(cached.get("benchmark_data_daily") or {})
+                daily_base = cached.get("benchmark_data_daily") or {}
             merged_daily, _ = PortfolioBenchmarksCacheService._merge_global_quotes_into_daily(daily_base)
             updated = PortfolioBenchmarksCacheService._recompute_now(
                 user_id, {**cached, "benchmark_data_daily": merged_daily}
@@ -545,10 +548,7 @@ class PortfolioBenchmarksCacheService:
             if mq:
                 um["benchmark_quotes_applied_at"] = _utc_iso_z(_dt_as_utc(mq))
             updated["meta"] = um
-            cache.cached_data = _to_json_safe(updated)
-            cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-            cache.created_at = datetime.utcnow()
-            db.session.commit()
+            PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(updated))
             result = copy.deepcopy(updated.get("comparison_data") or {})
             result["meta"] = updated.get("meta") or {}
             return result
@@ -572,10 +572,7 @@ class PortfolioBenchmarksCacheService:
                 um["benchmark_global_daily_version"] = BenchmarkGlobalService.get_daily_data_version()
                 um["benchmark_quotes_applied_at"] = new_applied
                 updated["meta"] = um
-                cache.cached_data = _to_json_safe(updated)
-                cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-                cache.created_at = datetime.utcnow()
-                db.session.commit()
+                PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(updated))
                 result = copy.deepcopy(updated.get("comparison_data") or {})
                 result["meta"] = updated.get("meta") or {}
                 return result
@@ -583,17 +580,16 @@ class PortfolioBenchmarksCacheService:
             meta["benchmark_quotes_applied_at"] = new_applied
             cached_mut = dict(cached)
             cached_mut["meta"] = meta
-            cache.cached_data = _to_json_safe(cached_mut)
-            cache.expires_at = PortfolioBenchmarksCache.get_default_expiry()
-            db.session.commit()
-            result = copy.deepcopy(cached_mut.get("comparison_data") or {})
+            PortfolioBenchmarksCacheService._save(user_id, _to_json_safe(cached_mut), renew_created=False)
+            # comparison_data sigue siendo el JSON compartido: copia superficial
+            result = dict(cached_mut.get("comparison_data") or {})
             if not meta.get("sync_type"):
                 meta = dict(meta)
                 meta["sync_type"] = "cached"
             result["meta"] = meta
             return result
 
-        result = copy.deepcopy(cached.get("comparison_data") or {})
+        result = dict(cached.get("comparison_data") or {})
         # Caches antiguos pueden no tener sync_type; usar fallback para que la UI muestre algo
         if not meta.get("sync_type"):
             meta = dict(meta)
@@ -642,7 +638,6 @@ def get_market_indices_snapshot(user_id: int) -> list[dict[str, Any]]:
     Si aún no hay fila para un índice, usa caché por usuario y luego `benchmark_global_daily`.
     """
     from app.models.benchmark_global_quote import BenchmarkGlobalQuote
-    from app.models.benchmark_global_daily import BenchmarkGlobalDaily
 
     global_by_name = {r.benchmark_name: r for r in BenchmarkGlobalQuote.query.all()}
 
@@ -690,9 +685,7 @@ def get_market_indices_snapshot(user_id: int) -> list[dict[str, Any]]:
 
         prices = _extract_prices(points)
         if len(prices) < 2:
-            gd = BenchmarkGlobalDaily.query.filter_by(benchmark_name=name).first()
-            if gd and gd.data_points:
-                prices = _extract_prices(list(gd.data_points))
+            prices = BenchmarkGlobalService.last_closes(name, 2)
         if len(prices) >= 2:
             prev_p, last_p = prices[-2], prices[-1]
             pct = round(((last_p - prev_p) / prev_p) * 100, 2) if prev_p else None
@@ -11,14 +11,15 @@ from __future__ import annotations
 
 import copy
 import json
-from datetime import date, datetime, time, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
 from app import db
 from app.models.portfolio_evolution_cache import PortfolioEvolutionCache
+from app.services import json_cache_lru
+from app.services.cache_rebuild_state_service import classify_dates
 from app.services.metrics.portfolio_evolution import PortfolioEvolutionService
-from app.services.metrics.portfolio_valuation import PortfolioValuation
-from app.services.metrics.modified_dietz import ModifiedDietzCalculator
+from app.services.metrics.ledger_replay import LedgerReplayEngine
 
 
 def _utc_iso_z(dt: datetime) -> str:
@@ -50,16 +51,15 @@ class PortfolioEvolutionCacheService:
 
     @staticmethod
     def get(user_id: int, frequency: str) -> dict | None:
-        cache = PortfolioEvolutionCache.query.filter_by(user_id=user_id).first()
+        cache = json_cache_lru.read(PortfolioEvolutionCache, user_id)
         if not cache or not cache.is_valid:
             if cache:
-                db.session.delete(cache)
+                PortfolioEvolutionCache.query.filter_by(user_id=user_id).delete()
                 db.session.commit()
             return None
 
-        data = copy.deepcopy(cache.cached_data or {})
+        data = cache.cached_data or {}
         meta = _touch_meta_defaults(data.get("meta") or {})
-        data["meta"] = meta
 
         evolution = data.get("evolution")
         if not evolution:
@@ -67,7 +67,8 @@ class PortfolioEvolutionCacheService:
         if meta.get("frequency") and meta.get("frequency") != frequency:
             # Frecuencia distinta: no reutilizamos el snapshot.
             return None
-        return evolution
+        # JSON compartido con la caché en memoria: copia superficial
+        return dict(evolution)
 
     @staticmethod
     def touch_for_dates(user_id: int, dates: list[date]) -> None:
@@ -76,38 +77,43 @@ class PortfolioEvolutionCacheService:
         - Si alguna fecha es hoy: dirty_now=True
         """
         today = datetime.now().date()  # coincide con PortfolioValuation/ModifiedDietz en el proyecto
-        any_past = any(d < today for d in dates if isinstance(d, date))
-        any_today = any(d == today for d in dates if isinstance(d, date))
+        any_past, any_today = classify_dates(dates, today=today)
         if not any_past and not any_today:
             return
+        if PortfolioEvolutionCacheService.mark_dirty(user_id, full_rebuild=any_past):
+            db.session.commit()
 
-        cache = PortfolioEvolutionCache.query.filter_by(user_id=user_id).first()
-        if not cache:
-            return
+    @staticmethod
+    def touch_for_prices_update(user_id: int) -> None:
+        """Actualizar NOW por cambios en current_price (precios)."""
+        if PortfolioEvolutionCacheService.mark_dirty(user_id, full_rebuild=False):
+            db.session.commit()
+
+    @staticmethod
+    def mark_dirty(user_id: int, full_rebuild: bool) -> bool:
+        """
+        Marca el snapshot (needs_full_rebuild o dirty_now) sin commit: lo escribe el commit en
+        curso. Si la marca ya estaba no reescribe el JSON. Devuelve False si no hay caché.
+        """
+        cached = json_cache_lru.read(PortfolioEvolutionCache, user_id)
+        if not cached:
+            return False
 
-        data = copy.deepcopy(cache.cached_data or {})
+        data = dict(cached.cached_data or {})
         meta = _touch_meta_defaults(data.get("meta") or {})
-        if any_past:
+        if meta["needs_full_rebuild"] or (meta["dirty_now"] and not full_rebuild):
+            return True
+        if full_rebuild:
             meta["needs_full_rebuild"] = True
             meta["dirty_now"] = False
-        elif any_today:
+        else:
             meta["dirty_now"] = True
         data["meta"] = meta
-        cache.cached_data = data
-        db.session.commit()
-
-    @staticmethod
-    def touch_for_prices_update(user_id: int) -> None:
-        """Actualizar NOW por cambios en current_price (precios)."""
-        cache = PortfolioEvolutionCache.query.filter_by(user_id=user_id).first()
-        if not cache:
-            return
-        data = copy.deepcopy(cache.cached_data or {})
-        meta = _touch_meta_defaults(data.get("meta") or {})
-        meta["dirty_now"] = True
-        data["meta"] = meta
-        cache.cached_data = data
-        db.session.commit()
+        cache_row = json_cache_lru.row_for_update(PortfolioEvolutionCache, user_id)
+        if cache_row is None:
+            return False
+        cache_row.cached_data = data
+        return True
 
     @staticmethod
     def invalidate(user_id: int) -> None:
@@ -116,6 +122,24 @@ class PortfolioEvolutionCacheService:
             db.session.delete(cache)
             db.session.commit()
 
+    @staticmethod
+    def _save(user_id: int, data: dict[str, Any], renew: bool = False) -> None:
+        """
+        Escribe el snapshot sin cargar el blob anterior y lo deja en la caché en memoria.
+        renew=True: nuevo snapshot (crea la fila si falta y renueva created_at/TTL).
+        """
+        cache_row = json_cache_lru.row_for_update(PortfolioEvolutionCache, user_id)
+        if cache_row is None:
+            if not renew:
+                return
+            cache_row = PortfolioEvolutionCache(user_id=user_id, cached_data=data)
+            db.session.add(cache_row)
+        cache_row.cached_data = data
+        if renew:
+            cache_row.expires_at = PortfolioEvolutionCache.get_default_expiry()
+            cache_row.created_at = datetime.utcnow()
+        json_cache_lru.commit_and_remember(cache_row, data)
+
     @staticmethod
     def _bump_version(meta: dict[str, Any], now: datetime) -> None:
         meta["version"] = int(now.timestamp() * 1000)
@@ -158,40 +182,21 @@ class PortfolioEvolutionCacheService:
             return PortfolioEvolutionCacheService._full_rebuild(user_id, frequency)
 
         start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        start_date_dt = datetime.combine(start_date, time.min)
-        end_date_dt = datetime.combine(today, time.max)
 
         service = PortfolioEvolutionService(user_id)
 
         # Calcular último punto (misma lógica que PortfolioEvolutionService cuando date == end_date)
-        # - Para el último punto usamos precios actuales (use_current_prices=True)
-        portfolio_data = PortfolioValuation.get_detailed_value_at_date(
-            user_id=user_id,
-            target_date=end_date_dt,
-            use_current_prices=True,
-        )
-
-        value = float(portfolio_data["total_value"])
-        holdings_value = float(portfolio_data["holdings_value"])
-        pl_unrealized_at_date = float(portfolio_data["pl_unrealized"])
-
-        capital = float(service._get_capital_invested(today))
-        return_data = ModifiedDietzCalculator.calculate_return(
-            user_id=user_id,
-            start_date=start_date_dt,
-            end_date=end_date_dt,
-        )
-        return_pct = float(return_data.get("return_pct") or 0.0)
-
-        dividends = float(service._get_dividends_until(today))
-        fees = float(service._get_fees_until(today))
-        pl_realized = float(service._get_pl_realized_until(today))
-
-        pl_total = pl_realized + pl_unrealized_at_date + dividends - fees
-        user_money = capital + pl_realized + dividends - fees
-        user_money_for_leverage = user_money
-
-        broker_money = user_money_for_leverage - float(holdings_value - pl_unrealized_at_date)
+        # - Un solo replay del ledger; el último punto usa precios actuales
+        engine = LedgerReplayEngine.for_user(user_id, start_date=start_date, end_date=today)
+        if engine is None:
+            return PortfolioEvolutionCacheService._full_rebuild(user_id, frequency)
+        snapshot = engine.replay([today])[-1]
+
+        value = float(snapshot["total_value"])
+        capital = float(snapshot["capital_invested"])
+        return_pct = float(snapshot["return_pct"] or 0.0)
+        broker_money = float(snapshot["leverage"])
+        pl_total = float(snapshot["pl_total"])
 
         # Actualizar estructuras del snapshot
         labels = evolution.get("labels") or []
@@ -234,62 +239,37 @@ class PortfolioEvolutionCacheService:
         Devuelve el snapshot evolution para el frontend + meta.version para detectar cambios.
         """
         cached = None
-        cache_row = PortfolioEvolutionCache.query.filter_by(user_id=user_id).first()
+        cache_row = json_cache_lru.read(PortfolioEvolutionCache, user_id)
         if cache_row and cache_row.is_valid and cache_row.cached_data:
             cached = cache_row.cached_data
 
         if not cached:
             rebuilt = PortfolioEvolutionCacheService._full_rebuild(user_id, frequency)
-            cache_row = PortfolioEvolutionCache.query.filter_by(user_id=user_id).first()
-            if not cache_row:
-                cache_row = PortfolioEvolutionCache(user_id=user_id, cached_data=rebuilt, expires_at=PortfolioEvolutionCache.get_default_expiry())
-                db.session.add(cache_row)
-            else:
-                cache_row.cached_data = rebuilt
-            cache_row.expires_at = PortfolioEvolutionCache.get_default_expiry()
-            cache_row.created_at = datetime.utcnow()
-            db.session.commit()
-            response = copy.deepcopy(rebuilt["evolution"])
+            PortfolioEvolutionCacheService._save(user_id, rebuilt, renew=True)
+            response = dict(rebuilt["evolution"])
             response["meta"] = rebuilt["meta"]
             return response
 
         meta = _touch_meta_defaults(cached.get("meta") or {})
-        if meta.get("frequency") != frequency:
+        if meta.get("frequency") != frequency or meta.get("needs_full_rebuild"):
             rebuilt = PortfolioEvolutionCacheService._full_rebuild(user_id, frequency)
-            cache_row.cached_data = rebuilt
-            cache_row.expires_at = PortfolioEvolutionCache.get_default_expiry()
-            cache_row.created_at = datetime.utcnow()
-            db.session.commit()
-            response = copy.deepcopy(rebuilt["evolution"])
-            response["meta"] = rebuilt["meta"]
-            return response
-
-        if meta.get("needs_full_rebuild"):
-            rebuilt = PortfolioEvolutionCacheService._full_rebuild(user_id, frequency)
-            cache_row.cached_data = rebuilt
-            cache_row.expires_at = PortfolioEvolutionCache.get_default_expiry()
-            cache_row.created_at = datetime.utcnow()
-            db.session.commit()
-            response = copy.deepcopy(rebuilt["evolution"])
+            PortfolioEvolutionCacheService._save(user_id, rebuilt, renew=True)
+            response = dict(rebuilt["evolution"])
             response["meta"] = rebuilt["meta"]
             return response
 
         if meta.get("dirty_now"):
             updated = PortfolioEvolutionCacheService._recompute_now_last_point(user_id, cached, frequency)
-            cache_row.cached_data = updated
-            cache_row.expires_at = PortfolioEvolutionCache.get_default_expiry()
-            cache_row.created_at = datetime.utcnow()
-            db.session.commit()
-            response = copy.deepcopy(updated["evolution"])
+            PortfolioEvolutionCacheService._save(user_id, updated, renew=True)
+            response = dict(updated["evolution"])
             response["meta"] = updated["meta"]
             return response
 
-        # Sin dirty: devolver snapshot actual
-        response = copy.deepcopy(cached.get("evolution") or {})
+        # Sin dirty: devolver snapshot actual (copia superficial; el JSON es compartido)
+        response = dict(cached.get("evolution") or {})
         # Caches antiguos pueden no tener sync_type; usar fallback para que la UI muestre algo
         if not meta.get("sync_type"):
             meta = dict(meta)
             meta["sync_type"] = "cached"
         response["meta"] = meta
         return response
-
@@ -1,4 +1,6 @@
 """Servicio para recalcular holdings (posiciones) desde transacciones"""
+from typing import Dict, Iterable, Optional, Set
+
 from app import db
 from app.models import Transaction, PortfolioHolding, Asset, BrokerAccount
 from app.services.fifo_calculator import FIFOCalculator
@@ -20,35 +22,42 @@ def recalculate_all_holdings_for_user(user_id: int) -> int:
     return total
 
 
-def recalculate_holdings(user_id: int, account_id: int) -> int:
+def recalculate_holdings(user_id: int, account_id: int, asset_ids: Optional[Iterable[int]] = None) -> int:
     """
     Recalcula los holdings de una cuenta desde las transacciones BUY/SELL con FIFO.
 
+    Args:
+        asset_ids: Si se indica, solo se replayan las operaciones de esos activos y solo se
+                   reescriben sus holdings (el resto de la cuenta no se toca). None = toda la cuenta.
+
     Returns:
         Número de holdings creados/actualizados
     """
     db.session.flush()
 
-    PortfolioHolding.query.filter_by(
-        user_id=user_id,
-        account_id=account_id
-    ).delete()
+    scope = None if asset_ids is None else set(asset_ids)
+    if scope is not None and not scope:
+        return 0
 
-    transactions = (
+    query = (
         Transaction.query
         .filter_by(user_id=user_id, account_id=account_id)
         .filter(Transaction.transaction_type.in_(['BUY', 'SELL']))
-        .order_by(Transaction.transaction_date, Transaction.id)
-        .all()
     )
+    if scope is not None:
+        query = query.filter(Transaction.asset_id.in_(scope))
+    transactions = query.order_by(Transaction.transaction_date, Transaction.id).all()
+
+    # Símbolos de todos los activos en una sola consulta
+    traded = {txn.asset_id for txn in transactions if txn.asset_id}
+    symbols = dict(db.session.query(Asset.id, Asset.symbol).filter(Asset.id.in_(traded))) if traded else {}
 
     positions = {}
     for txn in transactions:
         if not txn.asset_id:
             continue
         if txn.asset_id not in positions:
-            asset = Asset.query.get(txn.asset_id)
-            symbol = asset.symbol if asset else f'Asset_{txn.asset_id}'
+            symbol = symbols[txn.asset_id] if txn.asset_id in symbols else f'Asset_{txn.asset_id}'
             positions[txn.asset_id] = FIFOCalculator(symbol=symbol)
 
         fifo = positions[txn.asset_id]
@@ -63,21 +72,51 @@ def recalculate_holdings(user_id: int, account_id: int) -> int:
         elif txn.transaction_type == 'SELL':
             fifo.add_sell(quantity=txn.quantity, date=txn.transaction_date)
 
-    holdings_created = 0
-    for asset_id, fifo in positions.items():
-        pos = fifo.get_current_position()
-        if pos['quantity'] > 0:
-            holding = PortfolioHolding(
-                user_id=user_id,
-                account_id=account_id,
-                asset_id=asset_id,
-                quantity=pos['quantity'],
-                average_buy_price=pos['average_buy_price'],
-                total_cost=pos['total_cost'],
-                first_purchase_date=pos['first_purchase_date'],
-                last_transaction_date=pos['last_transaction_date']
-            )
+    return upsert_holdings(user_id, account_id, positions, scope)
+
+
+def upsert_holdings(
+    user_id: int,
+    account_id: int,
+    positions: Dict[int, FIFOCalculator],
+    asset_ids: Optional[Set[int]] = None
+) -> int:
+    """
+    Vuelca posiciones FIFO en portfolio_holdings actualizando las filas existentes (sin commit).
+
+    Los activos con cantidad > 0 se crean o actualizan; el resto pierde su holding.
+    Solo se tocan los activos de `asset_ids` (None = todos los de la cuenta).
+
+    Returns:
+        Número de holdings abiertos escritos
+    """
+    query = PortfolioHolding.query.filter_by(user_id=user_id, account_id=account_id)
+    if asset_ids is not None:
+        if not asset_ids:
+            return 0
+        query = query.filter(PortfolioHolding.asset_id.in_(asset_ids))
+    existing = {holding.asset_id: holding for holding in query}
+
+    scope = set(existing) | set(positions) if asset_ids is None else asset_ids
+    holdings_written = 0
+    for asset_id in scope:
+        fifo = positions.get(asset_id)
+        position = fifo.get_current_position() if fifo is not None else None
+        holding = existing.get(asset_id)
+
+        if position is None or position['quantity'] <= 0:
+            if holding is not None:
+                db.session.delete(holding)
+            continue
+
+        if holding is None:
+            holding = PortfolioHolding(user_id=user_id, account_id=account_id, asset_id=asset_id)
             db.session.add(holding)
-            holdings_created += 1
+        holding.quantity = position['quantity']
+        holding.average_buy_price = position['average_buy_price']
+        holding.total_cost = position['total_cost']
+        holding.first_purchase_date = position['first_purchase_date']
+        holding.last_transaction_date = position['last_transaction_date']
+        holdings_written += 1
 
-    return holdings_created
+    return holdings_written
@@ -1,10 +1,18 @@
 """
-Servicio de polling de precios en segundo plano.
-Actualiza 1 elemento por minuto (rotación): activos (cartera/watchlist) + benchmarks globales.
+Servicio de polling de precios en segundo plano: activos (cartera/watchlist) + benchmarks globales.
+
+- run_poll_batch (cron price-poll-one): en cada tick descarga en paralelo los N tickers más
+  atrasados respecto a su antigüedad objetivo (holdings y benchmarks más exigentes que watchlist).
+  La cola se cachea en PricePollingState entre ticks y se reconstruye cada PRICE_POLL_QUEUE_TTL.
+- run_poll_one: rotación clásica de 1 elemento por llamada.
 """
+import time
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from flask import current_app
+from sqlalchemy import update
 
 from app import db
 from app.models.asset import Asset
@@ -17,6 +25,10 @@ from app.services.metrics.benchmark_comparison import BENCHMARKS
 # Tipos de activo que se pueden actualizar vía Yahoo Chart API
 POLLABLE_TYPES = ("Stock", "ETF", "Crypto", "Commodity")
 
+# Polling por lotes: no repetir un ticker dentro del mismo minuto y terminar antes del siguiente tick
+MIN_REFRESH_SECONDS = 55
+POLL_DEADLINE_SECONDS = 40
+
 
 @dataclass(frozen=True)
 class _PollAsset:
@@ -69,6 +81,11 @@ def get_assets_to_poll() -> List[Asset]:
     - Excluye delisted
     - Sin duplicados por asset_id
     """
+    return _get_pollable_assets()[0]
+
+
+def _get_pollable_assets() -> Tuple[List[Asset], Set[int]]:
+    """get_assets_to_poll + ids de activos con holdings (prioridad en el polling por lotes)."""
     from app.services.delisting_reconciliation_service import get_delisted_asset_ids
 
     holding_ids = (
@@ -90,7 +107,7 @@ def get_assets_to_poll() -> List[Asset]:
     dash_ids = db.session.query(Asset.id).filter(Asset.symbol.in_(dash_syms)).all()
     all_ids |= {r[0] for r in dash_ids}
     if not all_ids:
-        return []
+        return [], holding_ids
 
     delisted = set(get_delisted_asset_ids())
     ids_to_poll = [i for i in all_ids if i not in delisted]
@@ -113,7 +130,7 @@ def get_assets_to_poll() -> List[Asset]:
         seen.add(a.id)
         result.append(a)
 
-    return result
+    return result, holding_ids
 
 
 def build_poll_queue() -> List[PollSlot]:
@@ -145,9 +162,173 @@ def _poll_benchmark_slot(slot: _PollBenchmark) -> bool:
     return True
 
 
+def _build_batch_queue() -> List[Dict[str, Any]]:
+    """Cola serializable (JSON) para el polling por lotes: holdings, resto de activos y benchmarks."""
+    assets, holding_ids = _get_pollable_assets()
+    queue = [
+        {"kind": "asset", "asset_id": a.id, "ticker": a.yahoo_ticker.strip(), "held": a.id in holding_ids}
+        for a in sorted(assets, key=lambda x: (x.id not in holding_ids, x.id))
+    ]
+    for name, ticker in BENCHMARKS.items():
+        queue.append({"kind": "benchmark", "name": name, "ticker": ticker, "held": True})
+    return queue
+
+
+def _load_batch_queue(state: PricePollingState, now: datetime) -> List[Dict[str, Any]]:
+    """Cola cacheada en PricePollingState; se reconstruye al caducar PRICE_POLL_QUEUE_TTL."""
+    ttl = current_app.config.get("PRICE_POLL_QUEUE_TTL", 600)
+    if state.queue is not None and state.queue_built_at and (now - state.queue_built_at).total_seconds() < ttl:
+        return state.queue
+    state.queue = _build_batch_queue()
+    state.queue_built_at = now
+    return state.queue
+
+
+def _select_batch(queue: List[Dict[str, Any]], batch_size: int, now: datetime) -> List[Dict[str, Any]]:
+    """Los `batch_size` slots más atrasados de la cola según la última actualización en BD."""
+    asset_ids = [s["asset_id"] for s in queue if s["kind"] == "asset"]
+    updated_at: Dict[Tuple[str, Any], Optional[datetime]] = {}
+    if asset_ids:
+        rows = db.session.query(Asset.id, Asset.last_price_update).filter(Asset.id.in_(asset_ids)).all()
+        updated_at.update({("asset", r[0]): r[1] for r in rows})
+    for name, ts in db.session.query(BenchmarkGlobalQuote.benchmark_name, BenchmarkGlobalQuote.updated_at).all():
+        updated_at[("benchmark", name)] = ts
+    return _rank_slots(
+        queue,
+        updated_at,
+        now,
+        batch_size,
+        current_app.config.get("PRICE_POLL_HELD_MAX_AGE", 180),
+        current_app.config.get("PRICE_POLL_OTHER_MAX_AGE", 900),
+    )
+
+
+def _rank_slots(
+    queue: List[Dict[str, Any]],
+    updated_at: Dict[Tuple[str, Any], Optional[datetime]],
+    now: datetime,
+    batch_size: int,
+    held_max_age: float,
+    other_max_age: float,
+) -> List[Dict[str, Any]]:
+    """
+    Prioridad = antigüedad / antigüedad objetivo (holdings y benchmarks `held_max_age`, resto
+    `other_max_age`); sin precio = máxima. Se omiten los actualizados hace menos de
+    MIN_REFRESH_SECONDS y los activos que ya no existen.
+    """
+    candidates = []
+    for slot in queue:
+        key = ("asset", slot["asset_id"]) if slot["kind"] == "asset" else ("benchmark", slot["name"])
+        if slot["kind"] == "asset" and key not in updated_at:
+            continue  # Activo borrado desde que se cacheó la cola
+        ts = updated_at.get(key)
+        if ts is None:
+            candidates.append((float("inf"), slot))
+            continue
+        age = (now - ts).total_seconds()
+        if age < MIN_REFRESH_SECONDS:
+            continue
+        candidates.append((age / (held_max_age if slot.get("held") else other_max_age), slot))
+
+    # sort es estable: a igual urgencia se respeta el orden de la cola (holdings primero)
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    return [slot for _, slot in candidates[:batch_size]]
+
+
+def run_poll_batch(batch_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Un tick del cron en modo lote: descarga concurrente (Chart API) de los slots más atrasados,
+    una UPDATE masiva de Asset, upsert de benchmarks y un único commit.
+
+    Returns:
+        {"assets": [asset_id], "benchmarks": [name], "failed": int} | None si la cola está vacía
+    """
+    from app.services.market_data.services.batch_quote_fetcher import BatchQuoteFetcher
+    from app.services.market_data.services.price_updater import PriceUpdater
+
+    batch_size = batch_size or current_app.config.get("PRICE_POLL_BATCH_SIZE", 40)
+    now = datetime.utcnow()
+
+    state = db.session.get(PricePollingState, 1)
+    if not state:
+        state = PricePollingState(id=1, last_asset_index=0)
+        db.session.add(state)
+    queue = _load_batch_queue(state, now)
+    state.last_run_at = now
+    batch = _select_batch(queue, batch_size, now) if queue else []
+    # Cerrar la transacción antes de las peticiones HTTP (no bloquear SQLite durante la red)
+    db.session.commit()
+    if not queue:
+        return None
+    if not batch:
+        return {"assets": [], "benchmarks": [], "failed": 0}
+
+    results = BatchQuoteFetcher().fetch_many(
+        [slot["ticker"] for slot in batch], time.monotonic() + POLL_DEADLINE_SECONDS
+    )
+
+    now = datetime.utcnow()
+    asset_rows: List[Dict[str, Any]] = []
+    benchmark_quotes: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    failed = 0
+    for slot in batch:
+        fields = results[slot["ticker"]]["fields"]
+        if not fields or fields.get("current_price") is None:
+            failed += 1
+            continue
+        if slot["kind"] == "asset":
+            row = PriceUpdater._price_fields(fields, None, now)
+            row["id"] = slot["asset_id"]
+            asset_rows.append(row)
+        else:
+            benchmark_quotes[slot["name"]] = (slot["ticker"], fields)
+
+    if benchmark_quotes:
+        existing = {
+            r.benchmark_name: r
+            for r in BenchmarkGlobalQuote.query.filter(BenchmarkGlobalQuote.benchmark_name.in_(benchmark_quotes)).all()
+        }
+        for name, (ticker, fields) in benchmark_quotes.items():
+            row = existing.get(name)
+            if not row:
+                row = BenchmarkGlobalQuote(benchmark_name=name, yahoo_ticker=ticker, updated_at=now)
+                db.session.add(row)
+            day_pct = fields.get("day_change_percent")
+            row.yahoo_ticker = ticker
+            row.regular_market_price = fields["current_price"]
+            row.previous_close = fields.get("previous_close")
+            row.day_change_percent = round(day_pct, 4) if day_pct is not None else None
+            row.updated_at = now
+    if asset_rows:
+        db.session.execute(update(Asset), asset_rows)
+        state = db.session.get(PricePollingState, 1)
+        state.last_updated_asset_id = asset_rows[-1]["id"]
+        state.updated_at = now
+    db.session.commit()
+
+    benchmark_tickers = {ticker for ticker, _ in benchmark_quotes.values()}
+    calls = []
+    for res in results.values():
+        for api_name, url, value in res["calls"]:
+            if res["ticker"] in benchmark_tickers:
+                value = {**value, "benchmark_quote": True}
+            calls.append((api_name, url, value))
+    try:
+        from app.services.api_log_service import log_api_calls
+
+        log_api_calls(calls)
+    except Exception:
+        pass
+
+    asset_ids = [row["id"] for row in asset_rows]
+    if asset_ids:
+        _invalidate_caches_for_assets(asset_ids)
+    return {"assets": asset_ids, "benchmarks": list(benchmark_quotes), "failed": failed}
+
+
 def run_poll_one() -> Optional[Dict[str, Any]]:
     """
-    Ejecuta una iteración del job: un slot de la cola (activo o benchmark).
+    Ejecuta una iteración del job en modo rotación: un slot de la cola (activo o benchmark).
     Returns:
         {"kind": "asset", "asset_id": int} | {"kind": "benchmark", "name": str, "ticker": str} | None
     """
@@ -192,23 +373,28 @@ def run_poll_one() -> Optional[Dict[str, Any]]:
 def _invalidate_caches_for_asset(asset_id: int) -> None:
     """
     Caches que dependen del precio del activo.
-    Benchmarks: solo dirty_now (no borrar serie HIST global en caché por usuario).
+    Benchmarks: solo dirty_now (no borrar serie HIST global en caché por usuario); lo marca
+    el propio commit de precios (cache_invalidation_bus).
     """
+    _invalidate_caches_for_assets([asset_id])
+
+
+def _invalidate_caches_for_assets(asset_ids: Iterable[int]) -> None:
+    """Como _invalidate_caches_for_asset para varios activos: cada usuario afectado se procesa una vez."""
     from app.services.portfolio_evolution_cache import PortfolioEvolutionCacheService
-    from app.services.portfolio_benchmarks_cache import PortfolioBenchmarksCacheService
 
+    asset_ids = list(asset_ids)
     user_ids = set()
     for row in db.session.query(PortfolioHolding.user_id).filter(
-        PortfolioHolding.asset_id == asset_id,
+        PortfolioHolding.asset_id.in_(asset_ids),
         PortfolioHolding.quantity > 0,
     ).distinct().all():
         user_ids.add(row[0])
-    for row in db.session.query(Watchlist.user_id).filter(Watchlist.asset_id == asset_id).distinct().all():
+    for row in db.session.query(Watchlist.user_id).filter(Watchlist.asset_id.in_(asset_ids)).distinct().all():
         user_ids.add(row[0])
 
     for uid in user_ids:
         PortfolioEvolutionCacheService.invalidate(uid)
-        PortfolioBenchmarksCacheService.touch_for_prices_update(uid)
         from app.services.dashboard_summary_cache import DashboardSummaryCacheService
 
         DashboardSummaryCacheService.recompute_current_from_cache(uid)
@@ -0,0 +1,346 @@
+"""
+Transaction Frame - Vista columnar (NumPy) de las transacciones de un usuario
+
+Una sola SELECT por usuario y petición: los servicios de métricas filtran por tipo,
+fechas, activo o cuenta con máscaras booleanas en lugar de lanzar una consulta ORM por
+cada combinación.
+
+Caché en dos niveles, versionada por el contador user_ledger_versions:
+- Por petición (flask.g): el mismo frame para todos los servicios de la petición
+- Por proceso (LRU pequeño, TRANSACTION_FRAME_CACHE_SIZE usuarios; 0 lo desactiva):
+  reutilizado mientras la versión del usuario no cambie
+
+Cada flush que toca transacciones incrementa la versión (hooks de sesión, igual que los
+checkpoints FIFO), así que otros procesos (cron, worker) ven el cambio en su siguiente
+lectura. Los borrados masivos (query.delete) deben llamar a bump_ledger_version.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from datetime import datetime, time
+from threading import Lock
+from typing import Iterable, Optional, Set
+
+import numpy as np
+
+from app import db
+from app.models.transaction import Transaction
+from app.models.user_ledger_version import UserLedgerVersion
+from app.services.currency_service import convert_many
+
+_COLUMNS = (
+    'id', 'transaction_date', 'transaction_type', 'asset_id', 'account_id',
+    'quantity', 'price', 'amount', 'currency', 'commission', 'fees', 'tax',
+)
+_LEDGER_COLUMNS = (
+    'user_id', 'transaction_date', 'transaction_type', 'asset_id', 'account_id',
+    'quantity', 'price', 'amount', 'currency', 'commission', 'fees', 'tax',
+)
+_DEFAULT_PROCESS_CACHE_SIZE = 32
+_SESSION_PENDING_KEY = '_ledger_version_pending'
+_SESSION_DIRTY_KEY = '_ledger_version_dirty'
+_G_KEY = '_transaction_frames'
+
+# LRU por proceso: {(user_id, version): TransactionFrame}
+_process_cache: 'OrderedDict[tuple, TransactionFrame]' = OrderedDict()
+_process_lock = Lock()
+_registered = False
+
+
+def _to_datetime64(value) -> np.datetime64:
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    return np.datetime64(value, 'us')
+
+
+def _float_column(values: list) -> np.ndarray:
+    return np.fromiter((v or 0.0 for v in values), dtype=np.float64, count=len(values))
+
+
+def _id_column(values: list) -> np.ndarray:
+    return np.fromiter((v or 0 for v in values), dtype=np.int64, count=len(values))
+
+
+class TransactionFrame:
+    """
+    Transacciones de un usuario ordenadas por (transaction_date, id) en arrays NumPy.
+
+    Columnas numéricas float64 (None -> 0.0), ids int64 (None -> 0), tipo y divisa como
+    arrays object. rows() devuelve las filas originales (acceso por atributo con los mismos
+    nombres que Transaction, None conservado) para los motores que iteran transacciones.
+    """
+
+    def __init__(self, user_id: int, version: int, records: list):
+        self.user_id = user_id
+        self.version = version
+        self._records = records
+
+        columns = list(zip(*records)) if records else [()] * len(_COLUMNS)
+        data = dict(zip(_COLUMNS, columns))
+
+        self.ids = _id_column(data['id'])
+        self.date_list = list(data['transaction_date'])
+        self.dates = np.array(self.date_list, dtype='datetime64[us]')
+        self.types = np.array(data['transaction_type'], dtype=object)
+        self.asset_ids = _id_column(data['asset_id'])
+        self.account_ids = _id_column(data['account_id'])
+        self.quantity = _float_column(data['quantity'])
+        self.price = _float_column(data['price'])
+        self.amount = _float_column(data['amount'])
+        self.currency = np.array(data['currency'], dtype=object)
+        self.commission = _float_column(data['commission'])
+        self.fees = _float_column(data['fees'])
+        self.tax = _float_column(data['tax'])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @classmethod
+    def load(cls, user_id: int, version: int = 0) -> 'TransactionFrame':
+        table = Transaction.__table__
+        records = db.session.execute(
+            db.select(*(table.c[name] for name in _COLUMNS))
+            .where(table.c.user_id == user_id)
+            .order_by(table.c.transaction_date, table.c.id)
+        ).all()
+        return cls(user_id, version, records)
+
+    # ------------------------------------------------------------------
+    # Filtros
+    # ------------------------------------------------------------------
+
+    def mask(
+        self,
+        types: Optional[Iterable[str]] = None,
+        start=None,
+        end=None,
+        after=None,
+        asset_ids: Optional[Iterable[int]] = None,
+        account_ids: Optional[Iterable[int]] = None,
+    ) -> np.ndarray:
+        """
+        Máscara booleana de filas.
+
+        Args:
+            types: Tipos de transacción admitidos (None = todos)
+            start: Fecha mínima inclusive (date = medianoche)
+            end: Fecha máxima inclusive
+            after: Fecha mínima exclusiva
+            asset_ids / account_ids: Ids admitidos (None = todos)
+        """
+        m = np.ones(len(self), dtype=bool)
+        if types is not None:
+            if isinstance(types, str):
+                types = [types]
+            m &= np.isin(self.types, list(types))
+        if start is not None:
+            m &= self.dates >= _to_datetime64(start)
+        if after is not None:
+            m &= self.dates > _to_datetime64(after)
+        if end is not None:
+            m &= self.dates <= _to_datetime64(end)
+        if asset_ids is not None:
+            m &= np.isin(self.asset_ids, np.fromiter(asset_ids, dtype=np.int64))
+        if account_ids is not None:
+            m &= np.isin(self.account_ids, np.fromiter(account_ids, dtype=np.int64))
+        return m
+
+    def rows(self, mask: Optional[np.ndarray] = None) -> list:
+        """Filas (orden cronológico) seleccionadas por la máscara."""
+        if mask is None:
+            return list(self._records)
+        records = self._records
+        return [records[i] for i in np.flatnonzero(mask)]
+
+    def first_date(self, mask: Optional[np.ndarray] = None) -> Optional[datetime]:
+        """Fecha de la primera transacción (de la máscara), o None."""
+        if mask is None:
+            return self.date_list[0] if self.date_list else None
+        idx = np.flatnonzero(mask)
+        return self.date_list[idx[0]] if len(idx) else None
+
+    # ------------------------------------------------------------------
+    # Importes en EUR
+    # ------------------------------------------------------------------
+
+    def amounts_eur(self, mask: np.ndarray, absolute: bool = True, at_flow_date: bool = False) -> np.ndarray:
+        """
+        Importe en EUR de cada fila de la máscara.
+
+        Args:
+            absolute: Usar abs(amount)
+            at_flow_date: Convertir a la tasa de la fecha de cada fila (False = tasa actual)
+        """
+        idx = np.flatnonzero(mask)
+        amounts = self.amount[idx]
+        if absolute:
+            amounts = np.abs(amounts)
+        dates = [self.date_list[i] for i in idx] if at_flow_date else None
+        return convert_many(amounts, self.currency[idx], dates)
+
+    def sum_eur(self, mask: np.ndarray, absolute: bool = True, at_flow_date: bool = False) -> float:
+        """Suma en EUR de las filas de la máscara (ver amounts_eur)."""
+        if not mask.any():
+            return 0.0
+        return float(self.amounts_eur(mask, absolute=absolute, at_flow_date=at_flow_date).sum())
+
+
+# ----------------------------------------------------------------------
+# Caché
+# ----------------------------------------------------------------------
+
+def _process_cache_size() -> int:
+    from flask import current_app, has_app_context
+
+    if not has_app_context():
+        return _DEFAULT_PROCESS_CACHE_SIZE
+    return int(current_app.config.get('TRANSACTION_FRAME_CACHE_SIZE', _DEFAULT_PROCESS_CACHE_SIZE))
+
+
+def _request_cache() -> Optional[dict]:
+    from flask import g, has_app_context
+
+    if not has_app_context():
+        return None
+    frames = g.get(_G_KEY)
+    if frames is None:
+        frames = {}
+        setattr(g, _G_KEY, frames)
+    return frames
+
+
+def ledger_version(user_id: int) -> int:
+    """Versión actual del ledger del usuario (0 si nunca se ha escrito)."""
+    version = db.session.execute(
+        db.select(UserLedgerVersion.version).where(UserLedgerVersion.user_id == user_id)
+    ).scalar()
+    return version or 0
+
+
+def for_user(user_id: int) -> TransactionFrame:
+    """Frame del usuario: caché de petición -> LRU de proceso (por versión) -> SELECT."""
+    session = db.session
+    if session.autoflush and (session.new or session.dirty or session.deleted):
+        # Como haría una Query ORM: los cambios pendientes incrementan la versión antes de leer
+        session.flush()
+
+    frames = _request_cache()
+    if frames is not None and user_id in frames:
+        return frames[user_id]
+
+    version = ledger_version(user_id)
+    key = (user_id, version)
+    # Con escrituras sin commit en esta sesión el frame no se comparte con otras peticiones
+    shareable = user_id not in session.info.get(_SESSION_DIRTY_KEY, ())
+    size = _process_cache_size()
+
+    frame = None
+    if shareable and size > 0:
+        with _process_lock:
+            frame = _process_cache.get(key)
+            if frame is not None:
+                _process_cache.move_to_end(key)
+
+    if frame is None:
+        frame = TransactionFrame.load(user_id, version)
+        if shareable and size > 0:
+            with _process_lock:
+                _process_cache[key] = frame
+                while len(_process_cache) > size:
+                    _process_cache.popitem(last=False)
+
+    if frames is not None:
+        frames[user_id] = frame
+    return frame
+
+
+def forget(user_ids: Iterable[int]) -> None:
+    """Descarta los frames en memoria (petición y proceso) de los usuarios indicados."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    from flask import g, has_app_context
+
+    if has_app_context():
+        frames = g.get(_G_KEY)
+        if frames:
+            for user_id in user_ids:
+                frames.pop(user_id, None)
+    with _process_lock:
+        for key in [k for k in _process_cache if k[0] in user_ids]:
+            del _process_cache[key]
+
+
+def bump_ledger_version(user_ids: Iterable[int], connection=None) -> None:
+    """
+    Incrementa la versión del ledger (sin commit) y descarta los frames locales.
+    Llamar tras borrados masivos de transacciones que no pasan por el flush del ORM.
+    """
+    user_ids = sorted({u for u in user_ids if u is not None})
+    if not user_ids:
+        return
+    connection = connection or db.session.connection()
+    table = UserLedgerVersion.__table__
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.user_id == user_id)
+            .values(version=table.c.version + 1, updated_at=now)
+        ).rowcount
+        if not updated:
+            connection.execute(table.insert().values(user_id=user_id, version=1, updated_at=now))
+    db.session.info.setdefault(_SESSION_DIRTY_KEY, set()).update(user_ids)
+    forget(user_ids)
+
+
+# ----------------------------------------------------------------------
+# Versionado automático en flush
+# ----------------------------------------------------------------------
+
+def _txn_user_ids(txn, state) -> Set[int]:
+    history = state.attrs['user_id'].history
+    return {u for u in [txn.user_id, *(history.deleted or ())] if u is not None}
+
+
+def _collect_versions(session, flush_context, instances) -> None:
+    pending = session.info.setdefault(_SESSION_PENDING_KEY, set())
+    for txn in list(session.new) + list(session.deleted):
+        if isinstance(txn, Transaction):
+            pending.update(_txn_user_ids(txn, db.inspect(txn)))
+    for txn in session.dirty:
+        if not isinstance(txn, Transaction):
+            continue
+        state = db.inspect(txn)
+        if any(state.attrs[c].history.has_changes() for c in _LEDGER_COLUMNS):
+            pending.update(_txn_user_ids(txn, state))
+
+
+def _apply_versions(session, flush_context) -> None:
+    pending = session.info.pop(_SESSION_PENDING_KEY, None)
+    if pending:
+        bump_ledger_version(pending, connection=session.connection())
+
+
+def _after_commit(session) -> None:
+    session.info.pop(_SESSION_DIRTY_KEY, None)
+
+
+def _after_rollback(session) -> None:
+    # La versión vuelve atrás: los frames construidos con datos no confirmados no valen
+    session.info.pop(_SESSION_PENDING_KEY, None)
+    forget(session.info.pop(_SESSION_DIRTY_KEY, ()))
+
+
+def register_transaction_frame_versioning(db) -> None:
+    """Registra los hooks de sesión que versionan el ledger al escribir transacciones."""
+    global _registered
+    if _registered:
+        return
+    from sqlalchemy import event
+
+    event.listen(db.session, 'before_flush', _collect_versions)
+    event.listen(db.session, 'after_flush', _apply_versions)
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
+    _registered = True
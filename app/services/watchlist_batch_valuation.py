@@ -0,0 +1,569 @@
+"""
+Valoración watchlist por lotes: todas las filas de un usuario (o de todos) en arrays columnares.
+
+Mismas fórmulas que ``WatchlistMetricsService.update_all_metrics`` (modos general / banks /
+realestate, tier, operativa y rentabilidades), pero con una pasada NumPy por modo de valoración
+en lugar de un bucle Python por fila. Los resultados se escriben con un único UPDATE por lotes
+(executemany por clave primaria) y solo para las filas que cambian.
+
+Igualdad exacta con el camino escalar:
+- ``**`` de Python usa ``pow`` de libm; ``np.power`` usa SIMD y difiere en la última cifra,
+  así que las potencias pasan por ``math.pow`` (``_pow``).
+- ``round(x, n)`` de Python redondea el decimal exacto; ``np.round`` escala y puede caer al otro
+  lado de un empate: cerca de .5 se recurre a ``round`` (``_round``).
+"""
+from __future__ import annotations
+
+import math
+from itertools import repeat
+from types import SimpleNamespace
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import select, update
+
+from app import db
+from app.models import Asset, PortfolioHolding, Watchlist, WatchlistConfig
+from app.services.valuation_mode_service import resolve_valuation_mode
+
+# Inputs numéricos de la fila (None → NaN)
+INPUT_FIELDS = (
+    "per_ntm",
+    "ntm_dividend_yield",
+    "eps",
+    "cagr_revenue_yoy",
+    "per_fair",
+    "cagr_eps_yoy",
+    "net_debt_to_ebitda",
+    "fcf_margin_pct",
+    "net_income_margin_pct",
+    "fcf_to_net_income",
+    "ebitda_margin_pct",
+    "operating_margin_pct",
+    "roic_pct",
+    "price_to_book",
+    "pb_fair",
+    "roe_pct",
+    "cet1_ratio_pct",
+    "npl_ratio_pct",
+    "cost_to_income_pct",
+    "nim_pct",
+    "bvps",
+    "loan_to_deposit_pct",
+    "cost_of_risk_pct",
+    "bvps_cagr_yoy",
+    "ffo_per_share",
+    "affo_per_share",
+    "price_to_ffo",
+    "p_ffo_fair",
+    "cagr_ffo_yoy",
+    "reit_leverage_ratio",
+    "occupancy_pct",
+    "walt_years",
+    "same_store_growth_pct",
+    "ffo_interest_coverage",
+    "ffo_to_total_debt",
+)
+
+# Campos calculados que escribe el motor (mismos que update_all_metrics)
+OUTPUT_FIELDS = (
+    "precio_actual",
+    "valoracion_12m",
+    "target_price_5yr",
+    "target_price_5yr_gross",
+    "valuation_adjustment_factor",
+    "tier",
+    "cantidad_aumentar_reducir",
+    "operativa_indicator",
+    "rentabilidad_5yr",
+    "rentabilidad_anual",
+)
+
+_FLOAT_OUTPUTS = tuple(f for f in OUTPUT_FIELDS if f not in ("tier", "operativa_indicator"))
+
+# Columnas de cada fila cargada: claves + inputs + calculados actuales + datos del activo
+ROW_KEYS = ("id", "user_id", "asset_id") + INPUT_FIELDS + OUTPUT_FIELDS + ("sector", "industry", "asset_price")
+
+
+class WatchlistFrame(NamedTuple):
+    """Filas watchlist en columnas."""
+    ids: np.ndarray  # int64
+    user_ids: np.ndarray  # int64
+    modes: np.ndarray  # 'general' | 'banks' | 'realestate'
+    cols: Dict[str, np.ndarray]  # INPUT_FIELDS + precio_actual, float64 con NaN
+    current_value_eur: np.ndarray  # NaN = sin cantidad invertida informada
+    stored: Dict[str, list]  # OUTPUT_FIELDS tal como están ahora en la fila
+
+    @staticmethod
+    def from_rows(rows, configs: Dict[int, Any], current_values: Optional[Dict[tuple, float]] = None) -> "WatchlistFrame":
+        """
+        ``rows``: objetos con id, user_id, asset_id, INPUT_FIELDS, OUTPUT_FIELDS y
+        sector / industry / asset_price del activo. ``current_values``: {(user_id, asset_id): EUR}.
+        """
+        rows = list(rows)
+        columns = {k: [getattr(r, k) for r in rows] for k in ROW_KEYS}
+        return WatchlistFrame.from_columns(columns, configs, current_values)
+
+    @staticmethod
+    def from_columns(columns: Dict[str, list], configs: Dict[int, Any], current_values=None) -> "WatchlistFrame":
+        """Igual que ``from_rows`` con los datos ya en listas por columna (claves de ROW_KEYS)."""
+        current_values = current_values or {}
+        cols = {f: np.array(columns[f], dtype=np.float64) for f in INPUT_FIELDS}
+        price = np.array(columns["asset_price"], dtype=np.float64)
+        stored_price = np.array(columns["precio_actual"], dtype=np.float64)
+        cols["precio_actual"] = np.where(np.isnan(price), stored_price, price)
+
+        # El modo depende solo de (usuario, sector, industria): se resuelve una vez por par
+        mode_cache: Dict[tuple, str] = {}
+        modes = []
+        for key in zip(columns["user_id"], columns["sector"], columns["industry"]):
+            mode = mode_cache.get(key)
+            if mode is None:
+                asset = SimpleNamespace(sector=key[1], industry=key[2])
+                mode = mode_cache[key] = resolve_valuation_mode(asset, configs.get(key[0]))
+            modes.append(mode)
+
+        return WatchlistFrame(
+            ids=np.array(columns["id"], dtype=np.int64),
+            user_ids=np.array(columns["user_id"], dtype=np.int64),
+            modes=np.array(modes, dtype=object),
+            cols=cols,
+            current_value_eur=np.array(
+                [current_values.get(k) for k in zip(columns["user_id"], columns["asset_id"])], dtype=np.float64
+            ),
+            stored={f: list(columns[f]) for f in OUTPUT_FIELDS},
+        )
+
+
+# ---------------------------------------------------------------------------
+# Utilidades NumPy con la semántica exacta del camino escalar
+# ---------------------------------------------------------------------------
+
+def _has(x: np.ndarray) -> np.ndarray:
+    return ~np.isnan(x)
+
+
+def _pos(x: np.ndarray) -> np.ndarray:
+    return x > 0  # NaN → False, como ``x is not None and x > 0``
+
+
+def _pow(base: np.ndarray, exp: float) -> np.ndarray:
+    """``base ** exp`` elemento a elemento con el ``pow`` de libm (NaN se mantiene)."""
+    out = np.full(base.shape, np.nan)
+    ok = np.isfinite(base)
+    n = int(ok.sum())
+    if n:
+        out[ok] = np.fromiter(map(math.pow, base[ok].tolist(), repeat(exp)), dtype=np.float64, count=n)
+    return out
+
+
+def _round(x: np.ndarray, ndigits: int) -> np.ndarray:
+    """``round(x, ndigits)`` de Python: np.round salvo cerca de un empate .5."""
+    out = np.round(x, ndigits)
+    scaled = x * (10.0 ** ndigits)
+    frac = np.abs(scaled - np.floor(scaled) - 0.5)
+    near = np.isfinite(x) & (frac <= 1e-9 + 8 * np.finfo(np.float64).eps * np.abs(scaled))
+    for i in np.flatnonzero(near):
+        out[i] = round(float(x[i]), ndigits)
+    return out
+
+
+def _clamp(x: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    return np.maximum(lo, np.minimum(hi, x))
+
+
+def _steps(x: np.ndarray, conds, values, default: float) -> np.ndarray:
+    """Factor por tramos; sin dato (NaN) → 1,00."""
+    return np.select([np.isnan(x)] + conds, [1.0] + values, default)
+
+
+def _pegy_valoracion(per, div, g) -> np.ndarray:
+    """Valoración 12m PEGY con signo invertido (``calculate_valoracion_12m_from_g``)."""
+    denom = g + np.where(np.isnan(div), 0.0, div)
+    ok = _pos(per) & _has(g) & (denom != 0)
+    pegy = per / denom
+    return np.where(ok, _round(-((pegy - 1.0) * 100.0), 2), np.nan)
+
+
+def _blend_growth(rev, eps_g) -> np.ndarray:
+    return np.where(
+        _has(rev) & _has(eps_g), (rev + eps_g) / 2.0, np.where(_has(rev), rev, eps_g)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Modos de valoración: (valoracion_12m, target_bruto, factor_final, target_ajustado)
+# ---------------------------------------------------------------------------
+
+def _style_b_factor(c) -> np.ndarray:
+    eps = c["eps"]
+    fm, nim, legacy = c["fcf_margin_pct"], c["net_income_margin_pct"], c["fcf_to_net_income"]
+    use_ratio = _has(fm) & _has(nim) & (np.abs(nim) > 1e-9) & ~((fm < 0) & (nim < 0))
+    ratio = np.where(use_ratio, fm / nim, legacy)
+
+    nd = c["net_debt_to_ebitda"]
+    f_debt = _steps(nd, [nd <= 2.0, nd <= 3.0, nd <= 4.0, nd <= 5.0], [1.0, 0.98, 0.94, 0.88], 0.80)
+    f_fcf = _steps(
+        ratio,
+        [_pos(eps) & (ratio <= 0), ratio >= 0.90, ratio >= 0.75, ratio >= 0.50],
+        [0.85, 1.0, 0.97, 0.92],
+        0.85,
+    )
+    em, om = c["ebitda_margin_pct"], c["operating_margin_pct"]
+    fe = _steps(em, [em < 12, em < 18, em <= 28], [0.96, 0.99, 1.0], 1.02)
+    fo = _steps(om, [om < 8, om < 12, om <= 22], [0.95, 0.99, 1.0], 1.02)
+    f_margin = np.select(
+        [np.isnan(em) & np.isnan(om), np.isnan(em), np.isnan(om)], [1.0, fo, fe], np.sqrt(fe * fo)
+    )
+    roic = c["roic_pct"]
+    f_roic = _steps(roic, [roic < 6, roic < 9, roic < 12, roic < 18], [0.93, 0.97, 1.0, 1.02], 1.03)
+    return np.minimum(1.06, np.maximum(0.72, f_debt * f_fcf * f_margin * f_roic))
+
+
+def _general(c):
+    eps, per, per_fair = c["eps"], c["per_ntm"], c["per_fair"]
+    div, rev, price = c["ntm_dividend_yield"], c["cagr_revenue_yoy"], c["precio_actual"]
+    g = _blend_growth(rev, c["cagr_eps_yoy"])
+    loss = eps <= 0
+    profitable = _pos(eps) & _pos(per) & _has(g)
+
+    # EPS ≤ 0: PEGY con PER NTM (o fair) y blend; target por extrapolación sobre el precio
+    per_loss = np.where(_pos(per), per, np.where(_pos(per_fair), per_fair, np.nan))
+    v12 = np.select(
+        [loss, np.isnan(eps), profitable],
+        [_pegy_valoracion(per_loss, div, g), _pegy_valoracion(per, div, rev), _pegy_valoracion(per, div, g)],
+        np.nan,
+    )
+    base = 1.0 + v12 / 100.0
+    extrap = np.where(
+        loss & _pos(price) & _pos(base), _round(price * _pow(np.where(loss, base, np.nan), 5.0), 6), np.nan
+    )
+
+    # EPS > 0: EPS × (1+g)^5 × PER terminal, ajustado por F estilo B
+    per_t = np.where(_pos(per_fair), per_fair, per)
+    bruto = np.where(profitable, eps * _pow(np.where(profitable, 1.0 + g / 100.0, np.nan), 5.0) * per_t, np.nan)
+    f_final = np.where(profitable, _style_b_factor(c), np.nan)
+    adj = np.where(loss, extrap, bruto * f_final)
+    return v12, bruto, f_final, adj
+
+
+def _banks(c):
+    p0, pb, pb_fair = c["precio_actual"], c["price_to_book"], c["pb_fair"]
+    eps, per, div = c["eps"], c["per_ntm"], c["ntm_dividend_yield"]
+    core = _pos(p0) & _pos(pb)
+
+    bv = np.where(_pos(c["bvps"]), c["bvps"], p0 / pb)
+    p_fair = np.where(_pos(pb_fair), np.where(_pos(bv), bv * pb_fair, p0 * (pb_fair / pb)), np.nan)
+    v12 = np.where(core & _pos(p_fair), _round((p_fair / p0 - 1.0) * 100.0, 2), np.nan)
+
+    # Crecimiento BVPS: CAGR explícito o ROE × retención (payout vía yield × PER)
+    payout = np.where(_pos(eps) & _pos(per) & _has(div), (div / 100.0) * per, 0.0)
+    payout = np.maximum(0.0, np.minimum(1.0, payout))
+    roe = c["roe_pct"]
+    g_roe = np.where(_pos(eps), roe * (1.0 - payout), roe * 0.55)
+    g = _clamp(np.where(_has(c["bvps_cagr_yoy"]), c["bvps_cagr_yoy"], g_roe), -5.0, 12.0)
+    g = np.where(_has(c["bvps_cagr_yoy"]) | _has(roe), g, np.nan)
+
+    pb_t = np.where(_pos(pb_fair), pb_fair, np.where(_pos(pb), pb, np.nan))
+    ok = core & _has(g) & _pos(pb_t) & _pos(bv)
+    bruto = np.where(ok, bv * _pow(np.where(ok, 1.0 + g / 100.0, np.nan), 5.0) * pb_t, np.nan)
+
+    cet1, cti, nim = c["cet1_ratio_pct"], c["cost_to_income_pct"], c["nim_pct"]
+    npl, cor, ldr = c["npl_ratio_pct"], c["cost_of_risk_pct"], c["loan_to_deposit_pct"]
+    f_cet1 = _steps(cet1, [cet1 >= 14.0, cet1 >= 12.0, cet1 >= 10.0], [1.0, 0.98, 0.93], 0.86)
+    f_cti = _steps(cti, [cti <= 40.0, cti <= 55.0, cti <= 70.0], [1.02, 1.0, 0.96], 0.90)
+    f_nim = _steps(nim, [nim >= 5.5, nim >= 4.0, nim >= 3.0], [1.0, 0.98, 0.94], 0.88)
+    f_npl = _steps(npl, [npl <= 3.0, npl <= 5.0, npl <= 8.0, npl <= 12.0], [1.02, 1.0, 0.96, 0.90], 0.84)
+    f_cor = _steps(cor, [cor <= 1.0, cor <= 2.0, cor <= 3.5], [1.0, 0.97, 0.92], 0.85)
+    f_asset = np.where(np.isnan(npl) & np.isnan(cor), 1.0, np.sqrt(f_npl * f_cor))
+    f_ldr = _steps(ldr, [ldr <= 85.0, ldr <= 95.0, ldr <= 105.0], [1.0, 0.99, 0.94], 0.88)
+    f = np.minimum(1.06, np.maximum(0.72, f_cet1 * f_cti * f_nim * f_asset * f_ldr))
+    f_final = np.where(ok, f, np.nan)
+    return v12, bruto, f_final, bruto * f_final
+
+
+def _realestate(c):
+    p0, p_ffo = c["precio_actual"], c["price_to_ffo"]
+    flow = np.where(
+        _pos(c["affo_per_share"]), c["affo_per_share"],
+        np.where(_pos(c["ffo_per_share"]), c["ffo_per_share"], np.nan),
+    )
+    m_t = np.where(_pos(c["p_ffo_fair"]), c["p_ffo_fair"], np.where(_pos(p_ffo), p_ffo, np.nan))
+    core = _pos(p0) & _has(flow) & _pos(p_ffo)
+
+    p_fair = flow * m_t
+    v12 = np.where(core & _pos(p_fair), _round((p_fair / p0 - 1.0) * 100.0, 2), np.nan)
+
+    cf, ss = c["cagr_ffo_yoy"], c["same_store_growth_pct"]
+    g = np.select([_has(cf) & _has(ss), _has(cf)], [0.5 * cf + 0.5 * ss, cf], ss)
+    g = _clamp(g, -2.0, 7.0)
+    ok = core & _has(g)
+    bruto = np.where(ok, flow * _pow(np.where(ok, 1.0 + g / 100.0, np.nan), 5.0) * m_t, np.nan)
+
+    lev, cov_i, cov_d = c["reit_leverage_ratio"], c["ffo_interest_coverage"], c["ffo_to_total_debt"]
+    occ, walt = c["occupancy_pct"], c["walt_years"]
+    f_lev = _steps(lev, [lev <= 5.5, lev <= 7.0, lev <= 9.0], [1.0, 0.98, 0.94], 0.88)
+    f_ci = _steps(cov_i, [cov_i >= 4.5, cov_i >= 3.5, cov_i >= 2.5], [1.0, 0.98, 0.93], 0.85)
+    f_cd = _steps(cov_d, [cov_d >= 0.15, cov_d >= 0.11, cov_d >= 0.08], [1.0, 0.98, 0.94], 0.88)
+    f_occ = _steps(occ, [occ >= 98.0, occ >= 95.0, occ >= 90.0], [1.02, 1.0, 0.96], 0.88)
+    f_walt = _steps(walt, [walt < 5.0, walt < 7.0, walt <= 12.0, walt <= 15.0], [0.94, 0.97, 1.0, 1.01], 1.02)
+    f = np.minimum(1.06, np.maximum(0.72, f_lev * np.sqrt(f_ci * f_cd) * f_occ * f_walt))
+    f_final = np.where(ok, f, np.nan)
+    return v12, bruto, f_final, bruto * f_final
+
+
+_MODE_PIPELINES = {"general": _general, "banks": _banks, "realestate": _realestate}
+
+
+# ---------------------------------------------------------------------------
+# Tier, operativa y rentabilidades (dependen de la config de cada usuario)
+# ---------------------------------------------------------------------------
+
+def _tier(v12: np.ndarray, tier_ranges: Dict) -> np.ndarray:
+    """Tier 5..1 (NaN si ninguno), misma prioridad y bordes que ``calculate_tier``."""
+    tier = np.full(v12.shape, np.nan)
+    open_ = _has(v12)
+    for n in (5, 4, 3, 2, 1):
+        rng = tier_ranges.get(f"tier_{n}")
+        if f"tier_{n}" not in tier_ranges:
+            continue
+        lo, hi = rng.get("min"), rng.get("max")
+        if lo is not None and hi is not None and hi < lo:
+            continue
+        m = open_.copy()
+        if lo is not None:
+            m &= v12 >= lo
+        if hi is not None:
+            m &= v12 < hi
+        tier[m] = n
+        open_ &= ~m
+    return tier
+
+
+def _rule_condition(metric: np.ndarray, rule_config) -> Optional[np.ndarray]:
+    """Vector de ``_evaluate_rule_condition``: None si la regla no está definida."""
+    if not rule_config:
+        return None
+    op, value = rule_config.get("op"), rule_config.get("value")
+    if op is None or value is None:
+        return None
+    if op == "=":
+        res = metric == value
+    elif op == ">":
+        res = metric > value
+    elif op == "<":
+        res = metric < value
+    elif op == ">=":
+        res = metric >= value
+    elif op == "<=":
+        res = metric <= value
+    else:
+        return np.zeros(metric.shape, dtype=bool)
+    return _has(metric) & res
+
+
+def _rule(v12: np.ndarray, rent_anual: np.ndarray, operativa_rules: Dict, key: str) -> Optional[np.ndarray]:
+    cfg = operativa_rules.get(key) or {}
+    val_res = _rule_condition(v12, cfg.get("valoracion_12m"))
+    rent_res = _rule_condition(rent_anual, cfg.get("rentabilidad_anual"))
+    if val_res is None:
+        return rent_res
+    if rent_res is None:
+        return val_res
+    if (cfg.get("combiner") or "AND").upper() == "OR":
+        return val_res | rent_res
+    return val_res & rent_res
+
+
+def _apply_config(out: Dict[str, np.ndarray], rows: np.ndarray, frame: WatchlistFrame, config) -> None:
+    """Tier, cantidad, indicador y reglas BUY/SELL para las filas ``rows`` de un usuario."""
+    v12 = out["valoracion_12m"][rows]
+    cv = frame.current_value_eur[rows]
+    tier = _tier(v12, config.get_tier_ranges_dict())
+    out["tier"][rows] = tier
+
+    cantidad = np.array(frame.stored["cantidad_aumentar_reducir"], dtype=np.float64)[rows]
+    indicator = np.array(frame.stored["operativa_indicator"], dtype=object)[rows]
+
+    amounts = config.get_tier_amounts_dict()
+    by_tier = np.array(
+        [np.nan] + [amounts.get(f"tier_{n}") for n in range(1, 6)], dtype=np.float64
+    )
+    sized = _has(tier) & _has(cv)
+    amount = by_tier[np.where(sized, tier, 0).astype(np.int64)]
+    with_amount = sized & _has(amount)
+    diff = amount - cv
+    margin = amount * 0.25
+    cantidad = np.where(with_amount, diff, np.where(sized, cantidad, np.nan))
+    tier_indicator = np.select(
+        [amount <= 0, np.abs(diff) <= margin, diff > margin], ["-", "HOLD", "INCREASE"], "REDUCE"
+    ).astype(object)
+    indicator = np.where(with_amount, tier_indicator, indicator)
+    indicator[~sized & np.equal(indicator, None)] = "-"
+    out["cantidad_aumentar_reducir"][rows] = cantidad
+
+    # Reglas globales BUY / SELL (prevalecen); sin posición y sin BUY → '-'
+    has_position = cv > 0
+    color_thresholds = config.get_color_thresholds_dict()
+    rules = color_thresholds.get("operativa_rules", {}) if isinstance(color_thresholds, dict) else {}
+    buy = sell = np.zeros(rows.shape, dtype=bool)
+    if rules:
+        rent_anual = out["rentabilidad_anual"][rows]
+        buy_res = _rule(v12, rent_anual, rules, "buy")
+        sell_res = _rule(v12, rent_anual, rules, "sell")
+        if buy_res is not None:
+            buy = ~has_position & buy_res
+        if sell_res is not None:
+            sell = has_position & sell_res
+    indicator[~has_position] = "-"
+    indicator[buy] = "BUY"
+    indicator[sell] = "SELL"
+    out["operativa_indicator"][rows] = indicator
+
+
+def _rentabilidades(tp: np.ndarray, price: np.ndarray, div: np.ndarray):
+    ok = _has(tp) & _pos(price)
+    div_dec = np.where(np.isnan(div) | (div == 0), 0.0, div / 100.0)
+    gain = tp - price
+    rent_5yr = np.where(ok, (gain / price) * 100 + div_dec * 5 * 100, np.nan)
+
+    up = ok & (gain > 0)
+    annual_up = (_pow(np.where(up, tp / price, np.nan), 1.0 / 5.0) - 1.0) * 100
+    annual_down = (gain / price) / 5.0 * 100
+    rent_anual = np.where(ok, np.where(up, annual_up, annual_down) + div_dec * 100, np.nan)
+    return rent_5yr, rent_anual
+
+
+def compute_batch(frame: WatchlistFrame, configs: Dict[int, Any]) -> Dict[str, np.ndarray]:
+    """
+    Métricas de todas las filas del frame: {campo de OUTPUT_FIELDS: array}.
+    Floats con NaN para None; ``tier`` float con NaN; ``operativa_indicator`` array object.
+    """
+    n = len(frame.ids)
+    out = {f: np.full(n, np.nan) for f in _FLOAT_OUTPUTS}
+    out["tier"] = np.full(n, np.nan)
+    out["operativa_indicator"] = np.full(n, None, dtype=object)
+    out["precio_actual"] = frame.cols["precio_actual"]
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for mode, pipeline in _MODE_PIPELINES.items():
+            idx = np.flatnonzero(frame.modes == mode)
+            if not len(idx):
+                continue
+            v12, bruto, f_final, adj = pipeline({k: v[idx] for k, v in frame.cols.items()})
+            out["valoracion_12m"][idx] = v12
+            out["target_price_5yr_gross"][idx] = bruto
+            out["valuation_adjustment_factor"][idx] = np.where(_has(bruto), f_final, np.nan)
+            out["target_price_5yr"][idx] = adj
+
+        out["rentabilidad_5yr"], out["rentabilidad_anual"] = _rentabilidades(
+            out["target_price_5yr"], out["precio_actual"], frame.cols["ntm_dividend_yield"]
+        )
+
+        for user_id in np.unique(frame.user_ids).tolist():
+            _apply_config(out, np.flatnonzero(frame.user_ids == user_id), frame, configs[user_id])
+    return out
+
+
+def changed_rows(frame: WatchlistFrame, out: Dict[str, np.ndarray]) -> list[dict]:
+    """Parámetros del UPDATE por lotes: solo filas con algún campo distinto del guardado."""
+    values = {}
+    for f in OUTPUT_FIELDS:
+        if f == "operativa_indicator":
+            values[f] = out[f].tolist()
+        elif f == "tier":
+            values[f] = [None if math.isnan(t) else int(t) for t in out[f].tolist()]
+        else:
+            values[f] = [None if math.isnan(v) else v for v in out[f].tolist()]
+
+    params = []
+    for i, row_id in enumerate(frame.ids.tolist()):
+        row = {f: values[f][i] for f in OUTPUT_FIELDS}
+        if any(row[f] != frame.stored[f][i] for f in OUTPUT_FIELDS):
+            row["id"] = row_id
+            params.append(row)
+    return params
+
+
+# ---------------------------------------------------------------------------
+# Carga desde BD y escritura
+# ---------------------------------------------------------------------------
+
+def current_values_eur(user_id: int) -> Dict[int, float]:
+    """Valor actual en EUR por asset_id de las posiciones abiertas (agregando cuentas, como /watchlist)."""
+    from app.services.currency_service import convert_to_eur
+
+    grouped: Dict[int, list] = {}
+    rows = db.session.execute(
+        select(
+            PortfolioHolding.asset_id,
+            PortfolioHolding.quantity,
+            PortfolioHolding.total_cost,
+            Asset.current_price,
+            Asset.currency,
+        )
+        .join(Asset, Asset.id == PortfolioHolding.asset_id)
+        .where(PortfolioHolding.user_id == user_id, PortfolioHolding.quantity > 0)
+    )
+    for asset_id, quantity, total_cost, price, currency in rows:
+        g = grouped.setdefault(asset_id, [0, 0, price, currency])
+        g[0] += quantity
+        g[1] += total_cost
+    return {
+        asset_id: (
+            convert_to_eur(quantity * price, currency) if price else convert_to_eur(cost, currency)
+        )
+        for asset_id, (quantity, cost, price, currency) in grouped.items()
+    }
+
+
+def _load_columns(user_id: Optional[int], asset_ids=None) -> Dict[str, list]:
+    """Filas watchlist + sector / industria / precio del activo, traspuestas a listas por columna."""
+    stmt = (
+        select(
+            *(getattr(Watchlist, k) for k in ROW_KEYS[:-3]),
+            Asset.sector,
+            Asset.industry,
+            Asset.current_price.label("asset_price"),
+        )
+        .outerjoin(Asset, Asset.id == Watchlist.asset_id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(Watchlist.user_id == user_id)
+    if asset_ids is not None:
+        stmt = stmt.where(Watchlist.asset_id.in_(list(asset_ids)))
+    rows = db.session.execute(stmt).all()
+    return {k: list(col) for k, col in zip(ROW_KEYS, zip(*rows))}
+
+
+def recompute_watchlist_metrics(
+    user_id: Optional[int] = None,
+    current_values: Optional[Dict[int, float]] = None,
+    asset_ids=None,
+) -> int:
+    """
+    Recalcula las métricas de la watchlist de ``user_id`` (o de todos los usuarios) por lotes
+    y las escribe en un único UPDATE (sin commit). ``current_values``: {asset_id: EUR} del
+    usuario; si no se pasa, se calcula desde las posiciones. Devuelve las filas actualizadas.
+    """
+    from app.services.watchlist_service import WatchlistService
+
+    columns = _load_columns(user_id, asset_ids)
+    if not columns:
+        return 0
+    user_ids = sorted(set(columns["user_id"]))
+    configs = {
+        c.user_id: c for c in WatchlistConfig.query.filter(WatchlistConfig.user_id.in_(user_ids))
+    }
+    values: Dict[tuple, float] = {}
+    for uid in user_ids:
+        if uid not in configs:
+            configs[uid] = WatchlistService.get_or_create_config(uid)
+        per_asset = current_values if current_values is not None and uid == user_id else current_values_eur(uid)
+        values.update(((uid, asset_id), v) for asset_id, v in per_asset.items())
+
+    frame = WatchlistFrame.from_columns(columns, configs, values)
+    params = changed_rows(frame, compute_batch(frame, configs))
+    if params:
+        db.session.execute(update(Watchlist), params)
+    return len(params)
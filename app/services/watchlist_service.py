@@ -2,6 +2,7 @@
 Watchlist Service - Gestión de watchlist (CRUD básico)
 """
 from typing import List, Optional, Dict, Any
+from sqlalchemy.orm import selectinload
 from app import db
 from app.models import Watchlist, WatchlistConfig, Asset, User
 from datetime import datetime, date
@@ -22,9 +23,14 @@ class WatchlistService:
             user_id: ID del usuario
             
         Returns:
-            Lista de Watchlist items ordenados por created_at (más recientes primero)
+            Lista de Watchlist items ordenados por created_at (más recientes primero), con su asset cargado
         """
-        return Watchlist.query.filter_by(user_id=user_id).order_by(Watchlist.created_at.desc()).all()
+        return (
+            Watchlist.query.options(selectinload(Watchlist.asset))
+            .filter_by(user_id=user_id)
+            .order_by(Watchlist.created_at.desc())
+            .all()
+        )
     
     @staticmethod
     def get_watchlist_item(user_id: int, asset_id: int) -> Optional[Watchlist]:
@@ -0,0 +1,263 @@
+"""
+Renderizador de PDF con navegadores Chromium persistentes (Playwright).
+
+Lanzar Chromium por informe cuesta segundos y cientos de MB; aquí cada proceso mantiene un
+pool de PDF_RENDER_POOL_SIZE hilos, cada uno con su navegador y un contexto caliente (la API
+síncrona de Playwright solo se usa desde el hilo que la creó). Los trabajos entran por una cola
+acotada (PDF_RENDER_QUEUE_SIZE) y el llamador espera como mucho PDF_RENDER_TIMEOUT_SECONDS.
+
+Reciclado: un hilo cierra su navegador tras PDF_RENDER_MAX_RENDERS PDFs, si la memoria de los
+procesos hijos (driver + Chromium) supera PDF_RENDER_MAX_RSS_MB, tras un error de render o tras
+PDF_RENDER_IDLE_SECONDS sin trabajo; el siguiente trabajo lo relanza.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--font-render-hinting=none',
+]
+_PDF_OPTIONS = {
+    'format': 'A4',
+    'print_background': True,
+    'margin': {'top': '12mm', 'right': '12mm', 'bottom': '14mm', 'left': '12mm'},
+}
+
+_settings = {
+    'pool_size': 2,
+    'queue_size': 32,
+    'timeout': 180.0,
+    'max_renders': 50,
+    'max_rss_mb': 1024,
+    'idle': 300.0,
+}
+_lock = threading.Lock()
+_jobs: Optional[queue.Queue] = None
+_pool_pid: Optional[int] = None
+_STOP = object()
+
+
+class PdfRenderError(RuntimeError):
+    """El renderizador no pudo producir el PDF (cola llena, timeout o error de Chromium)."""
+
+
+class _Job:
+    __slots__ = ('html', 'deadline', 'future')
+
+    def __init__(self, html: str, deadline: float) -> None:
+        self.html = html
+        self.deadline = deadline
+        self.future: Future = Future()
+
+
+class _BrowserSlot:
+    """Navegador + contexto caliente de un hilo del pool."""
+
+    def __init__(self) -> None:
+        self._playwright = None
+        self._manager = None
+        self._browser = None
+        self._context = None
+        self.renders = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._context is not None
+
+    def open(self) -> None:
+        from playwright.sync_api import sync_playwright
+
+        self._manager = sync_playwright()
+        self._playwright = self._manager.start()
+        self._browser = self._playwright.chromium.launch(headless=True, args=_LAUNCH_ARGS)
+        self._context = self._browser.new_context()
+        self.renders = 0
+
+    def render(self, html: str, timeout_ms: int) -> bytes:
+        page = self._context.new_page()
+        try:
+            page.set_default_timeout(timeout_ms)
+            page.set_content(html, wait_until='load')
+            return page.pdf(**_PDF_OPTIONS)
+        finally:
+            page.close()
+
+    def close(self) -> None:
+        closers = []
+        if self._context is not None:
+            closers.append(self._context.close)
+        if self._browser is not None:
+            closers.append(self._browser.close)
+        if self._manager is not None:
+            closers.append(lambda: self._manager.__exit__(None, None, None))
+        for closer in closers:
+            try:
+                closer()
+            except Exception as e:
+                logger.debug('pdf_renderer: cierre de navegador: %s', e)
+        self._playwright = self._manager = self._browser = self._context = None
+        self.renders = 0
+
+
+# Punto de extensión para tests: fábrica del slot de cada hilo
+_slot_factory: Callable[[], _BrowserSlot] = _BrowserSlot
+
+
+def _children_rss_mb(root_pid: int) -> float:
+    """RSS (MB) de todos los descendientes de root_pid; 0 fuera de Linux."""
+    children: dict = {}
+    rss_kb: dict = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return 0.0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as fh:
+                ppid, rss = None, 0
+                for line in fh:
+                    if line.startswith('PPid:'):
+                        ppid = int(line.split()[1])
+                    elif line.startswith('VmRSS:'):
+                        rss = int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        pid = int(entry)
+        rss_kb[pid] = rss
+        children.setdefault(ppid, []).append(pid)
+    total, stack = 0, list(children.get(root_pid, ()))
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total / 1024.0
+
+
+def _should_recycle(slot: _BrowserSlot) -> bool:
+    if slot.renders >= _settings['max_renders']:
+        return True
+    limit = _settings['max_rss_mb']
+    return bool(limit) and _children_rss_mb(os.getpid()) > limit
+
+
+def _worker_loop(jobs: queue.Queue) -> None:
+    slot = _slot_factory()
+    try:
+        while True:
+            try:
+                job = jobs.get(timeout=_settings['idle'])
+            except queue.Empty:
+                if slot.is_open:
+                    logger.debug('pdf_renderer: navegador inactivo, se cierra')
+                    slot.close()
+                continue
+            if job is _STOP:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            remaining = job.deadline - time.monotonic()
+            if remaining <= 0:
+                job.future.set_exception(PdfRenderError('timeout en cola'))
+                continue
+            try:
+                if not slot.is_open:
+                    slot.open()
+                pdf = slot.render(job.html, int(remaining * 1000))
+            except Exception as e:
+                # Navegador posiblemente roto: el siguiente trabajo arranca uno limpio
+                slot.close()
+                job.future.set_exception(PdfRenderError(str(e)))
+                continue
+            slot.renders += 1
+            job.future.set_result(pdf)
+            if _should_recycle(slot):
+                logger.info('pdf_renderer: reciclando navegador tras %s PDFs', slot.renders)
+                slot.close()
+    finally:
+        slot.close()
+
+
+def _load_settings() -> None:
+    try:
+        from flask import current_app, has_app_context
+    except ImportError:
+        return
+    if not has_app_context():
+        return
+    config = current_app.config
+    _settings['pool_size'] = max(1, int(config.get('PDF_RENDER_POOL_SIZE', 2)))
+    _settings['queue_size'] = max(1, int(config.get('PDF_RENDER_QUEUE_SIZE', 32)))
+    _settings['timeout'] = float(config.get('PDF_RENDER_TIMEOUT_SECONDS', 180))
+    _settings['max_renders'] = max(1, int(config.get('PDF_RENDER_MAX_RENDERS', 50)))
+    _settings['max_rss_mb'] = int(config.get('PDF_RENDER_MAX_RSS_MB', 1024))
+    _settings['idle'] = float(config.get('PDF_RENDER_IDLE_SECONDS', 300))
+
+
+def _ensure_pool() -> queue.Queue:
+    """Arranca el pool (uno por proceso; tras fork el hijo arranca el suyo)."""
+    global _jobs, _pool_pid
+    pid = os.getpid()
+    if _pool_pid == pid and _jobs is not None:
+        return _jobs
+    with _lock:
+        if _pool_pid != pid or _jobs is None:
+            _load_settings()
+            jobs: queue.Queue = queue.Queue(maxsize=_settings['queue_size'])
+            for i in range(_settings['pool_size']):
+                threading.Thread(
+                    target=_worker_loop, args=(jobs,), name=f'pdf-renderer-{i}', daemon=True
+                ).start()
+            _jobs, _pool_pid = jobs, pid
+    return _jobs
+
+
+def render_pdf(html: str, timeout: Optional[float] = None) -> bytes:
+    """HTML completo → PDF en un navegador del pool. Lanza PdfRenderError si no se obtiene."""
+    jobs = _ensure_pool()
+    timeout = _settings['timeout'] if timeout is None else timeout
+    job = _Job(html, time.monotonic() + timeout)
+    try:
+        jobs.put_nowait(job)
+    except queue.Full:
+        raise PdfRenderError('cola de PDFs llena')
+    try:
+        return job.future.result(timeout=timeout)
+    except FutureTimeout:
+        job.future.cancel()
+        raise PdfRenderError(f'timeout tras {timeout:.0f}s')
+
+
+def shutdown_pdf_renderer(wait: float = 10.0) -> None:
+    """Para los hilos del pool y cierra sus navegadores (al salir del proceso)."""
+    global _jobs, _pool_pid
+    with _lock:
+        jobs, pid = _jobs, _pool_pid
+        _jobs = _pool_pid = None
+    if jobs is None or pid != os.getpid():
+        return
+    workers = [t for t in threading.enumerate() if t.name.startswith('pdf-renderer-')]
+    for _ in workers:
+        try:
+            jobs.put(_STOP, timeout=1)
+        except queue.Full:
+            break
+    deadline = time.monotonic() + wait
+    for t in workers:
+        t.join(max(0.0, deadline - time.monotonic()))
+
+
+atexit.register(shutdown_pdf_renderer)
@@ -0,0 +1,119 @@
+"""
+Presupuesto de sentencias SQL por petición (detector de N+1).
+
+Un listener ``before_cursor_execute`` cuenta las sentencias que ejecuta cada hilo mientras hay
+un contador activo. Cada petición abre uno; al terminar, si supera su presupuesto:
+- ``QUERY_BUDGET_STRICT`` (tests) → ``QueryBudgetExceeded`` y la petición falla.
+- si no → warning en el log ``followup.perf`` con endpoint y número de sentencias.
+
+Presupuesto por vista con ``@query_budget(n)``; el resto usa ``QUERY_BUDGET_PER_REQUEST``
+(0 = sin límite).
+
+Uso en tests:
+    with count_statements() as stmts:
+        client.get('/portfolio/holdings')
+    assert stmts.count <= 12
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger("followup.perf")
+
+_local = threading.local()
+_listener_registered = False
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Una petición ejecutó más sentencias SQL que su presupuesto."""
+
+
+class StatementCounter:
+    __slots__ = ("count",)
+
+    def __init__(self) -> None:
+        self.count = 0
+
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _on_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    for counter in getattr(_local, "stack", ()):
+        counter.count += 1
+
+
+def _register_listener() -> None:
+    global _listener_registered
+    if _listener_registered:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, "before_cursor_execute", _on_cursor_execute)
+    _listener_registered = True
+
+
+@contextmanager
+def count_statements() -> Iterator[StatementCounter]:
+    """Cuenta las sentencias SQL ejecutadas en este hilo dentro del bloque."""
+    _register_listener()
+    counter = StatementCounter()
+    stack = _stack()
+    stack.append(counter)
+    try:
+        yield counter
+    finally:
+        stack.remove(counter)
+
+
+def query_budget(limit: int):
+    """Decorador de vista: máximo de sentencias SQL por petición (aplicar debajo de @login_required)."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def register_query_budget(app) -> None:
+    """Abre un contador por petición y comprueba el presupuesto de la vista al responder."""
+    from flask import g, request
+
+    _register_listener()
+
+    @app.before_request
+    def _start_query_budget():
+        counter = StatementCounter()
+        _stack().append(counter)
+        g._query_budget_counter = counter
+
+    @app.after_request
+    def _check_query_budget(response):
+        counter = g.pop("_query_budget_counter", None)
+        if counter is None:
+            return response
+        _stack().remove(counter)
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, "query_budget", None) or app.config.get("QUERY_BUDGET_PER_REQUEST", 0)
+        if limit and counter.count > limit:
+            message = (
+                f"[query-budget] endpoint={request.endpoint} path={request.path} "
+                f"statements={counter.count} budget={limit}"
+            )
+            if app.config.get("QUERY_BUDGET_STRICT"):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    @app.teardown_request
+    def _drop_query_budget(exc):
+        counter = g.pop("_query_budget_counter", None)
+        if counter is not None and counter in _stack():
+            _stack().remove(counter)
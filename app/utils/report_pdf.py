@@ -210,6 +210,7 @@ def markdown_report_to_pdf_bytes(
 ) -> Optional[bytes]:
     """
     Renderiza el informe como PDF vía Playwright/Chromium (impresión con fondos y CSS como la web).
+    Usa los navegadores persistentes de app.utils.pdf_renderer (sin lanzar Chromium por informe).
     """
     md = full_md or ''
     if not md.strip():
@@ -218,39 +219,16 @@ def markdown_report_to_pdf_bytes(
     os.environ.setdefault('PLAYWRIGHT_BROWSERS_PATH', '0')
     html_doc = build_report_pdf_html(md, document_title=document_title, subtitle=subtitle)
     try:
-        from playwright.sync_api import sync_playwright
+        import playwright.sync_api  # noqa: F401
     except ImportError:
         logger.warning('markdown_report_to_pdf_bytes: Playwright no instalado')
         return None
 
+    from app.utils.pdf_renderer import PdfRenderError, render_pdf
+
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--font-render-hinting=none',
-                ],
-            )
-            try:
-                page = browser.new_page()
-                page.set_default_timeout(180_000)
-                page.set_content(html_doc, wait_until='load')
-                pdf_bytes = page.pdf(
-                    format='A4',
-                    print_background=True,
-                    margin={
-                        'top': '12mm',
-                        'right': '12mm',
-                        'bottom': '14mm',
-                        'left': '12mm',
-                    },
-                )
-                return pdf_bytes if pdf_bytes else None
-            finally:
-                browser.close()
-    except Exception as e:
+        pdf_bytes = render_pdf(html_doc)
+    except PdfRenderError as e:
         logger.warning('markdown_report_to_pdf_bytes: %s', e)
         return None
+    return pdf_bytes if pdf_bytes else None
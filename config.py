@@ -64,6 +64,46 @@ class Config:
     LOG_FILE = os.environ.get('LOG_FILE') or str(basedir / 'logs' / 'followup.log')
     # Cache del resumen del dashboard (minutos). Se invalida antes si hay cambios en datos.
     DASHBOARD_CACHE_MINUTES = int(os.environ.get('DASHBOARD_CACHE_MINUTES', 15))
+    # Polling /dashboard/state: segundos máximos sin recalcular NOW aunque no cambien precios/FX
+    DASHBOARD_NOW_MAX_AGE_SECONDS = int(os.environ.get('DASHBOARD_NOW_MAX_AGE_SECONDS', 300))
+    # Tipos de cambio históricos: CSV (date,currency,rate_to_eur) para uso sin red
+    FX_RATES_FALLBACK_FILE = os.environ.get('FX_RATES_FALLBACK_FILE') or str(basedir / 'instance' / 'fx_rates_fallback.csv')
+    # Frames columnares de transacciones cacheados por proceso (usuarios; 0 = solo por petición)
+    TRANSACTION_FRAME_CACHE_SIZE = int(os.environ.get('TRANSACTION_FRAME_CACHE_SIZE', 32))
+    # Caché en memoria (por proceso) de los JSON de dashboard/evolution/benchmarks/métricas (MB; 0 = desactivada)
+    JSON_CACHE_LRU_MAX_MB = int(os.environ.get('JSON_CACHE_LRU_MAX_MB', 64))
+    # Cron price-poll-one: tickers por tick, antigüedad objetivo (s) y vida de la cola cacheada (s)
+    PRICE_POLL_BATCH_SIZE = int(os.environ.get('PRICE_POLL_BATCH_SIZE', 40))
+    PRICE_POLL_HELD_MAX_AGE = int(os.environ.get('PRICE_POLL_HELD_MAX_AGE', 180))
+    PRICE_POLL_OTHER_MAX_AGE = int(os.environ.get('PRICE_POLL_OTHER_MAX_AGE', 900))
+    PRICE_POLL_QUEUE_TTL = int(os.environ.get('PRICE_POLL_QUEUE_TTL', 600))
+    # Importación de varios CSV a la vez: procesos para el parseo en paralelo (0 = núcleos disponibles)
+    IMPORT_PARSE_WORKERS = int(os.environ.get('IMPORT_PARSE_WORKERS', 0))
+    # Worker de rebuild de cachés: procesos del pool (0 = núcleos, 1 = en línea) y espera con la cola vacía (s)
+    CACHE_REBUILD_WORKERS = int(os.environ.get('CACHE_REBUILD_WORKERS', 2))
+    CACHE_REBUILD_IDLE_SECONDS = int(os.environ.get('CACHE_REBUILD_IDLE_SECONDS', 2))
+    # Cola de rebuild: ventana de sesión abierta, claim abandonado y reintento tras fallo (s)
+    CACHE_REBUILD_ACTIVE_SECONDS = int(os.environ.get('CACHE_REBUILD_ACTIVE_SECONDS', 300))
+    CACHE_REBUILD_CLAIM_TIMEOUT = int(os.environ.get('CACHE_REBUILD_CLAIM_TIMEOUT', 900))
+    CACHE_REBUILD_RETRY_SECONDS = int(os.environ.get('CACHE_REBUILD_RETRY_SECONDS', 30))
+    # Log de llamadas a APIs: tamaño del buffer en memoria, lote y segundos entre escrituras
+    API_LOG_BUFFER_SIZE = int(os.environ.get('API_LOG_BUFFER_SIZE', 10000))
+    API_LOG_BATCH_SIZE = int(os.environ.get('API_LOG_BATCH_SIZE', 200))
+    API_LOG_FLUSH_SECONDS = int(os.environ.get('API_LOG_FLUSH_SECONDS', 5))
+    # Días que se conservan las filas crudas de api_call_log (el rollup diario se guarda 6 meses)
+    API_LOG_RAW_RETENTION_DAYS = int(os.environ.get('API_LOG_RAW_RETENTION_DAYS', 31))
+    # Sentencias SQL por petición en vistas sin @query_budget (0 = sin límite); superarlo deja un
+    # warning en el log, o falla la petición con QUERY_BUDGET_STRICT (tests)
+    QUERY_BUDGET_PER_REQUEST = int(os.environ.get('QUERY_BUDGET_PER_REQUEST', 0))
+    QUERY_BUDGET_STRICT = False
+    # PDF de informes: navegadores Chromium persistentes por proceso, cola de trabajos, timeout
+    # por PDF y reciclado del navegador tras N PDFs, por memoria (MB, 0 = sin límite) o inactividad
+    PDF_RENDER_POOL_SIZE = int(os.environ.get('PDF_RENDER_POOL_SIZE', 2))
+    PDF_RENDER_QUEUE_SIZE = int(os.environ.get('PDF_RENDER_QUEUE_SIZE', 32))
+    PDF_RENDER_TIMEOUT_SECONDS = int(os.environ.get('PDF_RENDER_TIMEOUT_SECONDS', 180))
+    PDF_RENDER_MAX_RENDERS = int(os.environ.get('PDF_RENDER_MAX_RENDERS', 50))
+    PDF_RENDER_MAX_RSS_MB = int(os.environ.get('PDF_RENDER_MAX_RSS_MB', 1024))
+    PDF_RENDER_IDLE_SECONDS = int(os.environ.get('PDF_RENDER_IDLE_SECONDS', 300))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
     # Allowed extensions
@@ -97,6 +137,7 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    QUERY_BUDGET_STRICT = True
 
 
 # Diccionario de configuraciones
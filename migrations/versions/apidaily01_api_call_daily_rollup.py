@@ -0,0 +1,46 @@
+"""api_call_daily: rollup diario de api_call_log (llamadas y errores por API y clase de status)
+
+Revision ID: apidaily01
+Revises: bmkpoints01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "apidaily01"
+down_revision = "bmkpoints01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "api_call_daily",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("api_name", sa.String(length=50), nullable=False),
+        sa.Column("status_class", sa.String(length=8), nullable=False),
+        sa.Column("calls", sa.Integer(), nullable=False),
+        sa.Column("errors", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("day", "api_name", "status_class"),
+    )
+
+    # Histórico ya registrado: mismo agrupado que mantiene el flush del buffer
+    op.execute(
+        """
+        INSERT INTO api_call_daily (day, api_name, status_class, calls, errors)
+        SELECT date(called_at),
+               api_name,
+               CASE WHEN response_status IS NULL THEN 'none'
+                    ELSE CAST(response_status / 100 AS TEXT) || 'xx' END,
+               COUNT(*),
+               SUM(CASE WHEN response_status = 200 THEN 0 ELSE 1 END)
+        FROM api_call_log
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("api_call_daily")
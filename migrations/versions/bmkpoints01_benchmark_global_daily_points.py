@@ -0,0 +1,80 @@
+"""benchmark_global_daily: cierres en tabla (benchmark, día) en lugar de lista JSON
+
+Revision ID: bmkpoints01
+Revises: rebuildq01
+Create Date: 2026-10-18
+
+"""
+import json
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "bmkpoints01"
+down_revision = "rebuildq01"
+branch_labels = None
+depends_on = None
+
+
+def _load_points(raw):
+    if raw is None:
+        return []
+    return json.loads(raw) if isinstance(raw, str) else raw
+
+
+def upgrade():
+    op.create_table(
+        "benchmark_global_daily_point",
+        sa.Column("benchmark_name", sa.String(length=128), nullable=False),
+        sa.Column("day", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("close", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("benchmark_name", "day"),
+    )
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT benchmark_name, data_points FROM benchmark_global_daily")).fetchall()
+    for name, raw in rows:
+        by_day = {}
+        for p in _load_points(raw):
+            d, price = p.get("date"), p.get("price")
+            if not d or price is None:
+                continue
+            by_day[datetime.strptime(str(d)[:10], "%Y-%m-%d").date().toordinal()] = float(price)
+        if by_day:
+            conn.execute(
+                sa.text(
+                    "INSERT INTO benchmark_global_daily_point (benchmark_name, day, close) "
+                    "VALUES (:name, :day, :close)"
+                ),
+                [{"name": name, "day": day, "close": close} for day, close in sorted(by_day.items())],
+            )
+
+    with op.batch_alter_table("benchmark_global_daily", schema=None) as batch_op:
+        batch_op.drop_column("data_points")
+
+
+def downgrade():
+    with op.batch_alter_table("benchmark_global_daily", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("data_points", sa.JSON(), nullable=False, server_default="[]"))
+
+    conn = op.get_bind()
+    names = [r[0] for r in conn.execute(sa.text("SELECT benchmark_name FROM benchmark_global_daily")).fetchall()]
+    for name in names:
+        points = [
+            {"date": date.fromordinal(day).strftime("%Y-%m-%d"), "price": close}
+            for day, close in conn.execute(
+                sa.text(
+                    "SELECT day, close FROM benchmark_global_daily_point "
+                    "WHERE benchmark_name = :name ORDER BY day"
+                ),
+                {"name": name},
+            )
+        ]
+        conn.execute(
+            sa.text("UPDATE benchmark_global_daily SET data_points = :pts WHERE benchmark_name = :name"),
+            {"pts": json.dumps(points), "name": name},
+        )
+
+    op.drop_table("benchmark_global_daily_point")
@@ -0,0 +1,44 @@
+"""add fifo_checkpoints (estado FIFO persistido a fin de mes)
+
+Revision ID: fifockpt01
+Revises: wluserpricetgt01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "fifockpt01"
+down_revision = "wluserpricetgt01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "fifo_checkpoints",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.Column("as_of", sa.Date(), nullable=False),
+        sa.Column("state", sa.JSON(), nullable=False),
+        sa.Column("txn_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["account_id"], ["broker_accounts.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_fifo_checkpoints_user_id"), "fifo_checkpoints", ["user_id"], unique=False)
+    op.create_index(
+        "ix_fifo_checkpoints_scope_as_of",
+        "fifo_checkpoints",
+        ["user_id", "account_id", "as_of"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_fifo_checkpoints_scope_as_of", table_name="fifo_checkpoints")
+    op.drop_index(op.f("ix_fifo_checkpoints_user_id"), table_name="fifo_checkpoints")
+    op.drop_table("fifo_checkpoints")
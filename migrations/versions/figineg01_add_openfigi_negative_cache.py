@@ -0,0 +1,33 @@
+"""add openfigi_negative_cache (ISINs no encontrados en OpenFIGI, con caducidad)
+
+Revision ID: figineg01
+Revises: monthrollup01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "figineg01"
+down_revision = "monthrollup01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "openfigi_negative_cache",
+        sa.Column("isin", sa.String(length=12), nullable=False),
+        sa.Column("reason", sa.String(length=200), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("failed_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("isin"),
+    )
+    op.create_index(op.f("ix_openfigi_negative_cache_expires_at"), "openfigi_negative_cache", ["expires_at"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_openfigi_negative_cache_expires_at"), table_name="openfigi_negative_cache")
+    op.drop_table("openfigi_negative_cache")
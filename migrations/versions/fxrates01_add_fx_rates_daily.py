@@ -0,0 +1,31 @@
+"""add fx_rates_daily (tipos de cambio históricos a EUR)
+
+Revision ID: fxrates01
+Revises: fifockpt01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "fxrates01"
+down_revision = "fifockpt01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "fx_rates_daily",
+        sa.Column("currency", sa.String(length=8), nullable=False),
+        sa.Column("rate_date", sa.Date(), nullable=False),
+        sa.Column("rate_to_eur", sa.Float(), nullable=False),
+        sa.Column("source", sa.String(length=16), nullable=False, server_default="ecb"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("currency", "rate_date"),
+    )
+
+
+def downgrade():
+    op.drop_table("fx_rates_daily")
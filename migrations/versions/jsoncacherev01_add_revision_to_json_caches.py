@@ -0,0 +1,36 @@
+"""add revision to JSON cache tables (caché en memoria por proceso)
+
+Revision ID: jsoncacherev01
+Revises: pollqueue01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "jsoncacherev01"
+down_revision = "pollqueue01"
+branch_labels = None
+depends_on = None
+
+_TABLES = (
+    "dashboard_summary_cache",
+    "portfolio_evolution_cache",
+    "portfolio_benchmarks_cache",
+    "metrics_cache",
+)
+
+
+def upgrade():
+    for table in _TABLES:
+        op.add_column(
+            table,
+            sa.Column("revision", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        )
+
+
+def downgrade():
+    for table in _TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("revision")
@@ -0,0 +1,42 @@
+"""add monthly_rollups (agregados mensuales de ingresos, gastos, saldos y broker)
+
+Revision ID: monthrollup01
+Revises: jsoncacherev01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "monthrollup01"
+down_revision = "jsoncacherev01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "monthly_rollups",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("month", sa.Integer(), nullable=False),
+        sa.Column("income_by_category", sa.JSON(), nullable=False),
+        sa.Column("expense_by_category", sa.JSON(), nullable=False),
+        sa.Column("bank_cash", sa.Float(), nullable=False, server_default=sa.text("0")),
+        sa.Column("has_bank_balance", sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column("broker_withdrawals", sa.JSON(), nullable=False),
+        sa.Column("broker_deposits", sa.JSON(), nullable=False),
+        sa.Column("include_adjustment", sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "year", "month", name="uq_monthly_rollup_user_ym"),
+    )
+    op.create_index(op.f("ix_monthly_rollups_user_id"), "monthly_rollups", ["user_id"], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f("ix_monthly_rollups_user_id"), table_name="monthly_rollups")
+    op.drop_table("monthly_rollups")
@@ -0,0 +1,26 @@
+"""add queue cache to price_polling_state
+
+Revision ID: pollqueue01
+Revises: ledgerver01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "pollqueue01"
+down_revision = "ledgerver01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("price_polling_state", sa.Column("queue", sa.JSON(), nullable=True))
+    op.add_column("price_polling_state", sa.Column("queue_built_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("price_polling_state") as batch_op:
+        batch_op.drop_column("queue_built_at")
+        batch_op.drop_column("queue")
@@ -0,0 +1,48 @@
+"""cache_rebuild_state: columnas de cola (prioridad, claim, reintento y métricas)
+
+Revision ID: rebuildq01
+Revises: txnassetidx01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "rebuildq01"
+down_revision = "txnassetidx01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("cache_rebuild_state", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("requested_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("last_seen_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("claimed_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("claimed_action", sa.String(length=8), nullable=True))
+        batch_op.add_column(sa.Column("not_before", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("last_finished_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("last_wait_ms", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("last_run_ms", sa.Integer(), nullable=True))
+
+    # Pendientes de antes de la cola: su última marca como hora de petición
+    op.execute(
+        """
+        UPDATE cache_rebuild_state
+        SET requested_at = updated_at
+        WHERE pending_full_history = 1 OR pending_now = 1
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("cache_rebuild_state", schema=None) as batch_op:
+        batch_op.drop_column("last_run_ms")
+        batch_op.drop_column("last_wait_ms")
+        batch_op.drop_column("last_finished_at")
+        batch_op.drop_column("not_before")
+        batch_op.drop_column("claimed_action")
+        batch_op.drop_column("claimed_at")
+        batch_op.drop_column("last_seen_at")
+        batch_op.drop_column("requested_at")
@@ -0,0 +1,27 @@
+"""add ix_transactions_account_asset_date (recálculo de holdings por activo)
+
+Revision ID: txnassetidx01
+Revises: figineg01
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "txnassetidx01"
+down_revision = "figineg01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_transactions_account_asset_date",
+        "transactions",
+        ["account_id", "asset_id", "transaction_date"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_transactions_account_asset_date", table_name="transactions")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: FIFOCalculator (Decimal) vs FloatFIFOCalculator (float64 + __slots__).
+
+Genera un ledger sintético de compras/ventas repartido entre varios activos, lo replaya con
+ambos motores y muestra tiempos, speedup y la diferencia máxima de cantidad/coste/P&L.
+
+Uso:
+  python3 scripts/bench_fifo_engines.py
+  python3 scripts/bench_fifo_engines.py --trades 50000 --assets 40 --epsilon 1e-9
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services.fifo_calculator import FIFOCalculator, FloatFIFOCalculator  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark de motores FIFO")
+    p.add_argument("--trades", type=int, default=50_000, help="Número de operaciones BUY/SELL")
+    p.add_argument("--assets", type=int, default=40, help="Número de activos distintos")
+    p.add_argument("--epsilon", type=float, default=FloatFIFOCalculator.EPSILON, help="Epsilon del motor float")
+    p.add_argument("--seed", type=int, default=42)
+    return p.parse_args()
+
+
+def synthetic_ledger(n_trades: int, n_assets: int, seed: int) -> List[Tuple]:
+    """(asset_id, tipo, fecha, cantidad, precio, coste_total) en orden cronológico."""
+    rnd = random.Random(seed)
+    held: Dict[int, float] = {}
+    ts = datetime(2015, 1, 1)
+    ledger = []
+    for _ in range(n_trades):
+        ts += timedelta(minutes=rnd.randint(10, 600))
+        asset_id = rnd.randrange(n_assets)
+        price = round(rnd.uniform(1, 500), 4)
+        qty = round(rnd.uniform(0.01, 100), rnd.choice((0, 2, 6)))
+        if held.get(asset_id, 0) > 0 and rnd.random() < 0.45:
+            qty = min(qty, held[asset_id]) if rnd.random() < 0.95 else qty  # algún oversell
+            held[asset_id] -= qty
+            ledger.append((asset_id, "SELL", ts, qty, price, 0.0))
+        else:
+            held[asset_id] = held.get(asset_id, 0) + qty
+            ledger.append((asset_id, "BUY", ts, qty, price, qty * price + rnd.uniform(0, 5)))
+    return ledger
+
+
+def replay(engine, ledger: List[Tuple], **kwargs):
+    calculators = {}
+    realized_cost = 0.0
+    for asset_id, txn_type, ts, qty, price, total_cost in ledger:
+        calc = calculators.get(asset_id)
+        if calc is None:
+            calc = calculators[asset_id] = engine(symbol=f"Asset_{asset_id}", **kwargs)
+        if txn_type == "BUY":
+            calc.add_buy(quantity=qty, price=price, date=ts, total_cost=total_cost)
+        else:
+            realized_cost += float(calc.add_sell(quantity=qty, date=ts))
+    positions = {a: c.get_current_position() for a, c in calculators.items()}
+    return positions, realized_cost
+
+
+def main() -> int:
+    args = parse_args()
+    ledger = synthetic_ledger(args.trades, args.assets, args.seed)
+
+    timings = {}
+    results = {}
+    for name, engine, kwargs in (
+        ("decimal", FIFOCalculator, {}),
+        ("float", FloatFIFOCalculator, {"epsilon": args.epsilon}),
+    ):
+        with contextlib.redirect_stdout(io.StringIO()):  # silenciar avisos de oversell
+            t0 = time.perf_counter()
+            results[name] = replay(engine, ledger, **kwargs)
+            timings[name] = time.perf_counter() - t0
+
+    (dec_pos, dec_cost), (flt_pos, flt_cost) = results["decimal"], results["float"]
+    max_qty = max(abs(dec_pos[a]["quantity"] - flt_pos[a]["quantity"]) for a in dec_pos)
+    max_cost = max(abs(dec_pos[a]["total_cost"] - flt_pos[a]["total_cost"]) for a in dec_pos)
+
+    print(f"Ledger sintético: {len(ledger)} operaciones, {args.assets} activos")
+    print(f"  decimal: {timings['decimal'] * 1000:9.1f} ms")
+    print(f"  float:   {timings['float'] * 1000:9.1f} ms  (x{timings['decimal'] / timings['float']:.1f})")
+    print(f"  Δ cantidad máx: {max_qty:.3e}  Δ coste máx: {max_cost:.3e}  "
+          f"Δ coste vendido: {abs(dec_cost - flt_cost):.3e} (sobre {dec_cost:,.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -98,7 +98,7 @@ fi
 echo ""
 echo "-- SQLite (si existe instance/followup.db)"
 if [[ -f "$DB_PATH" ]]; then
-  for tbl in benchmark_global_quote benchmark_global_daily benchmark_global_state; do
+  for tbl in benchmark_global_quote benchmark_global_daily benchmark_global_daily_point benchmark_global_state; do
     if sqlite3 "$DB_PATH" ".tables" 2>/dev/null | grep -qw "$tbl"; then
       ok "tabla $tbl"
     else
@@ -121,7 +121,7 @@ from app import create_app
 from app import db
 from app.models.user import User
 from app.models.benchmark_global_quote import BenchmarkGlobalQuote
-from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalState
+from app.models.benchmark_global_daily import BenchmarkGlobalDaily, BenchmarkGlobalDailyPoint, BenchmarkGlobalState
 from app.services.price_polling_service import build_poll_queue
 from app.services.metrics.benchmark_comparison import BENCHMARKS
 from app.services.portfolio_benchmarks_cache import (
@@ -155,8 +155,9 @@ with app.app_context():
         pass
     nq = BenchmarkGlobalQuote.query.count()
     nd = BenchmarkGlobalDaily.query.count()
+    npts = BenchmarkGlobalDailyPoint.query.count()
     bgv = db.session.get(BenchmarkGlobalState, 1)
-    print(f"OK queue assets={n_assets} bench={n_bench} quotes_rows={nq} daily_rows={nd} state_ver={bgv.daily_data_version if bgv else None}")
+    print(f"OK queue assets={n_assets} bench={n_bench} quotes_rows={nq} daily_rows={nd} daily_points={npts} state_ver={bgv.daily_data_version if bgv else None}")
 PY
   then
     ok "build_poll_queue, get_market_indices_snapshot, get_comparison_state"
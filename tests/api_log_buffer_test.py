@@ -0,0 +1,72 @@
+"""Tests unitarios: buffer de log de llamadas a APIs (descarte acotado, escritura en lote y rollup)."""
+import os
+from contextlib import contextmanager
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from app.services import api_log_service as api_log
+
+
+class _FakeEngine:
+    def __init__(self):
+        self.batches = []
+
+    @contextmanager
+    def begin(self):
+        yield SimpleNamespace(execute=self._execute)
+
+    def _execute(self, stmt, rows=None):
+        if rows is not None:
+            self.batches.append(list(rows))
+        return SimpleNamespace(rowcount=1)
+
+
+def _setup(monkeypatch, capacity=3, batch_size=100):
+    engine = _FakeEngine()
+    monkeypatch.setattr(api_log, "db", SimpleNamespace(engine=engine))
+    monkeypatch.setattr(api_log, "_flusher_pid", os.getpid())
+    monkeypatch.setitem(api_log._settings, "capacity", capacity)
+    monkeypatch.setitem(api_log._settings, "batch_size", batch_size)
+    api_log._buffer.clear()
+    return engine
+
+
+def test_full_buffer_drops_oldest_and_flushes_in_one_batch(monkeypatch):
+    engine = _setup(monkeypatch, capacity=3)
+
+    for i in range(5):
+        api_log.log_api_call("yahoo_chart", f"url-{i}", 200)
+
+    assert api_log._dropped == 2
+    assert api_log.flush_api_log_buffer() == 3
+    assert [row["endpoint_or_operation"] for row in engine.batches[0]] == ["url-2", "url-3", "url-4"]
+    assert api_log._dropped == 0 and not api_log._buffer
+
+
+def test_batch_size_wakes_flusher(monkeypatch):
+    _setup(monkeypatch, batch_size=2)
+    api_log._wake.clear()
+
+    api_log.log_api_calls([("yahoo_quote", "a", {"ticker": "X"})])
+    assert not api_log._wake.is_set()
+    api_log.log_api_calls([("yahoo_quote", "b", None)], user_id=7)
+    assert api_log._wake.is_set()
+    assert api_log._buffer[-1][1]["user_id"] == 7
+    api_log._buffer.clear()
+
+
+def test_rollup_counts_group_by_day_api_and_status_class():
+    def row(api, status, hour):
+        return {"api_name": api, "response_status": status, "called_at": datetime(2026, 5, 10, hour)}
+
+    counts = api_log._rollup_counts([
+        row("yahoo_chart", 200, 9), row("yahoo_chart", 200, 23), row("yahoo_chart", 404, 10),
+        row("yahoo_chart", 429, 11), row("exchangerate", None, 12),
+    ])
+
+    day = date(2026, 5, 10)
+    assert counts == {
+        (day, "yahoo_chart", "2xx"): [2, 0],
+        (day, "yahoo_chart", "4xx"): [2, 2],
+        (day, "exchangerate", "none"): [1, 1],
+    }
@@ -0,0 +1,89 @@
+"""Tests unitarios: importación por lotes (parseo paralelo y dedupe entre archivos)."""
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import importer_v2
+from app.services.batch_import_service import BatchImportService
+from app.services.importer_v2 import CSVImporterV2
+
+
+def _importer(monkeypatch, inserted):
+    monkeypatch.setattr(importer_v2, "db", SimpleNamespace(session=SimpleNamespace(
+        commit=lambda: None,
+        rollback=lambda: None,
+    )))
+    importer = CSVImporterV2.__new__(CSVImporterV2)
+    importer.user_id = 3
+    importer.broker_account_id = 9
+    importer.stats = {"fees_created": 0, "transactions_created": 0, "dividends_created": 0,
+                      "deposits_created": 0, "withdrawals_created": 0, "deposits_skipped": []}
+    importer.existing_transactions_snapshot = set()
+    importer.pending_rows = []
+    importer.asset_ids = {}
+    importer.asset_cache = {}
+    importer._create_transaction_snapshot = lambda: None
+    importer._resolve_assets = lambda data, progress_callback=None: None
+    importer._finish_import = lambda: importer.stats
+
+    def insert():
+        rows, importer.pending_rows = importer.pending_rows, []
+        inserted.append(len(rows))
+        return len(rows)
+
+    importer._insert_pending_transactions = insert
+    return importer
+
+
+def _fees(*dates):
+    return {"broker": "IBKR", "fees": [{"date": d, "amount": 2.0, "currency": "EUR"} for d in dates]}
+
+
+def test_import_batch_dedupes_across_files_but_not_within_one(monkeypatch):
+    inserted = []
+    importer = _importer(monkeypatch, inserted)
+
+    stats = importer.import_batch([
+        _fees("2024-01-02", "2024-01-02"),  # mismo archivo: se respetan ambas
+        _fees("2024-01-02", "2024-02-02"),  # extracto solapado: solo la nueva
+    ])
+
+    assert inserted == [2, 1]
+    assert stats["fees_created"] == 3
+    assert stats["file_errors"] == {}
+
+
+def test_import_batch_discards_only_the_failing_file(monkeypatch):
+    inserted = []
+    importer = _importer(monkeypatch, inserted)
+
+    def resolve(data, progress_callback=None):
+        importer.stats["deposits_skipped"].append({"date": data["fees"][0]["date"]})
+        if data.get("broken"):
+            importer._queue_records(data)
+            raise RuntimeError("boom")
+
+    importer._resolve_assets = resolve
+    stats = importer.import_batch([_fees("2024-01-02"), dict(_fees("2024-03-02"), broken=True), _fees("2024-04-02")])
+
+    assert inserted == [1, 1]
+    assert stats["file_errors"] == {1: "boom"}
+    # Los contadores y depósitos omitidos del archivo fallido no cuentan
+    assert stats["fees_created"] == 2
+    assert len(stats["deposits_skipped"]) == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parse_files_keeps_order_and_reports_errors(tmp_path, workers):
+    good = tmp_path / "revolut.csv"
+    good.write_text("Symbol,Type,Quantity,Price,Value,Fees,Date\nBTC,Buy,1,€10,€10,€0,\"4 Feb 2026, 06:20:04\"\n")
+    bad = tmp_path / "otro.csv"
+    bad.write_text("a,b\n1,2\n")
+
+    parsed = BatchImportService.parse_files([("otro.csv", str(bad)), ("revolut.csv", str(good))], max_workers=workers)
+
+    assert [p.filename for p in parsed] == ["otro.csv", "revolut.csv"]
+    assert parsed[0].error and parsed[0].data is None
+    assert parsed[1].format == "REVOLUT_X"
+    assert len(parsed[1].data["trades"]) == 1
+    assert parsed[1].throughput["events"] == 2  # trade + posición
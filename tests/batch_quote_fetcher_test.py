@@ -0,0 +1,99 @@
+"""Tests unitarios: descarga concurrente de cotizaciones contra un servidor HTTP local."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.market_data.services.batch_quote_fetcher import (
+    BatchQuoteFetcher,
+    TokenBucket,
+    parse_quote_summary,
+)
+
+
+class _StubYahoo(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    delay = 0.05
+    connections = set()
+
+    def do_GET(self):
+        _StubYahoo.connections.add(self.client_address)
+        time.sleep(self.delay)
+        ticker = self.path.split('?')[0].rsplit('/', 1)[-1]
+        if ticker == 'MISSING':
+            body, status = b'{}', 404
+        elif self.path.startswith('/chart/'):
+            meta = {'regularMarketPrice': 110.0, 'chartPreviousClose': 100.0}
+            body, status = json.dumps({'chart': {'result': [{'meta': meta}], 'error': None}}).encode(), 200
+        else:
+            result = {'assetProfile': {'sector': 'Tech'}, 'summaryDetail': {'marketCap': {'raw': 2.5e9}}}
+            body, status = json.dumps({'quoteSummary': {'result': [result]}}).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    _StubYahoo.connections = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubYahoo)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_many_is_concurrent_and_reuses_connections(stub_url):
+    fetcher = BatchQuoteFetcher(
+        max_workers=8, rate=1000, burst=100,
+        chart_url=f"{stub_url}/chart", quote_summary_url=f"{stub_url}/quote",
+    )
+    tickers = [f"T{i}" for i in range(40)] + ['MISSING', 'T0']
+    seen = []
+
+    started = time.monotonic()
+    results = fetcher.fetch_many(tickers, time.monotonic() + 30, crumb='abc', on_result=seen.append)
+    elapsed = time.monotonic() - started
+
+    # 41 tickers únicos x 2 llamadas x 50 ms en serie serían ~4 s
+    assert elapsed < 2.0
+    assert len(results) == len(seen) == 41
+    assert results['MISSING']['error'] == 'Símbolo no encontrado en Yahoo Finance'
+    assert results['T5']['fields']['day_change_percent'] == pytest.approx(10.0)
+    assert results['T5']['quote']['market_cap_formatted'] == '2.5B'
+    assert [c[0] for c in results['T5']['calls']] == ['yahoo_chart', 'yahoo_quote']
+    # Una conexión keep-alive por hilo, no una por request
+    assert len(_StubYahoo.connections) <= 8
+
+
+def test_fetch_many_respects_global_deadline(stub_url):
+    fetcher = BatchQuoteFetcher(max_workers=2, rate=5, burst=1, chart_url=f"{stub_url}/chart")
+    results = fetcher.fetch_many([f"T{i}" for i in range(20)], time.monotonic() + 0.5)
+
+    done = [r for r in results.values() if r['error'] is None]
+    assert 1 <= len(done) <= 4
+    assert sum(r['error'] == 'timeout' for r in results.values()) == 20 - len(done)
+
+
+def test_token_bucket_refills_at_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+    assert bucket.acquire() and bucket.acquire()
+    assert not bucket.acquire(deadline=0.4)  # el siguiente token llega en t=0.5
+    now[0] = 0.5
+    assert bucket.acquire(deadline=0.5)
+
+
+def test_parse_quote_summary_only_returns_present_fields():
+    fields = parse_quote_summary({'quoteSummary': {'result': [{'financialData': {'numberOfAnalystOpinions': 7}}]}})
+    assert 'sector' not in fields and 'market_cap' not in fields
+    assert fields['number_of_analyst_opinions'] == 7
+    assert parse_quote_summary({'quoteSummary': {'result': []}}) is None
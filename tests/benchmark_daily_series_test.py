@@ -0,0 +1,30 @@
+"""Tests unitarios: serie diaria columnar de benchmarks."""
+from datetime import date
+
+from app.services.benchmark_global_service import DailySeries, _points_by_day
+
+
+def test_points_by_day_keeps_last_price_and_skips_gaps():
+    by_day = _points_by_day([
+        {"date": "2024-01-02", "price": 10},
+        {"date": "2024-01-03", "price": None},
+        {"date": "2024-01-02", "price": 11.5},
+        {"date": date(2024, 1, 4), "price": 12},
+    ])
+    assert by_day == {date(2024, 1, 2).toordinal(): 11.5, date(2024, 1, 4).toordinal(): 12.0}
+
+
+def test_points_from_slices_by_start_date():
+    series = DailySeries.from_rows(
+        (date(2024, 1, d).toordinal(), float(d)) for d in (2, 3, 5, 8)
+    )
+
+    assert series.points_from(date(2024, 1, 4)) == [
+        {"date": "2024-01-05", "price": 5.0},
+        {"date": "2024-01-08", "price": 8.0},
+    ]
+    assert len(series.points_from(date(2023, 12, 31))) == 4
+    assert series.points_from(date(2024, 2, 1)) == []
+    # Listas nuevas en cada llamada: modificarlas no toca la serie cacheada
+    series.points_from(date(2024, 1, 8))[0]["price"] = 0
+    assert series.points_from(date(2024, 1, 8))[0]["price"] == 8.0
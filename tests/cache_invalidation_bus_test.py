@@ -0,0 +1,71 @@
+"""Tests unitarios: bus de invalidación de cachés (coalescencia por commit)."""
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from app.models import Asset
+from app.services import cache_invalidation_bus as bus
+from app.services.cache_rebuild_state_service import CacheRebuildStateService, classify_dates
+from app.services.dashboard_summary_cache import DashboardSummaryCacheService
+from app.services.portfolio_benchmarks_cache import PortfolioBenchmarksCacheService
+from app.services.portfolio_evolution_cache import PortfolioEvolutionCacheService
+
+
+def _record_marks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(CacheRebuildStateService, "mark_for_dates",
+                        lambda user_id, dates=None, month_refs=None, commit=True: calls.append(
+                            ("rebuild", user_id, classify_dates(dates, month_refs), commit)))
+    for name, service in (("evolution", PortfolioEvolutionCacheService),
+                          ("benchmarks", PortfolioBenchmarksCacheService),
+                          ("dashboard", DashboardSummaryCacheService)):
+        monkeypatch.setattr(service, "mark_dirty",
+                            lambda user_id, full_rebuild, name=name: calls.append((name, user_id, full_rebuild)))
+    return calls
+
+
+def test_apply_changes_marks_each_cache_once_per_user(monkeypatch):
+    calls = _record_marks(monkeypatch)
+    monkeypatch.setattr(bus, "_holders", lambda asset_ids: {5})
+    today = datetime.utcnow().date()
+    pending = bus.PendingChanges()
+    # Varias escrituras en la misma transacción: una sola marca por caché
+    pending.add(1, bus.LEDGER, dates=[datetime(2024, 3, 1, 10, 30), today - timedelta(days=3)])
+    pending.add(1, bus.LEDGER, dates=[date(2024, 1, 2)])
+    pending.add(2, bus.CASHFLOW, dates=[today, today])
+    pending.add(2, bus.BANK, month_refs=[(today.year, today.month)])
+    pending.asset_ids.add(7)
+
+    bus.apply_changes(pending)
+
+    assert calls == [
+        ("rebuild", 1, (True, False), False),
+        ("evolution", 1, True),
+        ("benchmarks", 1, True),
+        ("rebuild", 2, (False, True), False),
+        ("dashboard", 2, False),
+        ("rebuild", 5, (False, False), False),
+        ("evolution", 5, False),
+        ("benchmarks", 5, False),
+    ]
+
+
+def test_bulk_asset_price_update_is_collected():
+    session = SimpleNamespace(info={})
+    state = SimpleNamespace(
+        is_update=True,
+        bind_mapper=SimpleNamespace(class_=Asset),
+        parameters=[{"id": 3, "current_price": 1.0}, {"id": 4, "market_cap": 2.0}],
+        session=session,
+    )
+
+    bus._collect_bulk_prices(state)
+
+    assert session.info[bus._SESSION_KEY].asset_ids == {3}
+    assert not bus.PendingChanges()
+
+
+def test_classify_dates_treats_other_months_as_past():
+    today = date(2026, 5, 10)
+    assert classify_dates([date(2026, 5, 11)], today=today) == (False, False)
+    assert classify_dates(month_refs=[(2026, 5)], today=today) == (False, True)
+    assert classify_dates([today], month_refs=[("2026", "6")], today=today) == (True, True)
@@ -0,0 +1,42 @@
+"""Tests unitarios: cola y worker de rebuild de cachés."""
+from datetime import datetime
+
+from flask import Flask
+
+from app.services import cache_rebuild_worker as worker
+from app.services.cache_rebuild_state_service import CacheRebuildStateService, RebuildJob, _percentile
+
+
+def _job(user_id, action="now"):
+    now = datetime(2026, 5, 10, 12, 0)
+    return RebuildJob(user_id, action, now, now)
+
+
+def test_percentile_nearest_rank():
+    assert _percentile([], 0.5) is None
+    assert _percentile([30, 10, 20], 0.5) == 20
+    assert _percentile(list(range(1, 101)), 0.95) == 95
+
+
+def test_inline_worker_finishes_each_claimed_job(monkeypatch):
+    queue = [_job(1), _job(2, "full"), _job(3)]
+    finished = []
+    monkeypatch.setattr(CacheRebuildStateService, "claim_next", lambda: queue.pop(0) if queue else None)
+    monkeypatch.setattr(CacheRebuildStateService, "finish",
+                        lambda job, ok, run_ms=None: finished.append((job.user_id, ok, run_ms)))
+
+    def fake_run(job):
+        if job.user_id == 2:
+            raise RuntimeError("boom")
+        return 7
+
+    monkeypatch.setattr(worker, "run_job", fake_run)
+    monkeypatch.setattr(worker.db.session, "rollback", lambda: None)
+
+    with Flask(__name__).app_context():
+        processed = worker.run_worker(workers=1, max_jobs=2, log=lambda msg: None)
+
+    # El presupuesto corta tras 2 jobs; el fallido vuelve a la cola vía finish(ok=False)
+    assert processed == 2
+    assert finished == [(1, True, 7), (2, False, None)]
+    assert queue == [_job(3)]
@@ -0,0 +1,42 @@
+"""Tests unitarios: Modified Dietz, TWR e IRR vectorizados sobre arrays de flujos."""
+from datetime import datetime
+
+import pytest
+
+from app.services.metrics.cash_flow_returns import CashFlowReturns, month_boundaries
+
+
+def test_modified_dietz_weights_flows_by_remaining_days():
+    returns = CashFlowReturns(
+        [datetime(2024, 1, 1), datetime(2024, 1, 11)], [1000.0, 1600.0],
+        [datetime(2024, 1, 6, 15), datetime(2024, 1, 1)], [500.0, 999.0],
+    )
+    result = returns.period(0, 1)
+    # El flujo del propio corte inicial ya está en VI; el del día 6 pesa 5/10
+    assert result["cash_flows"] == 500.0
+    assert result["weighted_capital"] == pytest.approx(1250.0)
+    assert result["return"] == pytest.approx(100 / 1250)
+    assert result["days"] == 10
+
+
+def test_twr_chains_sub_periods_and_many_periods_are_vectorized():
+    boundaries = [datetime(2024, 1, 1), datetime(2024, 2, 1), datetime(2024, 3, 1)]
+    # Depósito de 100 justo en el corte de febrero (peso 0 en enero)
+    returns = CashFlowReturns(boundaries, [100.0, 210.0, 231.0], [datetime(2024, 2, 1)], [100.0])
+
+    assert returns.twr(0, 2) == pytest.approx(1.1 * 1.1 - 1)
+    assert returns.modified_dietz([0, 1], [1, 2])["return"].tolist() == pytest.approx([0.1, 0.1])
+
+
+def test_irr_without_flows_is_the_annualized_growth():
+    returns = CashFlowReturns([datetime(2022, 1, 1), datetime(2024, 1, 1)], [100.0, 121.0], [], [])
+    years = (datetime(2024, 1, 1) - datetime(2022, 1, 1)).days / 365.25
+    assert returns.irr(0, 1) == pytest.approx(1.21 ** (1 / years) - 1)
+    assert CashFlowReturns([datetime(2024, 1, 1)] * 2, [0.0, 0.0], [], []).irr(0, 1) is None
+
+
+def test_month_boundaries():
+    now = datetime(2024, 3, 10, 12)
+    assert month_boundaries(datetime(2024, 1, 15), now) == [
+        datetime(2024, 1, 15), datetime(2024, 2, 1), datetime(2024, 3, 1), now,
+    ]
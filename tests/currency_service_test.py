@@ -0,0 +1,42 @@
+"""Tests unitarios: conversión a EUR con tipo de cambio histórico (convert_many)."""
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.services import currency_service, fx_rate_service
+from app.services.currency_service import convert_many, convert_to_eur
+
+
+@pytest.fixture(autouse=True)
+def rates(monkeypatch):
+    monkeypatch.setattr(currency_service, "get_exchange_rates", lambda force_refresh=False: {
+        "EUR": 1.0, "USD": 0.9, "GBP": 1.2, "GBX": 0.012,
+    })
+    days = np.array([date(2024, 1, 2).toordinal(), date(2024, 1, 5).toordinal()], dtype=np.int64)
+    monkeypatch.setattr(fx_rate_service, "_history", {"USD": (days, np.array([0.8, 0.85]))})
+    monkeypatch.setattr(fx_rate_service, "_history_loaded_at", time.time())
+
+
+def test_convert_many_uses_last_published_rate():
+    result = convert_many(
+        [100, 100, 100, 100],
+        ["USD", "USD", "USD", "USD"],
+        [datetime(2024, 1, 1), datetime(2024, 1, 3, 15), date(2024, 1, 6), datetime.now()],
+    )
+    # Antes del primer dato -> primer tipo; fin de semana -> último publicado; hoy -> actual
+    assert result.tolist() == pytest.approx([80.0, 80.0, 85.0, 90.0])
+
+
+def test_convert_many_without_history_or_dates_uses_current_rate():
+    result = convert_many([10, 10, 200, 5], ["GBP", "usd", "GBX", None], [date(2024, 1, 3)] * 4)
+    assert result.tolist() == pytest.approx([12.0, 8.0, 2.4, 0.0])
+    assert convert_many([10], ["USD"]).tolist() == pytest.approx([9.0])
+
+
+def test_convert_to_eur_on_date_matches_convert_many():
+    yesterday = datetime.now() - timedelta(days=1)
+    assert convert_to_eur(100, "USD", date(2024, 1, 4)) == pytest.approx(80.0)
+    assert convert_to_eur(100, "USD", yesterday) == pytest.approx(85.0)
+    assert convert_to_eur(100, "USD") == pytest.approx(90.0)
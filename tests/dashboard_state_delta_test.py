@@ -0,0 +1,26 @@
+"""Tests unitarios: versionado por secciones del snapshot del dashboard (polling delta)."""
+from app.services.dashboard_summary_cache import _changed_sections, sections_since
+
+
+def _summary(**section_versions):
+    sections = {k: {"v": v} for k, v in section_versions.items()}
+    return {**sections, "meta": {"version": 300, "base_version": 100, "section_versions": section_versions}}
+
+
+def test_sections_since_returns_only_sections_newer_than_client():
+    summary = _summary(breakdown=300, top_movers=200, savings=100)
+
+    assert sections_since(summary, "200") == ["breakdown"]
+    assert sections_since(summary, 150) == ["breakdown", "top_movers"]
+    assert sections_since(summary, 300) == []
+    # Versión anterior al último snapshot completo, desconocida o sin versionado: todo
+    assert sections_since(summary, 99) is None
+    assert sections_since(summary, "2026-01-05T12:00:00Z") is None
+    assert sections_since({"meta": {"version": 5}}, 5) is None
+
+
+def test_changed_sections_compares_serialized_json_and_skips_meta():
+    prev = {"history": [[1, 2]], "changes": {"day_pct": 1.0}, "meta": {"version": 1}, "top_movers": []}
+    new = {"history": [(1, 2)], "changes": {"day_pct": 1.5}, "meta": {"version": 2}, "market_indices": []}
+
+    assert _changed_sections(prev, new) == ["changes", "market_indices", "top_movers"]
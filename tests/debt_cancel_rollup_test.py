@@ -0,0 +1,57 @@
+"""Regresión: cancelar un plan de deuda invalida los agregados mensuales de sus cuotas."""
+from datetime import date
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+import config
+from app import create_app, db
+from app.models import DebtPlan, Expense, ExpenseCategory, User
+from app.services.debt_service import DebtService
+from app.services.monthly_rollup_service import MonthlyRollupService
+
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    # BD en fichero: el rollup guarda los meses cerrados en su propia conexión
+    monkeypatch.setattr(config.TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'debt.db'}")
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def test_cancel_plan_drops_rollups_of_past_installments(file_app):
+    user = User(username="debt", email="debt@example.com")
+    user.set_password("x")
+    db.session.add(user)
+    db.session.flush()
+    category = ExpenseCategory(name="Préstamo", user_id=user.id)
+    db.session.add(category)
+    db.session.flush()
+
+    first_month = date.today().replace(day=1) - relativedelta(months=3)
+    plan = DebtPlan(
+        user_id=user.id, category_id=category.id, name="Préstamo", total_amount=300.0, months=3,
+        start_date=first_month,
+    )
+    db.session.add(plan)
+    db.session.flush()
+    for i in range(3):
+        db.session.add(Expense(
+            user_id=user.id, category_id=category.id, debt_plan_id=plan.id, amount=100.0,
+            description=f"Cuota {i + 1}/3", date=first_month + relativedelta(months=i),
+        ))
+    db.session.commit()
+
+    months = ((first_month.year, first_month.month), (first_month + relativedelta(months=2)).timetuple()[:2])
+    before = [f.expense_total for f in MonthlyRollupService.get_figures(user.id, *months)]
+    assert before == [100.0, 100.0, 100.0]
+
+    DebtService.cancel_plan(plan.id, user.id, delete_future_only=False)
+
+    assert Expense.query.count() == 0
+    after = [f.expense_total for f in MonthlyRollupService.get_figures(user.id, *months)]
+    assert after == [0.0, 0.0, 0.0]
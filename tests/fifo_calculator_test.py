@@ -0,0 +1,50 @@
+"""Tests unitarios: motor FIFO float64 frente al motor Decimal."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.fifo_calculator import FIFOCalculator, FloatFIFOCalculator
+
+
+def _replay(calc, ledger):
+    sold_cost = 0.0
+    for txn_type, ts, qty, price in ledger:
+        if txn_type == "BUY":
+            calc.add_buy(quantity=qty, price=price, date=ts, total_cost=qty * price + 1)
+        else:
+            sold_cost += float(calc.add_sell(quantity=qty, date=ts))
+    return calc.get_current_position(), sold_cost
+
+
+def test_float_engine_matches_decimal_engine(capsys):
+    rnd = random.Random(7)
+    ts = datetime(2024, 1, 1)
+    ledger = []
+    for _ in range(2000):
+        ts += timedelta(hours=1)
+        ledger.append((rnd.choice(["BUY", "BUY", "SELL"]), ts, round(rnd.uniform(0.01, 50), 3), rnd.uniform(1, 100)))
+
+    dec_pos, dec_sold = _replay(FIFOCalculator(), ledger)
+    flt_pos, flt_sold = _replay(FloatFIFOCalculator(), ledger)
+
+    assert flt_pos["quantity"] == pytest.approx(dec_pos["quantity"], abs=1e-6)
+    assert flt_pos["total_cost"] == pytest.approx(dec_pos["total_cost"], rel=1e-9)
+    assert flt_sold == pytest.approx(dec_sold, rel=1e-9)
+
+
+def test_float_residuals_below_epsilon_close_the_position():
+    calc = FloatFIFOCalculator()
+    calc.add_buy(quantity=0.1, price=10, date=datetime(2024, 1, 1), total_cost=1.0)
+    calc.add_buy(quantity=0.2, price=10, date=datetime(2024, 1, 2), total_cost=2.0)
+    assert calc.add_sell(quantity=0.3, date=datetime(2024, 1, 3)) == pytest.approx(3.0)
+    assert calc.is_closed()
+
+
+def test_float_engine_round_trips_through_dict():
+    calc = FloatFIFOCalculator(symbol="ACME")
+    calc.add_buy(quantity=3, price=10, date=datetime(2024, 1, 1), total_cost=31.0)
+    calc.add_sell(quantity=1, date=datetime(2024, 1, 2))
+    restored = FloatFIFOCalculator.from_dict(calc.to_dict())
+    assert restored.get_current_position() == calc.get_current_position()
+    assert restored.to_dict() == calc.to_dict()
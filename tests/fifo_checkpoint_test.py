@@ -0,0 +1,74 @@
+"""Tests unitarios: estado FIFO reanudable (checkpoints de fin de mes)."""
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import fifo_checkpoint_service
+from app.services.fifo_checkpoint_service import LedgerState, _month_end
+
+
+@pytest.fixture(autouse=True)
+def eur_only(monkeypatch):
+    monkeypatch.setattr(
+        fifo_checkpoint_service, "convert_to_eur",
+        lambda amount, currency, on_date=None: amount if amount and currency else 0.0,
+    )
+
+
+def _txn(ts, txn_type, amount=0.0, asset_id=None, quantity=None, price=None, commission=0.0):
+    return SimpleNamespace(
+        transaction_date=ts, transaction_type=txn_type, amount=amount, currency="EUR",
+        asset_id=asset_id, quantity=quantity, price=price, commission=commission, fees=0.0, tax=0.0,
+    )
+
+
+def _ledger():
+    return [
+        _txn(datetime(2024, 1, 1), "DEPOSIT", amount=1000.0),
+        _txn(datetime(2024, 1, 2), "BUY", asset_id=7, quantity=10, price=50.0, commission=1.0),
+        _txn(datetime(2024, 1, 3), "SELL", asset_id=8, quantity=2, price=10.0),
+        _txn(datetime(2024, 2, 5), "SELL", asset_id=7, quantity=5, price=60.0, commission=1.0),
+        _txn(datetime(2024, 2, 6), "BUY", asset_id=8, quantity=3, price=10.0),
+        _txn(datetime(2024, 2, 7), "FEE", amount=-2.0),
+    ]
+
+
+def _replay(transactions, state=None):
+    state = state or LedgerState()
+    for txn in transactions:
+        state.apply(txn)
+    return state
+
+
+def test_month_end():
+    assert _month_end(date(2024, 2, 10)) == date(2024, 2, 29)
+    assert _month_end(date(2024, 12, 31)) == date(2024, 12, 31)
+
+
+def test_resume_from_serialized_state_matches_full_replay():
+    ledger = _ledger()
+    full = _replay(ledger)
+    resumed = _replay(ledger[3:], LedgerState.from_dict(_replay(ledger[:3]).to_dict()))
+
+    assert resumed.to_dict() == full.to_dict()
+    assert resumed.cash_balance_eur() == pytest.approx(full.cash_balance_eur())
+    assert resumed.realized_totals_eur() == pytest.approx(full.realized_totals_eur())
+
+
+def test_orphan_sell_opens_short_but_is_ignored_for_valuation():
+    state = _replay(_ledger())
+
+    # Valoración: la venta huérfana de 8 se ignora -> 3 títulos
+    assert state.valuation_fifos()[8].get_current_position()["quantity"] == pytest.approx(3)
+    # Holdings/P&L: la venta abrió un corto de 2 -> quedan 1
+    assert state.positions[8].get_current_position()["quantity"] == pytest.approx(1)
+    # P&L realizado: 7 (299 - 250.5) + 8 (20 - 0)
+    assert state.realized_totals_eur()["realized_pl"] == pytest.approx(68.5)
+    assert state.realized_totals_eur()["total_sales"] == 2
+
+
+def test_cash_balance_can_be_limited_to_assets():
+    state = _replay(_ledger())
+    assert state.cash_balance_eur() == pytest.approx(1000 - 501 + 20 + 299 - 30 - 2)
+    assert state.cash_balance_eur(asset_ids=[7]) == pytest.approx(1000 - 501 + 299 - 2)
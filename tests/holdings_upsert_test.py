@@ -0,0 +1,68 @@
+"""Tests unitarios: recálculo de holdings acotado a los activos tocados (upsert)."""
+from datetime import date
+from types import SimpleNamespace
+
+from app.services import portfolio_holding_service
+from app.services.portfolio_holding_service import upsert_holdings
+
+
+class _Holding(SimpleNamespace):
+    asset_id = SimpleNamespace(in_=lambda ids: set(ids))
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter_by(self, **kwargs):
+        return _Query([r for r in self.rows if all(getattr(r, k) == v for k, v in kwargs.items())])
+
+    def filter(self, asset_ids):
+        return _Query([r for r in self.rows if r.asset_id in asset_ids])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+def _fifo(quantity):
+    return SimpleNamespace(get_current_position=lambda: {
+        'quantity': quantity, 'average_buy_price': 10.0, 'total_cost': quantity * 10.0,
+        'first_purchase_date': date(2024, 1, 2), 'last_transaction_date': date(2024, 3, 4),
+    })
+
+
+def test_upsert_holdings_only_touches_scoped_assets(monkeypatch):
+    rows = [
+        _Holding(user_id=1, account_id=5, asset_id=aid, quantity=1.0, current_price=7.0)
+        for aid in (10, 11, 12)
+    ]
+    added, deleted = [], []
+    _Holding.query = _Query(rows)
+    monkeypatch.setattr(portfolio_holding_service, "PortfolioHolding", _Holding)
+    monkeypatch.setattr(portfolio_holding_service, "db", SimpleNamespace(session=SimpleNamespace(
+        add=added.append, delete=deleted.append,
+    )))
+
+    # 10 sigue abierto, 11 se cerró, 13 es nuevo; 12 queda fuera del alcance
+    written = upsert_holdings(1, 5, {10: _fifo(4.0), 11: _fifo(0.0), 13: _fifo(2.0)}, {10, 11, 13})
+
+    assert written == 2
+    assert deleted == [rows[1]]
+    assert [(h.asset_id, h.quantity) for h in added] == [(13, 2.0)]
+    # Se actualiza en sitio (conserva id y precio cacheado) en vez de borrar y reinsertar
+    assert (rows[0].quantity, rows[0].total_cost, rows[0].current_price) == (4.0, 40.0, 7.0)
+    assert rows[2].quantity == 1.0
+
+
+def test_upsert_holdings_without_scope_covers_whole_account(monkeypatch):
+    rows = [_Holding(user_id=1, account_id=5, asset_id=aid, quantity=1.0) for aid in (10, 11)]
+    deleted = []
+    _Holding.query = _Query(rows)
+    monkeypatch.setattr(portfolio_holding_service, "PortfolioHolding", _Holding)
+    monkeypatch.setattr(portfolio_holding_service, "db", SimpleNamespace(session=SimpleNamespace(
+        add=lambda h: None, delete=deleted.append,
+    )))
+
+    assert upsert_holdings(1, 5, {10: _fifo(3.0)}) == 1
+    assert deleted == [rows[1]]
+    assert upsert_holdings(1, 5, {}, set()) == 0
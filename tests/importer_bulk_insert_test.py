@@ -0,0 +1,46 @@
+"""Tests unitarios: INSERT masivo del importador CSV e invalidaciones manuales."""
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.services import importer_v2
+from app.services.importer_v2 import CSVImporterV2
+
+
+def _importer():
+    importer = CSVImporterV2.__new__(CSVImporterV2)
+    importer.user_id = 3
+    importer.broker_account_id = 9
+    importer.pending_rows = []
+    return importer
+
+
+def test_insert_pending_transactions_invalidates_from_earliest_dates(monkeypatch):
+    calls = []
+    monkeypatch.setattr(importer_v2, "db", SimpleNamespace(session=SimpleNamespace(
+        execute=lambda stmt, rows: calls.append(("insert", len(rows))),
+    )))
+    monkeypatch.setattr(importer_v2.FifoCheckpointService, "invalidate",
+                        lambda user_id, account_id=None, from_date=None: calls.append(("fifo", account_id, from_date)))
+    monkeypatch.setattr(importer_v2.MonthlyRollupService, "invalidate",
+                        lambda user_id, from_date=None: calls.append(("rollup", from_date)))
+    monkeypatch.setattr(importer_v2, "bump_ledger_version", lambda user_ids: calls.append(("ledger", user_ids)))
+    monkeypatch.setattr(importer_v2.cache_invalidation_bus, "publish",
+                        lambda user_id, kind, dates=None: calls.append(("caches", kind, dates)))
+
+    importer = _importer()
+    importer._queue_transaction(transaction_type="BUY", transaction_date=datetime(2024, 3, 1), amount=-10.0)
+    importer._queue_transaction(transaction_type="DEPOSIT", transaction_date=datetime(2024, 5, 2), amount=100.0)
+    importer._queue_transaction(transaction_type="FEE", transaction_date=datetime(2024, 1, 7), amount=-1.0)
+
+    assert importer._insert_pending_transactions() == 3
+    assert calls == [
+        ("insert", 3),
+        ("fifo", 9, datetime(2024, 1, 7)),
+        ("caches", "ledger", [datetime(2024, 1, 7)]),
+        ("rollup", datetime(2024, 5, 2)),
+        ("ledger", [3]),
+    ]
+    assert importer.pending_rows == []
+    # Sin filas pendientes no se escribe ni invalida nada
+    assert importer._insert_pending_transactions() == 0
+    assert len(calls) == 5
@@ -0,0 +1,89 @@
+"""Tests unitarios: LRU en memoria delante de las tablas de caché JSON."""
+from datetime import datetime
+
+import pytest
+
+from app.services import json_cache_lru
+
+T0 = datetime(2026, 1, 5, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(json_cache_lru, "_max_bytes", lambda: 1000)
+    json_cache_lru.clear()
+    yield
+    json_cache_lru.clear()
+
+
+def test_lookup_requires_same_stamp():
+    key = ("metrics_cache", 1)
+    json_cache_lru._store(key, (10, 0, T0), {"a": 1}, 100)
+
+    assert json_cache_lru._lookup(key, (10, 0, T0)) == {"a": 1}
+    # Otra revision (UPDATE de otro proceso) o fila recreada con el mismo id: miss
+    assert json_cache_lru._lookup(key, (10, 1, T0)) is None
+    assert json_cache_lru._lookup(key, (10, 0, datetime(2026, 1, 5, 12, 1))) is None
+
+
+def test_evicts_least_recently_used_by_bytes():
+    for uid in (1, 2, 3):
+        json_cache_lru._store(("metrics_cache", uid), (uid, 0, T0), {"u": uid}, 240)
+    json_cache_lru._lookup(("metrics_cache", 1), (1, 0, T0))  # 1 pasa a ser el más reciente
+    json_cache_lru._store(("metrics_cache", 4), (4, 0, T0), {"u": 4}, 240)
+    json_cache_lru._store(("metrics_cache", 5), (5, 0, T0), {"u": 5}, 240)
+
+    assert [uid for _, uid in json_cache_lru._entries] == [3, 1, 4, 5]
+    assert json_cache_lru._total_bytes == 960
+
+    # Una entrada mayor que 1/4 del límite no se guarda y descarta la anterior
+    json_cache_lru._store(("metrics_cache", 4), (4, 1, T0), {"big": True}, 300)
+    assert ("metrics_cache", 4) not in json_cache_lru._entries
+    assert json_cache_lru._total_bytes == 720
+
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    import config
+    from app import create_app, db
+
+    monkeypatch.setattr(config.TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'lru.db'}")
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+
+
+def test_write_racing_another_process_is_not_stamped_with_its_revision(file_app):
+    from app.models import MetricsCache, User
+    from app.services.metrics.cache import MetricsCacheService
+
+    db = file_app
+    user = User(username="lru", email="lru@example.com")
+    user.set_password("x")
+    db.session.add(user)
+    db.session.commit()
+    MetricsCacheService.set(user.id, {"v": 1})
+
+    # Otro proceso confirma justo después de nuestro commit (antes de guardar en memoria)
+    session = db.session()
+    real_commit = session.commit
+
+    def commit_then_other_writer():
+        real_commit()
+        with db.engine.begin() as conn:
+            conn.execute(
+                MetricsCache.__table__.update()
+                .where(MetricsCache.user_id == user.id)
+                .values(cached_data={"v": "otro"})
+            )
+
+    session.commit = commit_then_other_writer
+    try:
+        MetricsCacheService.set(user.id, {"v": 2})
+    finally:
+        del session.commit
+
+    assert json_cache_lru.read(MetricsCache, user.id).cached_data == {"v": "otro"}
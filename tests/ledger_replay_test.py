@@ -0,0 +1,97 @@
+"""Tests unitarios: replay en una pasada del ledger (evolución del portfolio)."""
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.metrics import ledger_replay
+from app.services.metrics.ledger_replay import LedgerReplayEngine
+
+
+@pytest.fixture(autouse=True)
+def eur_only(monkeypatch):
+    monkeypatch.setattr(
+        ledger_replay, "convert_to_eur",
+        lambda amount, currency, on_date=None: amount if amount and currency else 0.0,
+    )
+    monkeypatch.setattr(
+        ledger_replay, "convert_many",
+        lambda amounts, currencies, dates=None: np.array(
+            [a if c else 0.0 for a, c in zip(amounts, currencies)], dtype=float
+        ),
+    )
+
+
+def _txn(txn_id, ts, txn_type, amount=0.0, asset_id=None, quantity=None, price=None, commission=0.0):
+    return SimpleNamespace(
+        id=txn_id, transaction_date=ts, transaction_type=txn_type, amount=amount,
+        currency="EUR", asset_id=asset_id, quantity=quantity, price=price,
+        commission=commission, fees=0.0, tax=0.0,
+    )
+
+
+def _ledger():
+    return [
+        _txn(1, datetime(2024, 1, 1, 10), "DEPOSIT", amount=1000.0),
+        _txn(2, datetime(2024, 1, 2, 10), "BUY", asset_id=7, quantity=10, price=50.0, commission=1.0),
+        _txn(3, datetime(2024, 1, 5, 10), "SELL", asset_id=7, quantity=5, price=60.0, commission=1.0),
+        _txn(4, datetime(2024, 1, 6, 10), "DIVIDEND", amount=10.0),
+        _txn(5, datetime(2024, 1, 7, 10), "FEE", amount=-2.0),
+    ]
+
+
+def _engine(transactions):
+    asset = SimpleNamespace(id=7, symbol="ACME", currency="EUR", asset_type="Stock", current_price=70.0)
+    return LedgerReplayEngine(
+        transactions=transactions,
+        assets={7: asset},
+        start_date=date(2024, 1, 1),
+        end_date=date(2024, 1, 10),
+    )
+
+
+def test_replay_emits_one_snapshot_per_date():
+    snapshots = _engine(_ledger()).replay([date(2024, 1, 1), date(2024, 1, 5), date(2024, 1, 10)])
+    assert [s["date"] for s in snapshots] == [date(2024, 1, 1), date(2024, 1, 5), date(2024, 1, 10)]
+
+
+def test_first_day_has_no_weighted_capital():
+    first = _engine(_ledger()).replay([date(2024, 1, 1)])[0]
+    assert first["total_value"] == pytest.approx(1000.0)
+    assert first["capital_invested"] == pytest.approx(1000.0)
+    assert first["return_pct"] == 0.0
+
+
+def test_historical_point_uses_average_cost():
+    snap = _engine(_ledger()).replay([date(2024, 1, 5)])[0]
+    assert snap["holdings_value"] == pytest.approx(250.5)
+    assert snap["pl_unrealized"] == pytest.approx(0.0)
+    assert snap["total_value"] == pytest.approx(1048.5)
+    assert snap["pl_realized"] == pytest.approx(48.5)
+    assert snap["return_pct"] == pytest.approx(4.85)
+    assert snap["leverage"] == pytest.approx(798.0)
+
+
+def test_last_point_uses_current_prices():
+    snap = _engine(_ledger()).replay([date(2024, 1, 5), date(2024, 1, 10)])[-1]
+    assert snap["total_value"] == pytest.approx(1156.0)
+    assert snap["pl_unrealized"] == pytest.approx(99.5)
+    assert snap["dividends"] == pytest.approx(10.0)
+    assert snap["fees"] == pytest.approx(2.0)
+    assert snap["pl_total"] == pytest.approx(156.0)
+    assert snap["return_pct"] == pytest.approx(15.6)
+    assert snap["leverage"] == pytest.approx(806.0)
+
+
+def test_sell_without_buy_only_opens_short_for_realized_pnl():
+    transactions = [
+        _txn(1, datetime(2024, 1, 1, 10), "DEPOSIT", amount=100.0),
+        _txn(2, datetime(2024, 1, 2, 10), "SELL", asset_id=7, quantity=1, price=10.0),
+        _txn(3, datetime(2024, 1, 3, 10), "BUY", asset_id=7, quantity=3, price=10.0),
+    ]
+    snap = _engine(transactions).replay([date(2024, 1, 4)])[0]
+    # Valoración: la venta huérfana se ignora -> 3 títulos en cartera
+    assert snap["holdings_cost"] == pytest.approx(30.0)
+    # P&L realizado: la venta sin lotes tiene coste 0
+    assert snap["pl_realized"] == pytest.approx(10.0)
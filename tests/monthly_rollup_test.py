@@ -0,0 +1,54 @@
+"""Tests unitarios: cifras mensuales (ajuste de reconciliación y broker) desde los agregados."""
+from types import SimpleNamespace
+
+from app.services import monthly_rollup_service
+from app.services.monthly_rollup_service import MonthFigures, _summarize
+
+
+def _row(income=None, expense=None, cash=0.0, has_balance=True, withdrawals=None, deposits=None, include=True):
+    return SimpleNamespace(
+        income_by_category=income or {},
+        expense_by_category=expense or {},
+        bank_cash=cash,
+        has_bank_balance=has_balance,
+        broker_withdrawals=withdrawals or {},
+        broker_deposits=deposits or {},
+        include_adjustment=include,
+    )
+
+
+def test_summarize_adjustment_and_broker_flows(monkeypatch):
+    monkeypatch.setattr(
+        monthly_rollup_service, "convert_to_eur", lambda amount, currency: amount * (0.5 if currency == "USD" else 1.0)
+    )
+    rows = {
+        (2025, 12): _row(cash=1000.0),
+        # Categoría 9 = Stock Market/Ajustes: cuenta en totales, no en la reconciliación
+        (2026, 1): _row(
+            income={"1": 2000.0, "9": 50.0},
+            expense={"2": 700.0},
+            cash=1500.0,
+            withdrawals={"10": {"USD": 200.0}, "99": {"EUR": 500.0}},  # 99 no es IBKR/DeGiro
+            deposits={"11": {"EUR": 300.0}},
+        ),
+        (2026, 2): _row(income={"1": 100.0}, has_balance=False),
+    }
+
+    jan, feb = _summarize(rows, [(2026, 1), (2026, 2)], {9}, set(), {10: "IBKR", 11: "DeGiro"})
+
+    assert (jan.income_total, jan.expense_total) == (2050.0, 700.0)
+    assert (jan.broker_withdrawals, jan.broker_deposits) == (100.0, 300.0)
+    # (1000 + 2000 + 100 - 1500) - (700 + 300)
+    assert jan.adjustment == 600.0
+    assert (jan.expense_adjustment, jan.income_adjustment) == (600.0, 0.0)
+    # Sin saldos en el mes: no hay ajuste
+    assert feb.adjustment is None
+
+
+def test_month_figures_respects_metric_preference():
+    excluded = MonthFigures(2026, 3, 0.0, 0.0, 0.0, 0.0, adjustment=-80.0, include_adjustment=False)
+    included = MonthFigures(2026, 3, 0.0, 0.0, 0.0, 0.0, adjustment=-80.0)
+
+    assert excluded.income_adjustment == 0.0
+    assert included.income_adjustment == 80.0
+    assert included.month_label == "Mar 2026"
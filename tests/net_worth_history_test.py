@@ -0,0 +1,104 @@
+"""Regresión: historial de patrimonio con un solo replay frente al cálculo mes a mes."""
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from app import db
+from app.models import Asset, Broker, BrokerAccount, Transaction, User
+from app.services import fifo_checkpoint_service, net_worth_service as nws
+from app.services.fifo_checkpoint_service import FifoCheckpointService
+
+MONTHS = 40
+
+
+def _fx(amount, currency, on_date=None):
+    """USD con tipo distinto cada día: detecta conversiones a fecha equivocada."""
+    if currency != "USD":
+        return amount
+    rate = 0.9 + (on_date.day / 1000 if on_date else 0.0)
+    return amount * rate
+
+
+@pytest.fixture
+def ledger(app, monkeypatch):
+    monkeypatch.setattr(nws, "convert_to_eur", _fx)
+    monkeypatch.setattr(fifo_checkpoint_service, "convert_to_eur", _fx)
+    with app.app_context():
+        db.create_all()
+        user = User(username="nw", email="nw@example.com")
+        user.set_password("x")
+        broker = Broker(name="B")
+        db.session.add_all([user, broker])
+        db.session.flush()
+        account = BrokerAccount(user_id=user.id, broker_id=broker.id, account_name="main")
+        assets = [
+            Asset(symbol="AAA", name="a", asset_type="Stock", currency="USD", current_price=12.3, previous_close=11.0),
+            Asset(symbol="BBB", name="b", asset_type="ETF", currency="EUR", current_price=55.5),
+            Asset(symbol="BTC", name="btc", asset_type="Crypto", currency="EUR", current_price=30000.0),
+            Asset(symbol="GC=F", name="oro", asset_type="Commodity", currency="USD", current_price=2000.0),
+            Asset(symbol="CL=F", name="crudo", asset_type="Commodity", currency="USD", current_price=80.0),
+        ]
+        db.session.add(account)
+        db.session.add_all(assets)
+        db.session.flush()
+
+        rng = random.Random(3)
+        start = datetime.combine(date.today() - relativedelta(months=MONTHS), time(10))
+        span = (datetime.now() - start).days - 1
+        for _ in range(400):
+            ts = start + timedelta(days=rng.randint(0, span), hours=rng.randint(0, 10))
+            asset = rng.choice(assets + [None])
+            if asset is None:
+                # Flujos de caja sin activo
+                db.session.add(Transaction(
+                    user_id=user.id, account_id=account.id, transaction_date=ts,
+                    transaction_type=rng.choice(["DEPOSIT", "WITHDRAWAL", "DIVIDEND", "FEE"]),
+                    amount=rng.uniform(10, 1000), currency=rng.choice(["EUR", "USD"]),
+                ))
+                continue
+            # SELL antes de cualquier BUY abre cortos
+            quantity, price = rng.uniform(0.1, 5), rng.uniform(5, 100)
+            db.session.add(Transaction(
+                user_id=user.id, account_id=account.id, asset_id=asset.id, transaction_date=ts,
+                transaction_type=rng.choice(["BUY", "BUY", "SELL"]), quantity=quantity, price=price,
+                amount=quantity * price, currency=asset.currency, commission=rng.uniform(0, 2), fees=0.0, tax=0.0,
+            ))
+        db.session.commit()
+        FifoCheckpointService.refresh(user.id)
+        yield user.id
+        db.session.remove()
+        db.drop_all()
+
+
+def _month_targets():
+    today = date.today()
+    targets = []
+    for i in range(MONTHS - 1, -1, -1):
+        d = today - relativedelta(months=i)
+        if (d.year, d.month) == (today.year, today.month):
+            targets.append((datetime.now(), True))
+        else:
+            month_end = date(d.year, d.month, 1) + relativedelta(months=1) - timedelta(days=1)
+            targets.append((datetime.combine(month_end, time.max), False))
+    return targets
+
+
+def test_single_replay_matches_per_month_values(ledger):
+    targets = _month_targets()
+
+    batched = nws._get_investment_values_at_dates(ledger, targets)
+
+    expected = [
+        (
+            nws._get_broker_value_at_date(ledger, target_date, use_current)["total_value"],
+            nws._get_holdings_value_at_date(ledger, target_date, ["Crypto"], use_current),
+            nws._get_holdings_value_at_date(ledger, target_date, ["Commodity"], use_current),
+        )
+        for target_date, use_current in targets
+    ]
+    assert len(batched) == MONTHS
+    assert any(b != 0 for b, _, _ in expected) and any(m != 0 for _, _, m in expected)
+    for month, (got, want) in enumerate(zip(batched, expected)):
+        assert got == pytest.approx(want, rel=1e-12, abs=1e-9), month
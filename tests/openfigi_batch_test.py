@@ -0,0 +1,86 @@
+"""Tests unitarios: mapping en lote de OpenFIGI y cache negativa en el importador."""
+import json
+from types import SimpleNamespace
+
+from app.services import importer_v2
+from app.services.importer_v2 import CSVImporterV2
+from app.services.market_data.providers import openfigi
+from app.services.market_data.providers.openfigi import OpenFIGIProvider
+from app.services.market_data.services.batch_quote_fetcher import TokenBucket
+
+
+def _provider(monkeypatch, api_key, responses):
+    posts = []
+
+    def post(url, headers=None, data=None, timeout=None):
+        jobs = json.loads(data)
+        posts.append(jobs)
+        status, body = responses.pop(0) if responses else (200, None)
+        if body is None:
+            body = [
+                {'warning': 'No identifier found.'} if job['idValue'].endswith('0')
+                else {'data': [{'ticker': 'T' + job['idValue'][-3:], 'micCode': 'XNAS', 'securityType': 'ETP'}]}
+                for job in jobs
+            ]
+        return SimpleNamespace(status_code=status, json=lambda: body, headers={'ratelimit-reset': '0'})
+
+    monkeypatch.setattr(openfigi.requests, 'post', post)
+    monkeypatch.setattr(openfigi, 'sleep', lambda seconds: None)
+    provider = OpenFIGIProvider(api_key=api_key)
+    provider.bucket = TokenBucket(rate=1e9, capacity=1)
+    return provider, posts
+
+
+def test_enrich_many_packs_jobs_per_request(monkeypatch):
+    items = [(f'US{i:010d}', 'USD') for i in range(1, 26)]
+
+    provider, posts = _provider(monkeypatch, 'key', [])
+    results = provider.enrich_many_by_isin(items + items[:3])
+
+    assert [len(jobs) for jobs in posts] == [25]
+    assert posts[0][0] == {'idType': 'ID_ISIN', 'idValue': 'US0000000001', 'currency': 'USD'}
+    assert results[('US0000000001', 'USD')]['symbol'] == 'T001'
+    assert results[('US0000000010', 'USD')] is None  # no encontrado
+
+    provider, posts = _provider(monkeypatch, None, [])
+    provider.enrich_many_by_isin(items)
+    assert [len(jobs) for jobs in posts] == [10, 10, 5]
+
+
+def test_enrich_many_retries_rate_limit_and_skips_failed_jobs(monkeypatch):
+    items = [('US0000000001', 'USD'), ('US0000000002', None)]
+    body = [{'error': 'Invalid idValue'}, {'data': [{'ticker': 'B'}]}]
+    provider, posts = _provider(monkeypatch, None, [(429, []), (200, body)])
+
+    results = provider.enrich_many_by_isin(items)
+
+    assert len(posts) == 2
+    # El error genérico no se cachea ni se devuelve: se puede reintentar
+    assert results == {('US0000000002', None): provider.cache['US0000000002_NONE']}
+    assert results[('US0000000002', None)]['symbol'] == 'B'
+
+
+def test_importer_enriches_in_batches_and_skips_negative_cache(monkeypatch):
+    monkeypatch.setattr(importer_v2, 'db', SimpleNamespace(session=SimpleNamespace(commit=lambda: None)))
+    batches = []
+
+    def enrich_many(registries, update_db=True):
+        batches.append([r.isin for r in registries])
+        return {r.isin: (r.isin != 'C', '') for r in registries}
+
+    importer = CSVImporterV2.__new__(CSVImporterV2)
+    importer.stats = {'enrichment_success': 0, 'enrichment_failed': 0}
+    importer.failed_enrichment_cache = {'A'}
+    importer.registry_service = SimpleNamespace(
+        negative_cached_isins=lambda isins: {'B'},
+        enrich_many_from_openfigi=enrich_many,
+        enricher=SimpleNamespace(openfigi=SimpleNamespace(max_jobs=2)),
+    )
+    importer._get_registry = lambda isin: SimpleNamespace(isin=isin)
+    importer._registry_needs_enrichment = lambda isin: isin != 'D'
+
+    importer._enrich_assets_with_progress(['A', 'B', 'C', 'D', 'E', 'F', 'G'])
+
+    assert batches == [['C', 'E'], ['F', 'G']]
+    assert importer.stats == {'enrichment_success': 3, 'enrichment_failed': 3}
+    assert importer.failed_enrichment_cache == {'A', 'B', 'C'}
@@ -0,0 +1,72 @@
+"""Tests unitarios: pool de navegadores persistentes para PDFs (reutilización, reciclado y timeouts)."""
+import threading
+
+import pytest
+
+from app.utils import pdf_renderer
+
+
+class _FakeSlot:
+    opened = 0
+
+    def __init__(self):
+        self.is_open = False
+        self.renders = 0
+
+    def open(self):
+        type(self).opened += 1
+        self.is_open = True
+
+    def render(self, html, timeout_ms):
+        if html == "boom":
+            raise RuntimeError("Target crashed")
+        if html == "slow":
+            threading.Event().wait(timeout_ms / 1000 + 0.2)
+        return f"pdf:{html}".encode()
+
+    def close(self):
+        self.is_open = False
+        self.renders = 0
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    _FakeSlot.opened = 0
+    monkeypatch.setattr(pdf_renderer, "_slot_factory", _FakeSlot)
+    monkeypatch.setattr(pdf_renderer, "_jobs", None)
+    monkeypatch.setattr(pdf_renderer, "_pool_pid", None)
+    monkeypatch.setattr(pdf_renderer, "_children_rss_mb", lambda pid: 0.0)
+    monkeypatch.setattr(pdf_renderer, "_settings", {
+        "pool_size": 1, "queue_size": 4, "timeout": 5.0, "max_renders": 3, "max_rss_mb": 512, "idle": 60.0,
+    })
+    yield pdf_renderer
+    pdf_renderer.shutdown_pdf_renderer()
+
+
+def test_browser_is_reused_and_recycled_after_max_renders(pool):
+    results = [pool.render_pdf(f"doc{i}") for i in range(5)]
+
+    assert results == [f"pdf:doc{i}".encode() for i in range(5)]
+    # 3 PDFs con el primer navegador, los 2 siguientes con uno nuevo
+    assert _FakeSlot.opened == 2
+
+
+def test_memory_threshold_recycles_browser(pool, monkeypatch):
+    monkeypatch.setattr(pool, "_children_rss_mb", lambda pid: 900.0)
+    pool.render_pdf("a")
+    pool.render_pdf("b")
+    assert _FakeSlot.opened == 2
+
+
+def test_render_error_restarts_browser_and_keeps_serving(pool):
+    assert pool.render_pdf("a") == b"pdf:a"
+    with pytest.raises(pool.PdfRenderError, match="Target crashed"):
+        pool.render_pdf("boom")
+    assert pool.render_pdf("b") == b"pdf:b"
+    assert _FakeSlot.opened == 2
+
+
+def test_timeout_raises_without_blocking_the_pool(pool):
+    with pytest.raises(pool.PdfRenderError, match="timeout"):
+        pool.render_pdf("slow", timeout=0.2)
+    assert pool.render_pdf("after", timeout=2) == b"pdf:after"
@@ -0,0 +1,29 @@
+"""Tests unitarios: prioridad por antigüedad del polling de precios por lotes."""
+from datetime import datetime, timedelta
+
+from app.services.price_polling_service import _rank_slots
+
+NOW = datetime(2026, 1, 5, 12, 0)
+
+
+def _asset(asset_id, held):
+    return {"kind": "asset", "asset_id": asset_id, "ticker": f"T{asset_id}", "held": held}
+
+
+def test_rank_slots_weights_staleness_by_target_age():
+    queue = [_asset(1, True), _asset(2, True), _asset(3, False), _asset(4, False),
+             {"kind": "benchmark", "name": "S&P 500", "ticker": "^GSPC", "held": True}]
+    updated_at = {
+        ("asset", 1): NOW - timedelta(minutes=2),    # 120/180 = 0.67
+        ("asset", 2): NOW - timedelta(seconds=30),   # recién actualizado: se omite
+        ("asset", 3): NOW - timedelta(minutes=20),   # 1200/900 = 1.33
+        ("asset", 4): None,                          # sin precio: primero
+    }
+
+    ranked = _rank_slots(queue, updated_at, NOW, 10, 180, 900)
+    assert [s.get("asset_id", s.get("name")) for s in ranked] == [4, "S&P 500", 3, 1]
+    assert len(_rank_slots(queue, updated_at, NOW, 2, 180, 900)) == 2
+
+
+def test_rank_slots_skips_assets_deleted_since_queue_was_cached():
+    assert _rank_slots([_asset(9, True)], {}, NOW, 10, 180, 900) == []
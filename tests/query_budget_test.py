@@ -0,0 +1,71 @@
+"""Tests unitarios: presupuesto de sentencias SQL por petición (detector de N+1)."""
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from app.utils import query_budget as query_budget_module
+from app.utils.query_budget import QueryBudgetExceeded, count_statements, query_budget, register_query_budget
+
+
+@pytest.fixture
+def engine():
+    return create_engine("sqlite://")
+
+
+def _app(engine, strict, default=0):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, QUERY_BUDGET_STRICT=strict, QUERY_BUDGET_PER_REQUEST=default)
+    register_query_budget(app)
+
+    def run(n):
+        with engine.connect() as conn:
+            for _ in range(n):
+                conn.execute(text("SELECT 1"))
+        return "ok"
+
+    @app.route("/budgeted/<int:n>")
+    @query_budget(3)
+    def budgeted(n):
+        return run(n)
+
+    @app.route("/default/<int:n>")
+    def default(n):
+        return run(n)
+
+    return app
+
+
+def test_count_statements_nests(engine):
+    with count_statements() as outer:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            with count_statements() as inner:
+                conn.execute(text("SELECT 2"))
+                conn.execute(text("SELECT 3"))
+    assert (outer.count, inner.count) == (3, 2)
+
+
+def test_strict_budget_fails_request(engine):
+    client = _app(engine, strict=True).test_client()
+
+    assert client.get("/budgeted/3").status_code == 200
+    with pytest.raises(QueryBudgetExceeded, match="statements=4 budget=3"):
+        client.get("/budgeted/4")
+
+
+def test_lenient_budget_logs_and_falls_back_to_default(engine, caplog, monkeypatch):
+    # create_app corta la propagación de followup.perf; caplog escucha en la raíz
+    monkeypatch.setattr(query_budget_module.logger, "propagate", True)
+    client = _app(engine, strict=False, default=5).test_client()
+
+    with caplog.at_level(logging.WARNING, logger="followup.perf"):
+        assert client.get("/budgeted/4").status_code == 200
+        assert client.get("/default/5").status_code == 200
+        assert client.get("/default/6").status_code == 200
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 2
+    assert "endpoint=budgeted" in messages[0] and "budget=3" in messages[0]
+    assert "endpoint=default" in messages[1] and "statements=6 budget=5" in messages[1]
@@ -0,0 +1,92 @@
+"""Tests unitarios: parsers en streaming (iter_events) e importación por bloques."""
+import csv
+from types import SimpleNamespace
+
+from app.services import importer_v2
+from app.services.importer_v2 import CSVImporterV2
+from app.services.parsers.ibkr_parser import IBKRParser
+from app.services.parsers.revolut_x_parser import RevolutXParser
+from app.services.parsers.streaming import ParsedEvent, chunked
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+def test_ibkr_streams_trades_with_instruments_defined_later(tmp_path):
+    path = _write_csv(tmp_path / "ibkr.csv", [
+        ["Operaciones", "Header", "DataDiscriminator", "Divisa", "Símbolo", "Fecha/Hora", "Cantidad", "Precio trans."],
+        ["Operaciones", "Data", "Order", "USD", "IGCl", "2024-04-25, 11:11:05", "-3", "10"],
+        ["Operaciones", "Data", "SubTotal", "USD", "IGCl", "", "-3", ""],
+        ["Dividendos", "Header", "Divisa", "Fecha", "Descripción", "Cantidad"],
+        ["Dividendos", "Data", "USD", "2024-07-18", "IGC(CA45408X3085) Dividendo", "4"],
+        ["Dividendos", "Data", "USD", "2024-07-18", "IGC(CA45408X3085) Dividendo", "6"],
+        ["Dividendos", "Data", "Total", "", "", "10"],
+        ["Dividendos", "Data", "Total en EUR", "", "", "9"],
+        ["Interés", "Header", "Divisa", "Fecha", "Descripción", "Cantidad"],
+        ["Interés", "Data", "EUR", "2024-08-03", "Debit", "-2"],
+        # La sección de instrumentos llega después de las operaciones
+        ["Información de instrumento financiero", "Header", "Símbolo", "Descripción", "Id. de seguridad", "Tipo"],
+        ["Información de instrumento financiero", "Data", "IGC", "India Globalization", "CA45408X3085", "COMMON"],
+    ])
+    parser = IBKRParser()
+
+    events = list(parser.iter_events(path))
+
+    assert [e.kind for e in events] == ["trade", "dividend", "fee"]
+    trade, dividend, fee = (e.data for e in events)
+    assert (trade["symbol"], trade["isin"], trade["transaction_type"]) == ("IGC", "CA45408X3085", "SELL")
+    assert trade["name"] == "India Globalization"
+    # Mismo día y símbolo: un dividendo, convertido con Total en EUR / Total
+    assert (dividend["amount_original"], dividend["amount"]) == (10.0, 9.0)
+    assert (fee["amount"], fee["description"]) == (2.0, "Interés EUR")
+    # Dos pasadas sobre las 12 filas
+    assert parser.throughput.rows == 24
+    assert parser.throughput.events == 3
+
+    parsed = IBKRParser().parse(path)
+    assert parsed["trades"] == [trade]
+    assert parsed["dividends"] == [dividend]
+
+
+def test_revolut_x_emits_positions_after_trades(tmp_path):
+    path = _write_csv(tmp_path / "revolut.csv", [
+        ["Symbol", "Type", "Quantity", "Price", "Value", "Fees", "Date"],
+        ["BTC", "Buy", "2", "€100", "€200", "€0", "4 Feb 2026, 06:20:04"],
+        ["BTC", "Sell", "1.5", "€120", "€180", "€0", "5 Feb 2026, 06:20:04"],
+        ["ETH", "Sell", "1", "€50", "€50", "€0", "6 Feb 2026, 06:20:04"],
+    ])
+
+    events = list(RevolutXParser().iter_events(path))
+
+    assert [e.kind for e in events] == ["trade", "trade", "trade", "holding"]
+    assert (events[-1].data["symbol"], events[-1].data["quantity"]) == ("BTC", 0.5)
+
+
+def test_import_events_processes_fixed_size_chunks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(importer_v2, "db", SimpleNamespace(session=SimpleNamespace(
+        commit=lambda: calls.append("commit"),
+    )))
+    importer = CSVImporterV2.__new__(CSVImporterV2)
+    importer.stats = {}
+    importer._create_transaction_snapshot = lambda: calls.append("snapshot")
+    importer._resolve_assets = lambda data, progress_callback=None: calls.append(
+        ("assets", data["broker"], len(data["trades"]), len(data["fees"]))
+    )
+    importer._import_records = lambda data: len(data["trades"]) + len(data["fees"])
+    importer._finish_import = lambda: importer.stats
+
+    events = [ParsedEvent("trade", {"n": i}) for i in range(4)] + [ParsedEvent("fee", {"amount": 1.0})]
+    stats = importer.import_events(iter(events), broker="IBKR", chunk_size=2)
+
+    assert calls == [
+        "snapshot",
+        ("assets", "IBKR", 2, 0), "commit",
+        ("assets", "IBKR", 2, 0), "commit",
+        ("assets", "IBKR", 0, 1), "commit",
+    ]
+    assert (stats["throughput"]["events"], stats["throughput"]["rows"]) == (5, 5)
+    assert [len(c) for c in chunked(range(5), 2)] == [2, 2, 1]
@@ -0,0 +1,57 @@
+"""Tests unitarios: vista columnar de transacciones (máscaras, filas y sumas en EUR)."""
+from collections import namedtuple
+from datetime import date, datetime
+
+import pytest
+
+from app.services import transaction_frame
+from app.services.transaction_frame import TransactionFrame, _COLUMNS
+
+Row = namedtuple("Row", _COLUMNS)
+
+
+def _row(txn_id, ts, txn_type, amount, currency="EUR", asset_id=None, account_id=1):
+    return Row(txn_id, ts, txn_type, asset_id, account_id, None, None, amount, currency, None, None, None)
+
+
+@pytest.fixture
+def frame():
+    return TransactionFrame(1, 3, [
+        _row(1, datetime(2024, 1, 1, 9), "DEPOSIT", 1000.0),
+        _row(2, datetime(2024, 1, 2), "DIVIDEND", 10.0, "USD", asset_id=7, account_id=2),
+        _row(3, datetime(2024, 2, 1), "WITHDRAWAL", -200.0),
+        _row(4, datetime(2024, 2, 1, 12), "FEE", -3.0, account_id=2),
+    ])
+
+
+def test_mask_filters_by_type_dates_and_ids(frame):
+    assert frame.mask(["DEPOSIT", "WITHDRAWAL"]).tolist() == [True, False, True, False]
+    # date = medianoche: start inclusivo, after exclusivo
+    assert frame.mask(start=date(2024, 2, 1)).tolist() == [False, False, True, True]
+    assert frame.mask(after=datetime(2024, 2, 1)).tolist() == [False, False, False, True]
+    assert frame.mask(end=datetime(2024, 1, 2)).tolist() == [True, True, False, False]
+    assert frame.mask(account_ids=[2], asset_ids=[7]).tolist() == [False, True, False, False]
+
+
+def test_rows_keep_original_values(frame):
+    rows = frame.rows(frame.mask("DIVIDEND"))
+    assert [r.id for r in rows] == [2]
+    assert rows[0].quantity is None and rows[0].asset_id == 7
+    assert frame.first_date() == datetime(2024, 1, 1, 9)
+    assert frame.first_date(frame.mask("FEE")) == datetime(2024, 2, 1, 12)
+    assert TransactionFrame(1, 0, []).first_date() is None
+
+
+def test_sum_eur_uses_absolute_amounts(frame, monkeypatch):
+    calls = []
+
+    def fake_convert_many(amounts, currencies, dates=None):
+        calls.append(dates)
+        return amounts * [0.9 if c == "USD" else 1.0 for c in currencies]
+
+    monkeypatch.setattr(transaction_frame, "convert_many", fake_convert_many)
+
+    assert frame.sum_eur(frame.mask(["DIVIDEND", "WITHDRAWAL"])) == pytest.approx(209.0)
+    assert frame.sum_eur(frame.mask("FEE"), at_flow_date=True) == pytest.approx(3.0)
+    assert calls == [None, [datetime(2024, 2, 1, 12)]]
+    assert frame.sum_eur(frame.mask("INTEREST")) == 0.0
@@ -0,0 +1,128 @@
+"""Tests unitarios: motor de valoración watchlist por lotes frente al camino escalar."""
+import copy
+import json
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services import watchlist_batch_valuation as wb
+from app.services.watchlist_metrics_service import WatchlistMetricsService
+
+_RATIO_FIELDS = ("ffo_to_total_debt", "fcf_to_net_income")
+_PRICE_FIELDS = (
+    "eps", "per_ntm", "per_fair", "price_to_book", "pb_fair", "bvps",
+    "ffo_per_share", "affo_per_share", "price_to_ffo", "p_ffo_fair",
+)
+
+
+class _Cfg:
+    def __init__(self, color_thresholds, tier_ranges, tier_amounts):
+        self._ct, self._tr, self._ta = color_thresholds, tier_ranges, tier_amounts
+
+    def get_tier_ranges_dict(self):
+        return json.loads(json.dumps(self._tr))
+
+    def get_tier_amounts_dict(self):
+        return dict(self._ta)
+
+    def get_color_thresholds_dict(self):
+        return json.loads(json.dumps(self._ct))
+
+    def get_valuation_sector_rules(self):
+        return self._ct["valuation_sector_rules"]
+
+
+def _configs():
+    sector_rules = {
+        "banks": [{"sector": "Financial Services", "industry": "Banks"}],
+        "realestate": [{"sector": "Real Estate", "industry": "REIT"}],
+    }
+    ranges = {
+        "tier_5": {"min": 50.0}, "tier_4": {"min": 30.0, "max": 50.0}, "tier_3": {"min": 10, "max": 30},
+        "tier_2": {"min": 0.0, "max": 10.0}, "tier_1": {"max": 0.0},
+    }
+    rules = {
+        "buy": {"valoracion_12m": {"op": ">", "value": -12.5}, "rentabilidad_anual": {"op": ">=", "value": 10.0}},
+        "sell": {"valoracion_12m": {"op": "<", "value": -5}, "rentabilidad_anual": {"op": "<", "value": 5.0},
+                 "combiner": "or"},
+    }
+    return {
+        1: _Cfg({"valuation_sector_rules": sector_rules, "operativa_rules": rules}, ranges,
+                {"tier_1": 500.0, "tier_2": 1000.0, "tier_3": 2000.0, "tier_4": 5000.0, "tier_5": 10000.0}),
+        # Tier 3 inválido (max < min), sin tier 1, cantidades 0 / ausentes y sin reglas BUY/SELL
+        2: _Cfg({"valuation_sector_rules": sector_rules}, {**ranges, "tier_3": {"min": 30, "max": 10}},
+                {"tier_2": 1000, "tier_3": 2000.0, "tier_4": 0.0}),
+    }
+
+
+def _value(rng, lo, hi):
+    roll = rng.random()
+    if roll < 0.25:
+        return None
+    if roll < 0.3:
+        return 0.0
+    return round(rng.uniform(lo, hi), rng.choice([1, 2, 6]))
+
+
+def _rows(n=600, seed=11):
+    rng = random.Random(seed)
+    rows, values = [], {}
+    for i in range(n):
+        user_id = rng.choice([1, 2])
+        sector, industry = rng.choice(
+            [("Financial Services", "Banks"), ("Real Estate", "REIT"), ("Technology", "Software"), (None, None)]
+        )
+        fields = {f: _value(rng, -30, 60) for f in wb.INPUT_FIELDS}
+        fields.update({f: _value(rng, -3, 40) for f in _PRICE_FIELDS})
+        fields.update({f: _value(rng, -0.5, 1.5) for f in _RATIO_FIELDS})
+        row = SimpleNamespace(
+            id=i + 1, user_id=user_id, asset_id=1000 + i, sector=sector, industry=industry,
+            asset_price=_value(rng, 0.5, 500), precio_actual=_value(rng, 1, 400),
+            valoracion_12m=None, target_price_5yr=None, target_price_5yr_gross=None,
+            valuation_adjustment_factor=None, tier=None, rentabilidad_5yr=None, rentabilidad_anual=None,
+            cantidad_aumentar_reducir=rng.choice([None, 12.5]),
+            operativa_indicator=rng.choice([None, "-", "HOLD", "BUY"]),
+            **fields,
+        )
+        rows.append(row)
+        if rng.random() < 0.6:
+            values[(user_id, row.asset_id)] = rng.choice([0.0, rng.uniform(0, 15000)])
+    return rows, values
+
+
+def test_batch_matches_update_all_metrics():
+    rows, values = _rows()
+    configs = _configs()
+
+    frame = wb.WatchlistFrame.from_rows(rows, configs, values)
+    params = {p["id"]: p for p in wb.changed_rows(frame, wb.compute_batch(frame, configs))}
+    assert set(frame.modes) == {"general", "banks", "realestate"}
+
+    for row in rows:
+        item = copy.copy(row)
+        asset = SimpleNamespace(sector=row.sector, industry=row.industry, current_price=row.asset_price)
+        WatchlistMetricsService.update_all_metrics(
+            item, configs[row.user_id], current_value_eur=values.get((row.user_id, row.asset_id)), asset=asset
+        )
+        batch = params.get(row.id, vars(row))
+        assert {f: batch[f] for f in wb.OUTPUT_FIELDS} == {f: getattr(item, f) for f in wb.OUTPUT_FIELDS}, row.id
+
+
+def test_unchanged_rows_are_not_rewritten():
+    rows, values = _rows(n=50)
+    configs = _configs()
+    frame = wb.WatchlistFrame.from_rows(rows, configs, values)
+    for p in wb.changed_rows(frame, wb.compute_batch(frame, configs)):
+        vars(rows[p["id"] - 1]).update({f: p[f] for f in wb.OUTPUT_FIELDS})
+
+    frame = wb.WatchlistFrame.from_rows(rows, configs, values)
+    assert wb.changed_rows(frame, wb.compute_batch(frame, configs)) == []
+
+
+def test_round_and_pow_follow_python_scalars():
+    x = np.array([2.675, 1.005, 0.125, -0.285, 19.999999, 1234.56785, np.nan])
+    assert wb._round(x, 2)[:-1].tolist() == [round(v, 2) for v in x[:-1].tolist()]
+    assert wb._round(x, 4)[:-1].tolist() == [round(v, 4) for v in x[:-1].tolist()]
+    base = np.linspace(0.5, 2.0, 997)
+    assert wb._pow(base, 5.0).tolist() == [b ** 5 for b in base.tolist()]